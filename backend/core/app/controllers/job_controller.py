@@ -0,0 +1,117 @@
+from typing import List, Tuple
+from uuid import UUID
+from sqlalchemy import case, func, literal, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, undefer
+from app.jobs.handlers import JOB_HANDLERS
+from app.models.job_model import Job as JobModel, JobStatus
+from app.schemas.job_schema import JobCreate, JobOut
+from app.utils.convert import remove_private_attributes
+from app.utils.custom_exceptions import (
+    BadRequestException,
+    NotFoundException,
+    UnprocessableEntityException,
+)
+
+
+def to_job_out(job: JobModel) -> JobOut:
+    job_dict = remove_private_attributes(job)
+    return JobOut.model_validate(job_dict)
+
+
+class JobController:
+    @staticmethod
+    def _get_job_model(db: Session, job_id: UUID) -> JobModel:
+        job = db.get(JobModel, job_id)
+        if job is None:
+            raise NotFoundException("Job not found")
+        return job
+
+    @staticmethod
+    def submit_job(db: Session, user_id: UUID, job: JobCreate) -> JobOut:
+        if job.kind not in JOB_HANDLERS:
+            raise UnprocessableEntityException(
+                "Unknown job kind, expected one of: " + ", ".join(sorted(JOB_HANDLERS))
+            )
+
+        new_job = JobModel(
+            user_id=user_id, kind=job.kind, params=job.params, priority=job.priority
+        )
+        db.add(new_job)
+        try:
+            db.commit()
+            db.refresh(new_job)
+        except SQLAlchemyError:
+            db.rollback()
+            raise BadRequestException("Failed to submit job")
+
+        return to_job_out(new_job)
+
+    @staticmethod
+    def get_job_by_id(db: Session, job_id: UUID) -> JobOut:
+        return to_job_out(JobController._get_job_model(db, job_id))
+
+    @staticmethod
+    def get_jobs_by_user_id(
+        db: Session, user_id: UUID, skip: int = 0, limit: int = 10
+    ) -> Tuple[List[JobOut], int]:
+        total = db.scalar(
+            select(func.count())
+            .select_from(JobModel)
+            .where(JobModel.user_id == user_id)
+        )
+        jobs = db.scalars(
+            select(JobModel)
+            .where(JobModel.user_id == user_id)
+            .order_by(JobModel.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+        ).all()
+        return [to_job_out(job) for job in jobs], total
+
+    @staticmethod
+    def get_job_result(db: Session, job_id: UUID) -> JobModel:
+        job = db.scalars(
+            select(JobModel)
+            .where(JobModel.id == job_id)
+            .options(undefer(JobModel.result))
+        ).first()
+        if job is None:
+            raise NotFoundException("Job not found")
+        if job.status != JobStatus.SUCCEEDED:
+            raise BadRequestException(f"Job has no result, it is {job.status.value}")
+        return job
+
+    @staticmethod
+    def cancel_job(db: Session, job_id: UUID) -> JobOut:
+        # Queued jobs are cancelled right away, running ones stop at their
+        # next checkpoint. A single statement, so a job claimed concurrently
+        # by a worker is only flagged
+        queued = JobModel.status == JobStatus.QUEUED
+        statement = (
+            update(JobModel)
+            .where(
+                JobModel.id == job_id,
+                JobModel.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]),
+            )
+            .values(
+                cancel_requested=True,
+                status=case(
+                    (queued, literal(JobStatus.CANCELLED, JobModel.status.type)),
+                    else_=JobModel.status,
+                ),
+                finished_at=case((queued, func.now()), else_=JobModel.finished_at),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            result = db.execute(statement)
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            raise BadRequestException("Failed to cancel job")
+
+        job = JobController._get_job_model(db, job_id)
+        if result.rowcount == 0:
+            raise BadRequestException(f"Job already {job.status.value}")
+        return to_job_out(job)
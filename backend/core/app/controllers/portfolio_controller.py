@@ -1,113 +1,293 @@
-from typing import List
+from typing import Collection, Dict, List, Sequence, Tuple
+from datetime import datetime
+from sqlalchemy import Integer, bindparam, case, func, select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from psycopg2.errors import UniqueViolation
 from collections import defaultdict
+import numpy as np
 from app.schemas.portfolio_schema import (
     PortfolioCreate,
     PortfolioUpdate,
     PortfolioOut,
     Asset,
+    Holding,
+    HoldingValue,
+    PortfolioValuation,
+    PortfolioInclude,
+    AssetTypeValue,
+    NetWorthSummary,
 )
+from app.models.asset_model import Asset as AssetModel
 from app.models.portfolio_model import Portfolio as PortfolioModel, AssetType
 from app.models.user_model import User as UserModel
 from app.utils.convert import remove_private_attributes
 from uuid import UUID
 from app.utils.custom_exceptions import NotFoundException, BadRequestException
 from .transaction_controller import TransactionController
-from app.models.transaction_model import TransactionType
-from app.utils.fetch_price import fetch_crypto_price
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.utils.fetch_price import (
+    fetch_crypto_price,
+    get_crypto_prices,
+    PRICE_CACHE_TTL_SECONDS,
+)
+from app.utils.cache import cache, portfolio_scope, user_scope
+from app.database.outbox import record_change
+from app.database.sharding import merge_pages, scatter
+from app.utils.transaction_working_set import (
+    ASSET_TYPES,
+    net_quantities,
+    transaction_working_set,
+)
 
 
-def calculate_portfolio_value(db, portfolio_id) -> float:
-    transactions = TransactionController.get_transactions_by_portfolio_id(
-        db, portfolio_id, include_deleted=False
+# Computed portfolio data is cached under the portfolio's version, which
+# transaction writes bump. Valuations also depend on prices, so they expire
+# together with the cached quotes. On a miss they are computed from the
+# owner's transactions in the working set, not reloaded from the database.
+def calculate_portfolio_value(db, portfolio_id, user_id) -> float:
+    return cache.get_or_set(
+        cache.key("portfolio_value", portfolio_scope(portfolio_id)),
+        lambda: _calculate_portfolio_value(db, portfolio_id, user_id),
+        PRICE_CACHE_TTL_SECONDS,
+        float,
     )
 
-    if len(transactions[0]) == 0:
-        return 0
 
-    total_value = 0
-    for transaction in transactions[0]:
-        asset_current_market_price = (
-            TransactionController.get_transaction_current_value(transaction)
-        )
-        if (
-            transaction.transaction_type == TransactionType.BUY
-            or transaction.transaction_type == TransactionType.TRANSFER_IN
-        ):
-            total_value += transaction.amount * asset_current_market_price
-        elif (
-            transaction.transaction_type == TransactionType.SELL
-            or transaction.transaction_type == TransactionType.TRANSFER_OUT
-        ):
-            total_value -= transaction.amount * asset_current_market_price
-        else:
-            raise BadRequestException("Invalid transaction type")
-
-    return total_value
+def _calculate_portfolio_value(db, portfolio_id, user_id) -> float:
+    # Transactions are netted by asset and currency first, so each of those
+    # is priced once rather than once per transaction
+    holdings = _get_working_set_holdings(db, portfolio_id, user_id)
+    return sum(
+        holding.quantity * TransactionController.get_transaction_current_value(holding)
+        for holding in holdings
+        # Quantities are summed exactly, fully sold assets net to 0
+        if holding.quantity != 0
+    )
 
 
 # List the asset in the portfolio and their current value
-def get_portfolio_assets(db, portfolio_id) -> List[Asset]:
-    transactions = TransactionController.get_transactions_by_portfolio_id(
-        db, portfolio_id
+def get_portfolio_assets(db, portfolio_id, user_id) -> List[Asset]:
+    return cache.get_or_set(
+        cache.key("portfolio_assets", portfolio_scope(portfolio_id)),
+        lambda: _get_portfolio_assets(db, portfolio_id, user_id),
+        PRICE_CACHE_TTL_SECONDS,
+        List[Asset],
     )
 
-    if len(transactions[0]) == 0:
-        return []
-
-    # Create a dictionary to hold the aggregated data for each asset
-    assets = defaultdict(lambda: {"quantity": 0, "ticker_symbol": "", "asset_type": ""})
 
-    for transaction in transactions[0]:
-        asset_name = transaction.asset_name
+def _get_portfolio_assets(db, portfolio_id, user_id) -> List[Asset]:
+    transactions = transaction_working_set.get(db, user_id)
+    rows = transactions.select(portfolio_id)
 
-        assets[asset_name]["ticker_symbol"] = transaction.ticker_symbol
-        assets[asset_name]["asset_type"] = transaction.asset_type
+    if len(rows) == 0:
+        return []
 
-        if transaction.transaction_type in [
-            TransactionType.BUY,
-            TransactionType.TRANSFER_IN,
-        ]:
-            assets[asset_name]["quantity"] += transaction.amount
-        elif transaction.transaction_type in [
-            TransactionType.SELL,
-            TransactionType.TRANSFER_OUT,
-        ]:
-            assets[asset_name]["quantity"] -= transaction.amount
+    # Oldest first: the oldest transaction of each asset gives its ticker
+    # symbol and type, the oldest of all the currency and the unit price
+    rows = rows[np.argsort(rows["created_at"], kind="stable")]
+    oldest = rows[0]
+    names, first, groups = np.unique(
+        rows["asset_name"], return_index=True, return_inverse=True
+    )
+    quantities = net_quantities(rows, groups.ravel(), len(names))
+    # Assets with the latest transactions first
+    last = len(rows) - 1 - np.unique(rows["asset_name"][::-1], return_index=True)[1]
 
-    # Convert the assets dictionary to a list of Asset objects
     asset_objects = []
-    for asset_name, asset_data in assets.items():
-        if asset_data["asset_type"] == AssetType.STOCKS:
+    for index in np.argsort(-last, kind="stable").tolist():
+        asset_name = transactions.string(names[index])
+        asset_type = ASSET_TYPES[rows["asset_type"][first[index]]]
+        if asset_type == AssetType.STOCKS:
             raise NotImplementedError("Stocks not implemented yet")
-        elif asset_data["asset_type"] == AssetType.CRYPTO:
+        elif asset_type == AssetType.CRYPTO:
             asset_current_market_price = fetch_crypto_price(
-                asset_name.lower(), transaction.currency.lower()
+                asset_name.lower(), transactions.string(oldest["currency"]).lower()
             )
-        elif asset_data["asset_type"] == AssetType.OTHERS:
+        elif asset_type == AssetType.OTHERS:
             raise NotImplementedError("Asset type not implemented yet")
 
+        quantity = quantities[index]
         asset_objects.append(
             Asset(
                 asset_name=asset_name,
-                ticker_symbol=asset_data["ticker_symbol"],
-                asset_type=asset_data["asset_type"],
-                quantity=asset_data["quantity"],
-                average_price=transaction.unit_price,
-                total_value=asset_data["quantity"] * asset_current_market_price,
+                ticker_symbol=transactions.string(rows["ticker_symbol"][first[index]]),
+                asset_type=asset_type,
+                quantity=quantity,
+                average_price=float(oldest["unit_price"]),
+                total_value=quantity * asset_current_market_price,
             )
         )
 
     return asset_objects
 
 
+# Net quantity of each asset held in the portfolio, from the working set
+def get_portfolio_holdings(db, portfolio_id, user_id) -> List[Holding]:
+    return cache.get_or_set(
+        cache.key("portfolio_holdings", portfolio_scope(portfolio_id)),
+        lambda: _get_working_set_holdings(db, portfolio_id, user_id),
+        value_type=List[Holding],
+    )
+
+
+# Statements built once with bound parameters, see transaction_controller
+signed_amount = case(
+    (
+        TransactionModel.transaction_type.in_(
+            [TransactionType.BUY, TransactionType.TRANSFER_IN]
+        ),
+        TransactionModel.amount,
+    ),
+    else_=-TransactionModel.amount,
+)
+# Grouped on the integer asset ids, the few groups are then named
+portfolio_asset_quantities = (
+    select(
+        TransactionModel.asset_id,
+        TransactionModel.currency,
+        func.sum(signed_amount).label("quantity"),
+    )
+    .where(
+        TransactionModel.portfolio_id == bindparam("portfolio_id"),
+        TransactionModel.deleted_at.is_(None),
+    )
+    .group_by(TransactionModel.asset_id, TransactionModel.currency)
+    .subquery()
+)
+select_portfolio_holdings = select(
+    AssetModel.provider_id,
+    AssetModel.symbol,
+    AssetModel.asset_type,
+    portfolio_asset_quantities.c.currency,
+    portfolio_asset_quantities.c.quantity,
+).join_from(
+    portfolio_asset_quantities,
+    AssetModel,
+    AssetModel.id == portfolio_asset_quantities.c.asset_id,
+)
+select_portfolio_owner_id = select(PortfolioModel.user_id).where(
+    PortfolioModel.id == bindparam("portfolio_id")
+)
+select_portfolio_by_id = select(PortfolioModel).where(
+    PortfolioModel.id == bindparam("portfolio_id")
+)
+select_portfolios = (
+    select(PortfolioModel)
+    .offset(bindparam("skip", type_=Integer))
+    .limit(bindparam("limit", type_=Integer))
+)
+select_user_portfolios = select_portfolios.where(
+    PortfolioModel.user_id == bindparam("user_id")
+)
+# In a stable order, for pages merged across shards
+select_first_portfolios = (
+    select(PortfolioModel)
+    .order_by(PortfolioModel.created_at, PortfolioModel.id)
+    .limit(bindparam("limit", type_=Integer))
+)
+
+
+# Aggregated in the database, for one-off readers such as jobs
+def _get_portfolio_holdings(db, portfolio_id) -> List[Holding]:
+    rows = db.execute(select_portfolio_holdings, {"portfolio_id": portfolio_id}).all()
+    return holdings_from_rows(rows)
+
+
+def _get_working_set_holdings(db, portfolio_id, user_id) -> List[Holding]:
+    rows = transaction_working_set.get(db, user_id).holdings(portfolio_id)
+    return holdings_from_rows(rows)
+
+
+def holdings_from_rows(rows) -> List[Holding]:
+    return [
+        Holding(
+            asset_name=asset_name,
+            ticker_symbol=ticker_symbol,
+            asset_type=asset_type,
+            currency=currency,
+            quantity=quantity,
+        )
+        for asset_name, ticker_symbol, asset_type, currency, quantity in rows
+    ]
+
+
+def price_key(holding: Holding) -> Tuple[str, str]:
+    return holding.asset_name.lower(), holding.currency.lower()
+
+
+# Value holdings with already fetched quotes, assets without a quote count as 0
+def value_holding(
+    holding: Holding, quotes: Dict[Tuple[str, str], float]
+) -> HoldingValue:
+    price = quotes.get(price_key(holding))
+    return HoldingValue(
+        **holding.model_dump(),
+        price=price,
+        total_value=holding.quantity * price if price is not None else 0.0,
+    )
+
+
+def value_holdings(
+    portfolio_id, holdings: List[Holding], quotes: Dict[Tuple[str, str], float]
+) -> PortfolioValuation:
+    assets = [value_holding(holding, quotes) for holding in holdings]
+    return PortfolioValuation(
+        portfolio_id=portfolio_id,
+        current_value=sum(asset.total_value for asset in assets),
+        assets=assets,
+        timestamp=datetime.utcnow(),
+    )
+
+
+def _get_net_worth_summary(db, user_id, currency: str, top: int) -> NetWorthSummary:
+    # Quantities across every portfolio of the user, whatever the currency
+    rows = transaction_working_set.get(db, user_id).holdings(by_currency=False)
+    holdings = [
+        Holding(
+            asset_name=asset_name,
+            ticker_symbol=ticker_symbol,
+            asset_type=asset_type,
+            currency=currency,
+            quantity=quantity,
+        )
+        for asset_name, ticker_symbol, asset_type, quantity in rows
+        if quantity != 0
+    ]
+    # Only crypto prices are available upstream so far
+    keys = {
+        price_key(holding)
+        for holding in holdings
+        if holding.asset_type == AssetType.CRYPTO
+    }
+    quotes = get_crypto_prices(keys) if keys else {}
+
+    assets = [value_holding(holding, quotes) for holding in holdings]
+    assets.sort(key=lambda asset: asset.total_value, reverse=True)
+    asset_types = defaultdict(float)
+    for asset in assets:
+        asset_types[asset.asset_type] += asset.total_value
+    return NetWorthSummary(
+        user_id=user_id,
+        currency=currency,
+        total_value=sum(asset.total_value for asset in assets),
+        asset_types=[
+            AssetTypeValue(asset_type=asset_type, total_value=total_value)
+            for asset_type, total_value in asset_types.items()
+        ],
+        top_holdings=assets[:top],
+        timestamp=datetime.utcnow(),
+    )
+
+
 class PortfolioController:
     @staticmethod
     def create_portfolio(db: Session, portfolio: PortfolioCreate) -> PortfolioOut:
         # Check if the user exists
-        db_user = db.query(UserModel).get(portfolio.user_id)
+        db_user = db.get(UserModel, portfolio.user_id)
 
         if db_user is None:
             raise NotFoundException("User not found")
@@ -122,6 +302,11 @@ class PortfolioController:
         db.add(new_portfolio)
 
         try:
+            # Flushed for its id, the event is committed with the portfolio
+            db.flush()
+            record_change(
+                db, "portfolio.created", new_portfolio.id, new_portfolio.user_id
+            )
             db.commit()
             db.refresh(new_portfolio)
         except IntegrityError as e:
@@ -137,51 +322,143 @@ class PortfolioController:
         return portfolio_out
 
     @staticmethod
-    def get_portfolio_by_id(db: Session, portfolio_id: UUID) -> PortfolioOut:
-        portfolio = db.query(PortfolioModel).get(portfolio_id)
+    def get_portfolio_owner_id(db: Session, portfolio_id: UUID) -> UUID:
+        # Authorization only needs the owner, which is a primary key lookup of a
+        # single column, cached until the portfolio's data changes
+        def load_owner_id() -> UUID:
+            user_id = db.execute(
+                select_portfolio_owner_id, {"portfolio_id": portfolio_id}
+            ).scalar()
+            if user_id is None:
+                raise NotFoundException("Portfolio not found")
+            return user_id
+
+        return cache.get_or_set(
+            cache.key("portfolio_owner", portfolio_scope(portfolio_id)),
+            load_owner_id,
+            value_type=UUID,
+        )
+
+    @staticmethod
+    def get_net_worth_summary(
+        db: Session, user_id: UUID, currency: str = "usd", top: int = 10
+    ) -> NetWorthSummary:
+        # One grouped holdings query and one batched quote lookup for all the
+        # user's portfolios, cached until a transaction of the user is written
+        # or the quotes expire
+        currency = currency.lower()
+        return cache.get_or_set(
+            cache.key("net_worth", user_scope(user_id), currency, top),
+            lambda: _get_net_worth_summary(db, user_id, currency, top),
+            PRICE_CACHE_TTL_SECONDS,
+            NetWorthSummary,
+        )
+
+    @staticmethod
+    def _to_portfolio_out(
+        db: Session, portfolio: PortfolioModel, include: Collection[PortfolioInclude]
+    ) -> PortfolioOut:
+        if PortfolioInclude.VALUE in include:
+            portfolio.current_value = calculate_portfolio_value(
+                db, portfolio.id, portfolio.user_id
+            )
+        if PortfolioInclude.ASSETS in include:
+            portfolio.assets = get_portfolio_assets(db, portfolio.id, portfolio.user_id)
+        portfolio_dict = remove_private_attributes(portfolio)
+        return PortfolioOut.model_validate(portfolio_dict)
+
+    @staticmethod
+    def get_portfolio_by_id(
+        db: Session,
+        portfolio_id: UUID,
+        include: Collection[PortfolioInclude] = (PortfolioInclude.VALUE,),
+    ) -> PortfolioOut:
+        portfolio = (
+            db.execute(select_portfolio_by_id, {"portfolio_id": portfolio_id})
+            .scalars()
+            .first()
+        )
         if portfolio is None:
             raise NotFoundException("Portfolio not found")
 
-        portfolio.current_value = calculate_portfolio_value(db, portfolio_id)
-        portfolio_dict = remove_private_attributes(portfolio)
-        portfolio_out = PortfolioOut.model_validate(portfolio_dict)
-        return portfolio_out
+        return PortfolioController._to_portfolio_out(db, portfolio, include)
 
     @staticmethod
     def get_all_portfolios(
-        db: Session, skip: int = 0, limit: int = 10
+        db: Session,
+        skip: int = 0,
+        limit: int = 10,
+        include: Collection[PortfolioInclude] = tuple(PortfolioInclude),
     ) -> List[PortfolioOut]:
         try:
-            portfolios = db.query(PortfolioModel).offset(skip).limit(limit).all()
+            portfolios = (
+                db.execute(select_portfolios, {"skip": skip, "limit": limit})
+                .scalars()
+                .all()
+            )
             results = []
             for portfolio in portfolios:
-                portfolio.current_value = calculate_portfolio_value(db, portfolio.id)
-                portfolio.assets = get_portfolio_assets(db, portfolio.id)
-                portfolio_dict = remove_private_attributes(portfolio)
-                portfolio_out = PortfolioOut.model_validate(portfolio_dict)
+                portfolio_out = PortfolioController._to_portfolio_out(
+                    db, portfolio, include
+                )
                 results.append(portfolio_out)
             return results
         except SQLAlchemyError:
             raise BadRequestException("Failed to retrieve portfolios")
 
+    @staticmethod
+    def get_all_portfolios_from_shards(
+        sessions: Sequence[Session],
+        skip: int = 0,
+        limit: int = 10,
+        include: Collection[PortfolioInclude] = tuple(PortfolioInclude),
+    ) -> Tuple[List[PortfolioOut], int]:
+        # Every shard lists its first skip + limit portfolios, and only the
+        # page cut from their merge is valued, on the shard of each portfolio
+        def first_portfolios(db: Session):
+            portfolios = db.execute(
+                select_first_portfolios, {"limit": skip + limit}
+            ).scalars()
+            total = db.query(PortfolioModel).count()
+            return [(db, portfolio) for portfolio in portfolios], total
+
+        try:
+            page, total = merge_pages(
+                scatter(sessions, first_portfolios),
+                lambda item: (item[1].created_at, item[1].id),
+                skip,
+                limit,
+            )
+            results = [
+                PortfolioController._to_portfolio_out(db, portfolio, include)
+                for db, portfolio in page
+            ]
+            return results, total
+        except SQLAlchemyError:
+            raise BadRequestException("Failed to retrieve portfolios")
+
     @staticmethod
     def get_portfolios_by_user_id(
-        db: Session, user_id: UUID, skip: int = 0, limit: int = 10
+        db: Session,
+        user_id: UUID,
+        skip: int = 0,
+        limit: int = 10,
+        include: Collection[PortfolioInclude] = tuple(PortfolioInclude),
     ) -> List[PortfolioOut]:
         try:
             portfolios = (
-                db.query(PortfolioModel)
-                .filter(PortfolioModel.user_id == user_id)
-                .offset(skip)
-                .limit(limit)
+                db.execute(
+                    select_user_portfolios,
+                    {"user_id": user_id, "skip": skip, "limit": limit},
+                )
+                .scalars()
                 .all()
             )
             results = []
             for portfolio in portfolios:
-                portfolio.current_value = calculate_portfolio_value(db, portfolio.id)
-                portfolio.assets = get_portfolio_assets(db, portfolio.id)
-                portfolio_dict = remove_private_attributes(portfolio)
-                portfolio_out = PortfolioOut.model_validate(portfolio_dict)
+                portfolio_out = PortfolioController._to_portfolio_out(
+                    db, portfolio, include
+                )
                 results.append(portfolio_out)
             return results
         except SQLAlchemyError:
@@ -191,7 +468,7 @@ class PortfolioController:
     def update_portfolio_by_id(
         db: Session, portfolio_id: UUID, portfolio: PortfolioUpdate
     ) -> PortfolioOut:
-        db_portfolio = db.query(PortfolioModel).get(portfolio_id)
+        db_portfolio = db.get(PortfolioModel, portfolio_id)
 
         if db_portfolio is None:
             raise NotFoundException("Portfolio not found")
@@ -201,6 +478,7 @@ class PortfolioController:
             db_portfolio.name = portfolio.name
         if portfolio.description:
             db_portfolio.description = portfolio.description
+        record_change(db, "portfolio.updated", portfolio_id, db_portfolio.user_id)
 
         try:
             db.commit()
@@ -216,14 +494,18 @@ class PortfolioController:
 
     @staticmethod
     def delete_portfolio_by_id(db: Session, portfolio_id: UUID) -> str:
-        portfolio = db.query(PortfolioModel).get(portfolio_id)
+        portfolio = db.get(PortfolioModel, portfolio_id)
         if portfolio is None:
             raise NotFoundException("Portfolio not found")
+        user_id = portfolio.user_id
         db.delete(portfolio)
+        record_change(db, "portfolio.deleted", portfolio_id, user_id)
         try:
             db.commit()
         except SQLAlchemyError:
             db.rollback()
             raise BadRequestException("Failed to delete portfolio")
 
+        cache.invalidate(portfolio_scope(portfolio_id), user_scope(user_id))
+
         return "Portfolio deleted successfully"
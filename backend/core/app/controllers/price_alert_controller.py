@@ -0,0 +1,149 @@
+import os
+from typing import List, Tuple
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.models.price_alert_model import PriceAlert as PriceAlertModel
+from app.schemas.price_alert_schema import (
+    PriceAlertCreate,
+    PriceAlertOut,
+    PriceAlertUpdate,
+)
+from app.utils.convert import remove_private_attributes
+from app.utils.custom_exceptions import BadRequestException, NotFoundException
+from app.utils.price_alerts import active_alert, price_alerts
+
+load_dotenv()
+
+# Active ones, triggered alerts do not count
+PRICE_ALERT_MAX_PER_USER = int(os.getenv("PRICE_ALERT_MAX_PER_USER") or 100)
+
+
+def to_price_alert_out(alert: PriceAlertModel) -> PriceAlertOut:
+    alert_dict = remove_private_attributes(alert)
+    return PriceAlertOut.model_validate(alert_dict)
+
+
+# The worker evaluating the alerts has its own changes evaluated right away,
+# those of the others once it syncs
+def track_alert(alert: PriceAlertModel) -> None:
+    if not price_alerts.leading:
+        return
+    if alert.triggered_at is None:
+        price_alerts.book.track(active_alert(alert))
+    else:
+        price_alerts.book.untrack(alert.id)
+
+
+class PriceAlertController:
+    @staticmethod
+    def _get_alert_model(db: Session, alert_id: UUID) -> PriceAlertModel:
+        alert = db.get(PriceAlertModel, alert_id)
+        if alert is None:
+            raise NotFoundException("Price alert not found")
+        return alert
+
+    @staticmethod
+    def _check_active_alert_limit(db: Session, user_id: UUID) -> None:
+        active = db.scalar(
+            select(func.count())
+            .select_from(PriceAlertModel)
+            .where(
+                PriceAlertModel.user_id == user_id,
+                PriceAlertModel.triggered_at.is_(None),
+            )
+        )
+        if active >= PRICE_ALERT_MAX_PER_USER:
+            raise BadRequestException(
+                f"At most {PRICE_ALERT_MAX_PER_USER} active price alerts per user"
+            )
+
+    @staticmethod
+    def create_alert(
+        db: Session, user_id: UUID, alert: PriceAlertCreate
+    ) -> PriceAlertOut:
+        PriceAlertController._check_active_alert_limit(db, user_id)
+        alert_data = alert.model_dump()
+        # Keyed like the quotes of the price feed
+        alert_data["asset_name"] = alert.asset_name.lower()
+        alert_data["currency"] = alert.currency.lower()
+        new_alert = PriceAlertModel(user_id=user_id, **alert_data)
+        db.add(new_alert)
+        try:
+            db.commit()
+            db.refresh(new_alert)
+        except SQLAlchemyError:
+            db.rollback()
+            raise BadRequestException("Failed to create price alert")
+
+        track_alert(new_alert)
+        return to_price_alert_out(new_alert)
+
+    @staticmethod
+    def get_alert_owner_id(db: Session, alert_id: UUID) -> UUID:
+        owner_id = db.scalar(
+            select(PriceAlertModel.user_id).where(PriceAlertModel.id == alert_id)
+        )
+        if owner_id is None:
+            raise NotFoundException("Price alert not found")
+        return owner_id
+
+    @staticmethod
+    def get_alert_by_id(db: Session, alert_id: UUID) -> PriceAlertOut:
+        return to_price_alert_out(PriceAlertController._get_alert_model(db, alert_id))
+
+    @staticmethod
+    def get_alerts_by_user_id(
+        db: Session, user_id: UUID, skip: int = 0, limit: int = 10
+    ) -> Tuple[List[PriceAlertOut], int]:
+        total = db.scalar(
+            select(func.count())
+            .select_from(PriceAlertModel)
+            .where(PriceAlertModel.user_id == user_id)
+        )
+        alerts = db.scalars(
+            select(PriceAlertModel)
+            .where(PriceAlertModel.user_id == user_id)
+            .order_by(PriceAlertModel.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+        ).all()
+        return [to_price_alert_out(alert) for alert in alerts], total
+
+    @staticmethod
+    def update_alert_by_id(
+        db: Session, alert_id: UUID, alert: PriceAlertUpdate
+    ) -> PriceAlertOut:
+        alert_model = PriceAlertController._get_alert_model(db, alert_id)
+        if alert_model.triggered_at is not None:
+            PriceAlertController._check_active_alert_limit(db, alert_model.user_id)
+        for key, value in alert.model_dump(exclude_none=True).items():
+            setattr(alert_model, key, value)
+        # Re-armed, to trigger again
+        alert_model.triggered_at = None
+        alert_model.triggered_price = None
+        try:
+            db.commit()
+            db.refresh(alert_model)
+        except SQLAlchemyError:
+            db.rollback()
+            raise BadRequestException("Failed to update price alert")
+
+        track_alert(alert_model)
+        return to_price_alert_out(alert_model)
+
+    @staticmethod
+    def delete_alert_by_id(db: Session, alert_id: UUID) -> str:
+        alert = PriceAlertController._get_alert_model(db, alert_id)
+        db.delete(alert)
+        try:
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            raise BadRequestException("Failed to delete price alert")
+
+        if price_alerts.leading:
+            price_alerts.book.untrack(alert_id)
+        return "Price alert deleted successfully"
@@ -0,0 +1,198 @@
+import csv
+import io
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Deque, Dict, Iterator, NamedTuple, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session, aliased
+from app.models.archived_transaction_model import transactions_with_archive
+from app.models.asset_model import Asset as AssetModel
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+
+# Rows fetched per round trip of the server-side cursor
+REPORT_FETCH_ROWS = 1000
+# Report rows written to the response per chunk
+REPORT_CHUNK_ROWS = 500
+# Lots held longer than this are long term
+LONG_TERM_DAYS = 365
+# Quantities below this are float noise, not an open lot
+QUANTITY_EPSILON = 1e-12
+
+REALIZED_GAINS_COLUMNS = [
+    "sold_at",
+    "acquired_at",
+    "holding_days",
+    "term",
+    "portfolio_id",
+    "asset_name",
+    "ticker_symbol",
+    "currency",
+    "quantity",
+    "proceeds",
+    "cost_basis",
+    "gain",
+]
+
+# Every live transaction of the user up to the end of the report year, oldest
+# first, as lots opened before the year are sold during it. Closed out
+# positions may have been archived, their sales still count.
+report_transactions = aliased(TransactionModel, transactions_with_archive())
+select_report_transactions = (
+    select(
+        report_transactions.created_at,
+        report_transactions.portfolio_id,
+        AssetModel.provider_id.label("asset_name"),
+        AssetModel.symbol.label("ticker_symbol"),
+        report_transactions.currency,
+        report_transactions.transaction_type,
+        report_transactions.amount,
+        report_transactions.unit_price,
+        report_transactions.transaction_fee,
+    )
+    .join(AssetModel, AssetModel.id == report_transactions.asset_id)
+    .where(
+        report_transactions.user_id == bindparam("user_id"),
+        report_transactions.deleted_at.is_(None),
+        report_transactions.created_at < bindparam("end_time"),
+    )
+    .order_by(report_transactions.created_at)
+)
+
+
+class RealizedGain(NamedTuple):
+    sold_at: datetime
+    # None when the sale exceeds the recorded lots
+    acquired_at: Optional[datetime]
+    holding_days: Optional[int]
+    term: str
+    portfolio_id: UUID
+    asset_name: str
+    ticker_symbol: str
+    currency: str
+    quantity: float
+    proceeds: float
+    cost_basis: float
+    gain: float
+
+
+class Lot:
+    __slots__ = ("acquired_at", "quantity", "unit_cost")
+
+    def __init__(self, acquired_at: datetime, quantity: float, unit_cost: float):
+        self.acquired_at = acquired_at
+        self.quantity = quantity
+        self.unit_cost = unit_cost
+
+
+def match_lots(rows, start_time: datetime) -> Iterator[RealizedGain]:
+    """
+    Match sales against the open lots of the same portfolio, asset and
+    currency, first in first out, as the rows go by.
+
+    Buy fees are part of the cost basis of the lot and sell fees are deducted
+    from the proceeds, pro rata of the quantity matched. Transfers open and
+    close lots without realizing anything. Only sales from start_time on are
+    reported, earlier ones just consume their lots.
+    """
+    lots: Dict[Tuple[UUID, str, str], Deque[Lot]] = defaultdict(deque)
+    for row in rows:
+        if row.amount <= 0:
+            continue
+        key = (row.portfolio_id, row.asset_name, row.currency)
+
+        if row.transaction_type in (TransactionType.BUY, TransactionType.TRANSFER_IN):
+            unit_cost = (row.amount * row.unit_price + row.transaction_fee) / row.amount
+            lots[key].append(Lot(row.created_at, row.amount, unit_cost))
+            continue
+
+        realized = (
+            row.transaction_type == TransactionType.SELL
+            and row.created_at >= start_time
+        )
+        open_lots = lots[key]
+        remaining = row.amount
+        while remaining > QUANTITY_EPSILON:
+            lot = open_lots[0] if open_lots else None
+            quantity = min(remaining, lot.quantity) if lot else remaining
+            if realized:
+                yield realized_gain(row, lot, quantity)
+            remaining -= quantity
+            if lot is None:
+                break
+            lot.quantity -= quantity
+            if lot.quantity <= QUANTITY_EPSILON:
+                open_lots.popleft()
+        if not open_lots:
+            del lots[key]
+
+
+def realized_gain(row, lot: Optional[Lot], quantity: float) -> RealizedGain:
+    share = quantity / row.amount
+    proceeds = quantity * row.unit_price - row.transaction_fee * share
+    cost_basis = quantity * lot.unit_cost if lot else 0.0
+    holding_days = (row.created_at - lot.acquired_at).days if lot else None
+    if holding_days is None:
+        term = "unmatched"
+    else:
+        term = "long" if holding_days > LONG_TERM_DAYS else "short"
+    return RealizedGain(
+        sold_at=row.created_at,
+        acquired_at=lot.acquired_at if lot else None,
+        holding_days=holding_days,
+        term=term,
+        portfolio_id=row.portfolio_id,
+        asset_name=row.asset_name,
+        ticker_symbol=row.ticker_symbol,
+        currency=row.currency,
+        quantity=quantity,
+        proceeds=proceeds,
+        cost_basis=cost_basis,
+        gain=proceeds - cost_basis,
+    )
+
+
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return round(value, 8)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class ReportController:
+    @staticmethod
+    def realized_gains(db: Session, user_id: UUID, year: int) -> Iterator[RealizedGain]:
+        """Realized gains of the user over a calendar year, streamed from the database."""
+        start_time, end_time = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+        # yield_per streams the rows through a server-side cursor, so memory
+        # is bounded by the open lots rather than by the history
+        rows = db.execute(
+            select_report_transactions,
+            {"user_id": user_id, "end_time": end_time},
+            execution_options={"yield_per": REPORT_FETCH_ROWS},
+        )
+        try:
+            yield from match_lots(rows, start_time)
+        finally:
+            rows.close()
+
+    @staticmethod
+    def realized_gains_csv(db: Session, user_id: UUID, year: int) -> Iterator[str]:
+        """The realized gains report as CSV, written in chunks."""
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(REALIZED_GAINS_COLUMNS)
+        rows = ReportController.realized_gains(db, user_id, year)
+        for count, gain in enumerate(rows, start=1):
+            writer.writerow([csv_value(value) for value in gain])
+            if count % REPORT_CHUNK_ROWS == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        yield output.getvalue()
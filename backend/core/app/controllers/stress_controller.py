@@ -0,0 +1,130 @@
+from datetime import datetime
+from typing import List, Sequence, Tuple
+from uuid import UUID
+from sqlalchemy import BigInteger, Float, cast, func, select, type_coerce
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.controllers.portfolio_controller import signed_amount
+from app.database.fixed_point import from_units
+from app.database.sharding import scatter
+from app.models.asset_model import Asset as AssetModel
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import Transaction as TransactionModel
+from app.schemas.portfolio_schema import (
+    PortfolioPnL,
+    ScenarioResult,
+    StressTestRequest,
+    StressTestResult,
+)
+from app.utils.custom_exceptions import BadRequestException
+from app.utils.fetch_price import get_crypto_prices
+from app.utils.price_shocks import HoldingsMatrix
+
+# Net quantity of every asset of every portfolio, in a single scan grouped
+# on the integer asset ids, which are then named. Units are summed as float8:
+# exact while sums stay under 2^53 units, some 90 million of an asset, and
+# as fast as floats, where the numeric state of bigint sums spills to disk
+# sooner over that many groups.
+all_asset_quantities = (
+    select(
+        TransactionModel.portfolio_id,
+        TransactionModel.asset_id,
+        func.sum(cast(type_coerce(signed_amount, BigInteger), Float)).label("quantity"),
+    )
+    .where(TransactionModel.deleted_at.is_(None))
+    .group_by(TransactionModel.portfolio_id, TransactionModel.asset_id)
+    .subquery()
+)
+select_all_holdings = select(
+    all_asset_quantities.c.portfolio_id,
+    AssetModel.provider_id,
+    AssetModel.asset_type,
+    all_asset_quantities.c.quantity,
+).join_from(
+    all_asset_quantities,
+    AssetModel,
+    AssetModel.id == all_asset_quantities.c.asset_id,
+)
+
+
+class StressController:
+    @staticmethod
+    def load_holdings(
+        sessions: Sequence[Session],
+    ) -> List[Tuple[UUID, str, AssetType, float]]:
+        try:
+            shards = scatter(sessions, lambda db: db.execute(select_all_holdings).all())
+        except SQLAlchemyError:
+            raise BadRequestException("Failed to load holdings")
+        # Fully sold assets net to 0 units
+        return [
+            (portfolio_id, asset, asset_type, from_units(units))
+            for rows in shards
+            for portfolio_id, asset, asset_type, units in rows
+            if units != 0
+        ]
+
+    @staticmethod
+    def run_stress_test(
+        sessions: Sequence[Session], request: StressTestRequest
+    ) -> StressTestResult:
+        # Holdings are loaded and priced once, in the requested currency as
+        # the net worth summary does, then every scenario is a matrix product
+        currency = request.currency.lower()
+        holdings = StressController.load_holdings(sessions)
+        held = {asset for _, asset, _, _ in holdings}
+        # Only crypto prices are available upstream so far
+        crypto = {
+            asset
+            for _, asset, asset_type, _ in holdings
+            if asset_type == AssetType.CRYPTO
+        }
+        quotes = get_crypto_prices({(asset, currency) for asset in crypto})
+        prices = {asset: price for (asset, _), price in quotes.items()}
+        matrix = HoldingsMatrix.from_holdings(
+            (
+                (portfolio_id, asset, quantity)
+                for portfolio_id, asset, _, quantity in holdings
+            ),
+            prices,
+        )
+
+        shocks = matrix.shock_matrix(
+            [
+                {asset.lower(): change for asset, change in scenario.shocks.items()}
+                for scenario in request.scenarios
+            ]
+        )
+        results = matrix.evaluate(shocks, request.worst)
+
+        base_value = matrix.total_value
+        scenarios = []
+        for index, scenario in enumerate(request.scenarios):
+            pnl = float(results.pnl[index])
+            scenarios.append(
+                ScenarioResult(
+                    name=scenario.name,
+                    pnl=pnl,
+                    pnl_ratio=pnl / base_value if base_value else None,
+                    stressed_value=base_value + pnl,
+                    losing_portfolios=int(results.losing_portfolios[index]),
+                    worst_portfolios=[
+                        PortfolioPnL(
+                            portfolio_id=matrix.portfolio_ids[row],
+                            base_value=float(matrix.base_values[row]),
+                            pnl=float(portfolio_pnl),
+                        )
+                        for row, portfolio_pnl in zip(
+                            results.worst_portfolios[index], results.worst_pnl[index]
+                        )
+                    ],
+                )
+            )
+        return StressTestResult(
+            currency=currency,
+            portfolios=len(matrix.portfolio_ids),
+            base_value=base_value,
+            unpriced_assets=sorted(held - set(prices)),
+            scenarios=scenarios,
+            timestamp=datetime.utcnow(),
+        )
@@ -1,19 +1,43 @@
-from typing import Tuple, List
-from sqlalchemy import ClauseElement, or_
-from app.utils.custom_exceptions import BadRequestException, NotFoundException
+from typing import Optional, Sequence, Tuple, List
+from collections import defaultdict
+from functools import lru_cache
+from sqlalchemy import (
+    ClauseElement,
+    Integer,
+    Select,
+    and_,
+    bindparam,
+    delete,
+    func,
+    select,
+    update,
+)
+from app.utils.custom_exceptions import (
+    BadRequestException,
+    ForbiddenException,
+    NotFoundException,
+)
 from app.utils.convert import remove_private_attributes
 from uuid import UUID
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased
 from sqlalchemy.exc import SQLAlchemyError
 from app.schemas.transaction_schema import (
     TransactionCreate,
     TransactionOut,
     TransactionUpdate,
+    TransactionBatchSelection,
 )
+from app.models.asset_model import Asset as AssetModel
 from app.models.transaction_model import Transaction as TransactionModel
+from app.models.archived_transaction_model import transactions_with_archive
 from app.models.user_model import User as UserModel
 from app.models.portfolio_model import Portfolio as PortfolioModel, AssetType
 from datetime import datetime
+from app.utils.cache import cache, portfolio_scope, user_scope
+from app.utils.transaction_working_set import transaction_working_set
+from app.database.assets import intern_asset, provider_id, registered_symbol
+from app.database.outbox import record_change
+from app.database.sharding import merge_pages, scatter
 from app.utils.fetch_price import (
     fetch_crypto_price,
     fetch_stocks_price,
@@ -21,19 +45,109 @@ from app.utils.fetch_price import (
 )
 
 
+def to_transaction_out(transaction: TransactionModel) -> TransactionOut:
+    transaction_dict = remove_private_attributes(transaction)
+    # Names are read from the transaction's asset
+    transaction_dict["asset_name"] = transaction.asset_name
+    transaction_dict["ticker_symbol"] = transaction.ticker_symbol
+    return TransactionOut.model_validate(transaction_dict)
+
+
+def invalidate_transaction_caches(
+    portfolio_id: UUID,
+    user_id: UUID,
+    written: Sequence = (),
+    removed: Sequence[UUID] = (),
+) -> None:
+    # Everything cached from a portfolio's or user's transactions is keyed by
+    # the version of that scope, so bumping it drops all of it at once. The
+    # user's working set follows the written and removed transactions instead
+    cache.invalidate(portfolio_scope(portfolio_id), user_scope(user_id))
+    if written or removed:
+        transaction_working_set.apply(user_id, written, removed)
+
+
+def invalidate_batch_caches(rows) -> None:
+    # Rows are the (portfolio_id, user_id) pairs touched by a batch, every
+    # scope is bumped once however many of its transactions changed
+    scopes = set()
+    for portfolio_id, user_id in rows:
+        scopes.add(portfolio_scope(portfolio_id))
+        scopes.add(user_scope(user_id))
+    cache.invalidate(*scopes)
+
+
+# Hot path statements are built once with bound parameters and reused: their
+# cache key is memoized and their SQL compiled on first use, so later calls
+# skip statement construction, cache key generation and compilation
+select_transaction_by_id = select(TransactionModel).where(
+    TransactionModel.id == bindparam("transaction_id")
+)
+
+
+@lru_cache(maxsize=None)
+def transaction_listing_statements(
+    owner_column: Optional[str],
+    has_start_time: bool,
+    has_end_time: bool,
+    include_deleted: bool,
+) -> Tuple[Select, Select]:
+    """COUNT and page statements for one combination of listing filters."""
+    # Archived rows are all deleted or closed out, so the archive is only
+    # read when deleted rows are asked for
+    source = (
+        aliased(TransactionModel, transactions_with_archive())
+        if include_deleted
+        else TransactionModel
+    )
+    conditions = []
+    if owner_column is not None:
+        column = getattr(source, owner_column)
+        conditions.append(column == bindparam("owner_id"))
+    if has_start_time:
+        conditions.append(source.created_at >= bindparam("start_time"))
+    if has_end_time:
+        conditions.append(source.created_at <= bindparam("end_time"))
+    # Live rows are exactly the ones without a deletion stamp, which matches
+    # the predicate of the partial indexes on the table
+    if not include_deleted:
+        conditions.append(source.deleted_at.is_(None))
+
+    count_statement = select(func.count()).select_from(source)
+    count_statement = count_statement.where(*conditions)
+    # A missing skip or limit is bound as NULL, which Postgres treats as no
+    # offset and no limit
+    page_statement = (
+        select(source)
+        .where(*conditions)
+        .order_by(source.created_at.desc())
+        .offset(bindparam("skip", type_=Integer))
+        .limit(bindparam("limit", type_=Integer))
+    )
+    return count_statement, page_statement
+
+
 class TransactionController:
     @staticmethod
-    def create_transaction(
-        db: Session, transaction: TransactionCreate
-    ) -> TransactionOut:
+    def _get_transaction_model(db: Session, transaction_id: UUID) -> TransactionModel:
+        # The primary key is (id, created_at) on the partitioned table, so
+        # transactions are looked up by id alone through its index
+        return (
+            db.execute(select_transaction_by_id, {"transaction_id": transaction_id})
+            .scalars()
+            .first()
+        )
+
+    @staticmethod
+    def validate_transaction_create(db: Session, transaction: TransactionCreate):
         # Check if the user exists
-        db_user = db.query(UserModel).get(transaction.user_id)
+        db_user = db.get(UserModel, transaction.user_id)
 
         if db_user is None:
             raise NotFoundException("User not found")
 
         # Check if the portfolio exists
-        db_portfolio = db.query(PortfolioModel).get(transaction.portfolio_id)
+        db_portfolio = db.get(PortfolioModel, transaction.portfolio_id)
 
         if db_portfolio is None:
             raise NotFoundException("Portfolio not found")
@@ -44,6 +158,30 @@ class TransactionController:
                 "Transaction asset type does not match portfolio asset type"
             )
 
+        TransactionController.validate_ticker_symbol(
+            db,
+            transaction.asset_type,
+            transaction.asset_name,
+            transaction.ticker_symbol,
+        )
+
+    @staticmethod
+    def validate_ticker_symbol(
+        db: Session, asset_type: AssetType, asset_name: str, ticker_symbol: str
+    ):
+        # An asset keeps the ticker symbol it was registered with
+        symbol = registered_symbol(db.get_bind(), asset_type, asset_name)
+        if symbol is not None and symbol != ticker_symbol:
+            raise BadRequestException(
+                f"{asset_name} is registered with ticker symbol {symbol}"
+            )
+
+    @staticmethod
+    def create_transaction(
+        db: Session, transaction: TransactionCreate
+    ) -> TransactionOut:
+        TransactionController.validate_transaction_create(db, transaction)
+
         new_transaction = TransactionModel(
             note=transaction.note,
             transaction_type=transaction.transaction_type,
@@ -61,30 +199,44 @@ class TransactionController:
         db.add(new_transaction)
 
         try:
+            # Flushed for its id, the event is committed with the transaction
+            db.flush()
+            record_change(
+                db,
+                "transaction.created",
+                new_transaction.portfolio_id,
+                new_transaction.user_id,
+                transaction_ids=[new_transaction.id],
+            )
             db.commit()
             db.refresh(new_transaction)
         except SQLAlchemyError:
             db.rollback()
             raise BadRequestException("Failed to create transaction")
 
-        transaction_dict = remove_private_attributes(new_transaction)
-        transaction_out = TransactionOut.model_validate(transaction_dict)
+        invalidate_transaction_caches(
+            new_transaction.portfolio_id,
+            new_transaction.user_id,
+            written=[new_transaction],
+        )
+
+        transaction_out = to_transaction_out(new_transaction)
 
         return transaction_out
 
     @staticmethod
     def get_transaction_by_id(db: Session, transaction_id: UUID) -> TransactionOut:
-        transaction = db.query(TransactionModel).get(transaction_id)
+        transaction = TransactionController._get_transaction_model(db, transaction_id)
         if transaction is None:
             raise NotFoundException("Transaction not found")
-        transaction_dict = remove_private_attributes(transaction)
-        transaction_out = TransactionOut.model_validate(transaction_dict)
+        transaction_out = to_transaction_out(transaction)
         return transaction_out
 
     @staticmethod
     def _get_transactions(
         db: Session,
-        filter_condition: ClauseElement = None,
+        owner_column: Optional[str] = None,
+        owner_id: UUID = None,
         skip: int = None,
         limit: int = None,
         start_time: datetime = None,
@@ -92,44 +244,24 @@ class TransactionController:
         include_deleted: bool = False,
     ) -> Tuple[List[TransactionOut], int]:
         try:
-            if filter_condition is not None:
-                query = db.query(TransactionModel).filter(filter_condition)
-            else:
-                query = db.query(TransactionModel)
-
-            if start_time and end_time:
-                query = query.filter(
-                    TransactionModel.created_at.between(start_time, end_time)
-                )
-
-            if start_time and not end_time:
-                query = query.filter(TransactionModel.created_at >= start_time)
-
-            if end_time and not start_time:
-                query = query.filter(TransactionModel.created_at <= end_time)
-
-            if not include_deleted:
-                query = query.filter(
-                    or_(
-                        TransactionModel.deleted_at.is_(None),
-                        TransactionModel.deleted_at > datetime.utcnow(),
-                    )
-                )
-
-            total = query.count()
-
-            # if skip is None:
-            #     transactions = query.limit(limit).all()
-            # elif limit is None:
-            #     transactions = query.offset(skip).all()
-            # else:
-            #     transactions = query.offset(skip).limit(limit).all()
-            transactions = query.offset(skip).limit(limit).all()
+            count_statement, page_statement = transaction_listing_statements(
+                owner_column, bool(start_time), bool(end_time), include_deleted
+            )
+            parameters = {
+                "owner_id": owner_id,
+                "start_time": start_time,
+                "end_time": end_time,
+            }
+            total = db.execute(count_statement, parameters).scalar_one()
+
+            transactions = (
+                db.execute(page_statement, {**parameters, "skip": skip, "limit": limit})
+                .scalars()
+                .all()
+            )
             results = []
             for transaction in transactions:
-                transaction_dict = remove_private_attributes(transaction)
-                transaction_out = TransactionOut.model_validate(transaction_dict)
-                results.append(transaction_out)
+                results.append(to_transaction_out(transaction))
             return results, total
         except SQLAlchemyError:
             raise BadRequestException("Failed to retrieve transactions")
@@ -144,7 +276,38 @@ class TransactionController:
         include_deleted: bool = False,
     ) -> Tuple[List[TransactionOut], int]:
         return TransactionController._get_transactions(
-            db, None, skip, limit, start_time, end_time, include_deleted
+            db,
+            skip=skip,
+            limit=limit,
+            start_time=start_time,
+            end_time=end_time,
+            include_deleted=include_deleted,
+        )
+
+    @staticmethod
+    def get_all_transactions_from_shards(
+        sessions: Sequence[Session],
+        skip: int = 0,
+        limit: int = 10,
+        start_time: datetime = None,
+        end_time: datetime = None,
+        include_deleted: bool = False,
+    ) -> Tuple[List[TransactionOut], int]:
+        # Every shard lists its first skip + limit transactions, newest first,
+        # and the page is cut from their merge
+        pages = scatter(
+            sessions,
+            lambda db: TransactionController.get_all_transactions(
+                db,
+                skip=0,
+                limit=skip + limit,
+                start_time=start_time,
+                end_time=end_time,
+                include_deleted=include_deleted,
+            ),
+        )
+        return merge_pages(
+            pages, lambda transaction: transaction.created_at, skip, limit, True
         )
 
     @staticmethod
@@ -159,12 +322,13 @@ class TransactionController:
     ) -> Tuple[List[TransactionOut], int]:
         return TransactionController._get_transactions(
             db,
-            TransactionModel.user_id == user_id,
-            skip,
-            limit,
-            start_time,
-            end_time,
-            include_deleted,
+            owner_column="user_id",
+            owner_id=user_id,
+            skip=skip,
+            limit=limit,
+            start_time=start_time,
+            end_time=end_time,
+            include_deleted=include_deleted,
         )
 
     @staticmethod
@@ -179,12 +343,13 @@ class TransactionController:
     ) -> Tuple[List[TransactionOut], int]:
         return TransactionController._get_transactions(
             db,
-            TransactionModel.portfolio_id == portfolio_id,
-            skip,
-            limit,
-            start_time,
-            end_time,
-            include_deleted,
+            owner_column="portfolio_id",
+            owner_id=portfolio_id,
+            skip=skip,
+            limit=limit,
+            start_time=start_time,
+            end_time=end_time,
+            include_deleted=include_deleted,
         )
 
     @staticmethod
@@ -205,11 +370,24 @@ class TransactionController:
     def update_transaction_by_id(
         db: Session, transaction_id: UUID, transaction: TransactionUpdate
     ) -> TransactionOut:
-        db_transaction = db.query(TransactionModel).get(transaction_id)
+        db_transaction = TransactionController._get_transaction_model(
+            db, transaction_id
+        )
 
         if db_transaction is None:
             raise NotFoundException("Transaction not found")
 
+        # Ticker symbols belong to assets, one can only be given with the asset
+        if transaction.ticker_symbol and not transaction.asset_name:
+            raise BadRequestException("ticker_symbol requires asset_name")
+        if transaction.ticker_symbol:
+            TransactionController.validate_ticker_symbol(
+                db,
+                db_transaction.asset_type,
+                transaction.asset_name,
+                transaction.ticker_symbol,
+            )
+
         # Update the transaction attributes
         if transaction.note:
             db_transaction.note = transaction.note
@@ -227,6 +405,13 @@ class TransactionController:
             db_transaction.unit_price = transaction.unit_price
         if transaction.transaction_fee:
             db_transaction.transaction_fee = transaction.transaction_fee
+        record_change(
+            db,
+            "transaction.updated",
+            db_transaction.portfolio_id,
+            db_transaction.user_id,
+            transaction_ids=[transaction_id],
+        )
 
         try:
             db.commit()
@@ -235,37 +420,290 @@ class TransactionController:
             db.rollback()
             raise BadRequestException("Failed to update transaction")
 
-        transaction_dict = remove_private_attributes(db_transaction)
-        transaction_out = TransactionOut.model_validate(transaction_dict)
+        invalidate_transaction_caches(
+            db_transaction.portfolio_id,
+            db_transaction.user_id,
+            written=[db_transaction],
+            removed=[transaction_id],
+        )
+
+        transaction_out = to_transaction_out(db_transaction)
 
         return transaction_out
 
     @staticmethod
     def soft_delete_transaction_by_id(db: Session, transaction_id: UUID) -> str:
-        transaction = db.query(TransactionModel).get(transaction_id)
+        transaction = TransactionController._get_transaction_model(db, transaction_id)
         if transaction is None:
             raise NotFoundException("Transaction not found")
 
         transaction.deleted_at = datetime.utcnow()
+        portfolio_id, user_id = transaction.portfolio_id, transaction.user_id
+        record_change(
+            db,
+            "transaction.deleted",
+            portfolio_id,
+            user_id,
+            transaction_ids=[transaction_id],
+            hard=False,
+        )
 
         try:
             db.commit()
         except SQLAlchemyError:
             db.rollback()
             raise BadRequestException("Failed to delete transaction")
+
+        invalidate_transaction_caches(portfolio_id, user_id, removed=[transaction_id])
         return "Transaction deleted successfully"
 
     @staticmethod
     def delete_transaction_by_id(db: Session, transaction_id: UUID) -> str:
-        transaction = db.query(TransactionModel).get(transaction_id)
+        transaction = TransactionController._get_transaction_model(db, transaction_id)
         if transaction is None:
             raise NotFoundException("Transaction not found")
 
+        portfolio_id, user_id = transaction.portfolio_id, transaction.user_id
         db.delete(transaction)
+        record_change(
+            db,
+            "transaction.deleted",
+            portfolio_id,
+            user_id,
+            transaction_ids=[transaction_id],
+            hard=True,
+        )
 
         try:
             db.commit()
         except SQLAlchemyError:
             db.rollback()
             raise BadRequestException("Failed to delete transaction")
+
+        invalidate_transaction_caches(portfolio_id, user_id, removed=[transaction_id])
         return "Transaction hard deleted successfully"
+
+    @staticmethod
+    def _batch_condition(
+        db: Session, selection: TransactionBatchSelection, user_id: Optional[UUID]
+    ) -> ClauseElement:
+        # Transactions of other users are never matched when user_id is set,
+        # explicit ids are checked up front to report them instead
+        if (selection.ids is None) == (selection.filter is None):
+            raise BadRequestException("Provide either ids or a filter")
+
+        if selection.ids is not None:
+            ids = set(selection.ids)
+            found, foreign = (
+                db.query(
+                    func.count(),
+                    func.count().filter(TransactionModel.user_id != user_id),
+                )
+                .filter(TransactionModel.id.in_(ids))
+                .one()
+            )
+            if found != len(ids):
+                raise NotFoundException("Transaction not found")
+            if user_id is not None and foreign:
+                raise ForbiddenException
+            conditions = [TransactionModel.id.in_(ids)]
+        else:
+            batch_filter = selection.filter
+            conditions = []
+            if batch_filter.portfolio_id:
+                conditions.append(
+                    TransactionModel.portfolio_id == batch_filter.portfolio_id
+                )
+            if batch_filter.asset_name:
+                conditions.append(
+                    TransactionModel.asset_id.in_(
+                        select(AssetModel.id).where(
+                            AssetModel.provider_id
+                            == provider_id(batch_filter.asset_name)
+                        )
+                    )
+                )
+            if batch_filter.transaction_type:
+                conditions.append(
+                    TransactionModel.transaction_type == batch_filter.transaction_type
+                )
+            if batch_filter.start_time:
+                conditions.append(
+                    TransactionModel.created_at >= batch_filter.start_time
+                )
+            if batch_filter.end_time:
+                conditions.append(TransactionModel.created_at <= batch_filter.end_time)
+            # An empty filter would match every transaction, of every user
+            # for the admin endpoints
+            if not conditions:
+                raise BadRequestException(
+                    "Filter on a portfolio, asset, transaction type or time range"
+                )
+            if not batch_filter.include_deleted:
+                conditions.append(TransactionModel.deleted_at.is_(None))
+
+        if user_id is not None:
+            conditions.append(TransactionModel.user_id == user_id)
+        return and_(*conditions)
+
+    @staticmethod
+    def _batch_asset_id(
+        db: Session,
+        condition: ClauseElement,
+        asset_name: str,
+        ticker_symbol: Optional[str],
+    ) -> ClauseElement:
+        # The named asset is registered for every asset type among the rows,
+        # which each point to the one of their own type
+        asset_types = db.scalars(
+            select(TransactionModel.asset_type).where(condition).distinct()
+        ).all()
+        for asset_type in asset_types:
+            if ticker_symbol is not None:
+                TransactionController.validate_ticker_symbol(
+                    db, asset_type, asset_name, ticker_symbol
+                )
+        for asset_type in asset_types:
+            intern_asset(
+                db.get_bind(),
+                asset_type,
+                asset_name,
+                ticker_symbol or asset_name.upper(),
+            )
+        return (
+            select(AssetModel.id)
+            .where(
+                AssetModel.asset_type == TransactionModel.asset_type,
+                AssetModel.provider_id == provider_id(asset_name),
+            )
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    def _apply_batch(db: Session, statement, action: str, topic: str, **data) -> int:
+        statement = statement.returning(
+            TransactionModel.id, TransactionModel.portfolio_id, TransactionModel.user_id
+        ).execution_options(synchronize_session=False)
+        # One event per portfolio, committed with the batch
+        changed = defaultdict(list)
+        try:
+            rows = db.execute(statement).all()
+            for transaction_id, portfolio_id, user_id in rows:
+                changed[portfolio_id, user_id].append(transaction_id)
+            for (portfolio_id, user_id), transaction_ids in changed.items():
+                record_change(
+                    db,
+                    topic,
+                    portfolio_id,
+                    user_id,
+                    transaction_ids=transaction_ids,
+                    **data,
+                )
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            raise BadRequestException(f"Failed to {action} transactions")
+
+        invalidate_batch_caches(changed)
+        return len(rows)
+
+    @staticmethod
+    def update_transactions(
+        db: Session,
+        selection: TransactionBatchSelection,
+        transaction: TransactionUpdate,
+        user_id: Optional[UUID] = None,
+    ) -> int:
+        changes = transaction.model_dump(exclude_none=True)
+        if not changes:
+            raise BadRequestException("No changes to apply")
+        # Ticker symbols belong to assets, only the asset named can change, the
+        # rows may not share one otherwise
+        ticker_symbol = changes.pop("ticker_symbol", None)
+        asset_name = changes.pop("asset_name", None)
+        if ticker_symbol is not None and asset_name is None:
+            raise BadRequestException("ticker_symbol requires asset_name")
+        condition = TransactionController._batch_condition(db, selection, user_id)
+        if asset_name is not None:
+            changes["asset_id"] = TransactionController._batch_asset_id(
+                db, condition, asset_name, ticker_symbol
+            )
+        statement = (
+            update(TransactionModel)
+            .where(condition)
+            .values(**changes, updated_at=func.now())
+        )
+        return TransactionController._apply_batch(
+            db, statement, "update", "transaction.updated"
+        )
+
+    @staticmethod
+    def soft_delete_transactions(
+        db: Session,
+        selection: TransactionBatchSelection,
+        user_id: Optional[UUID] = None,
+    ) -> int:
+        condition = TransactionController._batch_condition(db, selection, user_id)
+        statement = (
+            update(TransactionModel)
+            .where(condition, TransactionModel.deleted_at.is_(None))
+            .values(deleted_at=datetime.utcnow())
+        )
+        return TransactionController._apply_batch(
+            db, statement, "delete", "transaction.deleted", hard=False
+        )
+
+    @staticmethod
+    def delete_transactions(db: Session, selection: TransactionBatchSelection) -> int:
+        condition = TransactionController._batch_condition(db, selection, None)
+        statement = delete(TransactionModel).where(condition)
+        return TransactionController._apply_batch(
+            db, statement, "delete", "transaction.deleted", hard=True
+        )
+
+    @staticmethod
+    def delete_transactions_from_shards(
+        sessions: Sequence[Session], selection: TransactionBatchSelection
+    ) -> int:
+        if selection.ids is None or len(sessions) == 1:
+            return sum(
+                scatter(
+                    sessions,
+                    lambda db: TransactionController.delete_transactions(db, selection),
+                )
+            )
+
+        # Every shard deletes the ids it holds, once all of them are found
+        ids = set(selection.ids)
+        found = scatter(
+            sessions,
+            lambda db: set(
+                db.scalars(
+                    select(TransactionModel.id).where(TransactionModel.id.in_(ids))
+                )
+            ),
+        )
+        if set().union(*found) != ids:
+            raise NotFoundException("Transaction not found")
+        return sum(
+            TransactionController.delete_transactions(
+                db, TransactionBatchSelection(ids=list(shard_ids))
+            )
+            for db, shard_ids in zip(sessions, found)
+            if shard_ids
+        )
+
+    @staticmethod
+    def delete_transaction_from_shards(
+        sessions: Sequence[Session], transaction_id: UUID
+    ) -> str:
+        found = scatter(
+            sessions,
+            lambda db: TransactionController._get_transaction_model(db, transaction_id),
+        )
+        for db, transaction in zip(sessions, found):
+            if transaction is not None:
+                return TransactionController.delete_transaction_by_id(
+                    db, transaction_id
+                )
+        raise NotFoundException("Transaction not found")
@@ -2,9 +2,11 @@ from typing import List
 from passlib.context import CryptContext
 from psycopg2.errors import UniqueViolation
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy import Integer, bindparam, select
 from sqlalchemy.orm import Session
 from app.schemas.user_schema import UserCreate, UserUpdate, UserOut
 from app.models.user_model import User as UserModel
+from app.database.sharding import copy_user_row, shard_router
 from app.utils.jwt import create_access_token
 from uuid import UUID
 import logging
@@ -22,6 +24,19 @@ logging.getLogger("passlib").setLevel(logging.ERROR)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+# Statements built once with bound parameters, so that their cache key and
+# SQL are only generated on first use
+select_user_by_id = select(UserModel).where(UserModel.id == bindparam("user_id"))
+select_user_by_username = select(UserModel).where(
+    UserModel.username == bindparam("username")
+)
+select_users = (
+    select(UserModel)
+    .offset(bindparam("skip", type_=Integer))
+    .limit(bindparam("limit", type_=Integer))
+)
+
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -30,10 +45,23 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def sync_shard_user(db: Session, user: UserModel) -> None:
+    # The shard of a user keeps a copy of its row for the foreign keys of its
+    # data, and the unique usernames and emails
+    with shard_router.user_session(user.id, db) as shard_db:
+        if shard_db is not db:
+            copy_user_row(user, shard_db)
+            shard_db.commit()
+
+
 class UserController:
     @staticmethod
     def authenticate_user(db: Session, username: str, password: str) -> Payload:
-        user = db.query(UserModel).filter(UserModel.username == username).first()
+        user = (
+            db.execute(select_user_by_username, {"username": username})
+            .scalars()
+            .first()
+        )
 
         if not user:
             raise NotFoundException("User not found. Please register")
@@ -67,6 +95,8 @@ class UserController:
         db.add(new_user)
 
         try:
+            db.flush()
+            sync_shard_user(db, new_user)
             db.commit()
             db.refresh(new_user)
         except IntegrityError as e:
@@ -86,7 +116,8 @@ class UserController:
 
     @staticmethod
     def get_user_by_id(db: Session, user_id: UUID) -> UserOut:
-        user = db.query(UserModel).get(user_id)
+        # Runs for every authenticated request
+        user = db.execute(select_user_by_id, {"user_id": user_id}).scalars().first()
         if user is None:
             raise NotFoundException("User not found")
         user_dict = remove_private_attributes(user)
@@ -96,7 +127,9 @@ class UserController:
     @staticmethod
     def get_users(db: Session, skip: int = 0, limit: int = 10) -> List[UserOut]:
         try:
-            users = db.query(UserModel).offset(skip).limit(limit).all()
+            users = (
+                db.execute(select_users, {"skip": skip, "limit": limit}).scalars().all()
+            )
             results = []
             for user in users:
                 user_dict = remove_private_attributes(user)
@@ -108,7 +141,7 @@ class UserController:
 
     @staticmethod
     def update_user_by_id(db: Session, user_id: UUID, user: UserUpdate) -> UserOut:
-        db_user = db.query(UserModel).get(user_id)
+        db_user = db.get(UserModel, user_id)
         if db_user is None:
             raise NotFoundException("User not found")
 
@@ -123,6 +156,8 @@ class UserController:
             db_user.role = user.role
 
         try:
+            db.flush()
+            sync_shard_user(db, db_user)
             db.commit()
             db.refresh(db_user)
         except IntegrityError as e:
@@ -138,12 +173,19 @@ class UserController:
 
     @staticmethod
     def delete_user_by_id(db: Session, user_id: UUID) -> str:
-        user = db.query(UserModel).get(user_id)
+        user = db.get(UserModel, user_id)
         if user is None:
             raise NotFoundException("User not found")
 
         db.delete(user)
         try:
+            # The data of the user goes with its row on its shard
+            with shard_router.user_session(user_id, db) as shard_db:
+                if shard_db is not db:
+                    shard_user = shard_db.get(UserModel, user_id)
+                    if shard_user is not None:
+                        shard_db.delete(shard_user)
+                        shard_db.commit()
             db.commit()
         except SQLAlchemyError:
             db.rollback()
@@ -0,0 +1,264 @@
+"""
+Archival of cold transactions out of the partitioned transactions table.
+
+Run from backend/core, e.g. daily, with: python -m app.database.archival
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from app.database.db_config import Base
+from app.database.partitioning import PARTITIONED_TABLE
+from app.database.sharding import shard_router
+from app.models.transaction_model import TransactionType
+
+load_dotenv()
+
+ARCHIVE_TABLE = "transactions_archive"
+# Soft deleted transactions are archived once deleted for that long
+TRANSACTION_ARCHIVE_RETENTION_DAYS = float(
+    os.getenv("TRANSACTION_ARCHIVE_RETENTION_DAYS") or 30
+)
+# Rows moved per database transaction, which holds their row locks only
+TRANSACTION_ARCHIVE_BATCH_SIZE = int(
+    os.getenv("TRANSACTION_ARCHIVE_BATCH_SIZE") or 1000
+)
+# Pause between batches, leaving room for the live traffic and replication
+TRANSACTION_ARCHIVE_BATCH_PAUSE_SECONDS = float(
+    os.getenv("TRANSACTION_ARCHIVE_BATCH_PAUSE_SECONDS") or 0.05
+)
+
+POSITION_COLUMNS = ("portfolio_id", "asset_id", "asset_type", "currency")
+
+
+class Position(NamedTuple):
+    portfolio_id: object
+    asset_id: int
+    asset_type: str
+    currency: str
+
+
+class TransactionStorage(NamedTuple):
+    rows: int
+    table_bytes: int
+    index_bytes: int
+
+
+class ArchiveReport(NamedTuple):
+    deleted_rows: int
+    closed_rows: int
+    before: TransactionStorage
+    after: TransactionStorage
+    archive: TransactionStorage
+
+
+def _columns() -> str:
+    return ", ".join(
+        column.name for column in Base.metadata.tables[PARTITIONED_TABLE].columns
+    )
+
+
+def move_batch(
+    connection: Connection,
+    condition: str,
+    parameters: dict,
+    reason: str,
+    batch_size: int,
+) -> int:
+    """
+    Move up to batch_size transactions matching condition to the archive, in
+    one statement. Rows locked by a concurrent write are skipped rather than
+    waited for, the next run picks them up.
+    """
+    columns = _columns()
+    result = connection.execute(
+        text(
+            f"WITH batch AS ("
+            f"SELECT id, created_at FROM {PARTITIONED_TABLE} WHERE {condition} "
+            f"LIMIT :batch_size FOR UPDATE SKIP LOCKED), "
+            f"moved AS (DELETE FROM {PARTITIONED_TABLE} AS hot USING batch "
+            f"WHERE hot.id = batch.id AND hot.created_at = batch.created_at "
+            f"RETURNING hot.*) "
+            f"INSERT INTO {ARCHIVE_TABLE} ({columns}, archive_reason) "
+            f"SELECT {columns}, :reason FROM moved"
+        ),
+        {**parameters, "batch_size": batch_size, "reason": reason},
+    )
+    return result.rowcount
+
+
+def archive_deleted_batch(
+    connection: Connection, deleted_before: datetime, batch_size: int
+) -> int:
+    return move_batch(
+        connection,
+        "deleted_at < :deleted_before",
+        {"deleted_before": deleted_before},
+        "deleted",
+        batch_size,
+    )
+
+
+def closed_positions(connection: Connection, closed_before: datetime) -> List[Position]:
+    """Positions netting to zero whose last live transaction is older than closed_before."""
+    inflows = ", ".join(
+        f"'{kind.name}'" for kind in (TransactionType.BUY, TransactionType.TRANSFER_IN)
+    )
+    position = ", ".join(POSITION_COLUMNS)
+    rows = connection.execute(
+        text(
+            f"SELECT {position} FROM {PARTITIONED_TABLE} "
+            f"WHERE deleted_at IS NULL GROUP BY {position} "
+            f"HAVING max(created_at) < :closed_before AND sum("
+            f"CASE WHEN transaction_type IN ({inflows}) THEN amount ELSE -amount END"
+            f") = 0"
+        ),
+        {"closed_before": closed_before},
+    )
+    return [Position(*row) for row in rows]
+
+
+def archive_closed_batch(
+    connection: Connection, position: Position, closed_before: datetime, batch_size: int
+) -> int:
+    # Only rows up to the check, a transaction added to the position since
+    # stays, and the rows moved still net to zero
+    condition = " AND ".join(f"{column} = :{column}" for column in POSITION_COLUMNS)
+    return move_batch(
+        connection,
+        f"{condition} AND deleted_at IS NULL AND created_at < :closed_before",
+        {**position._asdict(), "closed_before": closed_before},
+        "closed",
+        batch_size,
+    )
+
+
+def transaction_storage(
+    connection: Connection, table: str = PARTITIONED_TABLE
+) -> TransactionStorage:
+    """Rows, and bytes on disk of the table and of its indexes, across partitions."""
+    rows = connection.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    table_bytes, index_bytes = connection.execute(
+        text(
+            "SELECT coalesce(sum(pg_relation_size(relid)), 0), "
+            "coalesce(sum(pg_indexes_size(relid)), 0) "
+            "FROM (SELECT relid FROM pg_partition_tree(to_regclass(:table)) "
+            "UNION SELECT to_regclass(:table)) AS tree"
+        ),
+        {"table": table},
+    ).one()
+    return TransactionStorage(rows, int(table_bytes), int(index_bytes))
+
+
+def archive_transactions(
+    engine: Engine,
+    retention_days: float = TRANSACTION_ARCHIVE_RETENTION_DAYS,
+    closed_before: Optional[datetime] = None,
+    batch_size: int = TRANSACTION_ARCHIVE_BATCH_SIZE,
+    pause_seconds: float = TRANSACTION_ARCHIVE_BATCH_PAUSE_SECONDS,
+    vacuum: bool = False,
+) -> ArchiveReport:
+    """
+    Move soft deleted transactions older than the retention window, and the
+    transactions of positions closed before closed_before when given, to the
+    archive.
+
+    Every batch is its own short database transaction, so the table is never
+    locked and writes to other rows carry on. With vacuum, the table is
+    vacuumed afterwards for the space of the moved rows to be reused.
+    """
+    with engine.connect() as connection:
+        before = transaction_storage(connection)
+
+    def run_batches(move) -> int:
+        moved = 0
+        while True:
+            with engine.begin() as connection:
+                count = move(connection)
+            moved += count
+            if count < batch_size:
+                return moved
+            time.sleep(pause_seconds)
+
+    deleted_before = datetime.utcnow() - timedelta(days=retention_days)
+    deleted_rows = run_batches(
+        lambda connection: archive_deleted_batch(connection, deleted_before, batch_size)
+    )
+
+    closed_rows = 0
+    if closed_before is not None:
+        with engine.connect() as connection:
+            positions = closed_positions(connection, closed_before)
+        for position in positions:
+            closed_rows += run_batches(
+                lambda connection: archive_closed_batch(
+                    connection, position, closed_before, batch_size
+                )
+            )
+
+    if vacuum:
+        with engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            connection.execute(text(f"VACUUM {PARTITIONED_TABLE}"))
+
+    with engine.connect() as connection:
+        after = transaction_storage(connection)
+        archive = transaction_storage(connection, ARCHIVE_TABLE)
+    return ArchiveReport(deleted_rows, closed_rows, before, after, archive)
+
+
+def format_storage(storage: TransactionStorage) -> str:
+    return (
+        f"{storage.rows:,} rows, {storage.table_bytes / 2**20:,.1f} MiB of table, "
+        f"{storage.index_bytes / 2**20:,.1f} MiB of indexes"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--retention-days",
+        type=float,
+        default=TRANSACTION_ARCHIVE_RETENTION_DAYS,
+        help="archive soft deleted transactions deleted for longer than this",
+    )
+    parser.add_argument(
+        "--closed-for-days",
+        type=float,
+        help="also archive positions closed out for longer than this",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=TRANSACTION_ARCHIVE_BATCH_SIZE
+    )
+    parser.add_argument(
+        "--vacuum", action="store_true", help="vacuum the transactions table afterwards"
+    )
+    args = parser.parse_args()
+
+    closed_before = None
+    if args.closed_for_days is not None:
+        closed_before = datetime.utcnow() - timedelta(days=args.closed_for_days)
+    for name, shard in shard_router.shards.items():
+        report = archive_transactions(
+            shard.engine,
+            retention_days=args.retention_days,
+            closed_before=closed_before,
+            batch_size=args.batch_size,
+            vacuum=args.vacuum,
+        )
+        print(
+            f"{name}: archived {report.deleted_rows:,} deleted and {report.closed_rows:,} closed out transactions"
+        )
+        print(f"transactions before: {format_storage(report.before)}")
+        print(f"transactions after:  {format_storage(report.after)}")
+        print(f"archive:             {format_storage(report.archive)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import threading
+from typing import Dict, Optional, Tuple, Union
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection, Engine
+from app.database.base import Base
+from app.database.partitioning import PARTITIONED_TABLE
+
+# Every asset held is a row of the assets table, which transactions refer to
+# by its integer id instead of repeating its names on each row. An asset is
+# identified by its type and its id at the price provider, the lowercased
+# asset name, e.g. bitcoin on CoinGecko.
+ASSETS_TABLE = "assets"
+ARCHIVE_TABLE = "transactions_archive"
+# Decimal places amounts of an asset are kept to, by asset type name
+DEFAULT_DECIMALS = {"CRYPTO": 8, "STOCKS": 4, "OTHERS": 2}
+
+# Ids handed out by each database, for the life of the process
+_asset_ids: Dict[Tuple[str, str, str], int] = {}
+# Symbols are never changed once registered
+_asset_symbols: Dict[Tuple[str, str, str], str] = {}
+_asset_ids_lock = threading.Lock()
+
+
+def provider_id(asset_name: str) -> str:
+    return asset_name.lower()
+
+
+def intern_asset(
+    bind: Union[Engine, Connection], asset_type, asset_name: str, ticker_symbol: str
+) -> int:
+    """
+    Id of an asset in the database of bind, registering it on first sight
+    with ticker_symbol as its symbol.
+
+    Assets are registered in a database transaction of their own, committed
+    at once, so an id stays valid when the caller's transaction is rolled
+    back and can be remembered by the process.
+    """
+    engine = bind.engine
+    key = (str(engine.url), asset_type.name, provider_id(asset_name))
+    asset_id = _asset_ids.get(key)
+    if asset_id is not None:
+        return asset_id
+
+    assets = Base.metadata.tables[ASSETS_TABLE]
+    values = {
+        "symbol": ticker_symbol,
+        "provider_id": provider_id(asset_name),
+        "asset_type": asset_type,
+        "decimals": DEFAULT_DECIMALS[asset_type.name],
+    }
+    # A concurrent registration makes the insert wait for it and do nothing,
+    # the select then sees the committed row
+    with engine.begin() as connection:
+        asset_id = connection.execute(
+            insert(assets)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=["asset_type", "provider_id"])
+            .returning(assets.c.id)
+        ).scalar()
+        if asset_id is None:
+            asset_id = connection.execute(
+                select(assets.c.id).where(
+                    assets.c.asset_type == asset_type,
+                    assets.c.provider_id == values["provider_id"],
+                )
+            ).scalar_one()
+    with _asset_ids_lock:
+        _asset_ids[key] = asset_id
+    return asset_id
+
+
+def registered_symbol(
+    bind: Union[Engine, Connection], asset_type, asset_name: str
+) -> Optional[str]:
+    """
+    Ticker symbol an asset is registered with in the database of bind, None
+    when it has not been registered yet.
+    """
+    engine = bind.engine
+    key = (str(engine.url), asset_type.name, provider_id(asset_name))
+    symbol = _asset_symbols.get(key)
+    if symbol is not None:
+        return symbol
+
+    assets = Base.metadata.tables[ASSETS_TABLE]
+    with engine.connect() as connection:
+        symbol = connection.execute(
+            select(assets.c.symbol).where(
+                assets.c.asset_type == asset_type,
+                assets.c.provider_id == provider_id(asset_name),
+            )
+        ).scalar()
+    if symbol is not None:
+        with _asset_ids_lock:
+            _asset_symbols[key] = symbol
+    return symbol
+
+
+def has_asset_names(connection: Connection, table: str) -> bool:
+    """Whether table still stores asset names rather than asset ids."""
+    return (
+        connection.execute(
+            text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_schema = current_schema() "
+                "AND table_name = :table AND column_name = 'asset_name'"
+            ),
+            {"table": table},
+        ).first()
+        is not None
+    )
+
+
+def migrate_to_asset_ids(engine: Engine) -> None:
+    """
+    Replace the asset_name and ticker_symbol columns of the transactions and
+    archive tables with an asset_id, registering every distinct asset found
+    under the greatest of its ticker symbols. Runs in a single database
+    transaction, on tables that have not been migrated yet.
+
+    Dropped columns only stop taking space as rows are rewritten, so run
+    VACUUM FULL on the tables afterwards to get it back at once.
+    """
+    decimals = " ".join(
+        f"WHEN '{asset_type}' THEN {places}"
+        for asset_type, places in DEFAULT_DECIMALS.items()
+    )
+    with engine.begin() as connection:
+        for table in (PARTITIONED_TABLE, ARCHIVE_TABLE):
+            if not has_asset_names(connection, table):
+                continue
+            connection.execute(
+                text(
+                    f"INSERT INTO {ASSETS_TABLE} "
+                    "(symbol, provider_id, asset_type, decimals) "
+                    "SELECT max(ticker_symbol), lower(asset_name), asset_type, "
+                    f"CASE asset_type::text {decimals} END FROM {table} "
+                    "GROUP BY lower(asset_name), asset_type "
+                    "ON CONFLICT (asset_type, provider_id) DO NOTHING"
+                )
+            )
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table} ADD COLUMN asset_id integer "
+                    f"REFERENCES {ASSETS_TABLE} (id)"
+                )
+            )
+            connection.execute(
+                text(
+                    f"UPDATE {table} SET asset_id = {ASSETS_TABLE}.id "
+                    f"FROM {ASSETS_TABLE} "
+                    f"WHERE {ASSETS_TABLE}.asset_type = {table}.asset_type "
+                    f"AND {ASSETS_TABLE}.provider_id = lower({table}.asset_name)"
+                )
+            )
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table} ALTER COLUMN asset_id SET NOT NULL, "
+                    "DROP COLUMN asset_name, DROP COLUMN ticker_symbol"
+                )
+            )
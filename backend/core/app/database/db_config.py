@@ -3,7 +3,14 @@ from sqlalchemy.orm import sessionmaker
 import psycopg2
 import os
 from dotenv import load_dotenv
+from app.database.assets import migrate_to_asset_ids
 from app.database.base import Base
+from app.database.fixed_point import migrate_to_fixed_point
+from app.database.partitioning import (
+    convert_to_partitioned,
+    ensure_transaction_partitions,
+    is_partitioned,
+)
 import importlib
 
 
@@ -55,7 +62,17 @@ def init_engine_and_session(user, password, host, port, db_name):
 
 
 def init_db(engine):
-    model_names = ["user_model", "portfolio_model", "transaction_model"]
+    model_names = [
+        "user_model",
+        "portfolio_model",
+        "asset_model",
+        "transaction_model",
+        "job_model",
+        "revoked_token_model",
+        "archived_transaction_model",
+        "outbox_event_model",
+        "price_alert_model",
+    ]
     models = []
 
     for model_name in model_names:
@@ -64,6 +81,19 @@ def init_db(engine):
 
     try:
         Base.metadata.create_all(bind=engine)
+        # Before any conversion, which copies the columns of the model
+        migrate_to_asset_ids(engine)
+        migrate_to_fixed_point(engine)
+        with engine.connect() as connection:
+            transactions_partitioned = is_partitioned(connection)
+        if not transactions_partitioned:
+            convert_to_partitioned(engine)
+        ensure_transaction_partitions(engine)
+        # create_all skips tables that already exist, so add indexes declared
+        # after the table was first created
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
     except Exception as e:
         print(f"Could not create database tables: {e}")
         exit(1)
@@ -0,0 +1,76 @@
+from decimal import Decimal
+from typing import Optional, Union
+from sqlalchemy import BigInteger, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.types import TypeDecorator
+from app.database.assets import ARCHIVE_TABLE
+from app.database.partitioning import PARTITIONED_TABLE
+
+# Amounts, unit prices and fees are stored as integers counting units of
+# 10^-8, a satoshi, so that sums of them are exact and run at the speed of
+# sums of floats. Values go up to FIXED_POINT_MAX, about 92 billion, the
+# schemas reject larger ones.
+FIXED_POINT_DECIMALS = 8
+FIXED_POINT_SCALE = 10**FIXED_POINT_DECIMALS
+FIXED_POINT_MAX = (2**63 - 1) // FIXED_POINT_SCALE
+FIXED_POINT_COLUMNS = ("amount", "unit_price", "transaction_fee")
+
+
+def to_units(value: Union[float, int, Decimal]) -> int:
+    if isinstance(value, Decimal):
+        return int(value.scaleb(FIXED_POINT_DECIMALS).to_integral_value())
+    return round(value * FIXED_POINT_SCALE)
+
+
+def from_units(units: Union[int, Decimal]) -> float:
+    # True division of integers is correctly rounded, whatever their size
+    return int(units) / FIXED_POINT_SCALE
+
+
+class FixedPoint(TypeDecorator):
+    """A decimal number stored as a count of units, read and written as float."""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect) -> Optional[int]:
+        return None if value is None else to_units(value)
+
+    def process_result_value(self, value, dialect) -> Optional[float]:
+        # Sums of bigint columns come back as numeric
+        return None if value is None else from_units(value)
+
+
+def float_columns(connection: Connection, table: str) -> list:
+    rows = connection.execute(
+        text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table "
+            "AND data_type = 'double precision'"
+        ),
+        {"table": table},
+    )
+    return [row[0] for row in rows if row[0] in FIXED_POINT_COLUMNS]
+
+
+def migrate_to_fixed_point(engine: Engine) -> None:
+    """
+    Convert the float amount, unit price and fee columns of the transactions
+    and archive tables to fixed point, rounding to the nearest unit. Runs in
+    a single database transaction, on columns not converted yet.
+    """
+    with engine.begin() as connection:
+        for table in (PARTITIONED_TABLE, ARCHIVE_TABLE):
+            columns = float_columns(connection, table)
+            if not columns:
+                continue
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table} "
+                    + ", ".join(
+                        f"ALTER COLUMN {column} TYPE bigint "
+                        f"USING round({column} * {FIXED_POINT_SCALE})::bigint"
+                        for column in columns
+                    )
+                )
+            )
@@ -0,0 +1,345 @@
+"""
+Change stream of portfolios and transactions, through a transactional outbox.
+
+Every mutation adds an event to the outbox_events table in the database
+transaction of the mutation itself, with record_change, so an event exists
+exactly when its change is committed. A relay in each worker, of which one
+at a time does the work, then publishes the pending events in the order
+they were written: it gives them consecutive positions and sends each with
+NOTIFY on OUTBOX_CHANNEL, in one database transaction, so positions are
+given and notifications delivered at its commit, together and in order.
+
+Each worker runs a subscriber that LISTENs to the channel and drops its local
+caches of the changed portfolio and user. A subscriber that sees a position
+skipped, or lost its connection, reads the events it missed from the table,
+so every event is handled at least once and in position order. Events stay
+in the table for OUTBOX_RETENTION_HOURS after publication, and those not yet
+published when the workers stop are published once a relay runs again.
+
+Other consumers can follow the stream the same way, from the table and the
+channel, by position.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import Callable, Iterable, List, NamedTuple, Optional
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, func, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from app.models.outbox_event_model import OutboxEvent
+from app.utils.cache import cache, portfolio_scope, user_scope
+
+load_dotenv()
+
+OUTBOX_CHANNEL = "outbox_events"
+# How often each worker's relay looks for events to publish
+OUTBOX_RELAY_POLL_SECONDS = float(os.getenv("OUTBOX_RELAY_POLL_SECONDS") or 0.2)
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE") or 500)
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS") or 24)
+# Idle subscribers check their connection and the table that often
+OUTBOX_SUBSCRIBER_IDLE_SECONDS = float(
+    os.getenv("OUTBOX_SUBSCRIBER_IDLE_SECONDS") or 30
+)
+OUTBOX_RECONNECT_SECONDS = 1.0
+
+# Serializes the relays of all workers, so positions follow publication
+RELAY_LOCK_KEY = 0x6F757462
+PURGE_INTERVAL_SECONDS = 3600
+
+
+class ChangeEvent(NamedTuple):
+    position: int
+    topic: str
+    portfolio_id: UUID
+    user_id: UUID
+    origin: str
+
+
+def process_origin() -> str:
+    # Taken at each write rather than at import, as forked workers share
+    # what was imported before the fork
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def record_change(
+    db: Session, topic: str, portfolio_id: UUID, user_id: UUID, **data
+) -> None:
+    """Add an event to the session, committed or rolled back with the change."""
+    db.add(
+        OutboxEvent(
+            topic=topic,
+            portfolio_id=portfolio_id,
+            user_id=user_id,
+            origin=process_origin(),
+            # Ids as strings
+            data=json.loads(json.dumps(data, default=str)),
+        )
+    )
+
+
+select_pending_events = (
+    select(
+        OutboxEvent.id,
+        OutboxEvent.topic,
+        OutboxEvent.portfolio_id,
+        OutboxEvent.user_id,
+        OutboxEvent.origin,
+    )
+    .where(OutboxEvent.position.is_(None))
+    .order_by(OutboxEvent.id)
+    .limit(bindparam("limit"))
+)
+publish_event = (
+    update(OutboxEvent)
+    .where(OutboxEvent.id == bindparam("event_id"))
+    .values(position=bindparam("event_position"), published_at=func.now())
+)
+select_events_after = (
+    select(
+        OutboxEvent.position,
+        OutboxEvent.topic,
+        OutboxEvent.portfolio_id,
+        OutboxEvent.user_id,
+        OutboxEvent.origin,
+    )
+    .where(OutboxEvent.position > bindparam("position"))
+    .order_by(OutboxEvent.position)
+)
+select_last_position = select(func.coalesce(func.max(OutboxEvent.position), 0))
+
+
+def notification_payload(event: ChangeEvent) -> str:
+    return json.dumps(
+        {
+            "position": event.position,
+            "topic": event.topic,
+            "portfolio_id": str(event.portfolio_id),
+            "user_id": str(event.user_id),
+            "origin": event.origin,
+        }
+    )
+
+
+def parse_notification(payload: str) -> ChangeEvent:
+    fields = json.loads(payload)
+    return ChangeEvent(
+        position=fields["position"],
+        topic=fields["topic"],
+        portfolio_id=UUID(fields["portfolio_id"]),
+        user_id=UUID(fields["user_id"]),
+        origin=fields["origin"],
+    )
+
+
+def publish_batch(connection: Connection, batch_size: int) -> int:
+    """
+    Publish up to batch_size pending events in the open transaction, unless
+    another relay is at it. Returns the events published.
+    """
+    locked = connection.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": RELAY_LOCK_KEY}
+    ).scalar()
+    if not locked:
+        return 0
+    rows = connection.execute(select_pending_events, {"limit": batch_size}).all()
+    if not rows:
+        return 0
+    last_position = connection.execute(select_last_position).scalar()
+    events = [
+        ChangeEvent(last_position + offset, *row[1:])
+        for offset, row in enumerate(rows, start=1)
+    ]
+    connection.execute(
+        publish_event,
+        [
+            {"event_id": row.id, "event_position": event.position}
+            for row, event in zip(rows, events)
+        ],
+    )
+    # Queued until the commit, then delivered in the order sent
+    connection.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        [
+            {"channel": OUTBOX_CHANNEL, "payload": notification_payload(event)}
+            for event in events
+        ],
+    )
+    return len(events)
+
+
+def purge_published(connection: Connection, retention_hours: float) -> int:
+    # The last event is kept, it holds the position the next ones follow
+    result = connection.execute(
+        text(
+            "DELETE FROM outbox_events "
+            "WHERE published_at < now() - :hours * interval '1 hour' "
+            "AND position < (SELECT max(position) FROM outbox_events)"
+        ),
+        {"hours": retention_hours},
+    )
+    return result.rowcount
+
+
+class OutboxRelay:
+    """Publishes the pending events of the outbox of one database."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        poll_seconds: float = OUTBOX_RELAY_POLL_SECONDS,
+        batch_size: int = OUTBOX_RELAY_BATCH_SIZE,
+        retention_hours: float = OUTBOX_RETENTION_HOURS,
+    ):
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.retention_hours = retention_hours
+        self.published = 0
+        self._purged_at = 0.0
+
+    def publish_pending(self) -> int:
+        published = 0
+        while True:
+            with self.engine.begin() as connection:
+                batch = publish_batch(connection, self.batch_size)
+            published += batch
+            if batch < self.batch_size:
+                break
+        self.published += published
+        if time.monotonic() - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            with self.engine.begin() as connection:
+                purge_published(connection, self.retention_hours)
+            self._purged_at = time.monotonic()
+        return published
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.publish_pending)
+            except Exception as e:
+                print(f"Could not publish outbox events: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+
+def invalidate_changed_caches(event: ChangeEvent) -> None:
+    # The writing worker bumped the shared versions already, if any
+    cache.invalidate_local(
+        portfolio_scope(event.portfolio_id), user_scope(event.user_id)
+    )
+
+
+class ChangeSubscriber:
+    """
+    Follows the change stream of one database in a worker, handing every
+    event made by other processes to handle, in position order.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        handle: Callable[[ChangeEvent], None] = invalidate_changed_caches,
+        idle_seconds: float = OUTBOX_SUBSCRIBER_IDLE_SECONDS,
+    ):
+        self.engine = engine
+        self.handle = handle
+        self.idle_seconds = idle_seconds
+        # Of the last event seen, None until the first connection
+        self.position: Optional[int] = None
+        self.handled = 0
+        self.replayed = 0
+
+    def deliver(self, events: Iterable[ChangeEvent]) -> None:
+        origin = process_origin()
+        for event in events:
+            # Seen already, through a replay or a notification
+            if event.position <= self.position:
+                continue
+            self.position = event.position
+            if event.origin != origin:
+                self.handle(event)
+                self.handled += 1
+
+    def catch_up(self) -> None:
+        """Deliver the events published since the last one seen."""
+        with self.engine.connect() as connection:
+            if self.position is None:
+                # Nothing is cached yet, the stream is followed from here on
+                self.position = connection.execute(select_last_position).scalar()
+                return
+            events = [
+                ChangeEvent(*row)
+                for row in connection.execute(
+                    select_events_after, {"position": self.position}
+                )
+            ]
+        self.replayed += len(events)
+        self.deliver(events)
+
+    def receive(self, payloads: Iterable[str]) -> None:
+        """Deliver notified events, reading the table when some were missed."""
+        for payload in payloads:
+            event = parse_notification(payload)
+            if event.position > self.position + 1:
+                self.catch_up()
+            self.deliver([event])
+
+    def _connect(self):
+        # A connection of its own for the life of the subscription, taken out
+        # of the pool
+        connection = self.engine.raw_connection()
+        driver_connection = connection.driver_connection
+        connection.detach()
+        driver_connection.autocommit = True
+        with driver_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {OUTBOX_CHANNEL}")
+        return driver_connection
+
+    @staticmethod
+    def _drain(connection) -> List[str]:
+        connection.poll()
+        payloads = [notification.payload for notification in connection.notifies]
+        connection.notifies.clear()
+        return payloads
+
+    def _check(self, connection) -> None:
+        # A query fails when the connection was lost without a word
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.catch_up()
+
+    async def _listen(self, connection) -> None:
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(connection.fileno(), readable.set)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(readable.wait(), self.idle_seconds)
+                except asyncio.TimeoutError:
+                    await asyncio.to_thread(self._check, connection)
+                readable.clear()
+                payloads = self._drain(connection)
+                if payloads:
+                    await asyncio.to_thread(self.receive, payloads)
+        finally:
+            loop.remove_reader(connection.fileno())
+
+    async def run(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = await asyncio.to_thread(self._connect)
+                # Listening first, so that nothing falls between the two
+                await asyncio.to_thread(self.catch_up)
+                await self._listen(connection)
+            except Exception as e:
+                print(f"Change stream subscription lost: {e}")
+            finally:
+                if connection is not None:
+                    connection.close()
+            await asyncio.sleep(OUTBOX_RECONNECT_SECONDS)
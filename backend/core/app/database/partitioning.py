@@ -0,0 +1,231 @@
+import asyncio
+from datetime import date, datetime
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from app.database.base import Base
+
+# The transactions table is range partitioned by month on created_at. Every
+# month gets its own partition named after it, and a default partition catches
+# rows outside of the months created so far.
+PARTITIONED_TABLE = "transactions"
+DEFAULT_PARTITION = f"{PARTITIONED_TABLE}_default"
+PARTITION_MONTHS_AHEAD = 3
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = 24 * 60 * 60
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITIONED_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    prefix = f"{PARTITIONED_TABLE}_y"
+    if not name.startswith(prefix):
+        return None
+    year, _, month = name[len(prefix) :].partition("m")
+    try:
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+def is_partitioned(connection: Connection) -> bool:
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": PARTITIONED_TABLE},
+    ).scalar()
+    return relkind == "p"
+
+
+def list_partitions(connection: Connection) -> List[str]:
+    rows = connection.execute(
+        text("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(:table)
+            ORDER BY child.relname
+            """),
+        {"table": PARTITIONED_TABLE},
+    )
+    return [row[0] for row in rows]
+
+
+def _create_default_partition(connection: Connection) -> None:
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} "
+            f"PARTITION OF {PARTITIONED_TABLE} DEFAULT"
+        )
+    )
+
+
+def _create_month_partition(connection: Connection, month: date) -> None:
+    name = partition_name(month)
+    bounds = {"lower": month, "upper": add_months(month, 1)}
+    create_partition = text(
+        f"CREATE TABLE {name} PARTITION OF {PARTITIONED_TABLE} "
+        f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"
+    )
+
+    # Postgres refuses to create a partition while the default partition holds
+    # rows for its range, so those rows are moved over as part of the creation
+    stranded = connection.execute(
+        text(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+            "WHERE created_at >= :lower AND created_at < :upper)"
+        ),
+        bounds,
+    ).scalar()
+    if not stranded:
+        connection.execute(create_partition)
+        return
+
+    connection.execute(
+        text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    )
+    connection.execute(create_partition)
+    connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE created_at >= :lower AND created_at < :upper RETURNING *) "
+            f"INSERT INTO {PARTITIONED_TABLE} SELECT * FROM moved"
+        ),
+        bounds,
+    )
+    connection.execute(
+        text(
+            f"ALTER TABLE {PARTITIONED_TABLE} "
+            f"ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"
+        )
+    )
+
+
+def create_partitions(
+    connection: Connection, first_month: date, last_month: date
+) -> List[str]:
+    """Create the monthly partitions from first_month to last_month inclusive."""
+    _create_default_partition(connection)
+    existing = set(list_partitions(connection))
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        if partition_name(month) not in existing:
+            _create_month_partition(connection, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def ensure_transaction_partitions(
+    engine: Engine,
+    months_ahead: int = PARTITION_MONTHS_AHEAD,
+    now: Optional[datetime] = None,
+) -> List[str]:
+    """Create the partitions for the current month and the next months_ahead."""
+    current = month_start(now or datetime.utcnow())
+    with engine.begin() as connection:
+        return create_partitions(connection, current, add_months(current, months_ahead))
+
+
+async def maintain_transaction_partitions(
+    engine: Engine,
+    interval_seconds: float = PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+) -> None:
+    """Keep creating future partitions for as long as the app is running."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(ensure_transaction_partitions, engine)
+        except Exception as e:
+            print(f"Could not create transaction partitions: {e}")
+
+
+def convert_to_partitioned(engine: Engine) -> None:
+    """
+    Rebuild a plain transactions table as a partitioned one.
+
+    The existing rows are copied into monthly partitions covering their
+    created_at range, all inside a single database transaction.
+    """
+    table = Base.metadata.tables[PARTITIONED_TABLE]
+    legacy_table = f"{PARTITIONED_TABLE}_unpartitioned"
+    columns = ", ".join(column.name for column in table.columns)
+
+    with engine.begin() as connection:
+        connection.execute(
+            text(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO {legacy_table}")
+        )
+
+        # Index and key names are schema wide, drop them so the partitioned
+        # table can be created with the names declared on the model
+        constraints = connection.execute(
+            text(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = to_regclass(:table) AND contype IN ('p', 'u')"
+            ),
+            {"table": legacy_table},
+        ).fetchall()
+        for (constraint,) in constraints:
+            connection.execute(
+                text(f'ALTER TABLE {legacy_table} DROP CONSTRAINT "{constraint}"')
+            )
+        indexes = connection.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = :table"),
+            {"table": legacy_table},
+        ).fetchall()
+        for (index,) in indexes:
+            connection.execute(text(f'DROP INDEX "{index}"'))
+
+        table.create(bind=connection, checkfirst=True)
+
+        first, last = connection.execute(
+            text(f"SELECT min(created_at), max(created_at) FROM {legacy_table}")
+        ).one()
+        if first is not None:
+            create_partitions(connection, month_start(first), month_start(last))
+        else:
+            _create_default_partition(connection)
+
+        connection.execute(
+            text(
+                f"INSERT INTO {PARTITIONED_TABLE} ({columns}) "
+                f"SELECT {columns} FROM {legacy_table}"
+            )
+        )
+        connection.execute(text(f"DROP TABLE {legacy_table}"))
+
+
+def detach_partitions_before(
+    connection: Connection, cutoff: datetime, archive_schema: Optional[str] = None
+) -> List[str]:
+    """
+    Detach every monthly partition that only holds rows older than cutoff.
+
+    Detached partitions stay around as plain tables, moved into archive_schema
+    when given, so they can be dumped or dropped independently of the live data.
+    """
+    cutoff_month = month_start(cutoff)
+    detached = []
+    if archive_schema:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+    for name in list_partitions(connection):
+        month = partition_month(name)
+        if month is None or add_months(month, 1) > cutoff_month:
+            continue
+        connection.execute(
+            text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}")
+        )
+        if archive_schema:
+            connection.execute(text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}"))
+        detached.append(name)
+    return detached
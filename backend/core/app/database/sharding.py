@@ -0,0 +1,380 @@
+"""
+Sharding of the user data across PostgreSQL databases, by user.
+
+The database of POSTGRES_DB is the directory: it holds every user, which is
+all that signing in and checking tokens need. The portfolios, transactions,
+archived transactions and jobs of a user live on one shard, picked by
+consistent hashing of the user id, next to a copy of the user row for the
+foreign keys. The directory can be one of the shards.
+
+With POSTGRES_SHARDS unset there is a single shard, the directory itself,
+and nothing changes.
+
+Moving users after shards are added or removed, run from backend/core while
+the users moved are not writing, before deploying the new POSTGRES_SHARDS:
+
+    python -m app.database.sharding --from db_a,db_b --to db_a,db_b,db_c
+"""
+
+import argparse
+import bisect
+import hashlib
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session, sessionmaker
+from app.database import db_config
+from app.database.assets import ASSETS_TABLE, intern_asset
+from app.database.base import Base
+from app.database.partitioning import (
+    PARTITIONED_TABLE,
+    create_partitions,
+    month_start,
+)
+from app.utils.cache import LRUCache
+from app.utils.custom_exceptions import CredentialsException
+from app.utils.jwt import decode_access_token
+
+load_dotenv()
+
+# Databases holding the user data, on the server of POSTGRES_HOST, e.g.
+# "portfolio_0,portfolio_1"; unset keeps everything in POSTGRES_DB
+POSTGRES_SHARDS = [
+    name.strip()
+    for name in (os.getenv("POSTGRES_SHARDS") or "").split(",")
+    if name.strip()
+]
+# Points of every shard on the hash ring, more spread the users more evenly
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES") or 256)
+# Users of the refresh tokens seen lately, so the signature of a token is
+# checked once a minute rather than on every request
+TOKEN_USER_TTL_SECONDS = 60
+
+# Tables holding the data of a user on its shard, parents first, with the
+# column of the owner
+USER_TABLES = (
+    ("users", "id"),
+    ("portfolios", "user_id"),
+    (PARTITIONED_TABLE, "user_id"),
+    ("transactions_archive", "user_id"),
+    ("jobs", "user_id"),
+    ("price_alerts", "user_id"),
+)
+
+T = TypeVar("T")
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of user ids onto shard names. Adding a shard moves
+    only the users it takes over, about 1/N of them, and removing one only
+    the users it had.
+    """
+
+    def __init__(self, names: Iterable[str], virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        self.names = sorted(set(names))
+        if not self.names:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted(
+            (ring_hash(f"{name}#{i}"), name)
+            for name in self.names
+            for i in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    def shard_for(self, user_id: Any) -> str:
+        index = bisect.bisect(self._points, ring_hash(str(user_id)))
+        return self._owners[index % len(self._owners)]
+
+
+class Shard(NamedTuple):
+    name: str
+    engine: Engine
+    session_factory: sessionmaker
+
+
+def open_shard(name: str) -> Shard:
+    """Create the database of a shard if needed, with the tables of the models."""
+    if name == db_config.POSTGRES_DB:
+        return Shard(name, db_config.engine, db_config.SessionLocal)
+    settings = (
+        db_config.POSTGRES_USER,
+        db_config.POSTGRES_PASSWORD,
+        db_config.POSTGRES_HOST,
+        db_config.POSTGRES_PORT,
+    )
+    db_config.create_database_if_not_exists(
+        db_config.create_db_connection(*settings), name
+    )
+    engine, session_factory = db_config.init_engine_and_session(*settings, name)
+    db_config.init_db(engine)
+    return Shard(name, engine, session_factory)
+
+
+class ShardRouter:
+    """Which database to use for the data of a user, and for all of them."""
+
+    def __init__(self, shards: Sequence[Shard], directory: Shard):
+        self.shards: Dict[str, Shard] = {shard.name: shard for shard in shards}
+        self.directory = directory
+        self.ring = HashRing(self.shards)
+        self.token_users = LRUCache()
+
+    @classmethod
+    def from_env(cls) -> "ShardRouter":
+        directory = Shard(
+            db_config.POSTGRES_DB, db_config.engine, db_config.SessionLocal
+        )
+        names = POSTGRES_SHARDS or [directory.name]
+        return cls([open_shard(name) for name in names], directory)
+
+    @property
+    def sharded(self) -> bool:
+        return list(self.shards) != [self.directory.name]
+
+    @property
+    def engines(self) -> List[Engine]:
+        return [shard.engine for shard in self.shards.values()]
+
+    def shard_for(self, user_id: Any) -> Shard:
+        return self.shards[self.ring.shard_for(user_id)]
+
+    def token_user(self, token: Optional[str]) -> Optional[str]:
+        """The user id of a refresh token, None when it isn't valid."""
+        if not token:
+            return None
+        user_id = self.token_users.get(token)
+        if user_id is None:
+            try:
+                user_id = decode_access_token(token).get("sub") or ""
+            except CredentialsException:
+                user_id = ""
+            self.token_users.set(token, user_id, TOKEN_USER_TTL_SECONDS)
+        return user_id or None
+
+    def session_for_token(self, token: Optional[str]) -> Session:
+        """A session on the shard of the user signed in, or on the directory."""
+        if not self.sharded:
+            return self.directory.session_factory()
+        user_id = self.token_user(token)
+        if user_id is None:
+            return self.directory.session_factory()
+        return self.shard_for(user_id).session_factory()
+
+    @contextmanager
+    def user_session(self, user_id: Any, db: Session) -> Iterator[Session]:
+        """A session on the shard of a user, db itself when it is bound there."""
+        shard = self.shard_for(user_id)
+        if not self.sharded or db.get_bind() is shard.engine:
+            yield db
+            return
+        with shard.session_factory() as session:
+            yield session
+
+    @contextmanager
+    def all_sessions(self, db: Session) -> Iterator[List[Session]]:
+        """A session on every shard, db for the shard it is bound to."""
+        if not self.sharded:
+            yield [db]
+            return
+        opened = []
+        sessions = []
+        try:
+            for shard in self.shards.values():
+                if db.get_bind() is shard.engine:
+                    sessions.append(db)
+                else:
+                    session = shard.session_factory()
+                    opened.append(session)
+                    sessions.append(session)
+            yield sessions
+        finally:
+            for session in opened:
+                session.close()
+
+
+def scatter(sessions: Sequence[Session], query: Callable[[Session], T]) -> List[T]:
+    """Run query on every shard session at once, results in session order."""
+    if len(sessions) == 1:
+        return [query(sessions[0])]
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        return list(pool.map(query, sessions))
+
+
+def merge_pages(
+    pages: Iterable[Tuple[List[T], int]],
+    key: Callable[[T], Any],
+    skip: int,
+    limit: int,
+    reverse: bool = False,
+) -> Tuple[List[T], int]:
+    """
+    One page of results gathered from every shard, each with its own first
+    skip + limit rows in the same order and its total count.
+    """
+    pages = list(pages)
+    merged = heapq.merge(*(rows for rows, _ in pages), key=key, reverse=reverse)
+    return list(islice(merged, skip, skip + limit)), sum(total for _, total in pages)
+
+
+def copy_user_row(user: Any, db: Session) -> None:
+    """Copy the row of a user from the directory to its shard, or update it there."""
+    table = Base.metadata.tables["users"]
+    values = {column.name: getattr(user, column.key) for column in table.columns}
+    db.execute(
+        insert(table)
+        .values(values)
+        .on_conflict_do_update(index_elements=[table.c.id], set_=values)
+    )
+
+
+def remap_assets(
+    rows: Sequence[Any], source: Connection, target: Connection
+) -> List[dict]:
+    """Rows pointing to the assets of target, registering them as needed."""
+    # Every shard gives out its own asset ids
+    assets = Base.metadata.tables[ASSETS_TABLE]
+    source_assets = source.execute(
+        select(assets).where(assets.c.id.in_({row["asset_id"] for row in rows}))
+    )
+    target_ids = {
+        asset.id: intern_asset(
+            target, asset.asset_type, asset.provider_id, asset.symbol
+        )
+        for asset in source_assets
+    }
+    return [{**row, "asset_id": target_ids[row["asset_id"]]} for row in rows]
+
+
+def move_user(
+    user_id: UUID, source: Connection, target: Connection, keep_user: bool = False
+) -> int:
+    """
+    Move the data of a user between two shards, in their open transactions.
+    The rows are locked on the source as they are read, so writes to them
+    wait for the move and new rows of the user wait on the foreign keys.
+    Rows already on the target are kept, which makes a move interrupted
+    between the two commits safe to run again. With keep_user, the user row
+    stays on the source as well. Returns the rows moved.
+    """
+    tables = Base.metadata.tables
+    moved = 0
+    for name, owner in USER_TABLES:
+        table = tables[name]
+        rows = (
+            source.execute(
+                select(table).where(table.c[owner] == user_id).with_for_update()
+            )
+            .mappings()
+            .all()
+        )
+        if not rows:
+            continue
+        if "asset_id" in table.c:
+            rows = remap_assets(rows, source, target)
+        if name == PARTITIONED_TABLE:
+            months = [row["created_at"] for row in rows]
+            create_partitions(
+                target, month_start(min(months)), month_start(max(months))
+            )
+        target.execute(
+            insert(table).on_conflict_do_nothing(), [dict(row) for row in rows]
+        )
+        moved += len(rows)
+    for name, owner in reversed(USER_TABLES):
+        if keep_user and name == "users":
+            continue
+        table = tables[name]
+        source.execute(delete(table).where(table.c[owner] == user_id))
+    return moved
+
+
+def rebalance(
+    old_ring: HashRing,
+    new_ring: HashRing,
+    engines: Dict[str, Engine],
+    directory: Optional[str] = None,
+) -> Dict[Tuple[str, str], int]:
+    """
+    Move every user whose shard differs between the two rings. engines maps
+    the names of both rings to their engines. The users of directory, when it
+    is a shard, stay there as well. Returns the users moved between every
+    pair of shards.
+    """
+    users = Base.metadata.tables["users"]
+    moves: Dict[Tuple[str, str], int] = {}
+    for source_name in old_ring.names:
+        with engines[source_name].connect() as connection:
+            user_ids = connection.execute(select(users.c.id)).scalars().all()
+        for user_id in user_ids:
+            # The directory has every user, not only those of its shard
+            if old_ring.shard_for(user_id) != source_name:
+                continue
+            target_name = new_ring.shard_for(user_id)
+            if target_name == source_name:
+                continue
+            # The target commits first, a failure in between leaves the user
+            # on both shards until the next run
+            with engines[source_name].begin() as source, engines[
+                target_name
+            ].begin() as target:
+                move_user(user_id, source, target, source_name == directory)
+            moves[(source_name, target_name)] = (
+                moves.get((source_name, target_name), 0) + 1
+            )
+    return moves
+
+
+shard_router = ShardRouter.from_env()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move users between shards.")
+    parser.add_argument(
+        "--from", dest="old", required=True, help="shards before, comma separated"
+    )
+    parser.add_argument(
+        "--to", dest="new", required=True, help="shards after, comma separated"
+    )
+    args = parser.parse_args()
+
+    old_names, new_names = args.old.split(","), args.new.split(",")
+    shards = {name: open_shard(name) for name in {*old_names, *new_names}}
+    moves = rebalance(
+        HashRing(old_names),
+        HashRing(new_names),
+        {name: shard.engine for name, shard in shards.items()},
+        directory=db_config.POSTGRES_DB,
+    )
+    for (source, target), count in sorted(moves.items()):
+        print(f"Moved {count:,} users from {source} to {target}")
+    print(f"Moved {sum(moves.values()):,} users in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.schemas.slow_query_schema import SlowQuery
+
+load_dotenv()
+
+# Diagnostic mode, off by default
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "").lower() in ("1", "true", "yes")
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS") or 200)
+# Share of slow SELECTs that are run again under EXPLAIN (ANALYZE, BUFFERS)
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(
+    os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE") or 0.1
+)
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE") or 100)
+
+# ASGI scope of the request being served, set by the request context
+# middleware, to tell which route issued a statement
+request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def current_route() -> Optional[str]:
+    scope = request_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    path = route.path if route is not None else scope.get("path")
+    return f"{scope.get('method')} {path}"
+
+
+def parameter_shape(parameters, executemany: bool) -> str:
+    """Names and types of the parameters, never their values."""
+    rows = parameters if executemany else [parameters]
+    if not rows:
+        return ""
+    first = rows[0]
+    if isinstance(first, dict):
+        shape = ", ".join(
+            f"{name}: {type(value).__name__}" for name, value in first.items()
+        )
+    else:
+        shape = ", ".join(type(value).__name__ for value in first or ())
+    return f"({shape}) x {len(rows)}" if executemany else f"({shape})"
+
+
+class SlowQueryLog:
+    """
+    Logs statements slower than a threshold through SQLAlchemy cursor events,
+    and keeps the latest ones in a ring buffer.
+
+    A sample of the slow SELECTs is executed again under
+    EXPLAIN (ANALYZE, BUFFERS) on the same connection, inside a savepoint, and
+    the plan is stored with the entry. This runs the query twice, so keep the
+    sample rate low outside of an investigation.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+        explain_sample_rate: float = SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+        buffer_size: int = SLOW_QUERY_BUFFER_SIZE,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self._entries: "deque[SlowQuery]" = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    def install(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+    def uninstall(self, engine: Engine) -> None:
+        event.remove(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.remove(engine, "handle_error", self.handle_error)
+
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info.setdefault("slow_query_start", []).append(
+            (context, time.perf_counter())
+        )
+
+    def handle_error(self, exception_context):
+        # A failing statement never reaches after_cursor_execute, its start
+        # must not stay on the pooled connection
+        if exception_context.connection is None:
+            return
+        starts = exception_context.connection.info.get("slow_query_start")
+        if starts and starts[-1][0] is exception_context.execution_context:
+            starts.pop()
+
+    def after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        _, started = conn.info["slow_query_start"].pop()
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        entry = SlowQuery(
+            statement=statement,
+            route=current_route(),
+            parameter_shape=parameter_shape(parameters, executemany),
+            duration_ms=round(duration_ms, 3),
+            recorded_at=datetime.utcnow(),
+        )
+        print(
+            f"Slow query ({entry.duration_ms:.1f} ms) on {entry.route}: "
+            f"{' '.join(statement.split())} {entry.parameter_shape}"
+        )
+        if (
+            not executemany
+            and statement.lstrip().upper().startswith("SELECT")
+            and random.random() < self.explain_sample_rate
+        ):
+            entry.plan = self.explain(cursor, statement, parameters)
+
+        with self._lock:
+            self._entries.append(entry)
+
+    @staticmethod
+    def explain(cursor, statement, parameters) -> Optional[str]:
+        # A raw DBAPI cursor bypasses the engine events, and the savepoint
+        # keeps a failing EXPLAIN from aborting the caller's transaction
+        with cursor.connection.cursor() as explain_cursor:
+            explain_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                explain_cursor.execute(
+                    f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+                )
+                plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+            except Exception as e:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                print(f"Could not explain slow query: {e}")
+                plan = None
+            explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+
+    def recent(self) -> List[SlowQuery]:
+        """Slow queries in the buffer, newest first."""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+slow_query_log = SlowQueryLog()
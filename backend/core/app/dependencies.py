@@ -1,9 +1,10 @@
 from fastapi import Depends, Request
 from sqlalchemy.orm import Session
-from app.database.db_config import SessionLocal
+from app.database.sharding import shard_router
 from app.controllers.user_controller import UserController
 from app.schemas.user_schema import UserOut
 from app.utils.jwt import decode_access_token
+from app.utils.token_revocation import token_revocations
 from jose import JWTError
 from typing import Annotated
 from uuid import UUID
@@ -24,16 +25,34 @@ def get_refresh_token(request: Request) -> str:
     return refresh_token
 
 
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    # On the shard of the user signed in, the directory for anyone else
+    db = shard_router.session_for_token(request.cookies.get("refresh_token"))
     try:
         yield db
     finally:
         db.close()
 
 
+def get_directory_db(db: Session = Depends(get_db)):
+    # Users and revoked tokens, the session of get_db unless it is on a shard
+    # other than the directory
+    if db.get_bind() is not shard_router.directory.engine and shard_router.sharded:
+        with shard_router.directory.session_factory() as directory_db:
+            yield directory_db
+    else:
+        yield db
+
+
+def get_shard_sessions(db: Session = Depends(get_db)):
+    # Admin views over every user, a session on every shard
+    with shard_router.all_sessions(db) as sessions:
+        yield sessions
+
+
 async def get_current_user(
-    token: Annotated[str, Depends(get_refresh_token)], db: Session = Depends(get_db)
+    token: Annotated[str, Depends(get_refresh_token)],
+    db: Session = Depends(get_directory_db),
 ) -> UserOut:
     try:
         payload = decode_access_token(token)
@@ -43,6 +62,8 @@ async def get_current_user(
         # token_data = Payload(user_id=user_id)  # Not needed if you only use user_id
     except JWTError:
         raise CredentialsException
+    if token_revocations.is_revoked(db, payload.get("jti")):
+        raise CredentialsException("Token has been revoked")
 
     user = UserController.get_user_by_id(db, user_id=user_id)
     if user is None:
@@ -0,0 +1,219 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+from uuid import UUID
+from pydantic import BaseModel
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session, aliased
+from app.controllers.portfolio_controller import (
+    _get_portfolio_holdings,
+    price_key,
+    value_holdings,
+)
+from app.models.archived_transaction_model import transactions_with_archive
+from app.models.asset_model import Asset as AssetModel
+from app.models.job_model import Job as JobModel
+from app.models.portfolio_model import Portfolio as PortfolioModel, AssetType
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.utils.custom_exceptions import ForbiddenException, NotFoundException
+from app.utils.fetch_price import fetch_crypto_prices
+
+# Rows handled between two checkpoints of the long running loops
+CHECKPOINT_EVERY_ROWS = 1000
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobResult(BaseModel):
+    content: bytes
+    content_type: str
+    filename: str
+
+
+class JobContext:
+    """What a job handler gets to run a job, in a worker process."""
+
+    def __init__(self, db: Session, job: JobModel):
+        self.db = db
+        self.job_id = job.id
+        self.user_id = job.user_id
+        self.params = job.params
+
+    def checkpoint(self) -> None:
+        """
+        Record that the job is alive, and stop it if its cancellation was
+        requested. Handlers call this regularly, cancellation is cooperative.
+        """
+        cancel_requested = self.db.execute(
+            text(
+                "UPDATE jobs SET heartbeat_at = now() WHERE id = :id "
+                "RETURNING cancel_requested"
+            ),
+            {"id": self.job_id},
+        ).scalar()
+        self.db.commit()
+        if cancel_requested:
+            raise JobCancelled
+
+    def owned_portfolio(self, portfolio_id: Optional[str]) -> PortfolioModel:
+        portfolio = self.db.get(PortfolioModel, UUID(str(portfolio_id)))
+        if portfolio is None:
+            raise NotFoundException("Portfolio not found")
+        if portfolio.user_id != self.user_id:
+            raise ForbiddenException
+        return portfolio
+
+
+JobHandler = Callable[[JobContext], JobResult]
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    def register(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = handler
+        return handler
+
+    return register
+
+
+def json_result(data, filename: str) -> JobResult:
+    return JobResult(
+        content=json.dumps(data, default=str).encode(),
+        content_type="application/json",
+        filename=filename,
+    )
+
+
+@job_handler("transactions_export")
+def export_transactions(context: JobContext) -> JobResult:
+    """All transactions of the user as CSV. Params: include_deleted (bool)."""
+    include_deleted = context.params.get("include_deleted", False)
+    # Archived rows are all deleted or closed out, as in the listing the
+    # archive is only read when deleted rows are asked for
+    transactions = (
+        aliased(TransactionModel, transactions_with_archive())
+        if include_deleted
+        else TransactionModel
+    )
+    # The columns of the table, with the asset named rather than its id
+    selected = []
+    for column in TransactionModel.__table__.columns:
+        if column.name == "asset_id":
+            selected.append(AssetModel.symbol.label("ticker_symbol"))
+            selected.append(AssetModel.provider_id.label("asset_name"))
+        else:
+            selected.append(getattr(transactions, column.name))
+    columns = [column.name for column in selected]
+    statement = (
+        select(*selected)
+        .join(AssetModel, AssetModel.id == transactions.asset_id)
+        .where(transactions.user_id == context.user_id)
+        .order_by(transactions.created_at)
+    )
+    if not include_deleted:
+        statement = statement.where(transactions.deleted_at.is_(None))
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    rows = context.db.execute(statement.execution_options(yield_per=1000))
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CHECKPOINT_EVERY_ROWS == 0:
+            context.checkpoint()
+
+    return JobResult(
+        content=output.getvalue().encode(),
+        content_type="text/csv",
+        filename="transactions.csv",
+    )
+
+
+@job_handler("portfolio_history")
+def portfolio_history(context: JobContext) -> JobResult:
+    """
+    Day by day positions of a portfolio over its whole history: the net
+    quantity of each asset and the net amount invested at the end of every
+    day with transactions. Params: portfolio_id.
+    """
+    portfolio = context.owned_portfolio(context.params.get("portfolio_id"))
+    # Closed out positions may have been archived, their days still count
+    transactions = aliased(TransactionModel, transactions_with_archive())
+    statement = (
+        select(
+            transactions.created_at,
+            AssetModel.provider_id.label("asset_name"),
+            transactions.transaction_type,
+            transactions.amount,
+            transactions.unit_price,
+            transactions.transaction_fee,
+        )
+        .join(AssetModel, AssetModel.id == transactions.asset_id)
+        .where(
+            transactions.portfolio_id == portfolio.id,
+            transactions.deleted_at.is_(None),
+        )
+        .order_by(transactions.created_at)
+    )
+
+    quantities = defaultdict(float)
+    invested = 0.0
+    history = []
+    rows = context.db.execute(statement.execution_options(yield_per=1000))
+    for count, row in enumerate(rows, start=1):
+        day = row.created_at.date().isoformat()
+        if history and history[-1]["date"] != day:
+            history[-1]["quantities"] = dict(quantities)
+        if not history or history[-1]["date"] != day:
+            history.append({"date": day})
+
+        sign = (
+            1
+            if row.transaction_type
+            in (TransactionType.BUY, TransactionType.TRANSFER_IN)
+            else -1
+        )
+        quantities[row.asset_name] += sign * row.amount
+        invested += sign * row.amount * row.unit_price + row.transaction_fee
+        history[-1]["invested"] = invested
+        if count % CHECKPOINT_EVERY_ROWS == 0:
+            context.checkpoint()
+    if history:
+        history[-1]["quantities"] = dict(quantities)
+
+    return json_result(
+        {"portfolio_id": portfolio.id, "history": history},
+        f"portfolio-{portfolio.id}-history.json",
+    )
+
+
+@job_handler("portfolio_valuation")
+def value_portfolios(context: JobContext) -> JobResult:
+    """Current valuation of every portfolio of the user, freshly computed."""
+    portfolios = context.db.scalars(
+        select(PortfolioModel).where(PortfolioModel.user_id == context.user_id)
+    ).all()
+    valuations = []
+    for portfolio in portfolios:
+        context.checkpoint()
+        holdings = _get_portfolio_holdings(context.db, portfolio.id)
+        crypto = [
+            holding for holding in holdings if holding.asset_type == AssetType.CRYPTO
+        ]
+        quotes = {}
+        if crypto:
+            keys = {price_key(holding) for holding in crypto}
+            quotes = fetch_crypto_prices(
+                {asset_name for asset_name, _ in keys},
+                {currency for _, currency in keys},
+            )
+        valuations.append(value_holdings(portfolio.id, holdings, quotes).model_dump())
+
+    return json_result(valuations, "portfolio-valuations.json")
@@ -0,0 +1,151 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.database.db_config import SessionLocal
+from app.database.sharding import shard_router
+from app.jobs.handlers import JOB_HANDLERS, JobCancelled, JobContext
+from app.models.job_model import Job as JobModel, JobStatus
+
+load_dotenv()
+
+JOB_WORKER_PROCESSES = int(os.getenv("JOB_WORKER_PROCESSES") or os.cpu_count() or 2)
+JOB_MAX_RUNNING_PER_USER = int(os.getenv("JOB_MAX_RUNNING_PER_USER") or 2)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS") or 1)
+# Running jobs without a checkpoint for that long are considered orphaned by a
+# dead worker and queued again
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS") or 600)
+
+# Serializes claims across worker processes, so that the per-user limit of
+# running jobs holds
+CLAIM_LOCK_KEY = 0x6A6F6273
+
+claim_job_statement = text("""
+    UPDATE jobs SET status = 'RUNNING', started_at = now(), heartbeat_at = now()
+    WHERE id = (
+        SELECT queued.id FROM jobs AS queued
+        WHERE queued.status = 'QUEUED'
+        AND (
+            SELECT count(*) FROM jobs AS running
+            WHERE running.user_id = queued.user_id AND running.status = 'RUNNING'
+        ) < :max_running_per_user
+        ORDER BY queued.priority DESC, queued.created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+    """)
+
+requeue_stale_jobs_statement = text("""
+    UPDATE jobs SET status = 'QUEUED', started_at = NULL, heartbeat_at = NULL
+    WHERE status = 'RUNNING'
+    AND heartbeat_at < now() - make_interval(secs => :stale_seconds)
+    """)
+
+
+def claim_next_job(db: Session) -> Optional[UUID]:
+    """Mark the next runnable job as running and return its id."""
+    db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CLAIM_LOCK_KEY})
+    job_id = db.execute(
+        claim_job_statement, {"max_running_per_user": JOB_MAX_RUNNING_PER_USER}
+    ).scalar()
+    db.commit()
+    return job_id
+
+
+def requeue_stale_jobs(db: Session) -> int:
+    result = db.execute(
+        requeue_stale_jobs_statement, {"stale_seconds": JOB_STALE_SECONDS}
+    )
+    db.commit()
+    return result.rowcount
+
+
+def finish_job(db: Session, job_id: UUID, status: JobStatus, **values) -> None:
+    job = db.get(JobModel, job_id)
+    # A cancellation requested while the job was finishing wins
+    if job.cancel_requested and status == JobStatus.SUCCEEDED:
+        status, values = JobStatus.CANCELLED, {}
+    job.status = status
+    job.finished_at = db.execute(text("SELECT now()")).scalar()
+    for name, value in values.items():
+        setattr(job, name, value)
+    db.commit()
+
+
+def run_job(job_id: UUID, shard: Optional[str] = None) -> None:
+    """Run one claimed job to completion, in a worker process."""
+    session_factory = (
+        SessionLocal if shard is None else shard_router.shards[shard].session_factory
+    )
+    with session_factory() as db:
+        job = db.get(JobModel, job_id)
+        try:
+            handler = JOB_HANDLERS[job.kind]
+            result = handler(JobContext(db, job))
+        except JobCancelled:
+            db.rollback()
+            finish_job(db, job_id, JobStatus.CANCELLED)
+        except Exception as e:
+            db.rollback()
+            detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+            finish_job(db, job_id, JobStatus.FAILED, error=detail)
+        else:
+            finish_job(
+                db,
+                job_id,
+                JobStatus.SUCCEEDED,
+                result=result.content,
+                result_content_type=result.content_type,
+                result_filename=result.filename,
+            )
+
+
+def init_worker_process() -> None:
+    # Connections inherited from the parent process must not be reused
+    for engine in {shard_router.directory.engine, *shard_router.engines}:
+        engine.dispose(close=False)
+
+
+def main() -> None:
+    print(
+        f"Job worker started with {JOB_WORKER_PROCESSES} processes, "
+        f"{JOB_MAX_RUNNING_PER_USER} running jobs per user"
+    )
+    running: Dict[UUID, Future] = {}
+    with ProcessPoolExecutor(
+        max_workers=JOB_WORKER_PROCESSES, initializer=init_worker_process
+    ) as pool:
+        while True:
+            for job_id, future in list(running.items()):
+                if future.done():
+                    del running[job_id]
+                    if future.exception() is not None:
+                        print(f"Job {job_id} crashed: {future.exception()}")
+
+            try:
+                # Jobs live on the shard of their user, which holds its data
+                for shard in shard_router.shards.values():
+                    with shard.session_factory() as db:
+                        requeue_stale_jobs(db)
+                        while len(running) < JOB_WORKER_PROCESSES:
+                            job_id = claim_next_job(db)
+                            if job_id is None:
+                                break
+                            running[job_id] = pool.submit(run_job, job_id, shard.name)
+            except BrokenProcessPool:
+                # A worker process died, let the supervisor restart the worker;
+                # its running jobs are queued again once stale
+                raise
+            except Exception as e:
+                print(f"Could not claim jobs: {e}")
+
+            if running:
+                wait(running.values(), JOB_POLL_SECONDS, FIRST_COMPLETED)
+            else:
+                time.sleep(JOB_POLL_SECONDS)
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 
 # from supertokens_python import init, get_all_cors_headers
@@ -12,10 +14,24 @@ from app.routes import (
     authentication_route,
     portfolio_route,
     transaction_route,
+    diagnostics_route,
+    job_route,
+    price_alert_route,
 )
 from app.database.db_config import init_db, engine
+from app.database.outbox import ChangeSubscriber, OutboxRelay
+from app.database.partitioning import maintain_transaction_partitions
+from app.database.sharding import shard_router
+from app.database.slow_query_log import SLOW_QUERY_LOG, slow_query_log
+from app.utils.price_alerts import price_alerts
+from app.utils.price_feed import price_feed
+from app.utils.rate_limiter import RATE_LIMIT
+from app.utils.token_revocation import token_revocations
 from fastapi.middleware.cors import CORSMiddleware
+from app.middleware.compression_middleware import CompressionMiddleware
+from app.middleware.rate_limit_middleware import RateLimitMiddleware
 from app.middleware.error_handling_middleware import exception_handling_middleware
+from app.middleware.request_context_middleware import request_context_middleware
 from dotenv import load_dotenv
 import os
 
@@ -30,8 +46,30 @@ load_dotenv()
 #     mode="asgi",
 # )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background maintenance tasks that live as long as the app
+    tasks = [
+        asyncio.create_task(maintain_transaction_partitions(shard_engine))
+        for shard_engine in shard_router.engines
+    ]
+    # Changes made by other workers reach this one's caches
+    for shard_engine in shard_router.engines:
+        tasks.append(asyncio.create_task(OutboxRelay(shard_engine).run()))
+        tasks.append(asyncio.create_task(ChangeSubscriber(shard_engine).run()))
+    tasks += [
+        asyncio.create_task(price_feed.run()),
+        asyncio.create_task(price_alerts.run()),
+        asyncio.create_task(token_revocations.run()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+
+
 # Create a FastAPI app
-app = FastAPI(title="Portfolio Tracker API", version="0.0.1")
+app = FastAPI(title="Portfolio Tracker API", version="0.0.1", lifespan=lifespan)
 # app.add_middleware(get_middleware())
 
 # Initialize the database
@@ -65,6 +103,11 @@ except Exception as e:
 #     }
 
 
+# Throttle clients before anything is done for them, set up before CORS so
+# browsers can read the Retry-After of a 429
+if RATE_LIMIT:
+    app.add_middleware(RateLimitMiddleware)
+
 # Set up CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -74,11 +117,22 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     # allow_headers=["Content-Type"] + get_all_cors_headers(),
+    # Not safelisted, browsers hide it from cross-origin code otherwise
+    expose_headers=["Retry-After"],
 )
 
+# Compress large responses with the encoding negotiated with the client
+app.add_middleware(CompressionMiddleware)
+
 # Set up error handling middleware
 app.middleware("http")(exception_handling_middleware)
 
+# Diagnostic slow query log, which needs to know the route of each statement
+if SLOW_QUERY_LOG:
+    for shard_engine in {engine, *shard_router.engines}:
+        slow_query_log.install(shard_engine)
+    app.middleware("http")(request_context_middleware)
+
 
 @app.get("/")
 async def root():
@@ -90,3 +144,6 @@ app.include_router(user_route.router)
 app.include_router(authentication_route.router)
 app.include_router(portfolio_route.router)
 app.include_router(transaction_route.router)
+app.include_router(diagnostics_route.router)
+app.include_router(job_route.router)
+app.include_router(price_alert_route.router)
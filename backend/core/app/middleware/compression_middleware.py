@@ -0,0 +1,89 @@
+import os
+from dotenv import load_dotenv
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.utils.content_negotiation import parse_quality_values
+
+# Optional dependency, only gzip is offered when it is missing
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+# Smaller bodies are sent as is, compressing them costs more than it saves
+RESPONSE_COMPRESSION_MIN_BYTES = int(
+    os.getenv("RESPONSE_COMPRESSION_MIN_BYTES") or 1024
+)
+# Levels tuned for bodies compressed on every request rather than once
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL") or 6)
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY") or 4)
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        if more_body:
+            return self._compressor.process(body) + self._compressor.flush()
+        return self._compressor.process(body) + self._compressor.finish()
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """The preferred encoding of the client among br and gzip, or identity."""
+    qualities = parse_quality_values(accept_encoding)
+    wildcard = qualities.get("*", 0)
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = "identity", 0.0
+    for encoding in offered:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies above a size threshold with brotli or gzip,
+    whichever the client prefers in its Accept-Encoding header. Server-Sent
+    Events and already encoded bodies are left alone.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = RESPONSE_COMPRESSION_MIN_BYTES,
+        gzip_level: int = RESPONSE_GZIP_LEVEL,
+        brotli_quality: int = RESPONSE_BROTLI_QUALITY,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding == "br":
+            responder = BrotliResponder(
+                self.app, self.minimum_size, self.brotli_quality
+            )
+        elif encoding == "gzip":
+            responder = GZipResponder(
+                self.app, self.minimum_size, compresslevel=self.gzip_level
+            )
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
@@ -0,0 +1,61 @@
+import math
+from fastapi.responses import JSONResponse
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.utils.cache import LRUCache
+from app.utils.custom_exceptions import CredentialsException
+from app.utils.jwt import decode_access_token
+from app.utils.rate_limiter import RateLimiter
+
+# Users of the refresh tokens seen lately, so the signature of a token is
+# checked once a minute rather than on every request
+TOKEN_USER_TTL_SECONDS = 60
+
+
+class RateLimitMiddleware:
+    """
+    Answers 429 with a Retry-After header to clients over their rate limit,
+    before any work is done for the request.
+
+    Signed-in clients are limited by user, whatever their address, and the
+    others by address.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = None):
+        self.app = app
+        self.limiter = limiter or RateLimiter.from_env()
+        self.token_users = LRUCache()
+
+    def client(self, connection: HTTPConnection) -> str:
+        token = connection.cookies.get("refresh_token")
+        if token:
+            user_id = self.token_users.get(token)
+            if user_id is None:
+                try:
+                    user_id = decode_access_token(token).get("sub")
+                except CredentialsException:
+                    user_id = ""
+                self.token_users.set(token, user_id, TOKEN_USER_TTL_SECONDS)
+            if user_id:
+                return f"user:{user_id}"
+        address = connection.client.host if connection.client else "unknown"
+        return f"address:{address}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        wait = await self.limiter.check(
+            self.client(connection), scope["method"], scope["path"]
+        )
+        if wait > 0:
+            response = JSONResponse(
+                {"detail": "Too many requests, try again later"},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,11 @@
+from fastapi import Request
+from app.database.slow_query_log import request_scope
+
+
+async def request_context_middleware(request: Request, call_next):
+    # The scope is shared with the router, which adds the matched route to it
+    token = request_scope.set(request.scope)
+    try:
+        return await call_next(request)
+    finally:
+        request_scope.reset(token)
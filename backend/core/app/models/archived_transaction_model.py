@@ -0,0 +1,70 @@
+from sqlalchemy import ForeignKey, Index, Subquery, func, select, union_all
+from sqlalchemy import Enum as SQLAlchemyEnum
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+from app.database.db_config import Base
+from app.database.fixed_point import FixedPoint
+from datetime import datetime
+from typing import Optional
+import uuid
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import Transaction, TransactionType
+
+
+class ArchivedTransaction(Base):
+    """
+    Cold storage for transactions moved out of the partitioned table: soft
+    deleted ones past the retention window, and optionally the history of
+    positions closed out long ago. Same columns as transactions, plus when
+    and why a row was archived.
+    """
+
+    __tablename__ = "transactions_archive"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id"), nullable=False)
+    transaction_type: Mapped[TransactionType] = mapped_column(
+        SQLAlchemyEnum(TransactionType), nullable=False
+    )
+    asset_type: Mapped[AssetType] = mapped_column(
+        SQLAlchemyEnum(AssetType), nullable=False
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    amount: Mapped[float] = mapped_column(FixedPoint, nullable=False)
+    currency: Mapped[str] = mapped_column(nullable=False)
+    unit_price: Mapped[float] = mapped_column(FixedPoint, nullable=False)
+    transaction_fee: Mapped[float] = mapped_column(FixedPoint, nullable=False)
+    portfolio_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("portfolios.id", ondelete="CASCADE"), nullable=False
+    )
+    note: Mapped[str] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column(nullable=False)
+    updated_at: Mapped[datetime] = mapped_column()
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    archived_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    # "deleted" or "closed"
+    archive_reason: Mapped[str] = mapped_column(nullable=False)
+
+    __table_args__ = (
+        Index("ix_transactions_archive_user_id_created_at", "user_id", "created_at"),
+        Index(
+            "ix_transactions_archive_portfolio_id_created_at",
+            "portfolio_id",
+            "created_at",
+        ),
+    )
+
+
+def transactions_with_archive() -> Subquery:
+    """
+    Every transaction, hot or archived, with the columns of the transactions
+    table. Filters on the subquery are pushed down to both sides of the union.
+    """
+    columns = [column.name for column in Transaction.__table__.columns]
+    archive = ArchivedTransaction.__table__
+    return union_all(
+        select(Transaction.__table__),
+        select(*(archive.c[name] for name in columns)),
+    ).subquery("transactions_with_archive")
@@ -0,0 +1,29 @@
+from sqlalchemy import SmallInteger, UniqueConstraint, Enum as SQLAlchemyEnum
+from sqlalchemy.orm import Mapped, mapped_column
+from app.database.db_config import Base
+from app.models.portfolio_model import AssetType
+
+
+class Asset(Base):
+    """
+    An asset held in any portfolio, interned by app.database.assets.
+    Transactions refer to it by id, so its names are stored once.
+    """
+
+    __tablename__ = "assets"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # Ticker, e.g. BTC
+    symbol: Mapped[str] = mapped_column(nullable=False)
+    # Id at the price provider, the lowercased asset name, e.g. bitcoin
+    provider_id: Mapped[str] = mapped_column(nullable=False)
+    asset_type: Mapped[AssetType] = mapped_column(
+        SQLAlchemyEnum(AssetType), nullable=False
+    )
+    decimals: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "asset_type", "provider_id", name="uq_assets_asset_type_provider_id"
+        ),
+    )
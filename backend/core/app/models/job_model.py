@@ -0,0 +1,63 @@
+from sqlalchemy import (
+    ForeignKey,
+    Index,
+    LargeBinary,
+    func,
+    text,
+    Enum as SQLAlchemyEnum,
+)
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from app.database.db_config import Base
+from datetime import datetime
+from enum import Enum as PyEnum
+from typing import Optional
+import uuid
+
+
+class JobStatus(str, PyEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    kind: Mapped[str] = mapped_column(nullable=False)
+    params: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
+    # Higher runs first, ties in submission order
+    priority: Mapped[int] = mapped_column(nullable=False, default=0)
+    status: Mapped[JobStatus] = mapped_column(
+        SQLAlchemyEnum(JobStatus), nullable=False, default=JobStatus.QUEUED
+    )
+    cancel_requested: Mapped[bool] = mapped_column(nullable=False, default=False)
+    # Only loaded when downloaded
+    result: Mapped[Optional[bytes]] = mapped_column(
+        LargeBinary, nullable=True, deferred=True
+    )
+    result_content_type: Mapped[Optional[str]] = mapped_column(nullable=True)
+    result_filename: Mapped[Optional[str]] = mapped_column(nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    started_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    # Touched by running jobs at every checkpoint, to detect dead workers
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+
+
+# The queue the workers claim from, in claim order
+Index(
+    "ix_jobs_queued_priority_created_at",
+    Job.priority.desc(),
+    Job.created_at,
+    postgresql_where=Job.status == JobStatus.QUEUED,
+)
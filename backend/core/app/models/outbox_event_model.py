@@ -0,0 +1,41 @@
+from sqlalchemy import BigInteger, Identity, Index, func
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from app.database.db_config import Base
+from datetime import datetime
+from typing import Optional
+import uuid
+
+
+class OutboxEvent(Base):
+    """
+    A change to portfolios or transactions, written in the same database
+    transaction as the change itself and published by app.database.outbox.
+    """
+
+    __tablename__ = "outbox_events"
+
+    # Order the events were written in, among the committed ones
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    # What changed, e.g. transaction.created
+    topic: Mapped[str] = mapped_column(nullable=False)
+    portfolio_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    # The process that made the change, which has already invalidated its caches
+    origin: Mapped[str] = mapped_column(nullable=False)
+    # Ids of the changed rows, left out of the notifications
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    # Place in the stream, gapless, given when the event is published
+    position: Mapped[Optional[int]] = mapped_column(
+        BigInteger, nullable=True, unique=True
+    )
+    published_at: Mapped[Optional[datetime]] = mapped_column(nullable=True, index=True)
+
+
+# The events left to publish, in publication order
+Index(
+    "ix_outbox_events_pending_id",
+    OutboxEvent.id,
+    postgresql_where=OutboxEvent.position.is_(None),
+)
@@ -0,0 +1,52 @@
+from sqlalchemy import ForeignKey, Index, func, Enum as SQLAlchemyEnum
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+from app.database.db_config import Base
+from app.database.fixed_point import FixedPoint
+from datetime import datetime
+from enum import Enum as PyEnum
+from typing import Optional
+import uuid
+
+
+class AlertDirection(str, PyEnum):
+    # Triggered once the price is at or above the threshold
+    ABOVE = "above"
+    # Triggered once the price is at or below the threshold
+    BELOW = "below"
+
+
+class PriceAlert(Base):
+    __tablename__ = "price_alerts"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # Lowercased, as the quotes of the price feed are keyed
+    asset_name: Mapped[str] = mapped_column(nullable=False)
+    currency: Mapped[str] = mapped_column(nullable=False)
+    direction: Mapped[AlertDirection] = mapped_column(
+        SQLAlchemyEnum(AlertDirection), nullable=False
+    )
+    threshold: Mapped[float] = mapped_column(FixedPoint, nullable=False)
+    note: Mapped[Optional[str]] = mapped_column(nullable=True)
+    # Alerts trigger once, and are active again when updated
+    triggered_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    triggered_price: Mapped[Optional[float]] = mapped_column(FixedPoint, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    # Every change, triggering included, which the workers sync from
+    updated_at: Mapped[datetime] = mapped_column(
+        default=func.now(), onupdate=func.now(), index=True
+    )
+
+
+# The alerts every worker evaluates
+Index(
+    "ix_price_alerts_active_asset_currency",
+    PriceAlert.asset_name,
+    PriceAlert.currency,
+    postgresql_where=PriceAlert.triggered_at.is_(None),
+)
@@ -0,0 +1,24 @@
+from sqlalchemy import ForeignKey, func
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+from app.database.db_config import Base
+from datetime import datetime
+from typing import Optional
+import uuid
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    # The jti claim of the revoked token
+    jti: Mapped[str] = mapped_column(primary_key=True)
+    user_id: Mapped[Optional[uuid.UUID]] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=True,
+        index=True,
+    )
+    # When the token would have expired anyway, the row is useless after that
+    expires_at: Mapped[datetime] = mapped_column(nullable=False, index=True)
+    # Workers load the revocations newer than the last ones they have seen
+    revoked_at: Mapped[datetime] = mapped_column(default=func.now(), index=True)
@@ -1,11 +1,17 @@
-from sqlalchemy import ForeignKey, Enum as SQLAlchemyEnum
+from sqlalchemy import ForeignKey, Index, event, select, text, Enum as SQLAlchemyEnum
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy import func
+from app.database.assets import intern_asset
 from app.database.db_config import Base
+from app.database.fixed_point import FixedPoint
 from datetime import datetime
 from enum import Enum as PyEnum
+from typing import Dict
 import uuid
+from app.models.asset_model import Asset
 from app.models.portfolio_model import AssetType
 
 
@@ -19,15 +25,16 @@ class TransactionType(str, PyEnum):
 class Transaction(Base):
     __tablename__ = "transactions"
 
+    # The table is range partitioned on created_at, which therefore has to be
+    # part of the primary key; ids are still unique as they are random UUIDs
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
         primary_key=True,
         default=uuid.uuid4,
-        unique=True,
         index=True,
     )
-    ticker_symbol: Mapped[str] = mapped_column(nullable=False)
-    asset_name: Mapped[str] = mapped_column(nullable=False)
+    # Asset names are stored once on the asset, see asset_name below
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id"), nullable=False)
     transaction_type: Mapped[TransactionType] = mapped_column(
         SQLAlchemyEnum(TransactionType), nullable=False
     )
@@ -35,17 +42,17 @@ class Transaction(Base):
         SQLAlchemyEnum(AssetType), nullable=False
     )
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), nullable=False)
-    amount: Mapped[float] = mapped_column(nullable=False)
+    amount: Mapped[float] = mapped_column(FixedPoint, nullable=False)
     currency: Mapped[str] = mapped_column(
         nullable=False
     )  # Assuming ISO 4217 currency codes
-    unit_price: Mapped[float] = mapped_column(nullable=False)
-    transaction_fee: Mapped[float] = mapped_column(nullable=False)
+    unit_price: Mapped[float] = mapped_column(FixedPoint, nullable=False)
+    transaction_fee: Mapped[float] = mapped_column(FixedPoint, nullable=False)
     portfolio_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("portfolios.id"), nullable=False, index=True
     )
     note: Mapped[str] = mapped_column()
-    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    created_at: Mapped[datetime] = mapped_column(primary_key=True, default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
         default=func.now(), onupdate=func.now()
     )
@@ -53,3 +60,103 @@ class Transaction(Base):
 
     portfolio = relationship("Portfolio", back_populates="transactions")
     user = relationship("User", back_populates="transactions")
+    asset: Mapped[Asset] = relationship(lazy="joined", innerjoin=True)
+
+    # Names assigned since the transaction was last loaded, the asset they
+    # name is looked up or registered when the transaction is flushed
+    _pending_asset = None
+
+    @hybrid_property
+    def asset_name(self) -> str:
+        return self._asset_names()["asset_name"]
+
+    @asset_name.inplace.setter
+    def _asset_name_setter(self, value: str) -> None:
+        self._assign_asset_name("asset_name", value)
+
+    @asset_name.inplace.expression
+    @classmethod
+    def _asset_name_expression(cls):
+        return (
+            select(Asset.provider_id)
+            .where(Asset.id == cls.asset_id)
+            .scalar_subquery()
+            .label("asset_name")
+        )
+
+    @hybrid_property
+    def ticker_symbol(self) -> str:
+        return self._asset_names()["ticker_symbol"]
+
+    @ticker_symbol.inplace.setter
+    def _ticker_symbol_setter(self, value: str) -> None:
+        self._assign_asset_name("ticker_symbol", value)
+
+    @ticker_symbol.inplace.expression
+    @classmethod
+    def _ticker_symbol_expression(cls):
+        return (
+            select(Asset.symbol)
+            .where(Asset.id == cls.asset_id)
+            .scalar_subquery()
+            .label("ticker_symbol")
+        )
+
+    def _asset_names(self) -> Dict[str, str]:
+        if self._pending_asset is not None:
+            return self._pending_asset
+        return {
+            "asset_name": self.asset.provider_id,
+            "ticker_symbol": self.asset.symbol,
+        }
+
+    def _assign_asset_name(self, field: str, value: str) -> None:
+        if self._pending_asset is None:
+            self._pending_asset = {} if self.asset_id is None else self._asset_names()
+        self._pending_asset[field] = value
+        if self.asset_id is not None:
+            # Nothing else may have changed, the flush has to visit the row
+            flag_modified(self, "asset_id")
+
+    # Partial indexes over live (not soft deleted) rows for the listing paths
+    __table_args__ = (
+        Index(
+            "ix_transactions_live_user_id_created_at",
+            "user_id",
+            "created_at",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        Index(
+            "ix_transactions_live_portfolio_id_created_at",
+            "portfolio_id",
+            "created_at",
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        # Soft deleted rows only, for archival to find them in batches
+        Index(
+            "ix_transactions_deleted_at",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+@event.listens_for(Transaction, "before_insert")
+@event.listens_for(Transaction, "before_update")
+def point_to_assigned_asset(mapper, connection, target: Transaction) -> None:
+    # An asset keeps the ticker symbol it was registered with
+    if target._pending_asset is not None:
+        target.asset_id = intern_asset(
+            connection,
+            AssetType(target.asset_type),
+            target._pending_asset["asset_name"],
+            target._pending_asset["ticker_symbol"],
+        )
+
+
+@event.listens_for(Transaction, "expire")
+def forget_assigned_asset(target: Transaction, attrs) -> None:
+    # Once flushed and expired, the names are read back from the asset
+    if attrs is None or "asset_id" in attrs or "asset" in attrs:
+        target.__dict__.pop("_pending_asset", None)
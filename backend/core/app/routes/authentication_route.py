@@ -6,12 +6,17 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, status, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from app.dependencies import get_db
+from app.dependencies import get_directory_db
 from app.controllers.user_controller import UserController
 from app.schemas.user_schema import UserCreate
 from app.schemas.api_response import TokenResponse
 from app.schemas.access_token_schema import Payload
-from app.utils.custom_exceptions import ForbiddenException, NotFoundException
+from app.utils.custom_exceptions import (
+    CredentialsException,
+    ForbiddenException,
+    NotFoundException,
+)
+from app.utils.token_revocation import token_revocations
 
 load_dotenv()
 
@@ -23,13 +28,13 @@ router = APIRouter(prefix="/api/v1/auth", tags=["Authentication"])
     status_code=status.HTTP_201_CREATED,
     response_model=TokenResponse[Payload],
 )
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: Session = Depends(get_directory_db)):
     """
     Register a new user.
 
     Args:
         user (UserCreate): The user data to be registered.
-        db (Session, optional): The database session. Defaults to Depends(get_db).
+        db (Session, optional): The database session. Defaults to Depends(get_directory_db).
 
     Returns:
         TokenResponse[Payload]: The token response containing the access token, token type, user ID, and message.
@@ -61,7 +66,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
 async def login(
     response: Response,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_directory_db),
 ):
     """
     Authenticate the user and generate access and refresh tokens.
@@ -69,7 +74,7 @@ async def login(
     Args:
         response (Response): The response object.
         form_data (OAuth2PasswordRequestForm): The form data containing the username and password.
-        db (Session, optional): The database session. Defaults to Depends(get_db).
+        db (Session, optional): The database session. Defaults to Depends(get_directory_db).
 
     Returns:
         TokenResponse[Payload]: The response containing the access token, token type, user ID, and message.
@@ -112,7 +117,7 @@ async def login(
 async def refresh(
     request: Request,
     response: Response,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_directory_db),
 ):
     """
     Refreshes the access token by decoding the refresh token from the request cookies,
@@ -138,6 +143,8 @@ async def refresh(
     decoded_refresh_token = decode_access_token(refresh_token)
     if not decoded_refresh_token:
         raise ForbiddenException
+    if token_revocations.is_revoked(db, decoded_refresh_token.get("jti")):
+        raise CredentialsException("Token has been revoked")
 
     # Get user information from decoded refresh token
     user_id = decoded_refresh_token["sub"]
@@ -174,15 +181,28 @@ async def refresh(
     "/logout",
     status_code=status.HTTP_200_OK,
 )
-async def logout(response: Response):
+async def logout(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_directory_db),
+):
     """
-    Logout the user by deleting the refresh token cookie.
+    Logout the user by revoking the refresh token and deleting its cookie.
 
     Args:
+        request (Request): The incoming request object.
         response (Response): The HTTP response object.
+        db (Session, optional): The database session. Defaults to Depends(get_directory_db).
 
     Returns:
         dict: A dictionary containing the success message.
     """
+    refresh_token = request.cookies.get("refresh_token")
+    if refresh_token:
+        try:
+            token_revocations.revoke(db, decode_access_token(refresh_token))
+        except CredentialsException:
+            # Invalid or expired already, nothing to revoke
+            pass
     response.delete_cookie(key="refresh_token")
     return {"message": "User logged out successfully"}
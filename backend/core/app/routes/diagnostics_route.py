@@ -0,0 +1,50 @@
+from typing import List
+from fastapi import APIRouter, Depends, status
+from app.dependencies import get_current_active_admin
+from app.schemas.api_response import ApiResponse
+from app.schemas.slow_query_schema import SlowQuery
+from app.database.slow_query_log import SLOW_QUERY_LOG, slow_query_log
+
+router = APIRouter(
+    prefix="/api/v1/diagnostics",
+    tags=["Diagnostics"],
+    dependencies=[Depends(get_current_active_admin)],
+)
+
+
+@router.get(
+    "/slow-queries",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[List[SlowQuery]],
+)
+async def get_slow_queries():
+    """
+    Retrieve the latest slow queries, with the plans captured for a sample of them. This is an admin only endpoint.
+
+    Returns:
+        ApiResponse[List[SlowQuery]]: The API response containing the slow queries, newest first.
+    """
+    message = (
+        "Slow queries retrieved successfully"
+        if SLOW_QUERY_LOG
+        else "Slow query log is disabled, set SLOW_QUERY_LOG to enable it"
+    )
+    return ApiResponse[List[SlowQuery]].success_response(
+        data=slow_query_log.recent(), message=message
+    )
+
+
+@router.delete(
+    "/slow-queries",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[str],
+)
+async def clear_slow_queries():
+    """
+    Empty the slow query buffer. This is an admin only endpoint.
+
+    Returns:
+        ApiResponse[str]: The API response indicating the buffer was emptied.
+    """
+    slow_query_log.clear()
+    return ApiResponse[str].success_response(message="Slow queries cleared")
@@ -0,0 +1,186 @@
+from typing import List
+from fastapi import APIRouter, Depends, Query, Response, status
+from sqlalchemy.orm import Session
+from app.dependencies import get_current_user, get_db
+from app.controllers.job_controller import JobController
+from app.jobs.handlers import JOB_HANDLERS
+from app.schemas.api_response import ApiResponse
+from app.schemas.job_schema import JobCreate, JobOut
+from app.schemas.pagination import Pagination
+from app.schemas.user_schema import UserOut, UserRole
+from app.utils.custom_exceptions import ForbiddenException
+from uuid import UUID
+
+router = APIRouter(
+    prefix="/api/v1/jobs",
+    tags=["Jobs"],
+    dependencies=[Depends(get_current_user)],
+)
+
+
+def check_job_access(job: JobOut, current_user: UserOut) -> None:
+    if current_user.role != UserRole.ADMIN and current_user.id != job.user_id:
+        raise ForbiddenException
+
+
+@router.post(
+    "/",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=ApiResponse[JobOut],
+)
+async def submit_job(
+    job: JobCreate,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Queue a job for the background workers.
+
+    Args:
+        job (JobCreate): The kind of job, its parameters and its priority.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Returns:
+        ApiResponse[JobOut]: The API response containing the queued job, to poll for its status.
+    """
+    job = JobController.submit_job(db, user_id=current_user.id, job=job)
+    return ApiResponse[JobOut].success_response(
+        data=job, message="Job submitted successfully"
+    )
+
+
+@router.get(
+    "/kinds",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[List[str]],
+)
+async def get_job_kinds():
+    """
+    List the kinds of jobs that can be submitted.
+
+    Returns:
+        ApiResponse[List[str]]: The API response containing the job kinds.
+    """
+    return ApiResponse[List[str]].success_response(data=sorted(JOB_HANDLERS))
+
+
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[Pagination[JobOut]],
+)
+async def get_user_jobs(
+    page: int = Query(gt=0),
+    page_size: int = Query(gt=0),
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Retrieve the jobs of the current user, newest first.
+
+    Args:
+        page (int): The page number of the results to retrieve.
+        page_size (int): The number of results per page.
+        db (Session): The database session.
+        current_user (UserOut): The current authenticated user.
+
+    Returns:
+        ApiResponse[Pagination[JobOut]]: The API response containing the paginated jobs.
+    """
+    skip = (page - 1) * page_size
+    jobs, total = JobController.get_jobs_by_user_id(
+        db, user_id=current_user.id, skip=skip, limit=page_size
+    )
+    result = Pagination[JobOut].create(jobs, page, page_size, total)
+    return ApiResponse[Pagination[JobOut]].success_response(
+        data=result, message="Jobs retrieved successfully"
+    )
+
+
+@router.get(
+    "/{job_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[JobOut],
+)
+async def get_job(
+    job_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Retrieve a job, to poll for its status.
+
+    Args:
+        job_id (UUID): The ID of the job.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Returns:
+        ApiResponse[JobOut]: The API response containing the job.
+    """
+    job = JobController.get_job_by_id(db, job_id=job_id)
+    check_job_access(job, current_user)
+    return ApiResponse[JobOut].success_response(data=job)
+
+
+@router.get("/{job_id}/result", status_code=status.HTTP_200_OK)
+async def download_job_result(
+    job_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Download the result of a succeeded job.
+
+    Args:
+        job_id (UUID): The ID of the job.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Raises:
+        BadRequestException: If the job has not succeeded.
+
+    Returns:
+        Response: The result file.
+    """
+    check_job_access(JobController.get_job_by_id(db, job_id=job_id), current_user)
+    job = JobController.get_job_result(db, job_id=job_id)
+    return Response(
+        content=job.result,
+        media_type=job.result_content_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{job.result_filename}"'
+        },
+    )
+
+
+@router.post(
+    "/{job_id}/cancel",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[JobOut],
+)
+async def cancel_job(
+    job_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Cancel a job. Queued jobs are cancelled right away, running ones stop at their next checkpoint.
+
+    Args:
+        job_id (UUID): The ID of the job.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Raises:
+        BadRequestException: If the job already finished.
+
+    Returns:
+        ApiResponse[JobOut]: The API response containing the job.
+    """
+    check_job_access(JobController.get_job_by_id(db, job_id=job_id), current_user)
+    job = JobController.cancel_job(db, job_id=job_id)
+    return ApiResponse[JobOut].success_response(
+        data=job, message="Job cancellation requested"
+    )
@@ -1,24 +1,84 @@
+import asyncio
+from typing import List, Set
 from fastapi import APIRouter, Depends, status, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from app.dependencies import get_current_user, get_current_active_admin
 from app.schemas.api_response import ApiResponse
 from app.schemas.pagination import Pagination
-from app.schemas.portfolio_schema import PortfolioOut, PortfolioCreate, PortfolioUpdate
+from app.utils.content_negotiation import NegotiatedRoute
+from app.schemas.portfolio_schema import (
+    PortfolioOut,
+    PortfolioCreate,
+    PortfolioUpdate,
+    PortfolioInclude,
+    NetWorthSummary,
+    StressTestRequest,
+    StressTestResult,
+)
 from app.schemas.user_schema import UserOut
-from app.dependencies import get_db
+from app.dependencies import get_db, get_directory_db, get_shard_sessions
+from app.database.sharding import shard_router
 from sqlalchemy.orm import Session
-from app.controllers.portfolio_controller import PortfolioController
-from app.models.portfolio_model import Portfolio as PortfolioModel
+from app.controllers.portfolio_controller import (
+    PortfolioController,
+    get_portfolio_holdings,
+    price_key,
+    value_holdings,
+)
+from app.controllers.stress_controller import StressController
+from app.models.portfolio_model import Portfolio as PortfolioModel, AssetType
 from uuid import UUID
-from app.utils.custom_exceptions import ForbiddenException
+from app.utils.custom_exceptions import (
+    ForbiddenException,
+    UnprocessableEntityException,
+)
+from app.utils.cache import cache, portfolio_scope
+from app.utils.price_feed import price_feed
+
+
+# Comment line sent to idle streams so proxies keep the connection open
+STREAM_KEEPALIVE_SECONDS = 15
 
 
 router = APIRouter(
     prefix="/api/v1/portfolios",
     tags=["Portfolios"],
     dependencies=[Depends(get_current_user)],
+    # Bulk clients can ask for MessagePack instead of JSON
+    route_class=NegotiatedRoute,
 )
 
 
+def portfolio_include(default: str):
+    """
+    Build a dependency parsing the `include` query parameter.
+
+    It selects the computed portfolio fields (value, assets) to calculate, the
+    default keeps the fields each endpoint returned before the parameter.
+    """
+
+    def parse_include(
+        include: str = Query(
+            default,
+            description="Comma separated computed fields to include: value, assets",
+        )
+    ) -> Set[PortfolioInclude]:
+        try:
+            return {
+                PortfolioInclude(field.strip())
+                for field in include.split(",")
+                if field.strip()
+            }
+        except ValueError:
+            raise UnprocessableEntityException(
+                "include only accepts: "
+                + ", ".join(field.value for field in PortfolioInclude)
+            )
+
+    return parse_include
+
+
 @router.post(
     "/",
     status_code=status.HTTP_201_CREATED,
@@ -60,15 +120,17 @@ async def create_portfolio(
 async def get_all_portfolios_in_db(
     page: int = Query(gt=0),
     page_size: int = Query(gt=0),
-    db: Session = Depends(get_db),
+    include: Set[PortfolioInclude] = Depends(portfolio_include("value,assets")),
+    sessions: List[Session] = Depends(get_shard_sessions),
 ):
     """
-    Retrieve all portfolios from the database.
+    Retrieve all portfolios from the database, gathered from every shard.
 
     Args:
         page (int): The page number of the results (default: 1).
         page_size (int): The number of portfolios per page (default: 10).
-        db (Session): The database session.
+        include (Set[PortfolioInclude]): The computed fields to include (default: value,assets).
+        sessions (List[Session]): A database session on every shard.
 
     Returns:
         ApiResponse[Pagination[PortfolioOut]]: The API response containing the paginated portfolios.
@@ -77,14 +139,75 @@ async def get_all_portfolios_in_db(
         None.
     """
     skip = (page - 1) * page_size
-    portfolios = PortfolioController.get_all_portfolios(db, skip=skip, limit=page_size)
-    total = db.query(PortfolioModel).count()
+    portfolios, total = PortfolioController.get_all_portfolios_from_shards(
+        sessions, skip=skip, limit=page_size, include=include
+    )
     result = Pagination[PortfolioOut].create(portfolios, page, page_size, total)
     return ApiResponse[Pagination[PortfolioOut]].success_response(
         data=result, message="Portfolios retrieved successfully"
     )
 
 
+@router.post(
+    "/admin/stress-test",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[StressTestResult],
+    dependencies=[Depends(get_current_active_admin)],
+)
+async def run_stress_test(
+    request: StressTestRequest,
+    sessions: List[Session] = Depends(get_shard_sessions),
+):
+    """
+    Apply price shock scenarios to every portfolio, gathered from every shard.
+
+    Args:
+        request (StressTestRequest): The scenarios, the currency and how many of the worst portfolios to list.
+        sessions (List[Session]): A database session on every shard.
+
+    Returns:
+        ApiResponse[StressTestResult]: The API response containing the total and per portfolio PnL of every scenario.
+
+    Raises:
+        BadRequestException: If the holdings could not be loaded or priced.
+    """
+    result = await run_in_threadpool(
+        StressController.run_stress_test, sessions, request
+    )
+    return ApiResponse[StressTestResult].success_response(
+        data=result, message="Stress test completed successfully"
+    )
+
+
+@router.get(
+    "/summary",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[NetWorthSummary],
+)
+async def get_net_worth_summary(
+    currency: str = Query("usd", min_length=3, max_length=10),
+    top: int = Query(10, gt=0, le=100),
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Summarize the net worth of the current user across all their portfolios.
+
+    Args:
+        currency (str, optional): The currency every holding is valued in. Defaults to usd.
+        top (int, optional): The number of most valuable holdings to return. Defaults to 10.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Returns:
+        ApiResponse[NetWorthSummary]: The API response containing the total value, the value per asset type and the top holdings.
+    """
+    summary = PortfolioController.get_net_worth_summary(
+        db, user_id=current_user.id, currency=currency, top=top
+    )
+    return ApiResponse[NetWorthSummary].success_response(data=summary)
+
+
 @router.get(
     "/{portfolio_id}",
     status_code=status.HTTP_200_OK,
@@ -92,6 +215,7 @@ async def get_all_portfolios_in_db(
 )
 async def get_portfolio(
     portfolio_id: UUID,
+    include: Set[PortfolioInclude] = Depends(portfolio_include("value")),
     db: Session = Depends(get_db),
     current_user: UserOut = Depends(get_current_user),
 ):
@@ -100,18 +224,121 @@ async def get_portfolio(
 
     Args:
         portfolio_id (UUID): The ID of the portfolio to retrieve.
+        include (Set[PortfolioInclude], optional): The computed fields to include. Defaults to value.
         db (Session, optional): The database session. Defaults to Depends(get_db).
         current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
 
     Returns:
         ApiResponse[PortfolioOut]: The API response containing the retrieved portfolio.
     """
-    portfolio = PortfolioController.get_portfolio_by_id(db, portfolio_id=portfolio_id)
-    if current_user.id != portfolio.user_id:
+    if current_user.id != PortfolioController.get_portfolio_owner_id(db, portfolio_id):
         raise ForbiddenException
+    portfolio = PortfolioController.get_portfolio_by_id(
+        db, portfolio_id=portfolio_id, include=include
+    )
     return ApiResponse[PortfolioOut].success_response(data=portfolio)
 
 
+def priced_keys(holdings):
+    # Only crypto prices are available upstream so far
+    return {
+        price_key(holding)
+        for holding in holdings
+        if holding.asset_type == AssetType.CRYPTO
+    }
+
+
+def load_portfolio_holdings(portfolio_id: UUID, user_id: UUID):
+    db = shard_router.shard_for(user_id).session_factory()
+    try:
+        return get_portfolio_holdings(db, portfolio_id, user_id)
+    finally:
+        db.close()
+
+
+async def portfolio_valuation_events(portfolio_id: UUID, user_id: UUID, holdings):
+    scope = portfolio_scope(portfolio_id)
+    version = cache.local_version(scope)
+    subscription = price_feed.subscribe(priced_keys(holdings))
+    try:
+        if not subscription.keys:
+            valuation = value_holdings(portfolio_id, holdings, {})
+            yield f"event: valuation\ndata: {valuation.model_dump_json()}\n\n"
+        while True:
+            try:
+                quotes = await asyncio.wait_for(
+                    subscription.get(), STREAM_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            # Transaction writes bump the portfolio's cache version, in any
+            # worker, which the change stream follows into this one's
+            if cache.local_version(scope) != version:
+                version = cache.local_version(scope)
+                holdings = await run_in_threadpool(
+                    load_portfolio_holdings, portfolio_id, user_id
+                )
+                if priced_keys(holdings) != subscription.keys:
+                    subscription.close()
+                    subscription = price_feed.subscribe(priced_keys(holdings))
+                    quotes = {
+                        key: price_feed.quotes[key]
+                        for key in subscription.keys
+                        if key in price_feed.quotes
+                    }
+
+            valuation = value_holdings(portfolio_id, holdings, quotes)
+            yield f"event: valuation\ndata: {valuation.model_dump_json()}\n\n"
+    finally:
+        subscription.close()
+
+
+@router.get(
+    "/{portfolio_id}/stream",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+async def stream_portfolio_valuation(
+    portfolio_id: UUID,
+    db: Session = Depends(get_db),
+    directory_db: Session = Depends(get_directory_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Stream the live valuation of a portfolio as Server-Sent Events.
+
+    Every connected client shares the same price tick loop, so a valuation event
+    is pushed whenever the price of one of the portfolio's assets is refreshed.
+
+    Args:
+        portfolio_id (UUID): The ID of the portfolio to stream.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        directory_db (Session, optional): The session current_user was loaded with. Defaults to Depends(get_directory_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Raises:
+        NotFoundException: If the portfolio does not exist.
+        ForbiddenException: If the current user is not the owner of the portfolio.
+
+    Returns:
+        StreamingResponse: A text/event-stream of PortfolioValuation events.
+    """
+    if current_user.id != PortfolioController.get_portfolio_owner_id(db, portfolio_id):
+        raise ForbiddenException
+    holdings = get_portfolio_holdings(db, portfolio_id, current_user.id)
+    # The dependencies only close their sessions once the stream ends, give the
+    # connections back to the pool now rather than hold them for hours
+    db.close()
+    directory_db.close()
+    return StreamingResponse(
+        portfolio_valuation_events(portfolio_id, current_user.id, holdings),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @router.get(
     "/",
     status_code=status.HTTP_200_OK,
@@ -120,6 +347,7 @@ async def get_portfolio(
 async def get_user_portfolios(
     page: int = Query(gt=0),
     page_size: int = Query(gt=0),
+    include: Set[PortfolioInclude] = Depends(portfolio_include("value,assets")),
     db: Session = Depends(get_db),
     current_user: UserOut = Depends(get_current_user),
 ):
@@ -129,6 +357,7 @@ async def get_user_portfolios(
     Args:
         page (int): The page number of the results to retrieve.
         page_size (int): The number of results per page.
+        include (Set[PortfolioInclude]): The computed fields to include (default: value,assets).
         db (Session): The database session.
         current_user (UserOut): The current authenticated user.
 
@@ -137,7 +366,7 @@ async def get_user_portfolios(
     """
     skip = (page - 1) * page_size
     portfolios = PortfolioController.get_portfolios_by_user_id(
-        db, user_id=current_user.id, skip=skip, limit=page_size
+        db, user_id=current_user.id, skip=skip, limit=page_size, include=include
     )
     total = (
         db.query(PortfolioModel)
@@ -176,11 +405,11 @@ async def update_portfolio(
     Raises:
         ForbiddenException: If the current user is not the owner of the portfolio.
     """
+    if current_user.id != PortfolioController.get_portfolio_owner_id(db, portfolio_id):
+        raise ForbiddenException
     portfolio = PortfolioController.update_portfolio_by_id(
         db, portfolio_id=portfolio_id, portfolio=portfolio
     )
-    if current_user.id != portfolio.user_id:
-        raise ForbiddenException
     return ApiResponse[PortfolioOut].success_response(
         data=portfolio, message="Portfolio updated successfully"
     )
@@ -207,8 +436,7 @@ async def delete_portfolio(
     Returns:
         ApiResponse[str]: The API response indicating the success message of the operation.
     """
-    portfolio = PortfolioController.get_portfolio_by_id(db, portfolio_id=portfolio_id)
-    if current_user.id != portfolio.user_id:
+    if current_user.id != PortfolioController.get_portfolio_owner_id(db, portfolio_id):
         raise ForbiddenException
     mmessage = PortfolioController.delete_portfolio_by_id(db, portfolio_id=portfolio_id)
     return ApiResponse[str].success_response(message=mmessage)
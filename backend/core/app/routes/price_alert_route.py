@@ -0,0 +1,174 @@
+from fastapi import APIRouter, Depends, status, Query
+from app.dependencies import get_current_user, get_db
+from app.schemas.api_response import ApiResponse
+from app.schemas.pagination import Pagination
+from app.schemas.price_alert_schema import (
+    PriceAlertOut,
+    PriceAlertCreate,
+    PriceAlertUpdate,
+)
+from app.schemas.user_schema import UserOut
+from sqlalchemy.orm import Session
+from app.controllers.price_alert_controller import PriceAlertController
+from uuid import UUID
+from app.utils.custom_exceptions import ForbiddenException
+
+router = APIRouter(
+    prefix="/api/v1/alerts",
+    tags=["Price alerts"],
+    dependencies=[Depends(get_current_user)],
+)
+
+
+@router.post(
+    "/",
+    status_code=status.HTTP_201_CREATED,
+    response_model=ApiResponse[PriceAlertOut],
+)
+async def create_price_alert(
+    alert: PriceAlertCreate,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Create a price alert for the current user, triggered once when the price of the asset crosses the threshold.
+
+    Args:
+        alert (PriceAlertCreate): The asset, currency, direction and threshold of the alert.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Raises:
+        BadRequestException: If the user has too many active alerts already.
+
+    Returns:
+        ApiResponse[PriceAlertOut]: The API response containing the created alert.
+    """
+    alert = PriceAlertController.create_alert(db, user_id=current_user.id, alert=alert)
+    return ApiResponse[PriceAlertOut].success_response(
+        data=alert, message="Price alert created successfully"
+    )
+
+
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[Pagination[PriceAlertOut]],
+)
+async def get_user_price_alerts(
+    page: int = Query(gt=0),
+    page_size: int = Query(gt=0),
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Retrieve the price alerts of the current user, newest first.
+
+    Args:
+        page (int): The page number of the results to retrieve.
+        page_size (int): The number of results per page.
+        db (Session): The database session.
+        current_user (UserOut): The current authenticated user.
+
+    Returns:
+        ApiResponse[Pagination[PriceAlertOut]]: The API response containing the paginated alerts.
+    """
+    skip = (page - 1) * page_size
+    alerts, total = PriceAlertController.get_alerts_by_user_id(
+        db, user_id=current_user.id, skip=skip, limit=page_size
+    )
+    result = Pagination[PriceAlertOut].create(alerts, page, page_size, total)
+    return ApiResponse[Pagination[PriceAlertOut]].success_response(
+        data=result, message="Price alerts retrieved successfully"
+    )
+
+
+@router.get(
+    "/{alert_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[PriceAlertOut],
+)
+async def get_price_alert(
+    alert_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Retrieve a price alert by its ID.
+
+    Args:
+        alert_id (UUID): The ID of the alert to retrieve.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Raises:
+        ForbiddenException: If the current user is not the owner of the alert.
+
+    Returns:
+        ApiResponse[PriceAlertOut]: The API response containing the alert.
+    """
+    if current_user.id != PriceAlertController.get_alert_owner_id(db, alert_id):
+        raise ForbiddenException
+    alert = PriceAlertController.get_alert_by_id(db, alert_id=alert_id)
+    return ApiResponse[PriceAlertOut].success_response(data=alert)
+
+
+@router.patch(
+    "/{alert_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[PriceAlertOut],
+)
+async def update_price_alert(
+    alert_id: UUID,
+    alert: PriceAlertUpdate,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Update a price alert by its ID, which re-arms it if it was triggered.
+
+    Args:
+        alert_id (UUID): The ID of the alert to be updated.
+        alert (PriceAlertUpdate): The updated alert data.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Returns:
+        ApiResponse[PriceAlertOut]: The API response containing the updated alert.
+
+    Raises:
+        ForbiddenException: If the current user is not the owner of the alert.
+    """
+    if current_user.id != PriceAlertController.get_alert_owner_id(db, alert_id):
+        raise ForbiddenException
+    alert = PriceAlertController.update_alert_by_id(db, alert_id=alert_id, alert=alert)
+    return ApiResponse[PriceAlertOut].success_response(
+        data=alert, message="Price alert updated successfully"
+    )
+
+
+@router.delete(
+    "/{alert_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[str],
+)
+async def delete_price_alert(
+    alert_id: UUID,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Delete a price alert by its ID.
+
+    Args:
+        alert_id (UUID): The ID of the alert to be deleted.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Returns:
+        ApiResponse[str]: The API response indicating the success message of the operation.
+    """
+    if current_user.id != PriceAlertController.get_alert_owner_id(db, alert_id):
+        raise ForbiddenException
+    message = PriceAlertController.delete_alert_by_id(db, alert_id=alert_id)
+    return ApiResponse[str].success_response(message=message)
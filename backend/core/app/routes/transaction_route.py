@@ -1,20 +1,31 @@
 from fastapi import APIRouter, Depends, status, Query
+from fastapi.responses import StreamingResponse
 from app.dependencies import get_current_user, get_current_active_admin
 from app.schemas.api_response import ApiResponse
 from app.schemas.user_schema import UserOut
-from app.dependencies import get_db
+from app.dependencies import get_db, get_shard_sessions
 from sqlalchemy.orm import Session
 from app.controllers.transaction_controller import TransactionController
 from app.controllers.portfolio_controller import PortfolioController
+from app.controllers.report_controller import ReportController
 from app.schemas.transaction_schema import (
     TransactionOut,
     TransactionCreate,
     TransactionUpdate,
+    TransactionBatchSelection,
+    TransactionBatchUpdate,
+    TransactionBatchResult,
 )
 from app.models.transaction_model import Transaction as TransactionModel
 from uuid import UUID
+from typing import List
 from app.utils.custom_exceptions import ForbiddenException
+from app.utils.write_batcher import (
+    TRANSACTION_WRITE_BATCHING,
+    transaction_write_batcher_for,
+)
 from app.schemas.pagination import Pagination
+from app.utils.content_negotiation import NegotiatedRoute
 from datetime import datetime
 
 
@@ -22,6 +33,8 @@ router = APIRouter(
     prefix="/api/v1/transactions",
     tags=["Transactions"],
     dependencies=[Depends(get_current_user)],
+    # Bulk clients can ask for MessagePack instead of JSON
+    route_class=NegotiatedRoute,
 )
 
 
@@ -36,7 +49,9 @@ async def create_transaction(
     current_user: UserOut = Depends(get_current_user),
 ):
     """
-    Create a new transaction.
+    Create a new transaction. The asset name is stored lowercased, as the id
+    of the asset at the price provider, e.g. "Bitcoin" is returned as "bitcoin".
+    An asset keeps the ticker symbol it was first registered with.
 
     Args:
         transaction (TransactionCreate): The transaction data.
@@ -44,6 +59,7 @@ async def create_transaction(
         current_user (UserOut, optional): The current user. Defaults to Depends(get_current_user).
 
     Raises:
+        BadRequestException: If the ticker symbol differs from the asset's registered one.
         ForbiddenException: If the current user is not authorized to create the transaction.
 
     Returns:
@@ -51,12 +67,120 @@ async def create_transaction(
     """
     if current_user.id != transaction.user_id:
         raise ForbiddenException
-    transaction = TransactionController.create_transaction(db, transaction)
+    if TRANSACTION_WRITE_BATCHING:
+        # Group commit: the create is written with others queued meanwhile
+        TransactionController.validate_transaction_create(db, transaction)
+        batcher = transaction_write_batcher_for(transaction.user_id)
+        transaction = await batcher.submit(transaction)
+    else:
+        transaction = TransactionController.create_transaction(db, transaction)
     return ApiResponse[TransactionOut].success_response(
         data=transaction, message="Transaction created successfully"
     )
 
 
+# Batch routes are declared before the /{transaction_id} ones, which would
+# otherwise match "batch" as an id
+@router.patch(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[TransactionBatchResult],
+)
+async def update_transactions(
+    batch: TransactionBatchUpdate,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Apply the same changes to many transactions of the current user at once.
+    A new ticker symbol has to come with the asset name it belongs to, which
+    is stored lowercased.
+
+    Args:
+        batch (TransactionBatchUpdate): The ids or filter selecting the transactions, and the changes.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Raises:
+        BadRequestException: If a ticker symbol is given without an asset name.
+        ForbiddenException: If one of the ids belongs to another user.
+        NotFoundException: If one of the ids does not exist.
+
+    Returns:
+        ApiResponse[TransactionBatchResult]: The API response containing the number of updated transactions.
+    """
+    affected = TransactionController.update_transactions(
+        db, selection=batch, transaction=batch.changes, user_id=current_user.id
+    )
+    return ApiResponse[TransactionBatchResult].success_response(
+        data=TransactionBatchResult(affected=affected),
+        message="Transactions updated successfully",
+    )
+
+
+@router.post(
+    "/batch/delete",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[TransactionBatchResult],
+)
+async def delete_transactions(
+    selection: TransactionBatchSelection,
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Soft delete many transactions of the current user at once.
+
+    Args:
+        selection (TransactionBatchSelection): The ids or filter selecting the transactions.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Raises:
+        ForbiddenException: If one of the ids belongs to another user.
+        NotFoundException: If one of the ids does not exist.
+
+    Returns:
+        ApiResponse[TransactionBatchResult]: The API response containing the number of deleted transactions.
+    """
+    affected = TransactionController.soft_delete_transactions(
+        db, selection=selection, user_id=current_user.id
+    )
+    return ApiResponse[TransactionBatchResult].success_response(
+        data=TransactionBatchResult(affected=affected),
+        message="Transactions deleted successfully",
+    )
+
+
+@router.post(
+    "/admin/batch/delete",
+    status_code=status.HTTP_200_OK,
+    response_model=ApiResponse[TransactionBatchResult],
+    dependencies=[Depends(get_current_active_admin)],
+)
+async def hard_delete_transactions(
+    selection: TransactionBatchSelection,
+    sessions: List[Session] = Depends(get_shard_sessions),
+):
+    """
+    Hard delete many transactions from the database at once, on every shard. This is an admin only endpoint.
+
+    Args:
+        selection (TransactionBatchSelection): The ids or filter selecting the transactions.
+        sessions (List[Session], optional): A database session on every shard. Defaults to Depends(get_shard_sessions).
+
+    Returns:
+        ApiResponse[TransactionBatchResult]: The API response containing the number of deleted transactions.
+    """
+    affected = TransactionController.delete_transactions_from_shards(
+        sessions, selection=selection
+    )
+    return ApiResponse[TransactionBatchResult].success_response(
+        data=TransactionBatchResult(affected=affected),
+        message="Transactions hard deleted successfully",
+    )
+
+
 @router.get(
     "/admin",
     status_code=status.HTTP_200_OK,
@@ -69,18 +193,18 @@ async def get_all_transactions_in_db(
     start_time: datetime = None,
     end_time: datetime = None,
     include_deleted: bool = False,
-    db: Session = Depends(get_db),
+    sessions: List[Session] = Depends(get_shard_sessions),
 ):
     """
-    Retrieve all transactions from the database. This is an admin only endpoint.
+    Retrieve all transactions from the database, merged from every shard. This is an admin only endpoint.
 
     Args:
         page (int): The page number for pagination (default: 1).
         page_size (int): The number of transactions per page (default: 10).
         start_time (datetime): The start time to filter transactions (optional).
         end_time (datetime): The end time to filter transactions (optional).
-        include_deleted (bool): Flag to include deleted transactions (default: False).
-        db (Session): The database session.
+        include_deleted (bool): Flag to include deleted and archived transactions (default: False).
+        sessions (List[Session]): A database session on every shard.
 
     Returns:
         ApiResponse[Pagination[TransactionOut]]: The API response containing the paginated transactions.
@@ -89,8 +213,8 @@ async def get_all_transactions_in_db(
         None.
     """
     skip = (page - 1) * page_size
-    transactions, total = TransactionController.get_all_transactions(
-        db,
+    transactions, total = TransactionController.get_all_transactions_from_shards(
+        sessions,
         skip=skip,
         limit=page_size,
         start_time=start_time,
@@ -151,6 +275,40 @@ async def get_transactions_by_user(
     )
 
 
+@router.get(
+    "/reports/realized-gains",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+)
+async def get_realized_gains_report(
+    year: int = Query(ge=1970, le=9998),
+    db: Session = Depends(get_db),
+    current_user: UserOut = Depends(get_current_user),
+):
+    """
+    Download the realized gains and losses of the current user over a year, as CSV.
+
+    Sales are matched against the lots of the same portfolio, asset and currency,
+    first in first out, with transaction fees included. The report is written
+    while the transactions are read, so its size does not matter.
+
+    Args:
+        year (int): The calendar year of the sales to report.
+        db (Session, optional): The database session. Defaults to Depends(get_db).
+        current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
+
+    Returns:
+        StreamingResponse: A text/csv report, one row per lot matched by a sale.
+    """
+    return StreamingResponse(
+        ReportController.realized_gains_csv(db, current_user.id, year),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="realized-gains-{year}.csv"'
+        },
+    )
+
+
 @router.get(
     "/{transaction_id}",
     status_code=status.HTTP_200_OK,
@@ -212,8 +370,7 @@ async def get_portfolio_transactions(
     Raises:
         ForbiddenException: If the current user does not have access to the portfolio.
     """
-    portfolio = PortfolioController.get_portfolio_by_id(db, portfolio_id=portfolio_id)
-    if current_user.id != portfolio.user_id:
+    if current_user.id != PortfolioController.get_portfolio_owner_id(db, portfolio_id):
         raise ForbiddenException
     skip = (page - 1) * page_size
     transactions, total = TransactionController.get_transactions_by_portfolio_id(
@@ -244,6 +401,8 @@ async def update_transaction(
 ):
     """
     Update a transaction by its ID. This endpoint is only accessible by the owner of the transaction.
+    A new asset name is stored lowercased, as the id of the asset at the price provider.
+    A new ticker symbol has to come with the asset name it belongs to.
 
     Args:
         transaction_id (UUID): The ID of the transaction to be updated.
@@ -251,6 +410,9 @@ async def update_transaction(
         db (Session, optional): The database session. Defaults to Depends(get_db).
         current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
 
+    Raises:
+        BadRequestException: If a ticker symbol is given without an asset name, or differs from the asset's registered one.
+
     Returns:
         ApiResponse[TransactionOut]: The API response containing the updated transaction data.
     """
@@ -305,18 +467,20 @@ async def delete_transaction(
     response_model=ApiResponse[str],
     dependencies=[Depends(get_current_active_admin)],
 )
-async def hard_delete_transaction(transaction_id: UUID, db: Session = Depends(get_db)):
+async def hard_delete_transaction(
+    transaction_id: UUID, sessions: List[Session] = Depends(get_shard_sessions)
+):
     """
-    Hard delete a transaction by its ID from the database. This is an admin only endpoint.
+    Hard delete a transaction by its ID from the database, whichever shard holds it. This is an admin only endpoint.
 
     Args:
         transaction_id (UUID): The ID of the transaction to be deleted.
-        db (Session, optional): The database session. Defaults to Depends(get_db).
+        sessions (List[Session], optional): A database session on every shard. Defaults to Depends(get_shard_sessions).
 
     Returns:
         ApiResponse[str]: The API response indicating the success or failure of the deletion.
     """
-    message = TransactionController.hard_delete_transaction_by_id(
-        db, transaction_id=transaction_id
+    message = TransactionController.delete_transaction_from_shards(
+        sessions, transaction_id=transaction_id
     )
     return ApiResponse[str].success_response(message=message)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, Query, status
 from sqlalchemy.orm import Session
-from app.dependencies import get_db
+from app.dependencies import get_directory_db
 from app.controllers.user_controller import UserController
 from app.schemas.user_schema import UserUpdate, UserOut
 from app.models.user_model import User as UserModel
@@ -20,7 +20,7 @@ router = APIRouter(
 )
 async def get_user(
     user_id: UUID,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_directory_db),
     current_user: UserOut = Depends(get_current_user),
 ):
     """
@@ -28,7 +28,7 @@ async def get_user(
 
     Args:
         user_id (UUID): The ID of the user to retrieve.
-        db (Session, optional): The database session. Defaults to Depends(get_db).
+        db (Session, optional): The database session. Defaults to Depends(get_directory_db).
         current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
 
     Raises:
@@ -52,7 +52,7 @@ async def get_user(
 async def get_all_users(
     page: int = Query(gt=0),
     page_size: int = Query(gt=0),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_directory_db),
 ):
     """
     Retrieve all users with pagination.
@@ -82,7 +82,7 @@ async def get_all_users(
 async def update_user(
     user_id: UUID,
     user: UserUpdate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_directory_db),
     current_user: UserOut = Depends(get_current_user),
 ):
     """
@@ -91,7 +91,7 @@ async def update_user(
     Args:
         user_id (UUID): The ID of the user to update.
         user (UserUpdate): The updated user data.
-        db (Session, optional): The database session. Defaults to Depends(get_db).
+        db (Session, optional): The database session. Defaults to Depends(get_directory_db).
         current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
 
     Raises:
@@ -115,7 +115,7 @@ async def update_user(
 )
 async def delete_user(
     user_id: UUID,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_directory_db),
     current_user: UserOut = Depends(get_current_user),
 ):
     """
@@ -123,7 +123,7 @@ async def delete_user(
 
     Parameters:
     - user_id (UUID): The ID of the user to be deleted.
-    - db (Session, optional): The database session. Defaults to Depends(get_db).
+    - db (Session, optional): The database session. Defaults to Depends(get_directory_db).
     - current_user (UserOut, optional): The current authenticated user. Defaults to Depends(get_current_user).
 
     Returns:
@@ -0,0 +1,31 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from app.models.job_model import JobStatus
+from uuid import UUID
+from typing import Any, Dict, Optional
+
+
+class JobCreate(BaseModel):
+    kind: str = Field(..., description="The kind of job, see GET /api/v1/jobs/kinds")
+    params: Dict[str, Any] = Field(default_factory=dict)
+    # Higher runs first
+    priority: int = Field(0, ge=-10, le=10)
+
+
+class JobOut(BaseModel):
+    id: UUID
+    user_id: UUID
+    kind: str
+    params: Dict[str, Any]
+    priority: int
+    status: JobStatus
+    cancel_requested: bool
+    result_content_type: Optional[str]
+    result_filename: Optional[str]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class ConfigDict:
+        from_attributes = True
@@ -1,9 +1,18 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
 from uuid import UUID
-from typing import Optional
+from typing import Annotated, Dict, Optional
+from enum import Enum
 from app.models.portfolio_model import AssetType
 
+STRESS_TEST_MAX_SCENARIOS = 10_000
+
+
+class PortfolioInclude(str, Enum):
+    # Computed fields of PortfolioOut, only calculated when requested
+    VALUE = "value"
+    ASSETS = "assets"
+
 
 class Asset(BaseModel):
     asset_name: str
@@ -14,6 +23,41 @@ class Asset(BaseModel):
     total_value: float
 
 
+class Holding(BaseModel):
+    asset_name: str
+    ticker_symbol: str
+    asset_type: AssetType
+    currency: str
+    quantity: float
+
+
+class HoldingValue(Holding):
+    price: Optional[float] = None
+    total_value: float
+
+
+class PortfolioValuation(BaseModel):
+    portfolio_id: UUID
+    current_value: float
+    assets: list[HoldingValue]
+    timestamp: datetime
+
+
+class AssetTypeValue(BaseModel):
+    asset_type: AssetType
+    total_value: float
+
+
+class NetWorthSummary(BaseModel):
+    user_id: UUID
+    # Every holding is valued in this currency
+    currency: str
+    total_value: float
+    asset_types: list[AssetTypeValue]
+    top_holdings: list[HoldingValue]
+    timestamp: datetime
+
+
 class PortfolioBase(BaseModel):
     name: str = Field(..., min_length=3, max_length=50)
     description: Optional[str] = Field(None, max_length=254)
@@ -29,6 +73,48 @@ class PortfolioUpdate(PortfolioBase):
     description: Optional[str] = Field(None, max_length=254)
 
 
+class PriceShockScenario(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    # Relative price change by asset name, e.g. {"bitcoin": -0.3} for a 30% drop
+    shocks: Dict[str, Annotated[float, Field(ge=-1)]] = Field(..., min_length=1)
+
+
+class StressTestRequest(BaseModel):
+    scenarios: list[PriceShockScenario] = Field(
+        ..., min_length=1, max_length=STRESS_TEST_MAX_SCENARIOS
+    )
+    currency: str = Field("usd", min_length=3, max_length=10)
+    # Portfolios losing the most listed per scenario
+    worst: int = Field(10, ge=0, le=100)
+
+
+class PortfolioPnL(BaseModel):
+    portfolio_id: UUID
+    base_value: float
+    pnl: float
+
+
+class ScenarioResult(BaseModel):
+    name: str
+    pnl: float
+    # Relative to the value of every portfolio, None when that is 0
+    pnl_ratio: Optional[float]
+    stressed_value: float
+    losing_portfolios: int
+    worst_portfolios: list[PortfolioPnL]
+
+
+class StressTestResult(BaseModel):
+    # Every holding is valued in this currency
+    currency: str
+    portfolios: int
+    base_value: float
+    # Held, but without a price to shock, they count as 0
+    unpriced_assets: list[str]
+    scenarios: list[ScenarioResult]
+    timestamp: datetime
+
+
 class PortfolioOut(BaseModel):
     id: UUID
     name: str
@@ -0,0 +1,43 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from app.database.fixed_point import FIXED_POINT_MAX
+from app.models.price_alert_model import AlertDirection
+from uuid import UUID
+from typing import Optional
+
+
+class PriceAlertBase(BaseModel):
+    # The asset as the price feed names it, e.g. bitcoin
+    asset_name: str = Field(..., min_length=3, max_length=50)
+    currency: str = Field("usd", min_length=3, max_length=10)
+    direction: AlertDirection = Field(...)
+    threshold: float = Field(..., gt=0, le=FIXED_POINT_MAX)
+    note: Optional[str] = Field(None, max_length=254)
+
+
+class PriceAlertCreate(PriceAlertBase):
+    pass
+
+
+class PriceAlertUpdate(BaseModel):
+    # Any change re-arms a triggered alert
+    direction: Optional[AlertDirection] = None
+    threshold: Optional[float] = Field(None, gt=0, le=FIXED_POINT_MAX)
+    note: Optional[str] = Field(None, max_length=254)
+
+
+class PriceAlertOut(BaseModel):
+    id: UUID
+    user_id: UUID
+    asset_name: str
+    currency: str
+    direction: AlertDirection
+    threshold: float
+    note: Optional[str]
+    triggered_at: Optional[datetime]
+    triggered_price: Optional[float]
+    created_at: datetime
+    updated_at: datetime
+
+    class ConfigDict:
+        from_attributes = True
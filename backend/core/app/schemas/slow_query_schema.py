@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+
+class SlowQuery(BaseModel):
+    statement: str
+    route: Optional[str]
+    parameter_shape: str
+    duration_ms: float
+    recorded_at: datetime
+    plan: Optional[str] = None
@@ -2,8 +2,12 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 from app.models.transaction_model import TransactionType
 from app.models.portfolio_model import AssetType
+from app.database.fixed_point import FIXED_POINT_MAX
 from uuid import UUID
-from typing import Optional
+from typing import List, Optional
+
+# Largest number of ids a batch mutation accepts
+TRANSACTION_BATCH_MAX_IDS = 1000
 
 
 class TransactionBase(BaseModel):
@@ -11,10 +15,11 @@ class TransactionBase(BaseModel):
     asset_name: str = Field(..., min_length=3, max_length=50)
     transaction_type: TransactionType = Field(...)
     asset_type: AssetType = Field(...)
-    amount: float = Field(..., gt=0)
+    amount: float = Field(..., gt=0, le=FIXED_POINT_MAX)
     currency: str = Field(..., min_length=3, max_length=3)  # ISO 4217 currency codes
-    unit_price: float = Field(..., gt=0)
-    transaction_fee: float = Field(..., ge=0)  # ge=0 allows for zero fee
+    unit_price: float = Field(..., gt=0, le=FIXED_POINT_MAX)
+    # ge=0 allows for zero fee
+    transaction_fee: float = Field(..., ge=0, le=FIXED_POINT_MAX)
     note: Optional[str] = Field(None, max_length=254)
 
 
@@ -24,13 +29,13 @@ class TransactionCreate(TransactionBase):
 
 
 class TransactionUpdate(BaseModel):
-    transaction_type: Optional[TransactionType]
+    transaction_type: Optional[TransactionType] = None
     ticker_symbol: Optional[str] = Field(None, min_length=3, max_length=8)
     asset_name: Optional[str] = Field(None, min_length=3, max_length=50)
-    amount: Optional[float] = Field(None, gt=0)
+    amount: Optional[float] = Field(None, gt=0, le=FIXED_POINT_MAX)
     currency: Optional[str] = Field(None, min_length=3, max_length=3)
-    unit_price: Optional[float] = Field(None, gt=0)
-    transaction_fee: Optional[float] = Field(None, ge=0)
+    unit_price: Optional[float] = Field(None, gt=0, le=FIXED_POINT_MAX)
+    transaction_fee: Optional[float] = Field(None, ge=0, le=FIXED_POINT_MAX)
     note: Optional[str] = Field(None, max_length=254)
 
 
@@ -53,3 +58,28 @@ class TransactionOut(BaseModel):
 
     class ConfigDict:
         from_attributes = True
+
+
+class TransactionBatchFilter(BaseModel):
+    portfolio_id: Optional[UUID] = None
+    asset_name: Optional[str] = None
+    transaction_type: Optional[TransactionType] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    include_deleted: bool = False
+
+
+class TransactionBatchSelection(BaseModel):
+    # Either explicit ids or a filter, not both
+    ids: Optional[List[UUID]] = Field(
+        None, min_length=1, max_length=TRANSACTION_BATCH_MAX_IDS
+    )
+    filter: Optional[TransactionBatchFilter] = None
+
+
+class TransactionBatchUpdate(TransactionBatchSelection):
+    changes: TransactionUpdate
+
+
+class TransactionBatchResult(BaseModel):
+    affected: int
@@ -0,0 +1,457 @@
+"""
+Production server: a master process that preloads the app and forks uvicorn
+workers serving requests on the socket it listens on.
+
+The app is imported once, in the master, which bootstraps the databases as
+importing app.main does; the workers are forked from it afterwards. They
+share the memory of everything the master imported, copy-on-write, and each
+runs the lifespan of the app for itself. There are SERVER_WORKERS of them,
+one per CPU by default.
+
+A worker is replaced by a new one, which is started first and the old one
+then stopped gracefully, once it has:
+- served SERVER_WORKER_MAX_REQUESTS requests, give or take a random part of
+  SERVER_WORKER_MAX_REQUESTS_JITTER so that workers are not all replaced
+  together,
+- more than SERVER_WORKER_MAX_MEMORY_MB of memory of its own, i.e. not
+  shared with the master, checked every SERVER_MEMORY_CHECK_SECONDS.
+Either is off at 0. On SIGHUP all workers are replaced that way, one at a
+time, which restarts them without dropping requests. The new workers are
+forked from the master like the old ones, new code is deployed by restarting
+the master.
+
+SIGTERM or SIGINT stop the workers gracefully, requests in flight have
+SERVER_GRACEFUL_TIMEOUT seconds to finish. A worker that exits before it
+serves, or does not serve within SERVER_WORKER_BOOT_TIMEOUT, is started
+again after a delay that doubles with every failure in a row, while the
+others go on serving. SERVER_WORKER_MAX_BOOT_FAILURES failures in a row stop
+the server.
+
+Run from backend/core with: python start.py
+"""
+
+import asyncio
+import importlib
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS") or os.cpu_count() or 1)
+SERVER_WORKER_MAX_REQUESTS = int(os.getenv("SERVER_WORKER_MAX_REQUESTS") or 100_000)
+SERVER_WORKER_MAX_REQUESTS_JITTER = int(
+    os.getenv("SERVER_WORKER_MAX_REQUESTS_JITTER") or 10_000
+)
+SERVER_WORKER_MAX_MEMORY_MB = float(os.getenv("SERVER_WORKER_MAX_MEMORY_MB") or 1024)
+SERVER_MEMORY_CHECK_SECONDS = float(os.getenv("SERVER_MEMORY_CHECK_SECONDS") or 10)
+SERVER_GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT") or 30)
+# For the app to start in a new worker, before the server gives up on it
+SERVER_WORKER_BOOT_TIMEOUT = float(os.getenv("SERVER_WORKER_BOOT_TIMEOUT") or 60)
+# Workers failing to start in a row before the server stops
+SERVER_WORKER_MAX_BOOT_FAILURES = int(os.getenv("SERVER_WORKER_MAX_BOOT_FAILURES") or 5)
+
+# Sent by workers to the master through their pipe
+READY = b"+"
+RECYCLE = b"r"
+# Connections a stopping worker accepted just before it stopped accepting get
+# that long to send their request, which it then serves
+DRAIN_SECONDS = 1.0
+# Before starting a worker again after a failed start, doubled on each one
+BOOT_RETRY_SECONDS = 1.0
+BOOT_RETRY_MAX_SECONDS = 30.0
+
+
+def private_memory_bytes(pid: int) -> Optional[int]:
+    """Memory of a process not shared with any other, None when unknown."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            kilobytes = sum(
+                int(line.split()[1])
+                for line in smaps
+                if line.startswith(("Private_Clean:", "Private_Dirty:"))
+            )
+    except (OSError, ValueError):
+        return None
+    return kilobytes * 1024
+
+
+def request_budget(max_requests: int, jitter: int) -> int:
+    if max_requests <= 0:
+        return 0
+    return max_requests + random.randint(0, max(jitter, 0))
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def dispose_engines() -> None:
+    # Pooled connections opened by the master must not be shared with the
+    # workers, which open their own
+    from app.database import db_config
+    from app.database.sharding import shard_router
+
+    for engine in {db_config.engine, *shard_router.engines}:
+        engine.dispose(close=False)
+
+
+class Worker:
+    def __init__(self, pid: int, pipe: int):
+        self.pid = pid
+        self.pipe = pipe
+        self.ready = False
+        self.started_at = time.monotonic()
+        # Set once it was asked to stop, the time it gets to do so
+        self.stop_deadline: Optional[float] = None
+        # Killed for not starting in time
+        self.boot_timed_out = False
+
+
+class PreforkServer:
+    def __init__(
+        self,
+        app: str,
+        host: str,
+        port: int,
+        workers: int = SERVER_WORKERS,
+        max_requests: int = SERVER_WORKER_MAX_REQUESTS,
+        max_requests_jitter: int = SERVER_WORKER_MAX_REQUESTS_JITTER,
+        max_memory_mb: float = SERVER_WORKER_MAX_MEMORY_MB,
+        memory_check_seconds: float = SERVER_MEMORY_CHECK_SECONDS,
+        graceful_timeout: float = SERVER_GRACEFUL_TIMEOUT,
+        boot_timeout: float = SERVER_WORKER_BOOT_TIMEOUT,
+        max_boot_failures: int = SERVER_WORKER_MAX_BOOT_FAILURES,
+        after_fork=dispose_engines,
+    ):
+        self.app_path = app
+        self.host = host
+        self.port = port
+        self.workers = max(workers, 1)
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.memory_check_seconds = memory_check_seconds
+        self.graceful_timeout = graceful_timeout
+        self.boot_timeout = boot_timeout
+        self.max_boot_failures = max(max_boot_failures, 1)
+        self.after_fork = after_fork
+        self.app = None
+        self.socket: Optional[socket.socket] = None
+        self._workers: Dict[int, Worker] = {}
+        # Workers to replace, one at a time, and the replacement under way
+        self._to_replace: Deque[Worker] = deque()
+        self._replacing: Optional[Worker] = None
+        self._replacement: Optional[Worker] = None
+        # Failed starts in a row, and when the next worker may be started
+        self._boot_failures = 0
+        self._boot_retry_at = 0.0
+        # Workers to start again once the retry time comes
+        self._respawns = 0
+        self._stopping = False
+        self._exit_code = 0
+        self._memory_checked_at = 0.0
+        self._wakeup_read, self._wakeup_write = -1, -1
+
+    def load(self) -> None:
+        # Importing the app bootstraps the databases, once for all workers
+        module, _, attribute = self.app_path.partition(":")
+        self.app = getattr(importlib.import_module(module), attribute)
+
+    def run(self) -> int:
+        if self.app is None:
+            self.load()
+        self.socket = bind_socket(self.host, self.port)
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_write, False)
+        signal.set_wakeup_fd(self._wakeup_write)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_rolling_restart)
+        # Only interrupts the wait, exits are reaped in the loop
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        print(
+            f"Serving {self.app_path} on {self.host}:{self.port} "
+            f"with {self.workers} workers, master [{os.getpid()}]"
+        )
+
+        for _ in range(self.workers):
+            self._spawn()
+        while not self._stopping:
+            self._tick()
+        self._stop_all()
+        self.socket.close()
+        return self._exit_code
+
+    def _handle_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _handle_rolling_restart(self, signum, frame) -> None:
+        print("Restarting the workers one by one")
+        self._to_replace.extend(
+            worker
+            for worker in self._workers.values()
+            if worker.stop_deadline is None and worker not in self._to_replace
+        )
+
+    def _spawn(self) -> Worker:
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            code = 0
+            try:
+                self._serve(write)
+            except BaseException as e:
+                print(f"Worker [{os.getpid()}] failed: {e!r}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        os.close(write)
+        os.set_blocking(read, False)
+        worker = Worker(pid, read)
+        self._workers[pid] = worker
+        return worker
+
+    def _tick(self) -> None:
+        pipes = {worker.pipe: worker for worker in self._workers.values()}
+        readable, _, _ = select.select([self._wakeup_read, *pipes], [], [], 1.0)
+        for fd in readable:
+            if fd == self._wakeup_read:
+                os.read(self._wakeup_read, 512)
+            else:
+                self._read_messages(pipes[fd])
+        self._reap()
+        self._check_boot()
+        self._respawn()
+        self._check_memory()
+        self._replace_next()
+        self._enforce_deadlines()
+
+    def _read_messages(self, worker: Worker) -> None:
+        try:
+            messages = os.read(worker.pipe, 512)
+        except BlockingIOError:
+            return
+        if READY in messages:
+            worker.ready = True
+            self._boot_failures = 0
+        if RECYCLE in messages:
+            self._recycle(worker, "served its requests")
+
+    def _recycle(self, worker: Worker, reason: str) -> None:
+        if (
+            worker.stop_deadline is not None
+            or worker is self._replacing
+            or worker in self._to_replace
+        ):
+            return
+        print(f"Replacing worker [{worker.pid}], it {reason}")
+        self._to_replace.append(worker)
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self._workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.pipe)
+            if worker.stop_deadline is not None or self._stopping:
+                continue
+            if not worker.ready:
+                self._boot_failed(worker)
+                continue
+            # Died on its own, e.g. killed for lack of memory
+            print(f"Worker [{pid}] exited with status {status}, starting another")
+            if worker is self._replacing:
+                self._replacing = None
+            else:
+                self._spawn()
+
+    def _boot_failed(self, worker: Worker) -> None:
+        self._boot_failures += 1
+        if self._boot_failures >= self.max_boot_failures:
+            print(
+                f"Worker [{worker.pid}] failed to start, "
+                f"{self._boot_failures} in a row, stopping"
+            )
+            self._exit_code = 1
+            self._stopping = True
+            return
+        delay = min(
+            BOOT_RETRY_SECONDS * 2 ** (self._boot_failures - 1), BOOT_RETRY_MAX_SECONDS
+        )
+        print(f"Worker [{worker.pid}] failed to start, starting another in {delay:g}s")
+        self._boot_retry_at = time.monotonic() + delay
+        if worker is self._replacement:
+            self._replacement = None
+            if self._replacing is not None:
+                # Goes on serving, and is replaced once the retry time comes
+                self._to_replace.appendleft(self._replacing)
+                self._replacing = None
+                return
+        self._respawns += 1
+
+    def _check_boot(self) -> None:
+        now = time.monotonic()
+        for worker in self._workers.values():
+            if (
+                not worker.ready
+                and not worker.boot_timed_out
+                and worker.stop_deadline is None
+                and now - worker.started_at > self.boot_timeout
+            ):
+                print(f"Worker [{worker.pid}] did not start in time")
+                # Reaped as a failed start
+                worker.boot_timed_out = True
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _respawn(self) -> None:
+        while self._respawns and time.monotonic() >= self._boot_retry_at:
+            self._respawns -= 1
+            self._spawn()
+
+    def _check_memory(self) -> None:
+        if self.max_memory_bytes <= 0:
+            return
+        now = time.monotonic()
+        if now - self._memory_checked_at < self.memory_check_seconds:
+            return
+        self._memory_checked_at = now
+        for worker in list(self._workers.values()):
+            memory = private_memory_bytes(worker.pid)
+            if memory is not None and memory > self.max_memory_bytes:
+                self._recycle(worker, f"holds {memory / 2**20:.0f} MiB of its own")
+
+    def _replace_next(self) -> None:
+        if self._replacement is not None:
+            if self._replacement.ready:
+                # Serving, the old one can go
+                if self._replacing is not None:
+                    self._terminate(self._replacing)
+                self._replacing = self._replacement = None
+            return
+        if time.monotonic() < self._boot_retry_at:
+            return
+        while self._to_replace:
+            worker = self._to_replace.popleft()
+            if worker.pid in self._workers and worker.stop_deadline is None:
+                self._replacing = worker
+                self._replacement = self._spawn()
+                return
+
+    def _terminate(self, worker: Worker) -> None:
+        worker.stop_deadline = time.monotonic() + self.graceful_timeout + 5
+        try:
+            os.kill(worker.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _enforce_deadlines(self) -> None:
+        now = time.monotonic()
+        for worker in self._workers.values():
+            if worker.stop_deadline is not None and now > worker.stop_deadline:
+                try:
+                    os.kill(worker.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _stop_all(self) -> None:
+        for worker in self._workers.values():
+            if worker.stop_deadline is None:
+                self._terminate(worker)
+        while self._workers:
+            select.select([self._wakeup_read], [], [], 0.2)
+            self._reap()
+            self._enforce_deadlines()
+
+    # In the worker
+
+    def _serve(self, pipe: int) -> None:
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+        signal.set_wakeup_fd(-1)
+        for worker in self._workers.values():
+            os.close(worker.pipe)
+        self._workers.clear()
+        # The master decides when workers stop: the signals are handled while
+        # serving, and raised again by uvicorn once done, ignored then
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_IGN)
+        random.seed()
+        if self.after_fork is not None:
+            self.after_fork()
+
+        config = uvicorn.Config(
+            self.app,
+            lifespan="on",
+            timeout_graceful_shutdown=self.graceful_timeout,
+        )
+        server = uvicorn.Server(config)
+        budget = request_budget(self.max_requests, self.max_requests_jitter)
+        asyncio.run(self._serve_until_stopped(server, pipe, budget))
+
+    async def _serve_until_stopped(
+        self, server: uvicorn.Server, pipe: int, budget: int
+    ) -> None:
+        watcher = asyncio.ensure_future(self._watch(server, pipe, budget))
+        try:
+            await server.serve(sockets=[self.socket])
+        finally:
+            watcher.cancel()
+
+    @staticmethod
+    def _stop_accepting(server: uvicorn.Server) -> None:
+        # uvicorn closes the connections without a request in progress as soon
+        # as it shuts down, so it is told to once those it just accepted had
+        # time to send theirs. The other workers accept the new ones meanwhile
+        for listener in server.servers:
+            listener.close()
+        asyncio.get_running_loop().call_later(
+            DRAIN_SECONDS, setattr, server, "should_exit", True
+        )
+
+    async def _watch(self, server: uvicorn.Server, pipe: int, budget: int) -> None:
+        while not server.started:
+            await asyncio.sleep(0.05)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._stop_accepting, server)
+        os.write(pipe, READY)
+        if budget <= 0:
+            return
+        # Asks to be replaced, and goes on serving until then
+        while server.server_state.total_requests < budget:
+            await asyncio.sleep(1)
+        os.write(pipe, RECYCLE)
+
+
+def main() -> None:
+    host = os.getenv("HOST") or "0.0.0.0"
+    server = PreforkServer("app.main:app", host, int(os.getenv("PORT") or 8000))
+    sys.exit(server.run())
@@ -0,0 +1,240 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from pydantic import TypeAdapter
+
+load_dotenv()
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES") or 10000)
+# Any server speaking the Redis protocol, e.g. redis://localhost:6379/0
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+DEFAULT_TTL_SECONDS = 300
+
+_MISSING = object()
+
+
+def portfolio_scope(portfolio_id) -> str:
+    return f"portfolio:{portfolio_id}"
+
+
+def user_scope(user_id) -> str:
+    return f"user:{user_id}"
+
+
+class LRUCache:
+    """In-process tier, bounded in entries and with a TTL per entry."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@lru_cache(maxsize=None)
+def _adapter(value_type: Any) -> TypeAdapter:
+    return TypeAdapter(value_type)
+
+
+class RedisTier:
+    """
+    Shared tier on a Redis protocol server, visible to every worker.
+
+    Entries are stored as JSON and validated against the type the caller
+    expects when read back, so the server never holds anything a worker would
+    execute.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisTier":
+        # Optional dependency, only needed when a shared tier is configured
+        import redis
+
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key: str, value_type: Any = Any) -> Optional[Tuple[Any, float]]:
+        raw = self._client.get(key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        value = _adapter(value_type).validate_python(entry["value"])
+        return value, float(entry["expires_at"])
+
+    def set(
+        self, key: str, entry: Tuple[Any, float], ttl: float, value_type: Any = Any
+    ) -> None:
+        value, expires_at = entry
+        raw = json.dumps(
+            {
+                "value": _adapter(value_type).dump_python(value, mode="json"),
+                "expires_at": expires_at,
+            }
+        )
+        self._client.set(key, raw, ex=max(1, math.ceil(ttl)))
+
+    def counter(self, key: str) -> int:
+        raw = self._client.get(key)
+        return int(raw) if raw is not None else 0
+
+    def incr(self, key: str) -> int:
+        return int(self._client.incr(key))
+
+
+class Cache:
+    """
+    Two tier cache with versioned keys.
+
+    Values computed from user data are stored under keys that embed the version
+    of their scope (a portfolio or a user). Invalidating a scope bumps its
+    version, which orphans every key built from the previous one in all tiers
+    at once, and notifies the registered invalidation hooks.
+
+    When a shared tier is configured, versions live there so an invalidation in
+    one worker is seen by all of them. Errors from the shared tier are logged
+    and the cache falls back to the local tier. Values that are not plain JSON,
+    such as models, are read back from it as the value_type they are cached
+    under.
+    """
+
+    def __init__(
+        self, local: Optional[LRUCache] = None, shared: Optional[RedisTier] = None
+    ):
+        self.local = local or LRUCache()
+        self.shared = shared
+        self._versions: Dict[str, int] = {}
+        self._hooks: List[Callable[[str], None]] = []
+
+    @classmethod
+    def from_env(cls) -> "Cache":
+        shared = RedisTier.from_url(CACHE_REDIS_URL) if CACHE_REDIS_URL else None
+        return cls(shared=shared)
+
+    def get(self, key: str, default: Any = None, value_type: Any = Any) -> Any:
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.shared is None:
+            return default
+
+        try:
+            entry = self.shared.get(key, value_type)
+        except Exception as e:
+            print(f"Could not read from the shared cache: {e}")
+            return default
+        if entry is None:
+            return default
+        value, expires_at = entry
+        # Keep a local copy for the time the shared entry has left
+        self.local.set(key, value, max(expires_at - time.time(), 0.001))
+        return value
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        value_type: Any = Any,
+    ) -> None:
+        self.local.set(key, value, ttl)
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(key, (value, time.time() + ttl), ttl, value_type)
+        except Exception as e:
+            print(f"Could not write to the shared cache: {e}")
+
+    def get_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: float = DEFAULT_TTL_SECONDS,
+        value_type: Any = Any,
+    ) -> Any:
+        value = self.get(key, _MISSING, value_type)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value, ttl, value_type)
+        return value
+
+    def version(self, scope: str) -> int:
+        if self.shared is not None:
+            try:
+                return self.shared.counter(f"version:{scope}")
+            except Exception as e:
+                print(f"Could not read from the shared cache: {e}")
+        return self.local_version(scope)
+
+    def local_version(self, scope: str) -> int:
+        # Changes with every invalidation of the scope, made in this worker or
+        # followed from another one, without a round trip to the shared tier
+        return self._versions.get(scope, 0)
+
+    def key(self, namespace: str, scope: str, *parts) -> str:
+        suffix = "".join(f":{part}" for part in parts)
+        return f"{namespace}:{scope}:v{self.version(scope)}{suffix}"
+
+    def invalidate(self, *scopes: str) -> None:
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+            if self.shared is not None:
+                try:
+                    self.shared.incr(f"version:{scope}")
+                except Exception as e:
+                    print(f"Could not write to the shared cache: {e}")
+            for hook in self._hooks:
+                hook(scope)
+
+    def invalidate_local(self, *scopes: str) -> None:
+        # Follows an invalidation made by another worker, which bumped the
+        # shared versions already
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+            for hook in self._hooks:
+                hook(scope)
+
+    def add_invalidation_hook(self, hook: Callable[[str], None]) -> None:
+        self._hooks.append(hook)
+
+
+cache = Cache.from_env()
@@ -1,23 +1,90 @@
 import httpx
+import os
+from typing import Dict, Iterable, Tuple
+from dotenv import load_dotenv
+from app.utils.cache import cache
 from app.utils.custom_exceptions import NotFoundException, BadRequestException
 
-# TODO: Add caching to reduce API calls
+load_dotenv()
+
+PRICE_CACHE_TTL_SECONDS = float(os.getenv("PRICE_CACHE_TTL_SECONDS") or 30)
+# Pointed at a local stub for load tests
+COINGECKO_API_URL = os.getenv("COINGECKO_API_URL") or "https://api.coingecko.com/api/v3"
+
+
+def price_cache_key(asset_name: str, currency: str) -> str:
+    return f"price:crypto:{asset_name}:{currency}"
 
 
 def fetch_crypto_price(asset_name: str, currency: str) -> float:
+    cached_price = cache.get(price_cache_key(asset_name, currency))
+    if cached_price is not None:
+        return cached_price
+
     # Fetch current price from CoinGecko API
-    url = f"https://api.coingecko.com/api/v3/simple/price?ids={asset_name}&vs_currencies={currency}"
+    url = f"{COINGECKO_API_URL}/simple/price?ids={asset_name}&vs_currencies={currency}"
     response = httpx.get(url)
     if response.status_code == 200:
         data = response.json()
         if asset_name in data and currency in data[asset_name]:
-            return data[asset_name][currency]
+            price = data[asset_name][currency]
+            cache.set(
+                price_cache_key(asset_name, currency), price, PRICE_CACHE_TTL_SECONDS
+            )
+            return price
         else:
             raise NotFoundException("Price not found for the given asset and currency")
     else:
         raise BadRequestException("Failed to fetch price from CoinGecko API")
 
 
+def fetch_crypto_prices(
+    asset_names: Iterable[str], currencies: Iterable[str]
+) -> Dict[Tuple[str, str], float]:
+    # Fetch current prices of several assets in a single CoinGecko API call.
+    # This always goes upstream and refreshes the cached prices on the way.
+    url = f"{COINGECKO_API_URL}/simple/price"
+    params = {
+        "ids": ",".join(sorted(set(asset_names))),
+        "vs_currencies": ",".join(sorted(set(currencies))),
+    }
+    response = httpx.get(url, params=params)
+    if response.status_code == 200:
+        data = response.json()
+        prices = {
+            (asset_name, currency): price
+            for asset_name, asset_prices in data.items()
+            for currency, price in asset_prices.items()
+        }
+        for (asset_name, currency), price in prices.items():
+            cache.set(
+                price_cache_key(asset_name, currency), price, PRICE_CACHE_TTL_SECONDS
+            )
+        return prices
+    else:
+        raise BadRequestException("Failed to fetch price from CoinGecko API")
+
+
+def get_crypto_prices(keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], float]:
+    # Prices of several (asset name, currency) pairs, from the cache when
+    # fresh; the missing ones are fetched together in a single upstream call
+    prices = {}
+    missing = set()
+    for asset_name, currency in keys:
+        cached_price = cache.get(price_cache_key(asset_name, currency))
+        if cached_price is not None:
+            prices[asset_name, currency] = cached_price
+        else:
+            missing.add((asset_name, currency))
+    if missing:
+        fetched = fetch_crypto_prices(
+            {asset_name for asset_name, _ in missing},
+            {currency for _, currency in missing},
+        )
+        prices.update({key: fetched[key] for key in missing if key in fetched})
+    return prices
+
+
 def fetch_stocks_price(asset_name: str, currency: str) -> float:
     # TODO: Implement fetching current price from Stocks API
     raise NotImplementedError("Stocks not implemented yet")
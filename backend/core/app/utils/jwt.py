@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 import os
 from dotenv import load_dotenv
-from uuid import UUID
+from uuid import UUID, uuid4
 from app.utils.custom_exceptions import CredentialsException
 
 load_dotenv()
@@ -31,6 +31,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
             # print(f"No expiration time set. Setting to {expire}")
 
         to_encode.update({"exp": expire})  # Add expiration time to token
+        # Token id, for the token to be revocable on its own
+        to_encode.setdefault("jti", uuid4().hex)
 
         encoded_jwt = jwt.encode(
             to_encode, SECRET_KEY, algorithm=ALGORITHM
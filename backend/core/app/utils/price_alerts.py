@@ -0,0 +1,566 @@
+"""
+Price alerts, evaluated against the quotes of the price feed.
+
+One worker at a time evaluates the alerts, the one holding an advisory lock
+on the directory database, so upstream prices are polled for them once
+whatever the number of workers. The others wait for the lock, which is
+released when the connection of its holder closes, should that worker die.
+
+The worker holds the active alerts in an AlertBook: per asset and currency,
+the thresholds of the alerts above and of those below, each in a sorted
+array. Alerts above a threshold trigger when the price reaches it, so the
+triggered ones are the prefix of their array up to the price, and those
+below the suffix from it, both found by binary search. A quote costs
+O(log n + triggered) whatever the number of alerts, one comparison when it
+triggers none, and triggered alerts leave their array by slicing it. Alerts
+created, updated or deleted are buffered, and merged into the arrays once
+enough changes piled up.
+
+Triggered alerts are delivered in batches: every PRICE_ALERT_FLUSH_SECONDS,
+or once PRICE_ALERT_BATCH_SIZE are waiting, they are marked triggered on
+their shard in one statement, and those it marked are written to the sink
+together. The statement checks the threshold against the price again, so an
+alert triggered twice, e.g. by a worker taking over from one that lost its
+connection, or changed meanwhile by another worker, is delivered once and
+only when it should be.
+
+The evaluating worker loads the alerts changed since its last sync every
+PRICE_ALERT_SYNC_SECONDS, and all of them again every
+PRICE_ALERT_RELOAD_SECONDS, which drops those deleted by other workers.
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection, Engine
+from app.database.fixed_point import from_units, to_units
+from app.database.sharding import ShardRouter, shard_router
+from app.models.price_alert_model import AlertDirection, PriceAlert
+from app.utils.price_feed import PriceFeed, PriceKey, price_feed
+
+load_dotenv()
+
+PRICE_ALERT_SYNC_SECONDS = float(os.getenv("PRICE_ALERT_SYNC_SECONDS") or 5)
+PRICE_ALERT_RELOAD_SECONDS = float(os.getenv("PRICE_ALERT_RELOAD_SECONDS") or 3600)
+PRICE_ALERT_FLUSH_SECONDS = float(os.getenv("PRICE_ALERT_FLUSH_SECONDS") or 0.5)
+PRICE_ALERT_BATCH_SIZE = int(os.getenv("PRICE_ALERT_BATCH_SIZE") or 1000)
+# Local file the triggered alerts are appended to, one JSON object per line
+PRICE_ALERT_LOG = os.getenv("PRICE_ALERT_LOG") or "price_alerts.log"
+# Changes are stamped when their transaction starts, so one committed late
+# can be older than the newest one already synced
+SYNC_OVERLAP = timedelta(seconds=60)
+# Changes buffered by a threshold index before it is rebuilt, at least
+MERGE_MIN_CHANGES = 8
+# Held by the worker evaluating the alerts
+EVALUATION_LOCK_KEY = 0x616C7274
+
+
+class ActiveAlert(NamedTuple):
+    id: UUID
+    user_id: UUID
+    asset_name: str
+    currency: str
+    direction: AlertDirection
+    threshold: float
+
+    @property
+    def key(self) -> PriceKey:
+        return (self.asset_name, self.currency)
+
+
+class ThresholdIndex:
+    """
+    The alerts of one direction of one asset and currency, by threshold.
+
+    Changes are buffered: added alerts are checked one by one, and removed
+    ones skipped, until there are more of them than about the square root of
+    the alerts in the arrays, which are then rebuilt with the changes. A
+    rebuild costs O(n), so that is O(sqrt(n)) per change and per quote.
+    """
+
+    def __init__(self, direction: AlertDirection):
+        self.direction = direction
+        self.above = direction == AlertDirection.ABOVE
+        self.thresholds = np.empty(0)
+        self.alerts = np.empty(0, dtype=object)
+        self.count = 0
+        # Not in the arrays yet, by id, and still in them, with their threshold
+        self._added: Dict[UUID, ActiveAlert] = {}
+        self._removed: Dict[UUID, float] = {}
+        self._merge_at = MERGE_MIN_CHANGES
+        # The price triggering the nearest alert, or one nearer still, so
+        # quotes that trigger none are told apart with a comparison
+        self.bound = math.inf if self.above else -math.inf
+
+    def __len__(self) -> int:
+        return self.count
+
+    def reached(self, price: float) -> bool:
+        return price >= self.bound if self.above else price <= self.bound
+
+    def add(self, alert: ActiveAlert) -> None:
+        self._added[alert.id] = alert
+        self.count += 1
+        if self.above:
+            self.bound = min(self.bound, alert.threshold)
+        else:
+            self.bound = max(self.bound, alert.threshold)
+
+    def remove(self, alert: ActiveAlert) -> None:
+        # The arrays only get alerts when merged, so the one of an id they
+        # may hold is the one of its first removal since
+        self._added.pop(alert.id, None)
+        self._removed.setdefault(alert.id, alert.threshold)
+        self.count -= 1
+
+    def merge(self) -> None:
+        thresholds, alerts = self.thresholds, self.alerts
+        if self._removed:
+            keep = np.ones(len(alerts), dtype=bool)
+            for alert_id, threshold in self._removed.items():
+                # Only the alerts of that threshold are compared
+                start = thresholds.searchsorted(threshold, "left")
+                stop = thresholds.searchsorted(threshold, "right")
+                for position in range(start, stop):
+                    if alerts[position].id == alert_id:
+                        keep[position] = False
+            thresholds, alerts = thresholds[keep], alerts[keep]
+            self._removed.clear()
+        if self._added:
+            added = np.empty(len(self._added), dtype=object)
+            # One by one, a list of tuples would make a 2d array
+            for position, alert in enumerate(self._added.values()):
+                added[position] = alert
+            added_thresholds = np.fromiter(
+                (alert.threshold for alert in added), float, len(added)
+            )
+            order = np.argsort(added_thresholds, kind="stable")
+            added_thresholds, added = added_thresholds[order], added[order]
+            # Ascending, so inserting them in order keeps the arrays sorted
+            positions = thresholds.searchsorted(added_thresholds, "right")
+            thresholds = np.insert(thresholds, positions, added_thresholds)
+            alerts = np.insert(alerts, positions, added)
+            self._added.clear()
+        self.thresholds, self.alerts = thresholds, alerts
+        self._merge_at = max(MERGE_MIN_CHANGES, math.isqrt(len(alerts)))
+
+    def trigger(self, price: float) -> List[ActiveAlert]:
+        """Remove and return the alerts the price triggers."""
+        if len(self._added) + len(self._removed) > self._merge_at:
+            self.merge()
+        triggered = []
+        if self.above:
+            count = self.thresholds.searchsorted(price, "right")
+            if count:
+                triggered = self.alerts[:count].tolist()
+                self.thresholds = self.thresholds[count:]
+                self.alerts = self.alerts[count:]
+            added = [
+                alert for alert in self._added.values() if alert.threshold <= price
+            ]
+        else:
+            count = self.thresholds.searchsorted(price, "left")
+            if count < len(self.alerts):
+                triggered = self.alerts[count:].tolist()
+                self.thresholds = self.thresholds[:count]
+                self.alerts = self.alerts[:count]
+            added = [
+                alert for alert in self._added.values() if alert.threshold >= price
+            ]
+
+        if triggered and self._removed:
+            triggered = [
+                alert
+                for alert in triggered
+                if self._removed.pop(alert.id, None) is None
+            ]
+        for alert in added:
+            del self._added[alert.id]
+        triggered += added
+        self.count -= len(triggered)
+
+        thresholds = [alert.threshold for alert in self._added.values()]
+        if len(self.thresholds):
+            thresholds.append(self.thresholds[0 if self.above else -1])
+        if self.above:
+            self.bound = min(thresholds, default=math.inf)
+        else:
+            self.bound = max(thresholds, default=-math.inf)
+        return triggered
+
+
+class AlertBook:
+    """The active alerts of every asset and currency."""
+
+    def __init__(self):
+        self._alerts: Dict[UUID, ActiveAlert] = {}
+        self._indexes: Dict[PriceKey, Dict[AlertDirection, ThresholdIndex]] = {}
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def __contains__(self, alert_id: UUID) -> bool:
+        return alert_id in self._alerts
+
+    @property
+    def keys(self) -> Set[PriceKey]:
+        return set(self._indexes)
+
+    def _index(self, alert: ActiveAlert) -> ThresholdIndex:
+        indexes = self._indexes.get(alert.key)
+        if indexes is None:
+            indexes = self._indexes[alert.key] = {
+                direction: ThresholdIndex(direction) for direction in AlertDirection
+            }
+        return indexes[alert.direction]
+
+    def track(self, alert: ActiveAlert) -> None:
+        """Add an alert, or replace the one with its id."""
+        current = self._alerts.get(alert.id)
+        if current == alert:
+            return
+        if current is not None:
+            self.untrack(alert.id)
+        self._alerts[alert.id] = alert
+        self._index(alert).add(alert)
+
+    def untrack(self, alert_id: UUID) -> None:
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return
+        index = self._index(alert)
+        index.remove(alert)
+        indexes = self._indexes[alert.key]
+        if not any(indexes.values()):
+            del self._indexes[alert.key]
+
+    def merge(self) -> None:
+        """Merge the buffered changes of every asset into its arrays."""
+        for indexes in self._indexes.values():
+            for index in indexes.values():
+                index.merge()
+
+    def trigger(self, key: PriceKey, price: float) -> List[ActiveAlert]:
+        """Remove and return the alerts of an asset the price triggers."""
+        indexes = self._indexes.get(key)
+        if indexes is None:
+            return []
+        triggered = []
+        for index in indexes.values():
+            if index.reached(price):
+                triggered += index.trigger(price)
+        if triggered:
+            for alert in triggered:
+                del self._alerts[alert.id]
+            if not any(indexes.values()):
+                del self._indexes[key]
+        return triggered
+
+
+def active_alert(row) -> ActiveAlert:
+    return ActiveAlert(
+        row.id, row.user_id, row.asset_name, row.currency, row.direction, row.threshold
+    )
+
+
+select_alerts = select(
+    PriceAlert.id,
+    PriceAlert.user_id,
+    PriceAlert.asset_name,
+    PriceAlert.currency,
+    PriceAlert.direction,
+    PriceAlert.threshold,
+    PriceAlert.triggered_at,
+    PriceAlert.updated_at,
+)
+# Only those that still are as they were when they triggered
+mark_triggered = text(
+    "UPDATE price_alerts AS alert "
+    "SET triggered_at = now(), triggered_price = fired.price, updated_at = now() "
+    "FROM unnest(CAST(:ids AS uuid[]), CAST(:prices AS bigint[])) "
+    "AS fired(id, price) "
+    "WHERE alert.id = fired.id AND alert.triggered_at IS NULL "
+    "AND CASE alert.direction WHEN 'ABOVE' THEN alert.threshold <= fired.price "
+    "ELSE alert.threshold >= fired.price END "
+    "RETURNING alert.id, alert.user_id, alert.asset_name, alert.currency, "
+    "alert.direction, alert.threshold, alert.note, alert.triggered_at, fired.price"
+)
+
+
+def mark_alerts_triggered(
+    connection: Connection, fired: List[Tuple[ActiveAlert, float]]
+) -> List[dict]:
+    """Mark the alerts triggered at their price, returning those it did."""
+    rows = connection.execute(
+        mark_triggered,
+        {
+            "ids": [str(alert.id) for alert, _ in fired],
+            "prices": [to_units(price) for _, price in fired],
+        },
+    )
+    return [
+        {
+            "id": str(row.id),
+            "user_id": str(row.user_id),
+            "asset_name": row.asset_name,
+            "currency": row.currency,
+            "direction": AlertDirection[row.direction].value,
+            "threshold": from_units(row.threshold),
+            "price": from_units(row.price),
+            "note": row.note,
+            "triggered_at": row.triggered_at.isoformat(),
+        }
+        for row in rows
+    ]
+
+
+class AlertLogSink:
+    """Appends triggered alerts to a local file, one write per batch."""
+
+    def __init__(self, path: str = PRICE_ALERT_LOG):
+        self.path = path
+
+    def __call__(self, notifications: List[dict]) -> None:
+        lines = "".join(
+            json.dumps(notification) + "\n" for notification in notifications
+        )
+        with open(self.path, "a") as log:
+            log.write(lines)
+
+
+AlertSink = Callable[[List[dict]], None]
+
+
+class PriceAlertMonitor:
+    """Evaluates the active alerts on every quote, and delivers the triggered."""
+
+    def __init__(
+        self,
+        router: ShardRouter = shard_router,
+        feed: PriceFeed = price_feed,
+        sink: AlertSink = AlertLogSink(),
+        sync_seconds: float = PRICE_ALERT_SYNC_SECONDS,
+        reload_seconds: float = PRICE_ALERT_RELOAD_SECONDS,
+        flush_seconds: float = PRICE_ALERT_FLUSH_SECONDS,
+        batch_size: int = PRICE_ALERT_BATCH_SIZE,
+    ):
+        self.router = router
+        self.feed = feed
+        self.sink = sink
+        self.sync_seconds = sync_seconds
+        self.reload_seconds = reload_seconds
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.book = AlertBook()
+        # Whether this worker evaluates the alerts
+        self.leading = False
+        self.delivered = 0
+        self._pending: List[Tuple[ActiveAlert, float]] = []
+        self._batch_full: Optional[asyncio.Event] = None
+        self._watermarks: Dict[Engine, datetime] = {}
+        self._loaded_at: Optional[float] = None
+
+    def evaluate(self, quotes: Dict[PriceKey, float]) -> int:
+        """Queue the alerts the quotes trigger for delivery."""
+        triggered = 0
+        for key, price in quotes.items():
+            for alert in self.book.trigger(key, price):
+                self._pending.append((alert, price))
+                triggered += 1
+        if len(self._pending) >= self.batch_size and self._batch_full is not None:
+            self._batch_full.set()
+        return triggered
+
+    # Loading, in a thread
+
+    def _load(self, engine: Engine, since: Optional[datetime]) -> list:
+        query = select_alerts
+        if since is None:
+            query = query.where(PriceAlert.triggered_at.is_(None))
+        else:
+            query = query.where(PriceAlert.updated_at > since - SYNC_OVERLAP)
+        with engine.connect() as connection:
+            rows = connection.execute(query).all()
+        if rows:
+            newest = max(row.updated_at for row in rows)
+            self._watermarks[engine] = max(newest, self._watermarks.get(engine, newest))
+        return rows
+
+    def load_all(self) -> AlertBook:
+        book = AlertBook()
+        for engine in self.router.engines:
+            for row in self._load(engine, None):
+                book.track(active_alert(row))
+        # Here rather than on the first quotes, in the event loop
+        book.merge()
+        return book
+
+    def load_changes(self) -> list:
+        return [
+            row
+            for engine in self.router.engines
+            for row in self._load(engine, self._watermarks.get(engine))
+        ]
+
+    def apply(self, rows: Iterable) -> None:
+        for row in rows:
+            if row.triggered_at is None:
+                self.book.track(active_alert(row))
+            else:
+                self.book.untrack(row.id)
+
+    async def sync(self) -> None:
+        if (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at >= self.reload_seconds
+        ):
+            self.book = await asyncio.to_thread(self.load_all)
+            self._loaded_at = time.monotonic()
+        else:
+            self.apply(await asyncio.to_thread(self.load_changes))
+
+    # Delivery, in a thread
+
+    def deliver(
+        self, fired: List[Tuple[ActiveAlert, float]]
+    ) -> List[Tuple[ActiveAlert, float]]:
+        """Deliver triggered alerts, returning those that could not be."""
+        by_engine = defaultdict(list)
+        for alert, price in fired:
+            by_engine[self.router.shard_for(alert.user_id).engine].append(
+                (alert, price)
+            )
+        failed = []
+        for engine, shard_fired in by_engine.items():
+            try:
+                # A sink that fails rolls back the marks
+                with engine.begin() as connection:
+                    notifications = mark_alerts_triggered(connection, shard_fired)
+                    if notifications:
+                        self.sink(notifications)
+            except Exception as e:
+                print(f"Could not deliver price alerts: {e}")
+                failed += shard_fired
+                continue
+            self.delivered += len(notifications)
+        return failed
+
+    async def flush(self) -> None:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        failed = await asyncio.to_thread(self.deliver, batch)
+        # Put back, they trigger again on a later quote unless synced since
+        for alert, _ in failed:
+            if alert.id not in self.book:
+                self.book.track(alert)
+
+    async def _deliver_triggered(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Could not deliver price alerts: {e}")
+
+    async def _evaluate_quotes(self) -> None:
+        subscription = None
+        synced_at = None
+        try:
+            while True:
+                if (
+                    synced_at is None
+                    or time.monotonic() - synced_at >= self.sync_seconds
+                ):
+                    try:
+                        await self.sync()
+                    except Exception as e:
+                        print(f"Could not sync price alerts: {e}")
+                    synced_at = time.monotonic()
+                if subscription is None or subscription.keys != self.book.keys:
+                    if subscription is not None:
+                        subscription.close()
+                    # Known quotes are offered right away
+                    subscription = self.feed.subscribe(self.book.keys)
+                try:
+                    quotes = await asyncio.wait_for(
+                        subscription.get(),
+                        max(synced_at + self.sync_seconds - time.monotonic(), 0),
+                    )
+                except asyncio.TimeoutError:
+                    continue
+                self.evaluate(quotes)
+        finally:
+            if subscription is not None:
+                subscription.close()
+
+    # Leadership, in a thread
+
+    def try_lead(self) -> Optional[Connection]:
+        """The connection holding the evaluation lock, None when another has it."""
+        connection = self.router.directory.engine.connect()
+        try:
+            locked = connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": EVALUATION_LOCK_KEY}
+            ).scalar()
+            # The lock outlives the transaction, which must not stay open
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not locked:
+            connection.close()
+            return None
+        return connection
+
+    @staticmethod
+    def resign(connection: Connection) -> None:
+        # Pooled connections keep their session locks, unlocked explicitly
+        try:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": EVALUATION_LOCK_KEY}
+            )
+            connection.commit()
+        except Exception:
+            connection.invalidate()
+        finally:
+            connection.close()
+
+    async def _lead(self) -> Connection:
+        while True:
+            try:
+                connection = await asyncio.to_thread(self.try_lead)
+            except Exception as e:
+                print(f"Could not take the price alert lock: {e}")
+                connection = None
+            if connection is not None:
+                return connection
+            await asyncio.sleep(self.sync_seconds)
+
+    async def run(self) -> None:
+        connection = await self._lead()
+        # Created here so it belongs to the loop serving the app
+        self._batch_full = asyncio.Event()
+        self.leading = True
+        try:
+            await asyncio.gather(self._evaluate_quotes(), self._deliver_triggered())
+        finally:
+            self.leading = False
+            self.book = AlertBook()
+            await asyncio.to_thread(self.resign, connection)
+
+
+price_alerts = PriceAlertMonitor()
@@ -0,0 +1,135 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Mapping, Optional, Set, Tuple
+from dotenv import load_dotenv
+from app.utils.fetch_price import fetch_crypto_prices
+
+load_dotenv()
+
+# Quotes are keyed by the lowercased (asset_name, currency) pair
+PriceKey = Tuple[str, str]
+PriceFetcher = Callable[[Iterable[str], Iterable[str]], Dict[PriceKey, float]]
+
+PRICE_TICK_SECONDS = float(os.getenv("PRICE_TICK_SECONDS") or 10)
+# Subscriptions to new assets arriving together share one early tick
+NEW_ASSET_DEBOUNCE_SECONDS = 0.5
+
+
+class PriceSubscription:
+    """
+    Receives the quotes of a fixed set of assets from a PriceFeed.
+
+    Only the newest quotes are kept for a subscriber. When it falls behind, the
+    pending update is replaced rather than queued, so a slow client never holds
+    up the feed or grows its memory.
+    """
+
+    def __init__(self, feed: "PriceFeed", keys: Iterable[PriceKey]):
+        self.keys = frozenset(keys)
+        self.dropped = 0
+        self._feed = feed
+        self._latest: Optional[Mapping[PriceKey, float]] = None
+        self._ready = asyncio.Event()
+
+    def offer(self, quotes: Mapping[PriceKey, float]) -> None:
+        if self._latest is not None:
+            self.dropped += 1
+        self._latest = quotes
+        self._ready.set()
+
+    async def get(self) -> Dict[PriceKey, float]:
+        await self._ready.wait()
+        self._ready.clear()
+        quotes, self._latest = self._latest, None
+        return {key: quotes[key] for key in self.keys if key in quotes}
+
+    def close(self) -> None:
+        self._feed.unsubscribe(self)
+
+
+class PriceFeed:
+    """
+    Shared price tick loop fanning quotes out to every subscriber.
+
+    Each tick fetches the distinct assets subscribed to in one upstream call, so
+    the upstream load does not grow with the number of connected clients.
+    """
+
+    def __init__(
+        self,
+        fetch_prices: PriceFetcher = fetch_crypto_prices,
+        interval_seconds: float = PRICE_TICK_SECONDS,
+    ):
+        self.quotes: Dict[PriceKey, float] = {}
+        self.upstream_calls = 0
+        self._fetch_prices = fetch_prices
+        self._interval_seconds = interval_seconds
+        self._subscribers: Dict[PriceKey, Set[PriceSubscription]] = defaultdict(set)
+        # Created by run() so it belongs to the loop serving the app
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def tracked_keys(self) -> Set[PriceKey]:
+        return set(self._subscribers)
+
+    def subscribe(self, keys: Iterable[PriceKey]) -> PriceSubscription:
+        subscription = PriceSubscription(self, keys)
+        new_keys = False
+        for key in subscription.keys:
+            new_keys = new_keys or key not in self._subscribers
+            self._subscribers[key].add(subscription)
+
+        if any(key in self.quotes for key in subscription.keys):
+            subscription.offer(dict(self.quotes))
+        if new_keys and self._wakeup is not None:
+            # Fetch new assets right away instead of waiting for the next tick
+            self._wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription: PriceSubscription) -> None:
+        for key in subscription.keys:
+            subscribers = self._subscribers.get(key)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[key]
+
+    def publish(self, quotes: Dict[PriceKey, float]) -> None:
+        self.quotes.update(quotes)
+        notified = set()
+        for key in quotes:
+            notified.update(self._subscribers.get(key, ()))
+        # All subscribers share one snapshot and pick their own assets out of it
+        # when they consume it, so a tick costs little per subscriber
+        snapshot = dict(self.quotes)
+        for subscription in notified:
+            subscription.offer(snapshot)
+
+    async def tick(self) -> None:
+        keys = self.tracked_keys
+        if not keys:
+            return
+        asset_names = {asset_name for asset_name, _ in keys}
+        currencies = {currency for _, currency in keys}
+        quotes = await asyncio.to_thread(self._fetch_prices, asset_names, currencies)
+        self.upstream_calls += 1
+        self.publish({key: price for key, price in quotes.items() if key in keys})
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Could not refresh prices: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._interval_seconds)
+                await asyncio.sleep(NEW_ASSET_DEBOUNCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+price_feed = PriceFeed()
@@ -0,0 +1,113 @@
+"""
+Price shock scenarios over many portfolios at once.
+
+The holdings are loaded once into a sparse portfolios x assets matrix of
+their values at the base prices. A scenario is a vector of relative price
+changes by asset, so the PnL of every portfolio under a block of scenarios
+is one sparse by dense product.
+"""
+
+from typing import Hashable, Iterable, Mapping, NamedTuple, Sequence, Tuple
+import numpy as np
+from scipy import sparse
+
+# Cells of the portfolios x scenarios PnL block evaluated at a time, which
+# bounds the memory to twice 32 MiB of float64, however many scenarios
+SHOCK_BLOCK_CELLS = 1 << 22
+
+
+class ShockResults(NamedTuple):
+    # By scenario
+    pnl: np.ndarray
+    losing_portfolios: np.ndarray
+    # By scenario, then the worst portfolios first, as row indexes
+    worst_portfolios: np.ndarray
+    worst_pnl: np.ndarray
+
+
+class HoldingsMatrix:
+    """Values of the holdings of many portfolios at the base prices."""
+
+    def __init__(
+        self, portfolio_ids: Sequence[Hashable], assets: Sequence[str], values
+    ):
+        self.portfolio_ids = list(portfolio_ids)
+        self.assets = list(assets)
+        self.values = sparse.csr_matrix(values, dtype=np.float64)
+        self.asset_index = {asset: column for column, asset in enumerate(self.assets)}
+        self.base_values = np.asarray(self.values.sum(axis=1)).ravel()
+        self.asset_values = np.asarray(self.values.sum(axis=0)).ravel()
+
+    @classmethod
+    def from_holdings(
+        cls,
+        holdings: Iterable[Tuple[Hashable, str, float]],
+        prices: Mapping[str, float],
+    ) -> "HoldingsMatrix":
+        """
+        From (portfolio id, asset, quantity) rows, priced with prices by
+        asset. Assets without a price are worth nothing, as elsewhere.
+        """
+        portfolio_rows = {}
+        asset_columns = {}
+        rows, columns, values = [], [], []
+        for portfolio_id, asset, quantity in holdings:
+            row = portfolio_rows.setdefault(portfolio_id, len(portfolio_rows))
+            price = prices.get(asset)
+            if price is None:
+                continue
+            rows.append(row)
+            columns.append(asset_columns.setdefault(asset, len(asset_columns)))
+            values.append(quantity * price)
+        matrix = sparse.csr_matrix(
+            (values, (rows, columns)), shape=(len(portfolio_rows), len(asset_columns))
+        )
+        return cls(list(portfolio_rows), list(asset_columns), matrix)
+
+    @property
+    def total_value(self) -> float:
+        return float(self.asset_values.sum())
+
+    def shock_matrix(self, scenarios: Sequence[Mapping[str, float]]) -> np.ndarray:
+        """Scenarios x assets relative price changes, 0 for assets not shocked."""
+        shocks = np.zeros((len(scenarios), len(self.assets)))
+        for row, scenario in enumerate(scenarios):
+            for asset, change in scenario.items():
+                column = self.asset_index.get(asset)
+                if column is not None:
+                    shocks[row, column] = change
+        return shocks
+
+    def portfolio_pnl(self, shocks: np.ndarray) -> np.ndarray:
+        """Portfolios x scenarios PnL, for a few scenarios."""
+        return np.asarray(self.values @ shocks.T)
+
+    def evaluate(self, shocks: np.ndarray, worst: int = 10) -> ShockResults:
+        """PnL of every scenario in total, and of its worst portfolios."""
+        count = len(self.portfolio_ids)
+        scenarios = shocks.shape[0]
+        worst = min(worst, count)
+        losing = np.zeros(scenarios, dtype=np.int64)
+        worst_portfolios = np.zeros((scenarios, worst), dtype=np.int64)
+        worst_pnl = np.zeros((scenarios, worst))
+
+        block = max(SHOCK_BLOCK_CELLS // max(count, 1), 1)
+        for start in range(0, scenarios, block):
+            end = min(start + block, scenarios)
+            # Scenarios x portfolios, so that each scenario is contiguous for
+            # the partial sort, several times faster than along columns
+            pnl = np.ascontiguousarray(self.portfolio_pnl(shocks[start:end]).T)
+            losing[start:end] = (pnl < 0).sum(axis=1)
+            if worst:
+                index = np.argpartition(pnl, worst - 1, axis=1)[:, :worst]
+                values = np.take_along_axis(pnl, index, axis=1)
+                order = np.argsort(values, axis=1, kind="stable")
+                worst_portfolios[start:end] = np.take_along_axis(index, order, 1)
+                worst_pnl[start:end] = np.take_along_axis(values, order, 1)
+
+        return ShockResults(
+            pnl=shocks @ self.asset_values,
+            losing_portfolios=losing,
+            worst_portfolios=worst_portfolios,
+            worst_pnl=worst_pnl,
+        )
@@ -0,0 +1,190 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Pattern, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# On by default, RATE_LIMIT=false turns it off
+RATE_LIMIT = os.getenv("RATE_LIMIT", "true").lower() in ("1", "true", "yes")
+# Any server speaking the Redis protocol, for every worker to share the buckets
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Buckets kept by the in-process store, least recently used ones are dropped
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS") or 100_000)
+
+
+class BucketPolicy(NamedTuple):
+    # Burst allowed from a full bucket, in cost units
+    capacity: float
+    refill_per_second: float
+
+
+class RouteLimit(NamedTuple):
+    bucket: str
+    # Tokens taken by one request
+    cost: float
+
+
+RATE_LIMIT_BUCKETS: Dict[str, BucketPolicy] = {
+    "api": BucketPolicy(capacity=120, refill_per_second=10),
+    # Valuations fan out into holdings scans and upstream price calls
+    "portfolios": BucketPolicy(capacity=60, refill_per_second=2),
+    # Full history scans, and jobs running them in the background
+    "reports": BucketPolicy(capacity=10, refill_per_second=0.1),
+    # Anonymous clients are keyed by address, this slows down password guessing
+    "auth": BucketPolicy(capacity=20, refill_per_second=0.2),
+}
+
+# The first matching (method, path pattern) decides, None matches any method
+ROUTE_LIMITS: List[Tuple[Optional[str], Pattern, RouteLimit]] = [
+    ("GET", re.compile(r"/api/v1/portfolios/summary$"), RouteLimit("portfolios", 10)),
+    (
+        "GET",
+        re.compile(r"/api/v1/portfolios/[^/]+/stream$"),
+        RouteLimit("portfolios", 10),
+    ),
+    # Portfolios are valued by default
+    ("GET", re.compile(r"/api/v1/portfolios/"), RouteLimit("portfolios", 5)),
+    (None, re.compile(r"/api/v1/portfolios/"), RouteLimit("portfolios", 1)),
+    ("GET", re.compile(r"/api/v1/transactions/reports/"), RouteLimit("reports", 1)),
+    ("POST", re.compile(r"/api/v1/jobs/?$"), RouteLimit("reports", 1)),
+    (None, re.compile(r"/api/v1/auth/"), RouteLimit("auth", 1)),
+]
+DEFAULT_ROUTE_LIMIT = RouteLimit("api", 1)
+
+
+class LocalBucketStore:
+    """Token buckets in process memory, each worker limiting on its own."""
+
+    def __init__(
+        self,
+        max_buckets: int = RATE_LIMIT_MAX_BUCKETS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_buckets = max_buckets
+        self._clock = clock
+        # Key to [tokens, updated_at]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, policy: BucketPolicy, cost: float) -> float:
+        """Take cost tokens from the bucket. Returns 0 when they were taken,
+        otherwise the seconds until the bucket holds enough of them."""
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [policy.capacity, now]
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(
+                    policy.capacity,
+                    bucket[0] + (now - bucket[1]) * policy.refill_per_second,
+                )
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / policy.refill_per_second
+
+
+# Refill and take in one round trip, atomically, on the server clock
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_per_second = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * refill_per_second)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / refill_per_second
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated_at", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / refill_per_second * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """
+    Token buckets on a Redis protocol server, shared by every worker. The
+    client is an asyncio one, requests wait for the round trip without
+    blocking the event loop.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBucketStore":
+        # Optional dependency, only needed when a shared store is configured
+        import redis.asyncio
+
+        return cls(redis.asyncio.Redis.from_url(url))
+
+    async def take(self, key: str, policy: BucketPolicy, cost: float) -> float:
+        return float(
+            await self._take(
+                keys=[key], args=[policy.capacity, policy.refill_per_second, cost]
+            )
+        )
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiting of each client, per class of route.
+
+    Every route class has its own bucket per client, and routes take a number
+    of tokens from it according to what they cost to serve, so a client can
+    make many cheap reads or a few valuations in the same budget. Buckets live
+    in process, or on a shared server so the limits hold across workers.
+    Errors from the shared store are logged and the request is let through.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        buckets: Dict[str, BucketPolicy] = RATE_LIMIT_BUCKETS,
+        routes: List[Tuple[Optional[str], Pattern, RouteLimit]] = ROUTE_LIMITS,
+    ):
+        self.store = store or LocalBucketStore()
+        self.buckets = buckets
+        self.routes = routes
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        if RATE_LIMIT_REDIS_URL:
+            return cls(RedisBucketStore.from_url(RATE_LIMIT_REDIS_URL))
+        return cls()
+
+    def route_limit(self, method: str, path: str) -> RouteLimit:
+        for route_method, pattern, limit in self.routes:
+            if (route_method is None or route_method == method) and pattern.match(path):
+                return limit
+        return DEFAULT_ROUTE_LIMIT
+
+    async def check(self, client: str, method: str, path: str) -> float:
+        """Seconds the client has to wait before this request, 0 to go ahead."""
+        limit = self.route_limit(method, path)
+        try:
+            return await self.store.take(
+                f"ratelimit:{limit.bucket}:{client}",
+                self.buckets[limit.bucket],
+                limit.cost,
+            )
+        except Exception as e:
+            print(f"Could not reach the rate limit store: {e}")
+            return 0.0
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.database.db_config import SessionLocal
+from app.models.revoked_token_model import RevokedToken
+from app.utils.bloom_filter import BloomFilter
+
+load_dotenv()
+
+# How long a revocation made by another worker can go unnoticed
+TOKEN_REVOCATION_REFRESH_SECONDS = float(
+    os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS") or 5
+)
+# Revocations the filter is sized for, it is rebuilt larger when they are exceeded
+TOKEN_REVOCATION_CAPACITY = int(os.getenv("TOKEN_REVOCATION_CAPACITY") or 100_000)
+TOKEN_REVOCATION_FALSE_POSITIVE_RATE = float(
+    os.getenv("TOKEN_REVOCATION_FALSE_POSITIVE_RATE") or 0.001
+)
+# Items cannot be removed from the filter, expired revocations only leave it
+# when it is rebuilt from scratch
+TOKEN_REVOCATION_REBUILD_SECONDS = float(
+    os.getenv("TOKEN_REVOCATION_REBUILD_SECONDS") or 3600
+)
+# Revocations are stamped when their transaction starts, so one committed
+# late can be older than the newest one already loaded
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+class TokenRevocationList:
+    """
+    Revoked token ids (the jti claim), stored in the database and mirrored in
+    a Bloom filter in each worker.
+
+    A token that was never revoked is almost always answered by the filter
+    alone. The rare filter hits, revoked tokens and false positives, are
+    confirmed with a primary key lookup. Each worker loads the revocations
+    made since its last refresh every few seconds, so a revocation made by
+    another worker takes effect within the refresh interval.
+
+    Tokens issued without a jti cannot be revoked and stay valid until they
+    expire.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        capacity: int = TOKEN_REVOCATION_CAPACITY,
+        false_positive_rate: float = TOKEN_REVOCATION_FALSE_POSITIVE_RATE,
+        refresh_seconds: float = TOKEN_REVOCATION_REFRESH_SECONDS,
+        rebuild_seconds: float = TOKEN_REVOCATION_REBUILD_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        # Checks that went past the filter to the database
+        self.lookups = 0
+        self._filter: Optional[BloomFilter] = None
+        self._built_at = 0.0
+        self._watermark: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def rebuild_due(self) -> bool:
+        return (
+            self._filter is None
+            or time.monotonic() - self._built_at >= self.rebuild_seconds
+            or len(self._filter) >= self._filter.capacity
+        )
+
+    def refresh(self, db: Session) -> None:
+        """Load the revocations made since the last refresh, or all of them
+        into a new filter when a rebuild is due."""
+        with self._lock:
+            rebuild = self.rebuild_due()
+            query = select(RevokedToken.jti, RevokedToken.revoked_at).where(
+                RevokedToken.expires_at > datetime.utcnow()
+            )
+            if not rebuild and self._watermark is not None:
+                query = query.where(
+                    RevokedToken.revoked_at > self._watermark - REFRESH_OVERLAP
+                )
+            rows = db.execute(query).all()
+
+            if rebuild:
+                bloom = BloomFilter(
+                    max(self.capacity, 2 * len(rows)), self.false_positive_rate
+                )
+            else:
+                bloom = self._filter
+            for jti, revoked_at in rows:
+                bloom.add(jti)
+                if self._watermark is None or revoked_at > self._watermark:
+                    self._watermark = revoked_at
+            if rebuild:
+                self._filter = bloom
+                self._built_at = time.monotonic()
+
+    def is_revoked(self, db: Session, jti: Optional[str]) -> bool:
+        if jti is None:
+            return False
+        if self._filter is None:
+            self.refresh(db)
+        if jti not in self._filter:
+            return False
+        self.lookups += 1
+        return (
+            db.scalar(select(RevokedToken.jti).where(RevokedToken.jti == jti))
+            is not None
+        )
+
+    def revoke(self, db: Session, payload: dict) -> bool:
+        """Revoke a decoded token until it expires. False when it has no jti."""
+        jti = payload.get("jti")
+        if jti is None:
+            return False
+        db.execute(
+            insert(RevokedToken)
+            .values(
+                jti=jti,
+                user_id=payload.get("sub"),
+                expires_at=datetime.utcfromtimestamp(payload["exp"]),
+            )
+            .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+        )
+        db.commit()
+        # The other workers pick it up at their next refresh
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        return True
+
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        result = db.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow())
+        )
+        db.commit()
+        return result.rowcount
+
+    def refresh_from_database(self) -> None:
+        with self.session_factory() as db:
+            if self.rebuild_due():
+                self.purge_expired(db)
+            self.refresh(db)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh_from_database)
+            except Exception as e:
+                print(f"Could not refresh revoked tokens: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+
+token_revocations = TokenRevocationList()
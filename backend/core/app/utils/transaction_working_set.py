@@ -0,0 +1,388 @@
+"""
+Hot working set of the live transactions of active users, as columns.
+
+Valuations and holdings only need a few fields of each transaction, so
+instead of ORM and pydantic objects every user's live transactions are kept
+as one NumPy structured array, with strings and portfolio ids coded as small
+integers and enums as their index. Entries are bounded by their size in
+bytes and evicted least recently used first.
+
+An entry is valid for the version of its user's cache scope it was loaded
+at, so a write anywhere, in any worker, makes it stale. Writes by id in this
+worker are applied to the entry as they happen instead, it is only reloaded
+from the database when something else changed in between.
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import BigInteger, bindparam, select, type_coerce
+from sqlalchemy.orm import Session
+from app.database.fixed_point import from_units, to_units
+from app.models.asset_model import Asset as AssetModel
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.utils.cache import cache, user_scope
+
+load_dotenv()
+
+TRANSACTION_WORKING_SET_MAX_BYTES = int(
+    os.getenv("TRANSACTION_WORKING_SET_MAX_BYTES") or 64 * 1024 * 1024
+)
+
+ASSET_TYPES = list(AssetType)
+TRANSACTION_TYPES = list(TransactionType)
+ASSET_TYPE_CODES = {asset_type: code for code, asset_type in enumerate(ASSET_TYPES)}
+TRANSACTION_TYPE_CODES = {kind: code for code, kind in enumerate(TRANSACTION_TYPES)}
+# Sign of the amount of each transaction type in a holding, by code
+TRANSACTION_SIGNS = np.array(
+    [
+        1 if kind in (TransactionType.BUY, TransactionType.TRANSFER_IN) else -1
+        for kind in TRANSACTION_TYPES
+    ],
+    dtype=np.int64,
+)
+
+# 66 bytes a transaction
+TRANSACTION_COLUMNS = np.dtype(
+    [
+        ("id", "S16"),
+        ("portfolio", np.int32),
+        ("asset_name", np.int32),
+        ("ticker_symbol", np.int32),
+        ("currency", np.int32),
+        ("asset_type", np.int8),
+        ("transaction_type", np.int8),
+        # Fixed point units, summed exactly
+        ("amount", np.int64),
+        ("unit_price", np.float64),
+        ("transaction_fee", np.float64),
+        ("created_at", "datetime64[us]"),
+    ]
+)
+# Order of the fields read from the database or from written transactions
+FIELDS = (
+    "id",
+    "portfolio_id",
+    "asset_name",
+    "ticker_symbol",
+    "currency",
+    "asset_type",
+    "transaction_type",
+    "amount",
+    "unit_price",
+    "transaction_fee",
+    "created_at",
+)
+
+# Asset names are joined from the assets, there are few of them, and amounts
+# read as stored
+SELECTED_FIELDS = {
+    "asset_name": AssetModel.provider_id,
+    "ticker_symbol": AssetModel.symbol,
+    "amount": type_coerce(TransactionModel.amount, BigInteger),
+}
+AMOUNT = FIELDS.index("amount")
+select_live_user_transactions = (
+    select(
+        *(
+            (
+                SELECTED_FIELDS[field]
+                if field in SELECTED_FIELDS
+                else getattr(TransactionModel, field)
+            )
+            for field in FIELDS
+        )
+    )
+    .join(AssetModel, AssetModel.id == TransactionModel.asset_id)
+    .where(
+        TransactionModel.user_id == bindparam("user_id"),
+        TransactionModel.deleted_at.is_(None),
+    )
+)
+
+
+def net_quantities(rows: np.ndarray, groups: np.ndarray, count: int) -> List[float]:
+    """
+    Net quantity of each of count groups of rows, given the group of every
+    row. Units are summed as integers, the quantities are exact.
+    """
+    units = np.zeros(count, np.int64)
+    np.add.at(
+        units, groups, rows["amount"] * TRANSACTION_SIGNS[rows["transaction_type"]]
+    )
+    return [from_units(total) for total in units.tolist()]
+
+
+class Categories:
+    """Values coded as small integers, in order of first appearance."""
+
+    def __init__(self, values: Iterable[Hashable] = ()):
+        self.values: List[Any] = []
+        self.codes: Dict[Hashable, int] = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value: Hashable) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            sys.getsizeof(self.values)
+            + sys.getsizeof(self.codes)
+            + sum(sys.getsizeof(value) for value in self.values)
+        )
+
+
+class UserTransactions:
+    """
+    Live transactions of one user, as of a version of the user's scope.
+
+    Appending fills spare capacity at the end of the array and returns a new
+    instance over the longer prefix, so readers of an earlier one still see
+    the rows they started with. Categories only ever grow.
+    """
+
+    def __init__(
+        self,
+        rows: np.ndarray,
+        size: int,
+        portfolios: Categories,
+        strings: Categories,
+        version: int,
+    ):
+        self._buffer = rows
+        self.size = size
+        self.portfolios = portfolios
+        self.strings = strings
+        self.version = version
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence], version: int) -> "UserTransactions":
+        """From tuples of FIELDS."""
+        empty = cls(np.empty(0, TRANSACTION_COLUMNS), 0, Categories(), Categories(), 0)
+        return empty.extended(rows, version)
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._buffer[: self.size]
+
+    @property
+    def nbytes(self) -> int:
+        return self._buffer.nbytes + self.portfolios.nbytes + self.strings.nbytes
+
+    def select(self, portfolio_id: Optional[UUID] = None) -> np.ndarray:
+        """Rows of a portfolio, or all of them."""
+        if portfolio_id is None:
+            return self.rows
+        code = self.portfolios.codes.get(portfolio_id)
+        if code is None:
+            return self.rows[:0]
+        rows = self.rows
+        return rows[rows["portfolio"] == code]
+
+    def string(self, code) -> str:
+        return self.strings.values[code]
+
+    def extended(self, rows: Sequence[Sequence], version: int) -> "UserTransactions":
+        """With rows of FIELDS appended, amounts in fixed point units."""
+        size = self.size + len(rows)
+        buffer = self._buffer
+        if size > len(buffer):
+            buffer = np.empty(max(size, 2 * len(buffer)), TRANSACTION_COLUMNS)
+            buffer[: self.size] = self.rows
+        code = self.strings.code
+        buffer[self.size : size] = [
+            (
+                transaction_id.bytes,
+                self.portfolios.code(portfolio_id),
+                code(asset_name),
+                code(ticker_symbol),
+                code(currency),
+                ASSET_TYPE_CODES[asset_type],
+                TRANSACTION_TYPE_CODES[transaction_type],
+                amount,
+                unit_price,
+                transaction_fee,
+                np.datetime64(created_at, "us"),
+            )
+            for (
+                transaction_id,
+                portfolio_id,
+                asset_name,
+                ticker_symbol,
+                currency,
+                asset_type,
+                transaction_type,
+                amount,
+                unit_price,
+                transaction_fee,
+                created_at,
+            ) in rows
+        ]
+        return UserTransactions(buffer, size, self.portfolios, self.strings, version)
+
+    def without(self, ids: Iterable[UUID], version: int) -> "UserTransactions":
+        rows = self.rows
+        kept = rows[~np.isin(rows["id"], [i.bytes for i in ids])]
+        return UserTransactions(kept, len(kept), self.portfolios, self.strings, version)
+
+    def holdings(
+        self, portfolio_id: Optional[UUID] = None, by_currency: bool = True
+    ) -> List[Tuple]:
+        """
+        Net quantity of each asset, as the grouped holdings queries return
+        it: (asset name, ticker symbol, asset type, currency, quantity) rows
+        of a portfolio, or (asset name, ticker symbol, asset type, quantity)
+        rows across currencies. The ticker symbol is the greatest one seen.
+        """
+        rows = self.select(portfolio_id)
+        if not len(rows):
+            return []
+        # Each group is keyed by one integer of its codes, unique in 1-D is
+        # many times faster than over rows of several columns
+        strings = len(self.strings.values)
+        keys = rows["asset_name"].astype(np.int64) * len(ASSET_TYPES)
+        keys += rows["asset_type"]
+        if by_currency:
+            keys = keys * strings + rows["currency"]
+        groups, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+        quantities = net_quantities(rows, inverse, len(groups))
+        tickers: Dict[int, str] = {}
+        pairs = np.unique(inverse.astype(np.int64) * strings + rows["ticker_symbol"])
+        pair_groups, ticker_codes = divmod(pairs, strings)
+        for group, ticker_code in zip(pair_groups.tolist(), ticker_codes.tolist()):
+            ticker_symbol = self.strings.values[ticker_code]
+            if ticker_symbol > tickers.get(group, ""):
+                tickers[group] = ticker_symbol
+
+        holdings = []
+        for group, key in enumerate(groups.tolist()):
+            if by_currency:
+                key, currency = divmod(key, strings)
+            asset_name, asset_type = divmod(key, len(ASSET_TYPES))
+            holding = [
+                self.strings.values[asset_name],
+                tickers[group],
+                ASSET_TYPES[asset_type],
+            ]
+            if by_currency:
+                holding.append(self.strings.values[currency])
+            holding.append(quantities[group])
+            holdings.append(tuple(holding))
+        return holdings
+
+
+class TransactionWorkingSet:
+    """In-process tier of UserTransactions, bounded in bytes."""
+
+    def __init__(self, max_bytes: int = TRANSACTION_WORKING_SET_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        # With the size each entry was counted at, categories shared with
+        # later versions may grow meanwhile
+        self._entries: "OrderedDict[UUID, Tuple[UserTransactions, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: UUID) -> UserTransactions:
+        version = cache.version(user_scope(user_id))
+        with self._lock:
+            entry, _ = self._entries.get(user_id, (None, 0))
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # A write committed while loading bumps the version past this one,
+        # so the entry is reloaded on the next read
+        rows = db.execute(select_live_user_transactions, {"user_id": user_id}).all()
+        entry = UserTransactions.from_rows(rows, version)
+        with self._lock:
+            self._store(user_id, entry)
+        return entry
+
+    def apply(
+        self,
+        user_id: UUID,
+        written: Iterable[Any] = (),
+        removed: Iterable[UUID] = (),
+    ) -> None:
+        """
+        Follow writes of a user's transactions, once they are committed and
+        the user's scope invalidated: removed ids are dropped, then written
+        transactions (any objects with the FIELDS attributes) appended, live
+        ones only. The entry is dropped instead when it is not exactly one
+        version behind, i.e. when it missed a write.
+        """
+        version = cache.version(user_scope(user_id))
+        with self._lock:
+            entry, _ = self._entries.get(user_id, (None, 0))
+            if entry is None:
+                return
+            if entry.version != version - 1:
+                self._discard(user_id)
+                return
+            removed = list(removed)
+            if removed:
+                entry = entry.without(removed, version)
+            written = [
+                self._row(transaction)
+                for transaction in written
+                if getattr(transaction, "deleted_at", None) is None
+            ]
+            entry = entry.extended(written, version)
+            self._store(user_id, entry)
+
+    @staticmethod
+    def _row(transaction: Any) -> List:
+        row = list(attrgetter(*FIELDS)(transaction))
+        row[AMOUNT] = to_units(row[AMOUNT])
+        return row
+
+    def discard(self, user_id: UUID) -> None:
+        with self._lock:
+            self._discard(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, user_id: UUID, entry: UserTransactions) -> None:
+        self._discard(user_id)
+        nbytes = entry.nbytes
+        if nbytes > self.max_bytes:
+            return
+        self._entries[user_id] = (entry, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def _discard(self, user_id: UUID) -> None:
+        _, nbytes = self._entries.pop(user_id, (None, 0))
+        self.nbytes -= nbytes
+
+
+transaction_working_set = TransactionWorkingSet()
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import uuid
+from collections import defaultdict
+from typing import Callable, List, Optional, Set, Tuple, Union
+from dotenv import load_dotenv
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.controllers.transaction_controller import (
+    invalidate_transaction_caches,
+    to_transaction_out,
+)
+from app.database.assets import intern_asset
+from app.database.db_config import SessionLocal
+from app.database.outbox import record_change
+from app.database.sharding import shard_router
+from app.models.transaction_model import Transaction as TransactionModel
+from app.schemas.transaction_schema import TransactionCreate, TransactionOut
+from app.utils.custom_exceptions import BadRequestException
+
+load_dotenv()
+
+# Off by default, every create then commits on its own as before
+TRANSACTION_WRITE_BATCHING = os.getenv("TRANSACTION_WRITE_BATCHING", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+TRANSACTION_BATCH_WINDOW_MS = float(os.getenv("TRANSACTION_BATCH_WINDOW_MS") or 5)
+TRANSACTION_BATCH_MAX_SIZE = int(os.getenv("TRANSACTION_BATCH_MAX_SIZE") or 500)
+
+Result = Union[TransactionOut, Exception]
+
+
+class TransactionWriteBatcher:
+    """
+    Group commit for transaction creates.
+
+    Validated creates are queued and written together, in one multi-row
+    INSERT ... RETURNING and a single commit, once the batch is full or the
+    oldest create has waited for the batch window. Every caller still gets its
+    own TransactionOut, or its own error: when the batch insert fails, the rows
+    are retried one by one in savepoints so only the failing ones are rejected.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        window_seconds: float = TRANSACTION_BATCH_WINDOW_MS / 1000,
+        max_batch_size: int = TRANSACTION_BATCH_MAX_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self.batches_written = 0
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def submit(self, transaction: TransactionCreate) -> TransactionOut:
+        """Queue an already validated create and wait for its batch."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((transaction.model_dump(), future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._schedule_flush)
+
+        return await future
+
+    async def flush(self) -> None:
+        """Write everything queued so far."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        try:
+            results = await asyncio.to_thread(
+                self._write, [values for values, _ in batch]
+            )
+        except Exception as e:
+            print(f"Could not write transaction batch: {e}")
+            results = [
+                BadRequestException("Failed to create transaction") for _ in batch
+            ]
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _schedule_flush(self) -> None:
+        # Keep a reference so the flush isn't garbage collected while it runs
+        task = asyncio.ensure_future(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    def _write(self, rows: List[dict]) -> List[Result]:
+        # Ids are assigned here to match the returned rows back to their
+        # callers; asking for the returned rows in parameter order instead
+        # makes the insert fall back to a statement per row, as created_at is
+        # part of the primary key and only known to the database
+        rows = [{**row, "id": uuid.uuid4()} for row in rows]
+        statement = insert(TransactionModel).returning(TransactionModel)
+        with self.session_factory() as db:
+            rows = [self._with_asset_id(db, row) for row in rows]
+            try:
+                created = {row.id: row for row in db.scalars(statement, rows)}
+                results: List[Result] = [
+                    self._to_out(created[row["id"]]) for row in rows
+                ]
+                self._record_created(db, rows, results)
+                db.commit()
+            except SQLAlchemyError:
+                db.rollback()
+                results = self._write_one_by_one(db, statement, rows)
+        self.batches_written += 1
+
+        written = defaultdict(list)
+        for row, result in zip(rows, results):
+            if not isinstance(result, Exception):
+                written[row["portfolio_id"], row["user_id"]].append(result)
+        for (portfolio_id, user_id), transactions in written.items():
+            invalidate_transaction_caches(portfolio_id, user_id, transactions)
+        return results
+
+    def _write_one_by_one(
+        self, db: Session, statement, rows: List[dict]
+    ) -> List[Result]:
+        results: List[Result] = []
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    created = db.scalars(statement, [row]).one()
+                results.append(self._to_out(created))
+            except SQLAlchemyError:
+                results.append(BadRequestException("Failed to create transaction"))
+        self._record_created(db, rows, results)
+        db.commit()
+        return results
+
+    @staticmethod
+    def _record_created(db: Session, rows: List[dict], results: List[Result]) -> None:
+        # One event per portfolio, committed with the batch
+        created = defaultdict(list)
+        for row, result in zip(rows, results):
+            if not isinstance(result, Exception):
+                created[row["portfolio_id"], row["user_id"]].append(row["id"])
+        for (portfolio_id, user_id), transaction_ids in created.items():
+            record_change(
+                db,
+                "transaction.created",
+                portfolio_id,
+                user_id,
+                transaction_ids=transaction_ids,
+            )
+
+    @staticmethod
+    def _with_asset_id(db: Session, row: dict) -> dict:
+        # A bulk insert sets columns only, the asset is named by its id
+        row = dict(row)
+        row["asset_id"] = intern_asset(
+            db.get_bind(),
+            row["asset_type"],
+            row.pop("asset_name"),
+            row.pop("ticker_symbol"),
+        )
+        return row
+
+    @staticmethod
+    def _to_out(transaction: TransactionModel) -> TransactionOut:
+        # Built before the commit expires the attributes returned by the insert
+        return to_transaction_out(transaction)
+
+
+# One per shard, as a batch is written in a single database transaction
+transaction_write_batchers = {
+    name: TransactionWriteBatcher(shard.session_factory)
+    for name, shard in shard_router.shards.items()
+}
+
+
+def transaction_write_batcher_for(user_id: uuid.UUID) -> TransactionWriteBatcher:
+    return transaction_write_batchers[shard_router.shard_for(user_id).name]
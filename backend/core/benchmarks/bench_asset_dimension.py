@@ -0,0 +1,239 @@
+"""
+Storage and grouping of transactions naming their asset on every row, as
+they used to, against referring to an interned asset by its integer id.
+
+The same synthetic transactions are written to two tables with the columns
+of the transactions table, one with the ticker symbol and asset name, the
+other with asset_id, next to a table of the assets. Sizes are taken after a
+VACUUM; the grouping is the per asset net quantity holdings are built from,
+its time the best execution time EXPLAIN ANALYZE reports. Tables go to a
+schema of their own in the `<POSTGRES_DB>_bench` database, dropped after.
+
+Run from backend/core with: python -m benchmarks.bench_asset_dimension
+"""
+
+import os
+from dotenv import load_dotenv
+from sqlalchemy import text
+from app.database.db_config import (
+    create_db_connection,
+    create_database_if_not_exists,
+    init_engine_and_session,
+    init_db,
+)
+
+TRANSACTIONS = 1_000_000
+PORTFOLIOS = 10_000
+# Ids at CoinGecko, the names transactions used to repeat
+ASSET_NAMES = [
+    "bitcoin",
+    "ethereum",
+    "tether",
+    "binancecoin",
+    "solana",
+    "usd-coin",
+    "ripple",
+    "staked-ether",
+    "dogecoin",
+    "cardano",
+    "avalanche-2",
+    "shiba-inu",
+    "wrapped-bitcoin",
+    "polkadot",
+    "chainlink",
+    "tron",
+    "matic-network",
+    "bitcoin-cash",
+    "internet-computer",
+    "uniswap",
+    "litecoin",
+    "dai",
+    "ethereum-classic",
+    "cosmos",
+    "near",
+    "stellar",
+    "filecoin",
+    "hedera-hashgraph",
+    "aptos",
+    "arbitrum",
+    "the-open-network",
+    "optimism",
+    "render-token",
+    "injective-protocol",
+    "immutable-x",
+    "crypto-com-chain",
+    "lido-dao",
+    "vechain",
+    "the-graph",
+    "maker",
+]
+SCHEMA = "bench_asset_dimension"
+
+COMMON_COLUMNS = """
+    transaction_type transactiontype NOT NULL,
+    asset_type assettype NOT NULL,
+    user_id uuid NOT NULL,
+    amount float NOT NULL,
+    currency varchar NOT NULL,
+    unit_price float NOT NULL,
+    transaction_fee float NOT NULL,
+    portfolio_id uuid NOT NULL,
+    note varchar,
+    created_at timestamp NOT NULL,
+    updated_at timestamp,
+    deleted_at timestamp
+"""
+LAYOUTS = {
+    "names": (
+        "ticker_symbol varchar NOT NULL, asset_name varchar NOT NULL",
+        "portfolio_id, asset_name",
+        "SELECT asset_name, max(ticker_symbol), currency, sum(amount) "
+        "FROM names GROUP BY asset_name, currency",
+    ),
+    "asset ids": (
+        "asset_id integer NOT NULL",
+        "portfolio_id, asset_id",
+        "SELECT assets.provider_id, assets.symbol, quantities.currency, "
+        "quantities.quantity FROM (SELECT asset_id, currency, "
+        "sum(amount) AS quantity FROM asset_ids GROUP BY asset_id, currency) "
+        "quantities JOIN assets ON assets.id = quantities.asset_id",
+    ),
+}
+
+load_dotenv()
+conn = create_db_connection(
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    host=os.getenv("POSTGRES_HOST"),
+    port=os.getenv("POSTGRES_PORT"),
+)
+create_database_if_not_exists(conn, f"{os.getenv('POSTGRES_DB')}_bench")
+engine, SessionLocal = init_engine_and_session(
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    host=os.getenv("POSTGRES_HOST"),
+    port=os.getenv("POSTGRES_PORT"),
+    db_name=f"{os.getenv('POSTGRES_DB')}_bench",
+)
+init_db(engine)
+
+
+def table_name(layout):
+    return layout.replace(" ", "_")
+
+
+def create_tables(connection):
+    connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    connection.execute(text(f"SET search_path TO {SCHEMA}, public"))
+    connection.execute(
+        text(
+            "CREATE TABLE assets (id serial PRIMARY KEY, "
+            "symbol varchar NOT NULL, provider_id varchar NOT NULL)"
+        )
+    )
+    for name in ASSET_NAMES:
+        connection.execute(
+            text("INSERT INTO assets (symbol, provider_id) VALUES (:symbol, :name)"),
+            {"symbol": name.replace("-", "")[:4].upper(), "name": name},
+        )
+    for layout, (asset_columns, _, _) in LAYOUTS.items():
+        connection.execute(
+            text(
+                f"CREATE TABLE {table_name(layout)} (id uuid NOT NULL, "
+                f"{asset_columns}, {COMMON_COLUMNS})"
+            )
+        )
+
+    connection.execute(text("SELECT setseed(0.42)"))
+    connection.execute(
+        text(
+            "CREATE TEMPORARY TABLE portfolios AS SELECT row_number() OVER () "
+            "AS n, gen_random_uuid() AS id, gen_random_uuid() AS user_id "
+            "FROM generate_series(1, :portfolios)"
+        ),
+        {"portfolios": PORTFOLIOS},
+    )
+    connection.execute(
+        text(
+            "INSERT INTO asset_ids SELECT gen_random_uuid(), "
+            f"1 + floor(random() * {len(ASSET_NAMES)})::int, "
+            "(ARRAY['BUY', 'SELL', 'TRANSFER_IN', 'TRANSFER_OUT'])"
+            "[1 + floor(random() * 4)::int]::transactiontype, 'CRYPTO', "
+            "portfolios.user_id, random() * 10, "
+            "(ARRAY['usd', 'eur'])[1 + floor(random() * 2)::int], "
+            "random() * 1000, 0, portfolios.id, '', "
+            "now() - random() * interval '1000 days', now(), NULL "
+            f"FROM generate_series(1, {TRANSACTIONS}) AS i "
+            "JOIN portfolios ON portfolios.n = 1 + i % :portfolios"
+        ),
+        {"portfolios": PORTFOLIOS},
+    )
+    # The very same rows, named
+    connection.execute(
+        text(
+            "INSERT INTO names SELECT asset_ids.id, assets.symbol, "
+            "assets.provider_id, transaction_type, asset_type, user_id, amount, "
+            "currency, unit_price, transaction_fee, portfolio_id, note, "
+            "created_at, updated_at, deleted_at "
+            "FROM asset_ids JOIN assets ON assets.id = asset_ids.asset_id"
+        )
+    )
+    for layout, (_, index_columns, _) in LAYOUTS.items():
+        connection.execute(
+            text(
+                f"CREATE INDEX {table_name(layout)}_asset_idx "
+                f"ON {table_name(layout)} ({index_columns})"
+            )
+        )
+
+
+def measure(connection, layout):
+    table = table_name(layout)
+    row_bytes = connection.execute(
+        text(f"SELECT avg(pg_column_size({table}.*)) FROM {table}")
+    ).scalar()
+    table_bytes = connection.execute(
+        text(f"SELECT pg_table_size('{SCHEMA}.{table}')")
+    ).scalar()
+    index_bytes = connection.execute(
+        text(f"SELECT pg_relation_size('{SCHEMA}.{table}_asset_idx')")
+    ).scalar()
+    grouping_ms = min(
+        float(
+            connection.execute(
+                text(f"EXPLAIN (ANALYZE, FORMAT JSON) {LAYOUTS[layout][2]}")
+            ).scalar()[0]["Execution Time"]
+        )
+        for _ in range(5)
+    )
+    return row_bytes, table_bytes, index_bytes, grouping_ms
+
+
+def main():
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        create_tables(connection)
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text(f"SET search_path TO {SCHEMA}, public"))
+        connection.execute(text("VACUUM ANALYZE names"))
+        connection.execute(text("VACUUM ANALYZE asset_ids"))
+        results = {layout: measure(connection, layout) for layout in LAYOUTS}
+        connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+
+    print(f"{TRANSACTIONS} transactions, {len(ASSET_NAMES)} assets")
+    for layout, (row_bytes, table_bytes, index_bytes, grouping_ms) in results.items():
+        print(
+            f"  {layout:9}  row {row_bytes:6.1f} B  table {table_bytes / 2**20:6.1f} MiB"
+            f"  (portfolio, asset) index {index_bytes / 2**20:5.1f} MiB"
+            f"  grouping {grouping_ms:6.1f} ms"
+        )
+    names, ids = results["names"], results["asset ids"]
+    print(
+        f"  row -{1 - ids[0] / names[0]:.0%}  table -{1 - ids[1] / names[1]:.0%}"
+        f"  index -{1 - ids[2] / names[2]:.0%}  grouping x{names[3] / ids[3]:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Amounts as floats, as they used to be stored, against fixed point units of
+10^-8 in a bigint, and numeric for reference.
+
+Drift: positions built of random buys, each sold in one go at the end, that
+should net to zero. Working set: the per group net quantity of the holdings,
+float weights summed by np.bincount against units summed exactly by
+np.add.at. Database: the grouped sum of the holdings queries over the same
+synthetic amounts in each type, its time the best execution time EXPLAIN
+ANALYZE reports, grouped by asset as the holdings of a portfolio are and
+by portfolio and asset as the stress test is. Units are also summed as
+float8, exact below 2^53. Tables go to a schema of their own in the
+`<POSTGRES_DB>_bench` database, dropped after.
+
+Run from backend/core with: python -m benchmarks.bench_fixed_point
+"""
+
+import os
+import random
+import time
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import text
+from app.database.db_config import (
+    create_db_connection,
+    create_database_if_not_exists,
+    init_engine_and_session,
+)
+from app.database.fixed_point import FIXED_POINT_SCALE, to_units
+
+POSITIONS = 10_000
+BUYS_PER_POSITION = 20
+WORKING_SET_ROWS = 100_000
+WORKING_SET_GROUPS = 80
+TRANSACTIONS = 1_000_000
+PORTFOLIOS = 10_000
+ASSETS = 40
+SCHEMA = "bench_fixed_point"
+# As the holdings of a portfolio, few groups, and as the stress test
+GROUPINGS = ("asset_id", "portfolio_id, asset_id")
+COLUMN_TYPES = ("float8", "bigint", "numeric")
+# Table and sum of each
+SUMS = {
+    "float": ("float8", "sum(amount)"),
+    "fixed point": ("bigint", "sum(amount)"),
+    "fixed point, float8 sum": ("bigint", "sum(amount::float8)"),
+    "numeric": ("numeric", "sum(amount)"),
+}
+
+load_dotenv()
+conn = create_db_connection(
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    host=os.getenv("POSTGRES_HOST"),
+    port=os.getenv("POSTGRES_PORT"),
+)
+create_database_if_not_exists(conn, f"{os.getenv('POSTGRES_DB')}_bench")
+engine, SessionLocal = init_engine_and_session(
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    host=os.getenv("POSTGRES_HOST"),
+    port=os.getenv("POSTGRES_PORT"),
+    db_name=f"{os.getenv('POSTGRES_DB')}_bench",
+)
+
+
+def drift(rng):
+    # Amounts entered with up to 8 decimals, as users type them
+    float_open = units_open = 0
+    worst = 0.0
+    for _ in range(POSITIONS):
+        buys = [round(rng.uniform(0.001, 2), 8) for _ in range(BUYS_PER_POSITION)]
+        bought_units = sum(to_units(amount) for amount in buys)
+        sold = bought_units / FIXED_POINT_SCALE
+        float_quantity = sum(buys) - sold
+        float_open += float_quantity != 0
+        units_open += bought_units - to_units(sold) != 0
+        worst = max(worst, abs(float_quantity))
+    return float_open, units_open, worst
+
+
+def timed(function, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def working_set(rng):
+    groups = rng.integers(0, WORKING_SET_GROUPS, WORKING_SET_ROWS)
+    signs = rng.choice([-1, 1], WORKING_SET_ROWS)
+    units = rng.integers(1, 10 * FIXED_POINT_SCALE, WORKING_SET_ROWS)
+    amounts = units / FIXED_POINT_SCALE
+
+    def floats():
+        return np.bincount(
+            groups, weights=amounts * signs, minlength=WORKING_SET_GROUPS
+        )
+
+    def fixed_point():
+        totals = np.zeros(WORKING_SET_GROUPS, np.int64)
+        np.add.at(totals, groups, units * signs)
+        return totals
+
+    return timed(floats), timed(fixed_point)
+
+
+def database():
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        connection.execute(text("SELECT setseed(0.42)"))
+        connection.execute(
+            text(
+                f"CREATE TABLE {SCHEMA}.units AS SELECT "
+                f"1 + i % {PORTFOLIOS} AS portfolio_id, "
+                f"1 + floor(random() * {ASSETS})::int AS asset_id, "
+                f"(floor(random() * {10 * FIXED_POINT_SCALE}) "
+                "* (CASE WHEN random() < 0.5 THEN 1 ELSE -1 END))::bigint AS amount "
+                f"FROM generate_series(1, {TRANSACTIONS}) AS i"
+            )
+        )
+        for column_type in COLUMN_TYPES:
+            amount = f"amount::{column_type}"
+            if column_type != "bigint":
+                amount = f"{amount} / {FIXED_POINT_SCALE}"
+            connection.execute(
+                text(
+                    f"CREATE TABLE {SCHEMA}.{column_type} AS SELECT "
+                    f"portfolio_id, asset_id, {amount} AS amount "
+                    f"FROM {SCHEMA}.units"
+                )
+            )
+
+    results = {}
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        for column_type in COLUMN_TYPES:
+            connection.execute(text(f"VACUUM ANALYZE {SCHEMA}.{column_type}"))
+        for grouping in GROUPINGS:
+            for name, (column_type, total) in SUMS.items():
+                results[grouping, name] = min(
+                    float(
+                        connection.execute(
+                            text(
+                                f"EXPLAIN (ANALYZE, FORMAT JSON) SELECT {grouping}, "
+                                f"{total} FROM {SCHEMA}.{column_type} "
+                                f"GROUP BY {grouping}"
+                            )
+                        ).scalar()[0]["Execution Time"]
+                    )
+                    for _ in range(5)
+                )
+        connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    return results
+
+
+def main():
+    float_open, units_open, worst = drift(random.Random(42))
+    print(f"{POSITIONS} positions of {BUYS_PER_POSITION} buys, sold at once")
+    print(f"  left open as floats       {float_open:6}  worst residue {worst:.1e}")
+    print(f"  left open as fixed point  {units_open:6}")
+
+    floats_ms, fixed_ms = working_set(np.random.default_rng(42))
+    print(f"working set, {WORKING_SET_ROWS} rows in {WORKING_SET_GROUPS} groups")
+    print(f"  float bincount       {floats_ms:6.2f} ms")
+    print(f"  fixed point add.at   {fixed_ms:6.2f} ms")
+
+    results = database()
+    print(f"database, grouped sum of {TRANSACTIONS} transactions")
+    for (grouping, name), grouping_ms in results.items():
+        print(
+            f"  by {grouping:22} {name:23} {grouping_ms:7.1f} ms"
+            f"  x{grouping_ms / results[grouping, 'float']:.2f} float"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Evaluation benchmark of price alerts.
+
+Loads 1M active alerts over 1000 assets, a few of them holding most alerts,
+with thresholds around the current price, then replays random walk quotes
+of every asset. Each quote is evaluated by binary search in the sorted
+thresholds of its asset, and compared with checking every alert of the
+asset, vectorized, on the same quotes. Triggered alerts are then written to the local sink in
+batches, and compared with one write each.
+
+Run from backend/core with: python -m benchmarks.bench_price_alerts
+"""
+
+import os
+import tempfile
+import time
+import uuid
+import numpy as np
+from app.models.price_alert_model import AlertDirection
+from app.utils.price_alerts import ActiveAlert, AlertBook, AlertLogSink
+
+ALERTS = 1_000_000
+ASSETS = 1000
+TICKS = 20
+# Relative move of a price in a tick, and of thresholds around it
+TICK_VOLATILITY = 0.002
+THRESHOLD_SPREAD = 0.2
+CHANGES_PER_TICK = 1000
+DELIVERY_BATCH_SIZE = 1000
+
+KEYS = [(f"asset-{i}", "usd") for i in range(ASSETS)]
+
+
+def make_alerts(generator):
+    # Zipf-like, the first assets hold most alerts
+    weights = 1 / np.arange(1, ASSETS + 1)
+    assets = generator.choice(ASSETS, ALERTS, p=weights / weights.sum())
+    directions = generator.random(ALERTS) < 0.5
+    offsets = generator.uniform(0, THRESHOLD_SPREAD, ALERTS)
+    thresholds = np.where(directions, 100 * (1 + offsets), 100 * (1 - offsets))
+    users = [uuid.uuid4() for _ in range(ALERTS // 10)]
+    return [
+        ActiveAlert(
+            uuid.uuid4(),
+            users[index % len(users)],
+            *KEYS[asset],
+            AlertDirection.ABOVE if above else AlertDirection.BELOW,
+            float(threshold),
+        )
+        for index, (asset, above, threshold) in enumerate(
+            zip(assets.tolist(), directions.tolist(), thresholds.tolist())
+        )
+    ]
+
+
+class ScannedAlerts:
+    """The alerts of an asset in arrival order, every one checked per quote."""
+
+    def __init__(self, alerts):
+        self.thresholds = np.array([alert.threshold for alert in alerts])
+        self.above = np.array(
+            [alert.direction == AlertDirection.ABOVE for alert in alerts]
+        )
+        self.alerts = np.empty(len(alerts), dtype=object)
+        for position, alert in enumerate(alerts):
+            self.alerts[position] = alert
+
+    def trigger(self, price):
+        crossed = np.where(
+            self.above, price >= self.thresholds, price <= self.thresholds
+        )
+        if not crossed.any():
+            return []
+        triggered = self.alerts[crossed].tolist()
+        kept = ~crossed
+        self.thresholds = self.thresholds[kept]
+        self.above = self.above[kept]
+        self.alerts = self.alerts[kept]
+        return triggered
+
+
+def run_ticks(trigger, prices):
+    start = time.perf_counter()
+    fired = [
+        (alert, price) for key, price in prices.items() for alert in trigger(key, price)
+    ]
+    return fired, time.perf_counter() - start
+
+
+def main():
+    generator = np.random.default_rng(0)
+    alerts = make_alerts(generator)
+
+    start = time.perf_counter()
+    book = AlertBook()
+    for alert in alerts:
+        book.track(alert)
+    book.merge()
+    build_seconds = time.perf_counter() - start
+
+    by_key = {key: [] for key in KEYS}
+    for alert in alerts:
+        by_key[alert.key].append(alert)
+    scanned = {key: ScannedAlerts(key_alerts) for key, key_alerts in by_key.items()}
+
+    prices = dict.fromkeys(KEYS, 100.0)
+    tick_seconds, scan_seconds, triggered, all_fired = [], [], [], []
+    for _ in range(TICKS):
+        moves = generator.normal(0, TICK_VOLATILITY * 100, ASSETS)
+        for key, move in zip(KEYS, moves.tolist()):
+            prices[key] += move
+        # Alerts created, moved or deleted since the last tick, only applied
+        # to the book, the scan gets them for free
+        for alert in generator.choice(len(alerts), CHANGES_PER_TICK).tolist():
+            book.untrack(alerts[alert].id)
+            book.track(alerts[alert])
+
+        fired, seconds = run_ticks(book.trigger, prices)
+        tick_seconds.append(seconds)
+        triggered.append(len(fired))
+        all_fired += fired
+        _, seconds = run_ticks(lambda key, price: scanned[key].trigger(price), prices)
+        scan_seconds.append(seconds)
+
+    # The same quotes again, which trigger nothing
+    _, quiet_seconds = run_ticks(book.trigger, prices)
+    _, quiet_scan_seconds = run_ticks(
+        lambda key, price: scanned[key].trigger(price), prices
+    )
+
+    notifications = [
+        {
+            "id": str(alert.id),
+            "user_id": str(alert.user_id),
+            "asset_name": alert.asset_name,
+            "currency": alert.currency,
+            "direction": alert.direction.value,
+            "threshold": alert.threshold,
+            "price": price,
+        }
+        for alert, price in all_fired[:10_000]
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        sink = AlertLogSink(os.path.join(directory, "price_alerts.log"))
+        start = time.perf_counter()
+        for notification in notifications:
+            sink([notification])
+        one_by_one_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for offset in range(0, len(notifications), DELIVERY_BATCH_SIZE):
+            sink(notifications[offset : offset + DELIVERY_BATCH_SIZE])
+        batched_seconds = time.perf_counter() - start
+
+    tick_seconds.sort()
+    scan_seconds.sort()
+    print(f"alerts:                    {ALERTS} over {ASSETS} assets")
+    print(f"largest asset:             {len(by_key[KEYS[0]])} alerts")
+    print(f"index built in:            {build_seconds:.2f}s")
+    print(f"alerts changed per tick:   {CHANGES_PER_TICK}")
+    print(f"triggered per tick:        {int(np.median(triggered))} (median)")
+    print(
+        f"binary search, per tick:   {np.median(tick_seconds) * 1000:.1f} ms p50, "
+        f"{tick_seconds[-1] * 1000:.1f} ms max"
+    )
+    print(
+        f"full scan, per tick:       {np.median(scan_seconds) * 1000:.1f} ms p50, "
+        f"{scan_seconds[-1] * 1000:.1f} ms max"
+    )
+    print(
+        f"tick triggering nothing:   {quiet_seconds * 1000:.1f} ms binary search, "
+        f"{quiet_scan_seconds * 1000:.1f} ms full scan"
+    )
+    print(f"active alerts left:        {len(book)}")
+    print(
+        f"sink, {len(notifications)} notifications:  "
+        f"{one_by_one_seconds * 1000:.0f} ms one by one, "
+        f"{batched_seconds * 1000:.0f} ms in batches of {DELIVERY_BATCH_SIZE}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Fan-out benchmark of the shared price feed.
+
+Simulates 10k streaming clients, each subscribed to a few out of 100 assets,
+with a share of them consuming slower than the tick rate.
+
+Run from backend/core with: python -m benchmarks.bench_price_feed
+"""
+
+import asyncio
+import random
+import time
+from app.utils.price_feed import PriceFeed
+
+SUBSCRIBERS = 10_000
+DISTINCT_ASSETS = 100
+ASSETS_PER_SUBSCRIBER = (1, 5)
+SLOW_SUBSCRIBER_RATIO = 0.1
+TICKS = 20
+TICK_SECONDS = 0.05
+UPSTREAM_LATENCY_SECONDS = 0.02
+
+ASSETS = [(f"asset-{i}", "usd") for i in range(DISTINCT_ASSETS)]
+
+
+def fetch_prices(asset_names, currencies):
+    time.sleep(UPSTREAM_LATENCY_SECONDS)
+    return {
+        (asset_name, currency): random.uniform(1, 100)
+        for asset_name in asset_names
+        for currency in currencies
+    }
+
+
+async def consume(subscription, delay, delivered):
+    while True:
+        await subscription.get()
+        delivered[0] += 1
+        if delay:
+            await asyncio.sleep(delay)
+
+
+async def main():
+    random.seed(0)
+    feed = PriceFeed(fetch_prices=fetch_prices, interval_seconds=TICK_SECONDS)
+    delivered = [0]
+    subscriptions, consumers = [], []
+    for i in range(SUBSCRIBERS):
+        keys = random.sample(ASSETS, random.randint(*ASSETS_PER_SUBSCRIBER))
+        subscription = feed.subscribe(keys)
+        slow = i < SUBSCRIBERS * SLOW_SUBSCRIBER_RATIO
+        delay = TICK_SECONDS * 3 if slow else 0
+        subscriptions.append(subscription)
+        consumers.append(asyncio.create_task(consume(subscription, delay, delivered)))
+
+    publish_seconds = []
+    publish = feed.publish
+
+    def timed_publish(quotes):
+        start = time.perf_counter()
+        publish(quotes)
+        publish_seconds.append(time.perf_counter() - start)
+
+    feed.publish = timed_publish
+
+    start = time.perf_counter()
+    for _ in range(TICKS):
+        await feed.tick()
+        await asyncio.sleep(TICK_SECONDS)
+    elapsed = time.perf_counter() - start
+
+    for consumer in consumers:
+        consumer.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+
+    publish_seconds.sort()
+    dropped = sum(subscription.dropped for subscription in subscriptions)
+    print(f"subscribers:               {SUBSCRIBERS}")
+    print(f"distinct assets tracked:   {len(feed.tracked_keys)}")
+    print(f"ticks:                     {TICKS} in {elapsed:.2f}s")
+    print(f"upstream calls:            {feed.upstream_calls}")
+    print(f"upstream calls per tick:   {feed.upstream_calls / TICKS:.1f}")
+    print(
+        f"fan-out p50 per tick:      {publish_seconds[len(publish_seconds) // 2] * 1000:.1f} ms"
+    )
+    print(f"fan-out max per tick:      {publish_seconds[-1] * 1000:.1f} ms")
+    print(f"updates delivered:         {delivered[0]}")
+    print(f"updates coalesced (slow):  {dropped}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Stress test of price shock scenarios over many portfolios, in process.
+
+Synthetic holdings of a few assets each among a small universe, as crypto
+portfolios are. The matrix is built once, then blocks of scenarios are
+evaluated with sparse products. The baseline values every portfolio under
+every scenario in a Python loop, timed on a sample and extrapolated.
+
+Run from backend/core with: python -m benchmarks.bench_price_shocks
+"""
+
+import random
+import time
+import numpy as np
+from app.utils.price_shocks import HoldingsMatrix
+
+PORTFOLIOS = 100_000
+ASSETS = 50
+ASSETS_PER_PORTFOLIO = (1, 10)
+SCENARIOS = (100, 1_000, 5_000)
+SHOCKED_ASSETS = 10
+WORST = 10
+# Portfolios x scenarios valued by the Python loop baseline
+LOOP_SAMPLE = (1_000, 100)
+
+
+def make_holdings(rng):
+    assets = [f"asset-{i}" for i in range(ASSETS)]
+    prices = {asset: rng.uniform(0.01, 50_000) for asset in assets}
+    holdings = []
+    for portfolio_id in range(PORTFOLIOS):
+        for asset in rng.sample(assets, rng.randint(*ASSETS_PER_PORTFOLIO)):
+            holdings.append((portfolio_id, asset, rng.uniform(-1, 100)))
+    return assets, prices, holdings
+
+
+def make_scenarios(rng, assets, count):
+    return [
+        {asset: rng.uniform(-0.9, 0.5) for asset in rng.sample(assets, SHOCKED_ASSETS)}
+        for _ in range(count)
+    ]
+
+
+def loop_pnl(holdings, prices, scenarios):
+    # Per portfolio, per scenario, per holding
+    by_portfolio = {}
+    for portfolio_id, asset, quantity in holdings:
+        by_portfolio.setdefault(portfolio_id, []).append((asset, quantity))
+    pnl = []
+    for scenario in scenarios:
+        pnl.append(
+            {
+                portfolio_id: sum(
+                    quantity * prices[asset] * scenario.get(asset, 0)
+                    for asset, quantity in positions
+                )
+                for portfolio_id, positions in by_portfolio.items()
+            }
+        )
+    return pnl
+
+
+def main():
+    rng = random.Random(42)
+    assets, prices, holdings = make_holdings(rng)
+    print(f"{PORTFOLIOS} portfolios, {len(holdings)} holdings of {ASSETS} assets")
+
+    start = time.perf_counter()
+    matrix = HoldingsMatrix.from_holdings(holdings, prices)
+    print(f"  build matrix             {time.perf_counter() - start:8.3f} s")
+
+    portfolios, scenarios = LOOP_SAMPLE
+    sample = [row for row in holdings if row[0] < portfolios]
+    start = time.perf_counter()
+    loop_pnl(sample, prices, make_scenarios(rng, assets, scenarios))
+    per_cell = (time.perf_counter() - start) / (portfolios * scenarios)
+
+    for count in SCENARIOS:
+        shocks = matrix.shock_matrix(make_scenarios(rng, assets, count))
+        start = time.perf_counter()
+        results = matrix.evaluate(shocks, WORST)
+        elapsed = time.perf_counter() - start
+        assert results.worst_portfolios.shape == (count, WORST)
+        loop = per_cell * PORTFOLIOS * count
+        print(
+            f"  {count:5} scenarios          {elapsed:8.3f} s"
+            f"   python loop ~{loop:8.1f} s   x{loop / elapsed:,.0f}"
+        )
+    print(f"  numpy {np.__version__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Per-call CPU profile of the hot path queries, built as legacy ORM Query
+chains (how the controllers used to build them) against the statements the
+controllers now build once with bound parameters.
+
+For each variant the profile splits out the time spent building statement
+cache keys and compiling SQL, which prebuilt statements only pay once.
+Queries are read only and run against the configured database.
+
+Run from backend/core with: python -m benchmarks.bench_query_compile
+"""
+
+import cProfile
+import pstats
+import time
+import uuid
+from datetime import datetime, timedelta
+from app.database.db_config import SessionLocal
+from app.controllers.transaction_controller import TransactionController
+from app.controllers.user_controller import UserController
+from app.models.transaction_model import Transaction as TransactionModel
+from app.models.user_model import User as UserModel
+from app.utils.custom_exceptions import NotFoundException
+
+CALLS = 2000
+
+# Where SQLAlchemy spends the time that statement caching saves; on a cache
+# hit what remains in the compiler module is processing the bound parameters
+COMPILE_MODULES = ("sqlalchemy/sql/compiler.py",)
+CACHE_KEY_MODULES = ("sqlalchemy/sql/cache_key.py", "sqlalchemy/sql/traversals.py")
+
+
+def legacy_transactions(db, user_id, start_time, end_time):
+    query = db.query(TransactionModel).filter(TransactionModel.user_id == user_id)
+    query = query.filter(TransactionModel.created_at.between(start_time, end_time))
+    query = query.filter(TransactionModel.deleted_at.is_(None))
+    query.count()
+    query.order_by(TransactionModel.created_at.desc()).offset(0).limit(10).all()
+
+
+def prebuilt_transactions(db, user_id, start_time, end_time):
+    TransactionController.get_transactions_by_user_id(
+        db, user_id, start_time=start_time, end_time=end_time
+    )
+
+
+def legacy_user(db, user_id, *args):
+    db.query(UserModel).get(user_id)
+
+
+def prebuilt_user(db, user_id, *args):
+    try:
+        UserController.get_user_by_id(db, user_id)
+    except NotFoundException:
+        pass
+
+
+def profile(function):
+    end_time = datetime.utcnow()
+    start_time = end_time - timedelta(days=30)
+    with SessionLocal() as db:
+        # Warm up the compiled statement caches
+        function(db, uuid.uuid4(), start_time, end_time)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        for _ in range(CALLS):
+            function(db, uuid.uuid4(), start_time, end_time)
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+
+    stats = pstats.Stats(profiler).stats
+
+    def own_time(modules):
+        return sum(
+            stat[2]
+            for (filename, _, _), stat in stats.items()
+            if filename.replace("\\", "/").endswith(modules)
+        )
+
+    return elapsed, own_time(COMPILE_MODULES), own_time(CACHE_KEY_MODULES)
+
+
+def report(name, elapsed, compile_seconds, cache_key_seconds):
+    def per_call(seconds):
+        return seconds / CALLS * 1e6
+
+    print(f"  {name}:")
+    print(f"    wall per call:       {per_call(elapsed):7.1f} us (profiled)")
+    print(f"    SQL compilation:     {per_call(compile_seconds):7.1f} us")
+    print(f"    cache key building:  {per_call(cache_key_seconds):7.1f} us")
+
+
+def main():
+    print(f"{CALLS} calls each\n")
+    for name, legacy, cached in (
+        ("transaction listing", legacy_transactions, prebuilt_transactions),
+        ("user by id", legacy_user, prebuilt_user),
+    ):
+        print(f"{name}")
+        report("ORM Query", *profile(legacy))
+        report("prebuilt statement", *profile(cached))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Overhead of the rate limiting middleware per request, in process.
+
+Requests go through the middleware straight to an app that answers at once,
+so the time is that of the limiter alone: identifying the client from its
+refresh token, or its address, and taking tokens from its bucket. The
+baseline is the same request to the bare app.
+
+Run from backend/core with: python -m benchmarks.bench_rate_limit
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import timedelta
+from app.middleware.rate_limit_middleware import RateLimitMiddleware
+from app.utils.jwt import create_access_token
+from app.utils.rate_limiter import BucketPolicy, LocalBucketStore, RateLimiter
+
+REQUESTS = 50_000
+CLIENTS = (1, 10_000)
+# Large enough for every request to be let through, to time the whole path
+UNLIMITED = {
+    bucket: BucketPolicy(capacity=1e12, refill_per_second=1e12)
+    for bucket in ("api", "portfolios", "reports", "auth")
+}
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def scope(path, cookie=None, address="10.0.0.1"):
+    headers = [(b"cookie", f"refresh_token={cookie}".encode())] if cookie else []
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "headers": headers,
+        "client": (address, 50000),
+    }
+
+
+async def measure(handler, scopes):
+    start = time.perf_counter()
+    for i in range(REQUESTS):
+        await handler(scopes[i % len(scopes)], receive, send)
+    return (time.perf_counter() - start) / REQUESTS * 1e6
+
+
+async def main():
+    for clients in CLIENTS:
+        tokens = [
+            create_access_token({"sub": uuid.uuid4()}, timedelta(days=1))
+            for _ in range(clients)
+        ]
+        paths = ("/api/v1/transactions/", "/api/v1/portfolios/summary")
+        signed_in = [scope(paths[i % 2], token) for i, token in enumerate(tokens)]
+        anonymous = [
+            scope(paths[i % 2], address=f"10.{i // 65536}.{i // 256 % 256}.{i % 256}")
+            for i in range(clients)
+        ]
+
+        baseline = await measure(app, signed_in)
+        print(f"{clients} clients, {REQUESTS} requests")
+        print(f"  no middleware          {baseline:6.2f} us/request")
+        for name, scopes, token_cache in (
+            ("anonymous", anonymous, True),
+            ("signed in", signed_in, True),
+            ("signed in, uncached", signed_in, False),
+        ):
+            middleware = RateLimitMiddleware(
+                app, RateLimiter(LocalBucketStore(), buckets=UNLIMITED)
+            )
+            if not token_cache:
+                middleware.token_users.max_entries = 0
+            else:
+                # Warm the token cache, as in a steady state
+                await measure(middleware, scopes)
+            overhead = await measure(middleware, scopes) - baseline
+            print(f"  {name:22} +{overhead:6.2f} us/request")
+        print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Bytes and CPU per response of a transaction listing page, as plain JSON (the
+FastAPI fast path), as MessagePack (what NegotiatedRoute sends) and compressed
+with gzip or brotli at the levels of the compression middleware.
+
+CPU time covers validating the response model and encoding it, plus the
+compression where there is one. Payloads are built in memory; the database is
+only touched by the model imports.
+
+Run from backend/core with: python -m benchmarks.bench_response_encoding
+"""
+
+import gzip
+import time
+import uuid
+from datetime import datetime, timedelta
+import brotli
+from pydantic import TypeAdapter
+from app.database.db_config import Base  # noqa: F401, imported before the models
+from app.middleware.compression_middleware import (
+    RESPONSE_BROTLI_QUALITY,
+    RESPONSE_GZIP_LEVEL,
+)
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import TransactionType
+from app.schemas.api_response import ApiResponse
+from app.schemas.pagination import Pagination
+from app.schemas.transaction_schema import TransactionOut
+from app.utils.content_negotiation import MsgpackResponse
+
+PAGE_SIZES = (100, 1000)
+# Responses encoded per measurement, whatever the page size
+ROWS_PER_MEASUREMENT = 100_000
+
+adapter = TypeAdapter(ApiResponse[Pagination[TransactionOut]])
+
+
+def listing_page(page_size):
+    user_id, portfolio_id = uuid.uuid4(), uuid.uuid4()
+    now = datetime.utcnow()
+    transactions = [
+        TransactionOut(
+            id=uuid.uuid4(),
+            ticker_symbol="BTC",
+            asset_name="bitcoin",
+            transaction_type=TransactionType.BUY,
+            asset_type=AssetType.CRYPTO,
+            user_id=user_id,
+            portfolio_id=portfolio_id,
+            amount=0.01 * (i + 1),
+            currency="usd",
+            unit_price=43000.25 + i,
+            transaction_fee=1.5,
+            note="",
+            created_at=now - timedelta(minutes=i),
+            updated_at=now - timedelta(minutes=i),
+            deleted_at=None,
+        )
+        for i in range(page_size)
+    ]
+    return ApiResponse[Pagination[TransactionOut]].success_response(
+        data=Pagination[TransactionOut].create(transactions, 1, page_size, 10_000)
+    )
+
+
+def encode_json(page):
+    return adapter.dump_json(adapter.validate_python(page))
+
+
+def encode_msgpack(page):
+    return MsgpackResponse(adapter.validate_python(page)).body
+
+
+ENCODINGS = {
+    "json": encode_json,
+    "json + gzip": lambda page: gzip.compress(encode_json(page), RESPONSE_GZIP_LEVEL),
+    "json + br": lambda page: brotli.compress(
+        encode_json(page), quality=RESPONSE_BROTLI_QUALITY
+    ),
+    "msgpack": encode_msgpack,
+    "msgpack + br": lambda page: brotli.compress(
+        encode_msgpack(page), quality=RESPONSE_BROTLI_QUALITY
+    ),
+}
+
+
+def measure(encode, page, iterations):
+    encode(page)
+    start = time.process_time()
+    for _ in range(iterations):
+        body = encode(page)
+    return len(body), (time.process_time() - start) / iterations
+
+
+def main():
+    for page_size in PAGE_SIZES:
+        page = listing_page(page_size)
+        iterations = max(ROWS_PER_MEASUREMENT // page_size, 10)
+        print(f"page of {page_size} transactions ({iterations} responses)")
+        results = {
+            name: measure(encode, page, iterations)
+            for name, encode in ENCODINGS.items()
+        }
+        json_size, json_seconds = results["json"]
+        for name, (size, seconds) in results.items():
+            print(
+                f"  {name:13} {size:9,} bytes ({size / json_size:4.0%})"
+                f"  {seconds * 1000:7.2f} ms CPU ({seconds / json_seconds:4.0%})"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
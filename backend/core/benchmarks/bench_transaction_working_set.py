@@ -0,0 +1,137 @@
+"""
+Memory and holdings time of a user's transactions in the working set,
+against the ORM and pydantic objects a listing builds for them.
+
+The same synthetic transactions, across a few portfolios and assets, are
+held as ORM instances plus their TransactionOut models, as listings keep
+them for a request, and as working set columns. Memory is what tracemalloc
+sees allocated for each. Holdings are then netted from the models in a
+Python loop and from the columns.
+
+Run from backend/core with: python -m benchmarks.bench_transaction_working_set
+"""
+
+import gc
+import random
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from app.database.db_config import engine  # noqa: F401, models need the engine
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.controllers.transaction_controller import to_transaction_out
+from app.database.fixed_point import to_units
+from app.utils.transaction_working_set import FIELDS, UserTransactions
+
+TRANSACTIONS = 100_000
+PORTFOLIOS = 5
+ASSETS = 40
+
+
+def make_rows(rng):
+    portfolios = [uuid.uuid4() for _ in range(PORTFOLIOS)]
+    start = datetime(2020, 1, 1)
+    rows = []
+    for i in range(TRANSACTIONS):
+        asset = rng.randrange(ASSETS)
+        created_at = start + timedelta(minutes=i)
+        rows.append(
+            {
+                "id": uuid.uuid4(),
+                "portfolio_id": rng.choice(portfolios),
+                "asset_name": f"asset-{asset}",
+                "ticker_symbol": f"AS{asset}",
+                "currency": rng.choice(("usd", "eur")),
+                "asset_type": AssetType.CRYPTO,
+                "transaction_type": rng.choice(list(TransactionType)),
+                "amount": rng.uniform(0.01, 10),
+                "unit_price": rng.uniform(1, 1000),
+                "transaction_fee": 0.0,
+                "created_at": created_at,
+                "updated_at": created_at,
+                "deleted_at": None,
+                "note": "",
+                "user_id": uuid.uuid4(),
+            }
+        )
+    return portfolios, rows
+
+
+def allocated(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return value, size
+
+
+def loop_holdings(transactions, portfolio_id):
+    # As valuations netted listed transactions
+    quantities = defaultdict(float)
+    for transaction in transactions:
+        if transaction.portfolio_id != portfolio_id:
+            continue
+        key = (transaction.asset_name, transaction.asset_type, transaction.currency)
+        if transaction.transaction_type in (
+            TransactionType.BUY,
+            TransactionType.TRANSFER_IN,
+        ):
+            quantities[key] += transaction.amount
+        else:
+            quantities[key] -= transaction.amount
+    return quantities
+
+
+def timed(function, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    portfolios, rows = make_rows(random.Random(42))
+
+    models, orm_bytes = allocated(lambda: [TransactionModel(**row) for row in rows])
+    outs, out_bytes = allocated(lambda: [to_transaction_out(model) for model in models])
+    columns, column_bytes = allocated(
+        lambda: UserTransactions.from_rows(
+            [
+                tuple(
+                    to_units(row[field]) if field == "amount" else row[field]
+                    for field in FIELDS
+                )
+                for row in rows
+            ],
+            0,
+        )
+    )
+
+    print(f"{TRANSACTIONS} transactions, {PORTFOLIOS} portfolios, {ASSETS} assets")
+    for name, size in (
+        ("ORM instances", orm_bytes),
+        ("TransactionOut models", out_bytes),
+        ("ORM + pydantic", orm_bytes + out_bytes),
+        ("working set columns", column_bytes),
+    ):
+        print(f"  {name:22} {size / 2**20:8.1f} MiB  {size / TRANSACTIONS:7.0f} B/row")
+    print(f"  reported nbytes        {columns.nbytes / 2**20:8.1f} MiB")
+    print(f"  {(orm_bytes + out_bytes) / column_bytes:.0f}x smaller")
+
+    portfolio_id = portfolios[0]
+    loop_ms = timed(lambda: loop_holdings(outs, portfolio_id))
+    column_ms = timed(lambda: columns.holdings(portfolio_id))
+    print(f"  holdings of a portfolio, models {loop_ms:7.1f} ms")
+    print(f"  holdings of a portfolio, columns {column_ms:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
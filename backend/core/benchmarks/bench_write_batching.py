@@ -0,0 +1,155 @@
+"""
+Ingestion benchmark of transaction creates, one commit per request against
+the group commit of the write batcher.
+
+Simulates concurrent bots posting transactions. Both paths validate each
+create in its own session, like the route does; the baseline then inserts
+and commits it alone, the batched path queues it for a multi-row insert.
+Writes go to a separate `<POSTGRES_DB>_bench` database.
+
+Run from backend/core with: python -m benchmarks.bench_write_batching
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from dotenv import load_dotenv
+from app.database.db_config import (
+    create_db_connection,
+    create_database_if_not_exists,
+    init_engine_and_session,
+    init_db,
+)
+from app.controllers.transaction_controller import TransactionController
+from app.models.portfolio_model import Portfolio as PortfolioModel, AssetType
+from app.models.transaction_model import TransactionType
+from app.models.user_model import User as UserModel, UserRole
+from app.schemas.transaction_schema import TransactionCreate
+from app.utils.write_batcher import TransactionWriteBatcher
+
+CLIENTS = 200
+REQUESTS_PER_CLIENT = 10
+# Connections of the default engine pool (5 plus 10 overflow)
+THREADS = 15
+WINDOW_SECONDS = 0.005
+
+load_dotenv()
+conn = create_db_connection(
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    host=os.getenv("POSTGRES_HOST"),
+    port=os.getenv("POSTGRES_PORT"),
+)
+create_database_if_not_exists(conn, f"{os.getenv('POSTGRES_DB')}_bench")
+engine, SessionLocal = init_engine_and_session(
+    user=os.getenv("POSTGRES_USER"),
+    password=os.getenv("POSTGRES_PASSWORD"),
+    host=os.getenv("POSTGRES_HOST"),
+    port=os.getenv("POSTGRES_PORT"),
+    db_name=f"{os.getenv('POSTGRES_DB')}_bench",
+)
+init_db(engine)
+
+
+def create_portfolio():
+    user_id, portfolio_id = uuid.uuid4(), uuid.uuid4()
+    with engine.begin() as connection:
+        connection.execute(
+            UserModel.__table__.insert().values(
+                id=user_id,
+                username=f"bench-{user_id}",
+                email=f"{user_id}@example.com",
+                hashed_password="",
+                role=UserRole.USER,
+            )
+        )
+        connection.execute(
+            PortfolioModel.__table__.insert().values(
+                id=portfolio_id,
+                name="Bench",
+                description="",
+                user_id=user_id,
+                asset_type=AssetType.CRYPTO,
+            )
+        )
+    return user_id, portfolio_id
+
+
+def transaction_create(user_id, portfolio_id):
+    return TransactionCreate(
+        ticker_symbol="BTC",
+        asset_name="bitcoin",
+        transaction_type=TransactionType.BUY,
+        asset_type=AssetType.CRYPTO,
+        amount=1,
+        currency="usd",
+        unit_price=1,
+        transaction_fee=0,
+        note="",
+        user_id=user_id,
+        portfolio_id=portfolio_id,
+    )
+
+
+def create_one_commit(transaction):
+    with SessionLocal() as db:
+        return TransactionController.create_transaction(db, transaction)
+
+
+def validate(transaction):
+    with SessionLocal() as db:
+        TransactionController.validate_transaction_create(db, transaction)
+
+
+async def run(create):
+    user_id, portfolio_id = create_portfolio()
+    latencies = []
+
+    async def client():
+        for _ in range(REQUESTS_PER_CLIENT):
+            start = time.perf_counter()
+            await create(transaction_create(user_id, portfolio_id))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CLIENTS)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies
+
+
+def report(name, elapsed, latencies):
+    def percentile(p):
+        return latencies[int(len(latencies) * p)] * 1000
+
+    print(f"{name}:")
+    print(f"  throughput:  {len(latencies) / elapsed:.0f} creates/s")
+    print(f"  p50 latency: {percentile(0.5):.1f} ms")
+    print(f"  p99 latency: {percentile(0.99):.1f} ms")
+
+
+async def main():
+    threads = asyncio.Semaphore(THREADS)
+
+    async def in_thread(function, *args):
+        async with threads:
+            return await asyncio.to_thread(function, *args)
+
+    async def one_commit(transaction):
+        return await in_thread(create_one_commit, transaction)
+
+    batcher = TransactionWriteBatcher(SessionLocal, window_seconds=WINDOW_SECONDS)
+
+    async def batched(transaction):
+        await in_thread(validate, transaction)
+        return await batcher.submit(transaction)
+
+    print(f"{CLIENTS} clients x {REQUESTS_PER_CLIENT} creates\n")
+    report("one commit per request", *await run(one_commit))
+    report("group commit", *await run(batched))
+    print(f"  batches:     {batcher.batches_written}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
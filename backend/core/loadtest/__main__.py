@@ -0,0 +1,119 @@
+"""
+Load test of the API with concurrent virtual users following weighted
+scenarios: portfolio polling, transaction posting, login bursts and admin
+listings. Prices come from a local CoinGecko stub.
+
+In process, against the app imported here with prices from the stub:
+
+    python -m loadtest --users 50 --duration 60
+
+Over a local port, against an API started with
+COINGECKO_API_URL=http://127.0.0.1:8090 for the stub served here:
+
+    python -m loadtest --url http://127.0.0.1:8000 --users 50 --duration 60
+
+Users and data are created in the configured database, run it against a
+scratch one. In process every user comes from an address of its own, as
+the rate limit expects of real clients. Over a port they all come from one
+address, so login bursts soon meet the rate limit of the auth routes;
+--no-rate-limit lifts it in process only.
+
+Run from backend/core.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Dict
+import httpx
+from loadtest.scenarios import SCENARIOS, run_load
+from loadtest.stats import format_report
+from loadtest.stub import CoinGeckoStub, StubServer
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(
+                f"unknown scenario {name}, one of {', '.join(SCENARIOS)}"
+            )
+        weights[name] = float(weight)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="API base URL, in process when not given")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--admins", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--ramp-up", type=float, default=5, help="seconds")
+    parser.add_argument("--think-ms", type=float, default=500)
+    parser.add_argument(
+        "--weights",
+        type=parse_weights,
+        help="e.g. portfolio_polling=6,transaction_posting=3,login_burst=1",
+    )
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--stub-port", type=int, default=8090)
+    parser.add_argument("--stub-latency-ms", type=float, default=50)
+    parser.add_argument("--stub-jitter-ms", type=float, default=20)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-rate-limit", action="store_true", help="in process only")
+    args = parser.parse_args()
+
+    stub = CoinGeckoStub(
+        args.stub_latency_ms, args.stub_jitter_ms, args.stub_error_rate
+    )
+    with StubServer(stub, port=0 if args.url is None else args.stub_port) as server:
+        if args.url is None:
+            # Read by the app modules when they are imported
+            os.environ["COINGECKO_API_URL"] = server.url
+            if args.no_rate_limit:
+                os.environ["RATE_LIMIT"] = "false"
+            from app.main import app
+
+            def client_factory(index):
+                # Anonymous requests are limited by client address
+                address = f"10.0.{index // 256 % 256}.{index % 256}"
+                return httpx.AsyncClient(
+                    transport=httpx.ASGITransport(app=app, client=(address, 50000)),
+                    base_url="http://loadtest",
+                )
+
+            target = "in process"
+        else:
+
+            def client_factory(index):
+                return httpx.AsyncClient(base_url=args.url, timeout=30)
+
+            target = args.url
+
+        print(
+            f"{args.users} users for {args.duration:g}s against {target}, "
+            f"prices from {server.url}"
+        )
+        start = time.monotonic()
+        stats = asyncio.run(
+            run_load(
+                client_factory,
+                users=args.users,
+                duration=args.duration,
+                weights=args.weights,
+                admins=args.admins,
+                think_seconds=args.think_ms / 1000,
+                ramp_up_seconds=args.ramp_up,
+                seed=args.seed,
+            )
+        )
+        elapsed = time.monotonic() - start
+
+    print(format_report(stats.report(elapsed)))
+    print(f"CoinGecko stub: {stub.calls} calls, {stub.errors} failed")
+
+
+if __name__ == "__main__":
+    main()
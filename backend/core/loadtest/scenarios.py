@@ -0,0 +1,242 @@
+"""
+Scripted user scenarios against the real routes, and the virtual users
+running them concurrently.
+
+Every virtual user signs up, logs in and creates a portfolio, then keeps
+picking a scenario by weight and running it, with a random think time in
+between. Sign up requests are not counted.
+"""
+
+import asyncio
+import random
+import re
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+import httpx
+from loadtest.stats import LoadStats
+
+API = "/api/v1"
+PASSWORD = "load-test-password"
+# Assets priced through the CoinGecko stub
+ASSETS = (("BTC", "bitcoin"), ("ETH", "ethereum"), ("SOL", "solana"))
+
+
+class VirtualUser:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        stats: LoadStats,
+        name: str,
+        admin: bool = False,
+        rng: Optional[random.Random] = None,
+    ):
+        self.client = client
+        self.stats = stats
+        self.name = name
+        self.admin = admin
+        self.random = rng or random.Random()
+        self.user_id: Optional[str] = None
+        self.portfolio_id: Optional[str] = None
+
+    async def request(
+        self, route: str, method: str, path: str, record: bool = True, **kwargs
+    ) -> Optional[httpx.Response]:
+        """Send a request, timed under route, None when it got no answer."""
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, f"{API}{path}", **kwargs)
+        except httpx.HTTPError:
+            response = None
+        if record:
+            status = response.status_code if response is not None else None
+            self.stats.record(route, time.perf_counter() - start, status)
+        return response
+
+    async def login(self, record: bool = True) -> bool:
+        response = await self.request(
+            "POST /auth/login",
+            "POST",
+            "/auth/login",
+            record,
+            data={"username": self.name, "password": PASSWORD},
+        )
+        if response is None or response.status_code != 200:
+            return False
+        # The cookie is secure, which httpx would not send back over http
+        token = re.search(r"refresh_token=([^;]+)", response.headers["set-cookie"])
+        self.client.cookies.set("refresh_token", token.group(1))
+        self.user_id = response.json()["user_id"]
+        return True
+
+    async def sign_up(self) -> bool:
+        """Register, log in and create a portfolio, uncounted."""
+        response = await self.request(
+            "POST /auth/register",
+            "POST",
+            "/auth/register",
+            False,
+            json={
+                "username": self.name,
+                "email": f"{self.name}@loadtest.example.com",
+                "password": PASSWORD,
+                "role": "admin" if self.admin else "user",
+            },
+        )
+        if response is None or response.status_code != 201:
+            return False
+        if not await self.login(record=False):
+            return False
+        response = await self.request(
+            "POST /portfolios/",
+            "POST",
+            "/portfolios/",
+            False,
+            json={
+                "name": "Load test",
+                "description": "",
+                "user_id": self.user_id,
+                "asset_type": "crypto",
+            },
+        )
+        if response is None or response.status_code != 201:
+            return False
+        self.portfolio_id = response.json()["data"]["id"]
+        return True
+
+    async def post_transaction(self) -> None:
+        ticker_symbol, asset_name = self.random.choice(ASSETS)
+        await self.request(
+            "POST /transactions/",
+            "POST",
+            "/transactions/",
+            json={
+                "ticker_symbol": ticker_symbol,
+                "asset_name": asset_name,
+                "transaction_type": "buy",
+                "asset_type": "crypto",
+                "user_id": self.user_id,
+                "portfolio_id": self.portfolio_id,
+                "amount": round(self.random.uniform(0.01, 2), 4),
+                "currency": "usd",
+                "unit_price": round(self.random.uniform(10, 1000), 2),
+                "transaction_fee": 0,
+                "note": "",
+            },
+        )
+
+
+async def login_burst(user: VirtualUser) -> None:
+    # Logging in again and again, as clients do after a deploy or an outage
+    for _ in range(3):
+        await user.login()
+
+
+async def portfolio_polling(user: VirtualUser) -> None:
+    # A dashboard refreshing the portfolio of the user every few seconds
+    for _ in range(3):
+        await user.request("GET /portfolios/summary", "GET", "/portfolios/summary")
+        await user.request(
+            "GET /portfolios/{id}", "GET", f"/portfolios/{user.portfolio_id}"
+        )
+        await user.request(
+            "GET /portfolios/",
+            "GET",
+            "/portfolios/",
+            params={"page": 1, "page_size": 10},
+        )
+        await asyncio.sleep(user.random.uniform(0.1, 0.3))
+
+
+async def transaction_posting(user: VirtualUser) -> None:
+    for _ in range(user.random.randint(1, 5)):
+        await user.post_transaction()
+    await user.request(
+        "GET /transactions/portfolio/{id}",
+        "GET",
+        f"/transactions/portfolio/{user.portfolio_id}",
+        params={"page": 1, "page_size": 20},
+    )
+
+
+async def admin_listing(user: VirtualUser) -> None:
+    # Paging through everything, deeper pages cost more
+    for page in range(1, 4):
+        await user.request(
+            "GET /transactions/admin",
+            "GET",
+            "/transactions/admin",
+            params={"page": page, "page_size": 50},
+        )
+    await user.request(
+        "GET /portfolios/admin",
+        "GET",
+        "/portfolios/admin",
+        params={"page": 1, "page_size": 20, "include": "value"},
+    )
+
+
+class Scenario(NamedTuple):
+    run: Callable[[VirtualUser], Awaitable[None]]
+    weight: float
+    admin_only: bool = False
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "portfolio_polling": Scenario(portfolio_polling, 6),
+    "transaction_posting": Scenario(transaction_posting, 3),
+    "login_burst": Scenario(login_burst, 1),
+    "admin_listing": Scenario(admin_listing, 1, admin_only=True),
+}
+
+
+async def run_load(
+    client_factory: Callable[[int], httpx.AsyncClient],
+    users: int,
+    duration: float,
+    weights: Optional[Dict[str, float]] = None,
+    admins: int = 1,
+    think_seconds: float = 0.5,
+    ramp_up_seconds: float = 0.0,
+    seed: Optional[int] = None,
+) -> LoadStats:
+    """
+    Run users virtual users for duration seconds, the first admins of them
+    admins. client_factory makes the client of a user from its index.
+    weights overrides the weights of the scenarios, a weight of 0 leaves a
+    scenario out.
+    """
+    weights = {**{name: s.weight for name, s in SCENARIOS.items()}, **(weights or {})}
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    stats = LoadStats()
+    deadline = time.monotonic() + ramp_up_seconds + duration
+
+    async def virtual_user(index: int) -> None:
+        await asyncio.sleep(ramp_up_seconds * index / users)
+        admin = index < admins
+        names = [
+            name
+            for name, scenario in SCENARIOS.items()
+            if weights.get(name) and (admin or not scenario.admin_only)
+        ]
+        if not names:
+            return
+        async with client_factory(index) as client:
+            user = VirtualUser(
+                client,
+                stats,
+                f"load-{run_id}-{index}",
+                admin=admin,
+                rng=random.Random(rng.random()),
+            )
+            if not await user.sign_up():
+                stats.record("sign up failed", 0.0, None)
+                return
+            while time.monotonic() < deadline:
+                name = user.random.choices(names, [weights[n] for n in names])[0]
+                await SCENARIOS[name].run(user)
+                await asyncio.sleep(user.random.expovariate(1 / think_seconds))
+
+    await asyncio.gather(*(virtual_user(index) for index in range(users)))
+    return stats
@@ -0,0 +1,97 @@
+import math
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+
+def percentile(ordered: Sequence[float], fraction: float) -> float:
+    """Nearest rank percentile of already sorted values."""
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class RouteReport(NamedTuple):
+    route: str
+    requests: int
+    throughput: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+    errors: int
+    rate_limited: int
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        # Answers of 400 and above, and requests without an answer
+        self.errors = 0
+        self.rate_limited = 0
+
+    def record(self, seconds: float, status: Optional[int]) -> None:
+        self.latencies.append(seconds)
+        if status is None or status >= 400:
+            self.errors += 1
+        if status == 429:
+            self.rate_limited += 1
+
+
+class LoadStats:
+    """Latencies and errors of a load test run, by route."""
+
+    def __init__(self):
+        self.routes: Dict[str, RouteStats] = defaultdict(RouteStats)
+
+    def record(self, route: str, seconds: float, status: Optional[int]) -> None:
+        self.routes[route].record(seconds, status)
+
+    def report(self, duration: float) -> List[RouteReport]:
+        """Per route and for all of them, the busiest routes first."""
+        total = RouteStats()
+        reports = []
+        for route, stats in self.routes.items():
+            reports.append(self._route_report(route, stats, duration))
+            total.latencies += stats.latencies
+            total.errors += stats.errors
+            total.rate_limited += stats.rate_limited
+        reports.sort(key=lambda report: report.requests, reverse=True)
+        reports.append(self._route_report("all", total, duration))
+        return reports
+
+    @staticmethod
+    def _route_report(route: str, stats: RouteStats, duration: float) -> RouteReport:
+        ordered = sorted(stats.latencies)
+        return RouteReport(
+            route=route,
+            requests=len(ordered),
+            throughput=len(ordered) / duration if duration else 0.0,
+            p50=percentile(ordered, 0.5),
+            p90=percentile(ordered, 0.9),
+            p99=percentile(ordered, 0.99),
+            max=ordered[-1] if ordered else 0.0,
+            errors=stats.errors,
+            rate_limited=stats.rate_limited,
+        )
+
+
+def format_report(reports: List[RouteReport]) -> str:
+    width = max(len(report.route) for report in reports)
+    lines = [
+        f"{'route':{width}}  {'requests':>8}  {'req/s':>8}  {'p50 ms':>8}  "
+        f"{'p90 ms':>8}  {'p99 ms':>8}  {'max ms':>8}  {'errors':>7}  {'429s':>6}"
+    ]
+    for report in reports:
+        lines.append(
+            f"{report.route:{width}}  {report.requests:8d}  "
+            f"{report.throughput:8.1f}  {report.p50 * 1000:8.1f}  "
+            f"{report.p90 * 1000:8.1f}  {report.p99 * 1000:8.1f}  "
+            f"{report.max * 1000:8.1f}  {report.error_rate:7.1%}  "
+            f"{report.rate_limited:6d}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,110 @@
+"""
+Local stand-in for the CoinGecko price API, with configurable latency and
+errors, so load tests never reach the real API and its rate limits.
+
+Point the API at it with COINGECKO_API_URL=http://127.0.0.1:<port>, or run
+it alone from backend/core with:
+
+    python -m loadtest.stub --port 8090 --latency-ms 80 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+import zlib
+from typing import Optional
+import uvicorn
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+
+class CoinGeckoStub:
+    """
+    Answers /simple/price with a stable made-up price for any asset and
+    currency, after latency_ms give or take jitter_ms. A share error_rate of
+    the calls fails with a 429 or a 500, as the real API does under load.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 50,
+        jitter_ms: float = 20,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self.app = FastAPI(title="CoinGecko stub")
+        self.app.get("/simple/price")(self.simple_price)
+
+    @staticmethod
+    def price(asset_name: str, currency: str) -> float:
+        # The same for every call, so valuations can be checked
+        return 1 + zlib.crc32(f"{asset_name}:{currency}".encode()) % 100_000 / 100
+
+    async def simple_price(
+        self, ids: str = Query(...), vs_currencies: str = Query(...)
+    ):
+        self.calls += 1
+        delay = self.latency_ms + self._random.uniform(-1, 1) * self.jitter_ms
+        await asyncio.sleep(max(delay, 0) / 1000)
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            status_code = self._random.choice((429, 500))
+            return JSONResponse({"error": "stub failure"}, status_code=status_code)
+        return {
+            asset_name: {
+                currency: self.price(asset_name, currency)
+                for currency in vs_currencies.split(",")
+            }
+            for asset_name in ids.split(",")
+        }
+
+
+class StubServer:
+    """Serves a stub on a local port from a background thread."""
+
+    def __init__(self, stub: CoinGeckoStub, port: int = 0):
+        self.stub = stub
+        self.server = uvicorn.Server(
+            uvicorn.Config(stub.app, port=port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        while not self.server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("The CoinGecko stub could not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local CoinGecko price API stub.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    stub = CoinGeckoStub(args.latency_ms, args.jitter_ms, args.error_rate)
+    uvicorn.run(stub.app, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
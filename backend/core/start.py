@@ -5,9 +5,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=int(os.getenv("PORT")),
-        reload=bool(os.getenv("ENV") == "development"),
-    )
+    if os.getenv("ENV") == "development":
+        uvicorn.run(
+            "app.main:app",
+            host="0.0.0.0",
+            port=int(os.getenv("PORT")),
+            reload=True,
+        )
+    else:
+        # Preloaded app, one worker per CPU by default, see app/server.py
+        from app.server import main
+
+        main()
@@ -0,0 +1,192 @@
+import uuid
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from tests.test_database import engine, TestingSessionLocal
+from tests.test_net_worth import add_transaction
+from tests.test_realized_gains import db  # noqa: F401, fixture
+from tests.test_write_batcher import create_portfolio
+from app.controllers.transaction_controller import TransactionController
+from app.database.assets import intern_asset, migrate_to_asset_ids
+from app.database.base import Base
+from app.models.asset_model import Asset as AssetModel
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.schemas.transaction_schema import (
+    TransactionBatchFilter,
+    TransactionBatchSelection,
+    TransactionCreate,
+    TransactionUpdate,
+)
+from app.utils.custom_exceptions import BadRequestException
+
+
+def test_assets_are_registered_once_and_name_their_transactions(db):
+    user_id, portfolio_id = create_portfolio()
+    coin, token = f"coin-{uuid.uuid4()}", f"token-{uuid.uuid4()}"
+    add_transaction(
+        db, user_id, portfolio_id, coin.upper(), TransactionType.BUY, 2, "usd"
+    )
+    add_transaction(db, user_id, portfolio_id, coin, TransactionType.SELL, 1, "eur")
+
+    asset_ids = db.scalars(
+        select(TransactionModel.asset_id).where(
+            TransactionModel.portfolio_id == portfolio_id
+        )
+    ).all()
+    assert len(set(asset_ids)) == 1
+    asset = db.get(AssetModel, asset_ids[0])
+    assert (asset.provider_id, asset.symbol, asset.decimals) == (coin, "COI", 8)
+
+    # Registered assets outlive the transaction that registered them
+    with TestingSessionLocal() as other:
+        transaction = TransactionModel(
+            ticker_symbol="TOK",
+            asset_name=token,
+            transaction_type=TransactionType.BUY,
+            asset_type=AssetType.CRYPTO,
+            user_id=user_id,
+            amount=1,
+            currency="usd",
+            unit_price=1,
+            transaction_fee=0,
+            portfolio_id=portfolio_id,
+            note="",
+        )
+        other.add(transaction)
+        other.flush()
+        token_id = transaction.asset_id
+        other.rollback()
+    assert intern_asset(engine, AssetType.CRYPTO, token, "OTHER") == token_id
+    with engine.connect() as connection:
+        symbol = connection.execute(
+            select(AssetModel.symbol).where(AssetModel.id == token_id)
+        ).scalar_one()
+    assert symbol == "TOK"
+
+    first = TransactionController.get_transactions_by_portfolio_id(db, portfolio_id)
+    renamed = TransactionController.update_transaction_by_id(
+        db, first[0][0].id, TransactionUpdate(asset_name=token.upper())
+    )
+    assert (renamed.asset_name, renamed.ticker_symbol) == (token, "TOK")
+
+    moved = TransactionController.update_transactions(
+        db,
+        TransactionBatchSelection(
+            filter=TransactionBatchFilter(
+                portfolio_id=portfolio_id, asset_name=token.upper()
+            )
+        ),
+        TransactionUpdate(asset_name=coin),
+    )
+    assert moved == 1
+    listed, _ = TransactionController.get_transactions_by_portfolio_id(db, portfolio_id)
+    assert {(t.asset_name, t.ticker_symbol) for t in listed} == {(coin, "COI")}
+
+
+def test_ticker_symbols_must_match_the_registered_asset(db):
+    user_id, portfolio_id = create_portfolio()
+    coin = f"coin-{uuid.uuid4()}"
+    add_transaction(db, user_id, portfolio_id, coin, TransactionType.BUY, 1, "usd")
+    transaction_id = db.scalars(
+        select(TransactionModel.id).where(TransactionModel.portfolio_id == portfolio_id)
+    ).one()
+
+    with pytest.raises(BadRequestException) as error:
+        TransactionController.update_transaction_by_id(
+            db, transaction_id, TransactionUpdate(ticker_symbol="XYZ")
+        )
+    assert error.value.detail == "ticker_symbol requires asset_name"
+    with pytest.raises(BadRequestException) as error:
+        TransactionController.update_transaction_by_id(
+            db, transaction_id, TransactionUpdate(asset_name=coin, ticker_symbol="XYZ")
+        )
+    assert error.value.detail == f"{coin} is registered with ticker symbol COI"
+    with pytest.raises(BadRequestException):
+        TransactionController.update_transactions(
+            db,
+            TransactionBatchSelection(ids=[transaction_id]),
+            TransactionUpdate(asset_name=coin, ticker_symbol="XYZ"),
+        )
+    create = dict(
+        asset_name=coin.upper(),
+        transaction_type=TransactionType.BUY,
+        asset_type=AssetType.CRYPTO,
+        user_id=user_id,
+        amount=1,
+        currency="usd",
+        unit_price=1,
+        transaction_fee=0,
+        portfolio_id=portfolio_id,
+        note="",
+    )
+    with pytest.raises(BadRequestException):
+        TransactionController.create_transaction(
+            db, TransactionCreate(ticker_symbol="XYZ", **create)
+        )
+
+    created = TransactionController.create_transaction(
+        db, TransactionCreate(ticker_symbol="COI", **create)
+    )
+    updated = TransactionController.update_transaction_by_id(
+        db, transaction_id, TransactionUpdate(asset_name=coin, ticker_symbol="COI")
+    )
+    assert {(t.asset_name, t.ticker_symbol) for t in (created, updated)} == {
+        (coin, "COI")
+    }
+
+
+def test_migration_replaces_asset_names_with_asset_ids():
+    # Legacy tables in a schema of their own, found first on the search path
+    schema = f"legacy_{uuid.uuid4().hex}"
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    legacy = create_engine(
+        engine.url, connect_args={"options": f"-csearch_path={schema},public"}
+    )
+    try:
+        Base.metadata.tables["assets"].create(bind=legacy)
+        with legacy.begin() as connection:
+            connection.execute(
+                text(
+                    "CREATE TABLE transactions (id serial PRIMARY KEY, "
+                    "ticker_symbol varchar NOT NULL, asset_name varchar NOT NULL, "
+                    "asset_type assettype NOT NULL, amount float NOT NULL)"
+                )
+            )
+            connection.execute(
+                text(
+                    "INSERT INTO transactions "
+                    "(ticker_symbol, asset_name, asset_type, amount) VALUES "
+                    "('BTC', 'bitcoin', 'CRYPTO', 1), ('XBT', 'Bitcoin', 'CRYPTO', 2), "
+                    "('AAPL', 'apple', 'STOCKS', 3)"
+                )
+            )
+
+        migrate_to_asset_ids(legacy)
+        # Nothing left to migrate the second time
+        migrate_to_asset_ids(legacy)
+
+        columns = {
+            column["name"] for column in inspect(legacy).get_columns("transactions")
+        }
+        assert columns == {"id", "asset_id", "asset_type", "amount"}
+        with legacy.connect() as connection:
+            rows = connection.execute(
+                text(
+                    "SELECT amount, provider_id, symbol, decimals "
+                    "FROM transactions JOIN assets ON assets.id = asset_id "
+                    "ORDER BY amount"
+                )
+            ).all()
+        assert [tuple(row) for row in rows] == [
+            (1, "bitcoin", "XBT", 8),
+            (2, "bitcoin", "XBT", 8),
+            (3, "apple", "AAPL", 4),
+        ]
+    finally:
+        legacy.dispose()
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
@@ -0,0 +1,132 @@
+import json
+import pickle
+import time
+from typing import List
+from pydantic import BaseModel
+from app.utils.cache import Cache, LRUCache, RedisTier, portfolio_scope
+
+
+class LocalRedis:
+    """Stand-in for a Redis protocol server, implementing the commands used."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+
+class Holding(BaseModel):
+    asset_name: str
+    quantity: float
+
+
+class DownRedis:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("shared cache is down")
+
+        return fail
+
+
+def test_lru_evicts_least_recently_used_entry():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("a") == 1
+    assert lru.get("b") is None
+    assert lru.get("c") == 3
+
+
+def test_lru_entries_expire():
+    lru = LRUCache()
+    lru.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+
+def test_invalidate_orphans_versioned_keys_and_fires_hooks():
+    cache = Cache()
+    invalidated = []
+    cache.add_invalidation_hook(invalidated.append)
+    scope = portfolio_scope("p1")
+    old_key = cache.key("portfolio_value", scope)
+    cache.set(old_key, 10.0)
+
+    cache.invalidate(scope)
+
+    assert invalidated == [scope]
+    assert cache.key("portfolio_value", scope) != old_key
+    assert cache.get(cache.key("portfolio_value", scope)) is None
+    assert cache.get_or_set(cache.key("portfolio_value", scope), lambda: 20.0) == 20.0
+
+
+def test_workers_share_values_and_invalidations_through_shared_tier():
+    server = LocalRedis()
+    worker_a = Cache(shared=RedisTier(server))
+    worker_b = Cache(shared=RedisTier(server))
+    scope = portfolio_scope("p1")
+
+    worker_a.set(worker_a.key("portfolio_value", scope), 10.0)
+    assert worker_b.get(worker_b.key("portfolio_value", scope)) == 10.0
+
+    worker_a.invalidate(scope)
+    assert worker_b.key("portfolio_value", scope) == worker_a.key(
+        "portfolio_value", scope
+    )
+    assert worker_b.get(worker_b.key("portfolio_value", scope)) is None
+
+
+def test_shared_tier_errors_fall_back_to_local_tier():
+    cache = Cache(shared=RedisTier(DownRedis()))
+    scope = portfolio_scope("p1")
+
+    cache.set(cache.key("portfolio_value", scope), 10.0)
+    assert cache.get(cache.key("portfolio_value", scope)) == 10.0
+
+    cache.invalidate(scope)
+    assert cache.get(cache.key("portfolio_value", scope)) is None
+
+
+def test_shared_tier_stores_json_and_reads_back_the_cached_type():
+    server = LocalRedis()
+    worker_a = Cache(shared=RedisTier(server))
+    worker_b = Cache(shared=RedisTier(server))
+    key = worker_a.key("portfolio_holdings", portfolio_scope("p1"))
+    holdings = [Holding(asset_name="bitcoin", quantity=1.5)]
+
+    worker_a.set(key, holdings, value_type=List[Holding])
+
+    assert json.loads(server.data[key])["value"][0]["asset_name"] == "bitcoin"
+    assert worker_b.get(key, value_type=List[Holding]) == holdings
+
+
+def test_shared_tier_never_unpickles_entries():
+    server = LocalRedis()
+    cache = Cache(shared=RedisTier(server))
+    key = cache.key("portfolio_value", portfolio_scope("p1"))
+    server.data[key] = pickle.dumps((10.0, time.time() + 60))
+
+    assert cache.get(key) is None
+
+
+def test_version_changes_are_seen_locally_without_the_shared_tier():
+    cache = Cache(shared=RedisTier(DownRedis()))
+    scope = portfolio_scope("p1")
+    version = cache.local_version(scope)
+
+    cache.invalidate_local(scope)
+
+    assert cache.local_version(scope) == version + 1
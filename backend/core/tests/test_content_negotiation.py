@@ -0,0 +1,92 @@
+import gzip
+from datetime import datetime
+from uuid import UUID, uuid4
+import brotli
+import ormsgpack
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from app.middleware.compression_middleware import CompressionMiddleware
+from app.utils.content_negotiation import NegotiatedRoute, prefers_msgpack
+
+
+class Item(BaseModel):
+    id: UUID
+    amount: float
+    created_at: datetime
+
+
+ITEM = Item(id=uuid4(), amount=1.5, created_at=datetime(2024, 1, 2, 3, 4, 5))
+
+router = APIRouter(route_class=NegotiatedRoute)
+
+
+@router.get("/items", response_model=list[Item], status_code=200)
+async def get_items(count: int = 1):
+    return [ITEM] * count
+
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=1000)
+app.include_router(router)
+client = TestClient(app)
+
+
+def test_accept_header_negotiation():
+    assert prefers_msgpack("application/msgpack")
+    assert prefers_msgpack("application/json;q=0.5, application/x-msgpack")
+    assert not prefers_msgpack("application/json, application/msgpack;q=0.9")
+    assert not prefers_msgpack("application/msgpack;q=0, */*")
+    assert not prefers_msgpack("*/*")
+
+
+def test_msgpack_clients_get_the_same_payload():
+    response = client.get("/items", headers={"Accept": "application/msgpack"})
+
+    assert response.headers["content-type"] == "application/msgpack"
+    assert "Accept" in response.headers["vary"]
+    (item,) = ormsgpack.unpackb(response.content)
+    assert item["id"] == str(ITEM.id)
+    assert item["amount"] == 1.5
+    assert item["created_at"] == "2024-01-02T03:04:05"
+
+    response = client.get("/items")
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == [item]
+
+
+def test_invalid_parameters_are_still_answered_in_json():
+    response = client.get(
+        "/items", params={"count": "x"}, headers={"Accept": "application/msgpack"}
+    )
+    assert response.status_code == 422
+    assert response.headers["content-type"] == "application/json"
+
+
+def test_large_bodies_are_compressed_with_the_preferred_encoding():
+    def get(accept_encoding):
+        # Decoding is done here, the test client would undo gzip on its own
+        with client.stream(
+            "GET",
+            "/items",
+            params={"count": 50},
+            headers={"Accept-Encoding": accept_encoding},
+        ) as response:
+            return response.headers, b"".join(response.iter_raw())
+
+    plain = client.get("/items", params={"count": 50}).content
+
+    headers, body = get("gzip, br")
+    assert headers["content-encoding"] == "br"
+    assert brotli.decompress(body) == plain
+
+    headers, body = get("br;q=0.5, gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert gzip.decompress(body) == plain
+
+    headers, body = get("br;q=0, gzip;q=0")
+    assert "content-encoding" not in headers
+    assert body == plain
+
+    with client.stream("GET", "/items", headers={"Accept-Encoding": "br"}) as response:
+        assert "content-encoding" not in response.headers
@@ -16,6 +16,7 @@ conn = create_db_connection(
     user=os.getenv("POSTGRES_USER"),
     password=os.getenv("POSTGRES_PASSWORD"),
     host=os.getenv("POSTGRES_HOST"),
+    port=os.getenv("POSTGRES_PORT"),
     dbname="postgres",
 )
 create_database_if_not_exists(conn, f"{os.getenv('POSTGRES_DB')}_test")
@@ -23,6 +24,7 @@ engine, TestingSessionLocal = init_engine_and_session(
     user=os.getenv("POSTGRES_USER"),
     password=os.getenv("POSTGRES_PASSWORD"),
     host=os.getenv("POSTGRES_HOST"),
+    port=os.getenv("POSTGRES_PORT"),
     db_name=f"{os.getenv('POSTGRES_DB')}_test",
 )
 init_db(engine)
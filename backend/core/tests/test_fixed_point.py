@@ -0,0 +1,137 @@
+import uuid
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import BigInteger, create_engine, inspect, select, text, type_coerce
+from tests.test_database import engine
+from tests.test_net_worth import add_transaction
+from tests.test_realized_gains import db  # noqa: F401, fixture
+from tests.test_write_batcher import create_portfolio
+from app.controllers.portfolio_controller import _get_portfolio_holdings
+from app.database.fixed_point import FIXED_POINT_MAX, migrate_to_fixed_point
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.schemas.transaction_schema import TransactionCreate, TransactionUpdate
+from app.utils.transaction_working_set import transaction_working_set
+
+
+def test_holdings_of_sold_assets_net_to_exactly_zero(db):
+    user_id, portfolio_id = create_portfolio()
+    # As floats, ten times 0.1 is 0.9999999999999999
+    for _ in range(10):
+        add_transaction(
+            db, user_id, portfolio_id, "bitcoin", TransactionType.BUY, 0.1, "usd"
+        )
+    add_transaction(
+        db, user_id, portfolio_id, "bitcoin", TransactionType.SELL, 1.0, "usd"
+    )
+    add_transaction(
+        db, user_id, portfolio_id, "ethereum", TransactionType.BUY, 0.3, "usd"
+    )
+
+    units = db.scalars(
+        select(type_coerce(TransactionModel.amount, BigInteger)).where(
+            TransactionModel.portfolio_id == portfolio_id,
+            TransactionModel.transaction_type == TransactionType.BUY,
+        )
+    ).all()
+    assert sorted(set(units)) == [10_000_000, 30_000_000]
+
+    quantities = {
+        holding.asset_name: holding.quantity
+        for holding in _get_portfolio_holdings(db, portfolio_id)
+    }
+    assert quantities == {"bitcoin": 0.0, "ethereum": 0.3}
+    holdings = transaction_working_set.get(db, user_id).holdings(portfolio_id)
+    assert {row[0]: row[4] for row in holdings} == quantities
+
+
+def test_migration_rounds_float_amounts_to_fixed_point():
+    # Legacy table in a schema of its own, found first on the search path
+    schema = f"legacy_{uuid.uuid4().hex}"
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+    legacy = create_engine(
+        engine.url, connect_args={"options": f"-csearch_path={schema},public"}
+    )
+    try:
+        with legacy.begin() as connection:
+            connection.execute(
+                text(
+                    "CREATE TABLE transactions (id serial PRIMARY KEY, "
+                    "amount float NOT NULL, unit_price float NOT NULL, "
+                    "transaction_fee float NOT NULL, note varchar)"
+                )
+            )
+            connection.execute(
+                text(
+                    "INSERT INTO transactions "
+                    "(amount, unit_price, transaction_fee) VALUES "
+                    "(0.1, 27000.5, 0), (0.000000006, 1e-9, 0.25)"
+                )
+            )
+
+        migrate_to_fixed_point(legacy)
+        # Nothing left to migrate the second time
+        migrate_to_fixed_point(legacy)
+
+        types = {
+            column["name"]: str(column["type"])
+            for column in inspect(legacy).get_columns("transactions")
+        }
+        assert types["amount"] == types["unit_price"] == "BIGINT"
+        assert types["transaction_fee"] == "BIGINT"
+        with legacy.connect() as connection:
+            rows = connection.execute(
+                text(
+                    "SELECT amount, unit_price, transaction_fee "
+                    "FROM transactions ORDER BY id"
+                )
+            ).all()
+        assert [tuple(row) for row in rows] == [
+            (10_000_000, 2_700_050_000_000, 0),
+            (1, 0, 25_000_000),
+        ]
+    finally:
+        legacy.dispose()
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+
+
+def test_values_beyond_the_fixed_point_range_are_rejected(db):
+    user_id, portfolio_id = create_portfolio()
+    fields = dict(
+        ticker_symbol="BTC",
+        asset_name="bitcoin",
+        transaction_type=TransactionType.BUY,
+        asset_type="crypto",
+        amount=1,
+        currency="usd",
+        unit_price=1,
+        transaction_fee=0,
+        user_id=user_id,
+        portfolio_id=portfolio_id,
+    )
+    for field in ("amount", "unit_price", "transaction_fee"):
+        TransactionCreate(**{**fields, field: FIXED_POINT_MAX})
+        with pytest.raises(ValidationError):
+            TransactionCreate(**{**fields, field: FIXED_POINT_MAX + 1})
+        with pytest.raises(ValidationError):
+            TransactionUpdate(**{field: FIXED_POINT_MAX + 1})
+
+    # The largest value accepted fits its column
+    add_transaction(
+        db,
+        user_id,
+        portfolio_id,
+        "bitcoin",
+        TransactionType.BUY,
+        FIXED_POINT_MAX,
+        "usd",
+    )
+    assert db.scalar(
+        select(TransactionModel.amount).where(
+            TransactionModel.portfolio_id == portfolio_id
+        )
+    ) == float(FIXED_POINT_MAX)
@@ -0,0 +1,124 @@
+import pytest
+from sqlalchemy import delete
+from tests.test_database import TestingSessionLocal
+from app.controllers.job_controller import JobController
+from app.jobs import handlers, runner
+from app.jobs.handlers import JobCancelled, JobContext
+from app.models.job_model import Job as JobModel, JobStatus
+from app.schemas.job_schema import JobCreate
+from app.utils.custom_exceptions import BadRequestException
+from tests.test_transaction_batch import add_transactions
+from tests.test_write_batcher import create_portfolio
+
+
+@pytest.fixture(autouse=True)
+def empty_queue(monkeypatch):
+    monkeypatch.setattr(runner, "SessionLocal", TestingSessionLocal)
+    with TestingSessionLocal() as db:
+        db.execute(delete(JobModel))
+        db.commit()
+
+
+def submit(db, user_id, kind="transactions_export", priority=0, **params):
+    job = JobCreate(kind=kind, params=params, priority=priority)
+    return JobController.submit_job(db, user_id=user_id, job=job).id
+
+
+def test_claims_follow_priority_then_age():
+    user_id, _ = create_portfolio()
+    other_user_id, _ = create_portfolio()
+    with TestingSessionLocal() as db:
+        oldest = submit(db, user_id)
+        urgent = submit(db, other_user_id, priority=5)
+        newest = submit(db, other_user_id)
+
+        assert [runner.claim_next_job(db) for _ in range(4)] == [
+            urgent,
+            oldest,
+            newest,
+            None,
+        ]
+
+
+def test_running_jobs_per_user_are_limited(monkeypatch):
+    monkeypatch.setattr(runner, "JOB_MAX_RUNNING_PER_USER", 1)
+    user_id, _ = create_portfolio()
+    other_user_id, _ = create_portfolio()
+    with TestingSessionLocal() as db:
+        first = submit(db, user_id, priority=1)
+        second = submit(db, user_id, priority=1)
+        other = submit(db, other_user_id)
+
+        assert runner.claim_next_job(db) == first
+        # The second job of the user waits behind the limit, not the queue
+        assert runner.claim_next_job(db) == other
+        assert runner.claim_next_job(db) is None
+
+        runner.finish_job(db, first, JobStatus.FAILED, error="boom")
+        assert runner.claim_next_job(db) == second
+
+
+def test_run_job_stores_the_export():
+    user_id, portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        add_transactions(db, user_id, portfolio_id, 3)
+        job_id = submit(db, user_id)
+        runner.claim_next_job(db)
+
+    runner.run_job(job_id)
+
+    with TestingSessionLocal() as db:
+        assert JobController.get_job_by_id(db, job_id).status == JobStatus.SUCCEEDED
+        job = JobController.get_job_result(db, job_id)
+        lines = job.result.decode().splitlines()
+        assert job.result_content_type == "text/csv"
+        assert lines[0].startswith("id,")
+        assert len(lines) == 4
+
+
+def test_failing_job_records_the_error():
+    user_id, _ = create_portfolio()
+    with TestingSessionLocal() as db:
+        job_id = submit(
+            db, user_id, kind="portfolio_history", portfolio_id=str(user_id)
+        )
+        runner.claim_next_job(db)
+
+    runner.run_job(job_id)
+
+    with TestingSessionLocal() as db:
+        job = JobController.get_job_by_id(db, job_id)
+        assert job.status == JobStatus.FAILED
+        assert job.error == "Portfolio not found"
+        with pytest.raises(BadRequestException):
+            JobController.get_job_result(db, job_id)
+
+
+def test_cancelling_a_queued_job_is_immediate():
+    user_id, _ = create_portfolio()
+    with TestingSessionLocal() as db:
+        job_id = submit(db, user_id)
+
+        assert JobController.cancel_job(db, job_id).status == JobStatus.CANCELLED
+        assert runner.claim_next_job(db) is None
+        with pytest.raises(BadRequestException):
+            JobController.cancel_job(db, job_id)
+
+
+def test_running_job_stops_at_its_next_checkpoint(monkeypatch):
+    monkeypatch.setattr(handlers, "CHECKPOINT_EVERY_ROWS", 2)
+    user_id, portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        add_transactions(db, user_id, portfolio_id, 5)
+        job_id = submit(db, user_id)
+        runner.claim_next_job(db)
+
+        job = JobController.cancel_job(db, job_id)
+        assert job.status == JobStatus.RUNNING and job.cancel_requested
+        with pytest.raises(JobCancelled):
+            JobContext(db, db.get(JobModel, job_id)).checkpoint()
+
+    runner.run_job(job_id)
+
+    with TestingSessionLocal() as db:
+        assert JobController.get_job_by_id(db, job_id).status == JobStatus.CANCELLED
@@ -0,0 +1,47 @@
+import time
+import pytest
+from app.utils import fetch_price
+from app.utils.custom_exceptions import BadRequestException
+from loadtest.stats import LoadStats, percentile
+from loadtest.stub import CoinGeckoStub, StubServer
+
+
+def test_prices_come_from_the_stub_with_its_latency_and_errors(monkeypatch):
+    stub = CoinGeckoStub(latency_ms=100, jitter_ms=0)
+    with StubServer(stub) as server:
+        monkeypatch.setattr(fetch_price, "COINGECKO_API_URL", server.url)
+
+        start = time.perf_counter()
+        prices = fetch_price.fetch_crypto_prices(["loadtest-coin"], ["usd", "eur"])
+        assert time.perf_counter() - start >= 0.1
+        assert prices == {
+            ("loadtest-coin", currency): CoinGeckoStub.price("loadtest-coin", currency)
+            for currency in ("usd", "eur")
+        }
+
+        stub.error_rate = 1
+        with pytest.raises(BadRequestException):
+            fetch_price.fetch_crypto_prices(["loadtest-coin"], ["usd"])
+    assert (stub.calls, stub.errors) == (2, 1)
+
+
+def test_report_has_percentiles_and_error_rates_by_route():
+    stats = LoadStats()
+    for i in range(1, 101):
+        stats.record("GET /portfolios/summary", i / 1000, 200)
+    for status in (201, 201, 400, 429, None):
+        stats.record("POST /transactions/", 0.5, status)
+
+    summary, transactions, total = stats.report(duration=10)
+
+    assert summary.route == "GET /portfolios/summary"
+    assert (summary.requests, summary.throughput) == (100, 10)
+    assert (summary.p50, summary.p90, summary.p99, summary.max) == (
+        0.05,
+        0.09,
+        0.099,
+        0.1,
+    )
+    assert (transactions.error_rate, transactions.rate_limited) == (0.6, 1)
+    assert (total.route, total.requests, total.errors) == ("all", 105, 3)
+    assert percentile([], 0.5) == 0
@@ -0,0 +1,126 @@
+import uuid
+from tests.test_database import TestingSessionLocal
+from app.controllers.portfolio_controller import PortfolioController
+from app.controllers.transaction_controller import invalidate_transaction_caches
+from app.models.portfolio_model import AssetType, Portfolio as PortfolioModel
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.utils import fetch_price
+from app.utils.cache import cache
+from tests.test_transaction_batch import count_statements
+from tests.test_write_batcher import create_portfolio
+
+TICKER_SYMBOLS = {"bitcoin": "BTC", "ethereum": "ETH", "dogecoin": "DOGE"}
+
+
+def add_transaction(db, user_id, portfolio_id, asset_name, kind, amount, currency):
+    db.add(
+        TransactionModel(
+            ticker_symbol=TICKER_SYMBOLS.get(asset_name, asset_name[:3].upper()),
+            asset_name=asset_name,
+            transaction_type=kind,
+            asset_type=AssetType.CRYPTO,
+            user_id=user_id,
+            amount=amount,
+            currency=currency,
+            unit_price=1,
+            transaction_fee=0,
+            portfolio_id=portfolio_id,
+            note="",
+        )
+    )
+    db.commit()
+
+
+def test_summary_spans_portfolios_and_is_cached_until_a_write(monkeypatch):
+    upstream_calls = []
+
+    def fetch_crypto_prices(asset_names, currencies):
+        upstream_calls.append((set(asset_names), set(currencies)))
+        prices = {"bitcoin": 100.0, "ethereum": 10.0, "dogecoin": 1.0}
+        return {(name, "eur"): prices[name] for name in asset_names}
+
+    monkeypatch.setattr(fetch_price, "fetch_crypto_prices", fetch_crypto_prices)
+    user_id, portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        # A second portfolio of the same user
+        other_portfolio_id = uuid.uuid4()
+        db.execute(
+            PortfolioModel.__table__.insert().values(
+                id=other_portfolio_id,
+                name="Other",
+                description="",
+                user_id=user_id,
+                asset_type=AssetType.CRYPTO,
+            )
+        )
+        for asset_name, kind, amount, currency, portfolio in (
+            ("bitcoin", TransactionType.BUY, 1, "usd", portfolio_id),
+            ("ethereum", TransactionType.BUY, 3, "usd", portfolio_id),
+            ("bitcoin", TransactionType.BUY, 2, "eur", other_portfolio_id),
+            ("dogecoin", TransactionType.BUY, 5, "usd", portfolio_id),
+            ("dogecoin", TransactionType.SELL, 5, "usd", portfolio_id),
+        ):
+            add_transaction(db, user_id, portfolio, asset_name, kind, amount, currency)
+
+        statements, stop = count_statements()
+        try:
+            summary = PortfolioController.get_net_worth_summary(
+                db, user_id, currency="EUR", top=1
+            )
+            cached = PortfolioController.get_net_worth_summary(
+                db, user_id, currency="eur", top=1
+            )
+        finally:
+            stop()
+
+        # Quantities are summed across portfolios and transaction currencies,
+        # the sold out asset is left out
+        assert summary.total_value == 3 * 100 + 3 * 10
+        assert [(a.asset_type, a.total_value) for a in summary.asset_types] == [
+            (AssetType.CRYPTO, 330)
+        ]
+        assert [(h.asset_name, h.quantity) for h in summary.top_holdings] == [
+            ("bitcoin", 3)
+        ]
+        assert statements == ["SELECT"]
+        assert upstream_calls == [({"bitcoin", "ethereum"}, {"eur"})]
+        assert cached == summary
+
+        add_transaction(
+            db, user_id, other_portfolio_id, "ethereum", TransactionType.BUY, 2, "eur"
+        )
+        invalidate_transaction_caches(other_portfolio_id, user_id)
+        statements, stop = count_statements()
+        try:
+            summary = PortfolioController.get_net_worth_summary(
+                db, user_id, "eur", top=1
+            )
+        finally:
+            stop()
+        assert statements == ["SELECT"]
+        assert summary.total_value == 3 * 100 + 5 * 10
+
+
+def test_cached_prices_are_not_fetched_again(monkeypatch):
+    requested = []
+
+    def fetch_crypto_prices(asset_names, currencies):
+        requested.append((set(asset_names), set(currencies)))
+        return {
+            (name, currency): 2.0 for name in asset_names for currency in currencies
+        }
+
+    monkeypatch.setattr(fetch_price, "fetch_crypto_prices", fetch_crypto_prices)
+    cached_asset = f"asset-{uuid.uuid4()}"
+    missing_asset = f"asset-{uuid.uuid4()}"
+    cache.set(fetch_price.price_cache_key(cached_asset, "usd"), 5.0)
+
+    prices = fetch_price.get_crypto_prices(
+        {(cached_asset, "usd"), (missing_asset, "usd")}
+    )
+
+    assert prices == {(cached_asset, "usd"): 5.0, (missing_asset, "usd"): 2.0}
+    assert requested == [({missing_asset}, {"usd"})]
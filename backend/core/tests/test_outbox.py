@@ -0,0 +1,136 @@
+import select
+import uuid
+from sqlalchemy import text
+from tests.test_database import engine, TestingSessionLocal
+from tests.test_realized_gains import db  # noqa: F401, fixture
+from tests.test_write_batcher import create_portfolio
+from app.controllers.transaction_controller import TransactionController
+from app.database import outbox
+from app.database.outbox import (
+    RELAY_LOCK_KEY,
+    ChangeSubscriber,
+    OutboxRelay,
+    invalidate_changed_caches,
+    record_change,
+)
+from app.models.outbox_event_model import OutboxEvent
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import TransactionType
+from app.schemas.transaction_schema import (
+    TransactionBatchFilter,
+    TransactionBatchSelection,
+    TransactionCreate,
+)
+from app.utils.cache import cache, portfolio_scope
+
+
+def test_mutations_write_their_events_in_the_same_transaction(db):
+    user_id, portfolio_id = create_portfolio()
+    created = [
+        TransactionController.create_transaction(
+            db,
+            TransactionCreate(
+                ticker_symbol="BTC",
+                asset_name="bitcoin",
+                transaction_type=TransactionType.BUY,
+                asset_type=AssetType.CRYPTO,
+                user_id=user_id,
+                amount=1,
+                currency="usd",
+                unit_price=1,
+                transaction_fee=0,
+                portfolio_id=portfolio_id,
+                note="",
+            ),
+        )
+        for _ in range(2)
+    ]
+    TransactionController.soft_delete_transactions(
+        db,
+        TransactionBatchSelection(
+            filter=TransactionBatchFilter(portfolio_id=portfolio_id)
+        ),
+    )
+
+    events = (
+        db.query(OutboxEvent)
+        .filter(OutboxEvent.portfolio_id == portfolio_id)
+        .order_by(OutboxEvent.id)
+        .all()
+    )
+    assert [event.topic for event in events] == [
+        "transaction.created",
+        "transaction.created",
+        "transaction.deleted",
+    ]
+    assert {event.user_id for event in events} == {user_id}
+    assert [event.data["transaction_ids"] for event in events[:2]] == [
+        [str(transaction.id)] for transaction in created
+    ]
+    assert sorted(events[2].data["transaction_ids"]) == sorted(
+        str(transaction.id) for transaction in created
+    )
+    assert events[2].data["hard"] is False
+    assert all(event.position is None for event in events)
+
+
+def write_event(origin: str, monkeypatch) -> uuid.UUID:
+    portfolio_id = uuid.uuid4()
+    with monkeypatch.context() as patch:
+        patch.setattr(outbox, "process_origin", lambda: origin)
+        with TestingSessionLocal() as db:
+            record_change(db, "portfolio.updated", portfolio_id, uuid.uuid4())
+            db.commit()
+    return portfolio_id
+
+
+def notifications(connection, count):
+    payloads = []
+    while len(payloads) < count and select.select([connection], [], [], 5)[0]:
+        payloads += ChangeSubscriber._drain(connection)
+    return payloads
+
+
+def test_events_are_published_in_order_and_replayed_when_missed(monkeypatch):
+    handled = []
+    subscriber = ChangeSubscriber(engine, handle=handled.append)
+    connection = subscriber._connect()
+    try:
+        relay = OutboxRelay(engine)
+        # Anything left pending by other tests comes before the subscription
+        pending = relay.publish_pending()
+        subscriber.catch_up()
+
+        first = write_event("other-worker", monkeypatch)
+        # Changes of this process have invalidated its caches already
+        write_event(outbox.process_origin(), monkeypatch)
+        second = write_event("other-worker", monkeypatch)
+        # Only one relay at a time publishes
+        with engine.begin() as locked:
+            locked.execute(
+                text("SELECT pg_advisory_xact_lock(:key)"), {"key": RELAY_LOCK_KEY}
+            )
+            assert relay.publish_pending() == 0
+        assert relay.publish_pending() == 3
+
+        subscriber.receive(notifications(connection, pending + 3))
+        assert [event.portfolio_id for event in handled] == [first, second]
+        assert handled[1].position == handled[0].position + 2
+        assert subscriber.replayed == 0
+
+        # The notification of the first one is lost
+        third = write_event("other-worker", monkeypatch)
+        fourth = write_event("other-worker", monkeypatch)
+        relay.publish_pending()
+        payloads = notifications(connection, 2)
+        subscriber.receive(payloads[1:])
+        # And a duplicate is ignored
+        subscriber.receive(payloads)
+        assert [event.portfolio_id for event in handled[2:]] == [third, fourth]
+        assert subscriber.replayed == 2
+    finally:
+        connection.close()
+
+    version = cache.version(portfolio_scope(fourth))
+    invalidate_changed_caches(handled[-1])
+    assert cache.version(portfolio_scope(fourth)) == version + 1
@@ -0,0 +1,31 @@
+import pytest
+from tests.test_database import TestingSessionLocal
+from tests.test_transaction_batch import count_statements
+from tests.test_write_batcher import create_portfolio
+from app.controllers.portfolio_controller import PortfolioController
+from app.utils.custom_exceptions import NotFoundException
+
+
+def test_owner_lookups_are_served_from_the_cache():
+    user_id, portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        assert PortfolioController.get_portfolio_owner_id(db, portfolio_id) == user_id
+        statements, stop = count_statements()
+        try:
+            owner_id = PortfolioController.get_portfolio_owner_id(db, portfolio_id)
+        finally:
+            stop()
+
+    assert owner_id == user_id
+    assert statements == []
+
+
+def test_deleting_a_portfolio_forgets_its_cached_owner():
+    user_id, portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        assert PortfolioController.get_portfolio_owner_id(db, portfolio_id) == user_id
+
+        PortfolioController.delete_portfolio_by_id(db, portfolio_id)
+
+        with pytest.raises(NotFoundException):
+            PortfolioController.get_portfolio_owner_id(db, portfolio_id)
@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+from tests.test_database import engine, TestingSessionLocal
+from tests.test_write_batcher import create_portfolio
+from app.controllers.user_controller import UserController
+from app.routes.portfolio_route import portfolio_include, stream_portfolio_valuation
+from app.schemas.portfolio_schema import PortfolioInclude
+from app.utils.custom_exceptions import UnprocessableEntityException
+
+
+def test_valuation_stream_gives_its_connections_back_before_streaming():
+    user_id, portfolio_id = create_portfolio()
+    db, directory_db = TestingSessionLocal(), TestingSessionLocal()
+    try:
+        current_user = UserController.get_user_by_id(directory_db, user_id)
+        response = asyncio.run(
+            stream_portfolio_valuation(portfolio_id, db, directory_db, current_user)
+        )
+        assert response.media_type == "text/event-stream"
+        # Nothing checked out while the stream is open
+        assert engine.pool.checkedout() == 0
+    finally:
+        db.close()
+        directory_db.close()
+
+
+def test_include_parses_comma_separated_fields():
+    parse_include = portfolio_include("value")
+
+    assert parse_include("value") == {PortfolioInclude.VALUE}
+    assert parse_include(" assets, value,") == {
+        PortfolioInclude.VALUE,
+        PortfolioInclude.ASSETS,
+    }
+    assert parse_include("") == set()
+
+
+def test_include_rejects_unknown_fields():
+    with pytest.raises(UnprocessableEntityException) as error:
+        portfolio_include("value")("value,transactions")
+
+    assert error.value.detail == "include only accepts: value, assets"
@@ -0,0 +1,140 @@
+import asyncio
+import uuid
+from sqlalchemy import delete, select
+from tests.test_database import engine, TestingSessionLocal
+from tests.test_write_batcher import create_portfolio
+from app.controllers.price_alert_controller import PriceAlertController
+from app.database.sharding import Shard, ShardRouter
+from app.models.price_alert_model import AlertDirection, PriceAlert
+from app.schemas.price_alert_schema import PriceAlertCreate, PriceAlertUpdate
+from app.utils.price_alerts import ActiveAlert, AlertBook, PriceAlertMonitor
+
+ABOVE, BELOW = AlertDirection.ABOVE, AlertDirection.BELOW
+BTC = ("bitcoin", "usd")
+
+
+def alert(direction, threshold, key=BTC):
+    return ActiveAlert(uuid.uuid4(), uuid.uuid4(), *key, direction, threshold)
+
+
+def test_quotes_trigger_the_alerts_they_cross():
+    book = AlertBook()
+    above = {threshold: alert(ABOVE, threshold) for threshold in (100, 110, 120)}
+    below = {threshold: alert(BELOW, threshold) for threshold in (80, 90)}
+    other = alert(ABOVE, 1, ("ethereum", "usd"))
+    for tracked in [*above.values(), *below.values(), other]:
+        book.track(tracked)
+
+    assert book.trigger(BTC, 95) == []
+    # Reaching the threshold is enough
+    assert book.trigger(BTC, 110) == [above[100], above[110]]
+    # Moved before the next quote, and one deleted
+    book.track(above[120]._replace(threshold=200))
+    book.untrack(below[80].id)
+    assert book.trigger(BTC, 150) == []
+    assert book.trigger(BTC, 70) == [below[90]]
+    assert book.trigger(BTC, 70) == []
+    assert len(book) == 2 and book.keys == {BTC, ("ethereum", "usd")}
+
+    assert book.trigger(BTC, 250) == [above[120]._replace(threshold=200)]
+    assert book.keys == {("ethereum", "usd")}
+
+
+def create_alert(db, user_id, key, direction, threshold):
+    return PriceAlertController.create_alert(
+        db,
+        user_id,
+        PriceAlertCreate(
+            asset_name=key[0], currency=key[1], direction=direction, threshold=threshold
+        ),
+    )
+
+
+def test_triggered_alerts_are_delivered_once_in_batches():
+    user_id, _ = create_portfolio()
+    key = (f"coin-{uuid.uuid4().hex[:8]}", "usd")
+    shard = Shard("test", engine, TestingSessionLocal)
+    batches = []
+    # Two workers, the second one triggering the same alerts
+    first, second = [
+        PriceAlertMonitor(router=ShardRouter([shard], shard), sink=sink)
+        for sink in (batches.append, lambda notifications: None)
+    ]
+    try:
+        with TestingSessionLocal() as db:
+            moved = create_alert(db, user_id, key, ABOVE, 100)
+            high = create_alert(db, user_id, key, ABOVE, 200)
+            low = create_alert(db, user_id, key, BELOW, 50)
+        for monitor in (first, second):
+            asyncio.run(monitor.sync())
+
+        # Changed meanwhile by another worker, the stale threshold is ignored
+        with TestingSessionLocal() as db:
+            PriceAlertController.update_alert_by_id(
+                db, moved.id, PriceAlertUpdate(threshold=150)
+            )
+        assert first.evaluate({key: 120.0}) == 1
+        asyncio.run(first.flush())
+        assert batches == []
+
+        asyncio.run(first.sync())
+        assert first.evaluate({key: 210.0}) == 2
+        assert second.evaluate({key: 210.0}) == 2
+        asyncio.run(second.flush())
+        asyncio.run(first.flush())
+        assert second.delivered == 2 and first.delivered == 0
+
+        assert first.evaluate({key: 40.0}) == 1
+        asyncio.run(first.flush())
+        assert len(batches) == 1
+        assert [notification["id"] for notification in batches[0]] == [str(low.id)]
+        assert batches[0][0]["price"] == 40.0
+
+        with TestingSessionLocal() as db:
+            triggered = dict(
+                db.execute(
+                    select(PriceAlert.id, PriceAlert.triggered_price).where(
+                        PriceAlert.user_id == user_id
+                    )
+                ).all()
+            )
+        assert triggered == {moved.id: 210.0, high.id: 210.0, low.id: 40.0}
+    finally:
+        with engine.begin() as connection:
+            connection.execute(delete(PriceAlert).where(PriceAlert.user_id == user_id))
+
+
+def test_one_worker_at_a_time_evaluates_the_alerts():
+    shard = Shard("test", engine, TestingSessionLocal)
+    first, second = [
+        PriceAlertMonitor(router=ShardRouter([shard], shard), sync_seconds=0.05)
+        for _ in range(2)
+    ]
+    connection = first.try_lead()
+    assert connection is not None
+    assert second.try_lead() is None
+
+    async def take_over():
+        task = asyncio.ensure_future(second.run())
+        await asyncio.sleep(0.2)
+        assert not second.leading
+        # Released by the leader stopping, or by its connection closing
+        await asyncio.to_thread(PriceAlertMonitor.resign, connection)
+        for _ in range(50):
+            if second.leading:
+                break
+            await asyncio.sleep(0.05)
+        leading = second.leading
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return leading
+
+    assert asyncio.run(take_over())
+    assert not second.leading
+    # Released on the way out
+    connection = first.try_lead()
+    assert connection is not None
+    PriceAlertMonitor.resign(connection)
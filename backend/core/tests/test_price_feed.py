@@ -0,0 +1,75 @@
+import asyncio
+from app.utils.price_feed import PriceFeed
+
+BTC = ("bitcoin", "usd")
+ETH = ("ethereum", "usd")
+PRICES = {BTC: 60000.0, ETH: 3000.0, ("solana", "usd"): 150.0}
+
+
+class StubFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, asset_names, currencies):
+        self.calls.append((set(asset_names), set(currencies)))
+        return dict(PRICES)
+
+
+def test_tick_fetches_each_asset_once_for_all_subscribers():
+    async def scenario():
+        fetcher = StubFetcher()
+        feed = PriceFeed(fetch_prices=fetcher)
+        btc_only = feed.subscribe([BTC])
+        both = feed.subscribe([BTC, ETH])
+        eth_only = feed.subscribe([ETH])
+
+        await feed.tick()
+
+        assert fetcher.calls == [({"bitcoin", "ethereum"}, {"usd"})]
+        assert await btc_only.get() == {BTC: 60000.0}
+        assert await both.get() == {BTC: 60000.0, ETH: 3000.0}
+        assert await eth_only.get() == {ETH: 3000.0}
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_only_keeps_latest_quotes():
+    async def scenario():
+        feed = PriceFeed(fetch_prices=StubFetcher())
+        subscription = feed.subscribe([BTC])
+
+        for price in (1.0, 2.0, 3.0):
+            feed.publish({BTC: price})
+
+        assert await subscription.get() == {BTC: 3.0}
+        assert subscription.dropped == 2
+
+    asyncio.run(scenario())
+
+
+def test_new_subscriber_gets_known_quotes_immediately():
+    async def scenario():
+        feed = PriceFeed(fetch_prices=StubFetcher())
+        feed.publish({BTC: 5.0})
+
+        subscription = feed.subscribe([BTC, ETH])
+
+        assert await subscription.get() == {BTC: 5.0}
+
+    asyncio.run(scenario())
+
+
+def test_unsubscribe_stops_tracking_assets():
+    async def scenario():
+        fetcher = StubFetcher()
+        feed = PriceFeed(fetch_prices=fetcher)
+        subscription = feed.subscribe([BTC])
+        feed.subscribe([ETH]).close()
+        subscription.close()
+
+        await feed.tick()
+
+        assert feed.tracked_keys == set()
+        assert fetcher.calls == []
+
+    asyncio.run(scenario())
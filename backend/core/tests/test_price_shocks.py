@@ -0,0 +1,92 @@
+import uuid
+import numpy as np
+from tests.test_net_worth import add_transaction
+from tests.test_realized_gains import db  # noqa: F401
+from tests.test_write_batcher import create_portfolio
+from app.controllers.stress_controller import StressController
+from app.models.transaction_model import TransactionType
+from app.schemas.portfolio_schema import StressTestRequest
+from app.utils import fetch_price, price_shocks
+from app.utils.price_shocks import HoldingsMatrix
+
+
+def test_pnl_matches_a_dense_computation_block_by_block(monkeypatch):
+    # A few scenarios per block, to go through several of them
+    monkeypatch.setattr(price_shocks, "SHOCK_BLOCK_CELLS", 100)
+    rng = np.random.default_rng(7)
+    assets = [f"asset-{i}" for i in range(8)]
+    prices = {asset: float(rng.uniform(1, 100)) for asset in assets[:-1]}
+    quantities = rng.uniform(-1, 10, (40, len(assets)))
+    quantities[rng.random(quantities.shape) < 0.6] = 0
+    holdings = [
+        (f"portfolio-{row}", assets[column], quantities[row, column])
+        for row, column in zip(*np.nonzero(quantities))
+    ]
+    matrix = HoldingsMatrix.from_holdings(holdings, prices)
+    scenarios = [
+        {asset: float(rng.uniform(-1, 1)) for asset in rng.choice(assets, 3)}
+        for _ in range(25)
+    ]
+
+    results = matrix.evaluate(matrix.shock_matrix(scenarios), worst=5)
+
+    rows = [matrix.portfolio_ids.index(f"portfolio-{row}") for row in range(40)]
+    # The last asset has no price, it is worth nothing shocked or not
+    values = quantities[rows] * np.array([prices.get(a, 0) for a in assets])
+    shocks = np.array([[s.get(a, 0) for a in assets] for s in scenarios])
+    expected = shocks @ values.T
+    assert np.allclose(results.pnl, expected.sum(axis=1))
+    assert (results.losing_portfolios == (expected < 0).sum(axis=1)).all()
+    assert np.allclose(results.worst_pnl, np.sort(expected, axis=1)[:, :5])
+    picked = np.take_along_axis(
+        expected, np.searchsorted(rows, results.worst_portfolios), axis=1
+    )
+    assert np.allclose(picked, results.worst_pnl)
+
+
+def test_stress_test_values_holdings_of_every_portfolio(db, monkeypatch):
+    # Assets of their own, held by no other portfolio of the test database
+    coin, token = f"coin-{uuid.uuid4()}", f"token-{uuid.uuid4()}"
+    prices = {coin: 100.0, token: 2.0}
+    monkeypatch.setattr(
+        fetch_price,
+        "fetch_crypto_prices",
+        lambda names, currencies: {
+            (name, currency): prices[name]
+            for name in names
+            if name in prices
+            for currency in currencies
+        },
+    )
+    first, second = create_portfolio(), create_portfolio()
+    for (user_id, portfolio_id), asset_name, kind, amount in (
+        (first, coin, TransactionType.BUY, 3),
+        (first, coin, TransactionType.SELL, 1),
+        (first, token, TransactionType.BUY, 10),
+        (second, coin.upper(), TransactionType.BUY, 1),
+        (second, "unpriced-coin", TransactionType.BUY, 7),
+    ):
+        add_transaction(db, user_id, portfolio_id, asset_name, kind, amount, "usd")
+
+    result = StressController.run_stress_test(
+        [db],
+        StressTestRequest(
+            scenarios=[
+                {"name": "crash", "shocks": {coin.upper(): -0.5, token: -1}},
+                {"name": "rally", "shocks": {token: 1}},
+            ],
+            worst=2,
+        ),
+    )
+
+    assert "unpriced-coin" in result.unpriced_assets
+    crash, rally = result.scenarios
+    assert (crash.name, rally.name) == ("crash", "rally")
+    # Only the shocked assets move, and they are held by these two alone
+    assert crash.pnl == -(2 * 100 + 1 * 100) * 0.5 - 10 * 2
+    assert crash.stressed_value == result.base_value + crash.pnl
+    assert crash.losing_portfolios == 2
+    assert [(p.portfolio_id, p.base_value, p.pnl) for p in crash.worst_portfolios][
+        :2
+    ] == [(first[1], 220, -120), (second[1], 100, -50)]
+    assert (rally.pnl, rally.losing_portfolios) == (20, 0)
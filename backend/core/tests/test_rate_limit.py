@@ -0,0 +1,136 @@
+import asyncio
+import uuid
+from datetime import timedelta
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from tests.test_database import client as app_client
+from app.middleware.rate_limit_middleware import RateLimitMiddleware
+from app.utils.jwt import create_access_token
+from app.utils.rate_limiter import (
+    BucketPolicy,
+    LocalBucketStore,
+    RateLimiter,
+    RedisBucketStore,
+    RouteLimit,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class DownStore:
+    async def take(self, key, policy, cost):
+        raise ConnectionError("Connection refused")
+
+
+class ScriptedRedis:
+    """Stand-in for an asyncio Redis client, running scripts as given."""
+
+    def __init__(self, run):
+        self.run = run
+        self.calls = []
+
+    def register_script(self, script):
+        async def call(keys, args):
+            self.calls.append((keys, args))
+            return self.run(keys, args)
+
+        return call
+
+
+def test_buckets_refill_at_their_rate():
+    clock = Clock()
+    store = LocalBucketStore(clock=clock)
+    policy = BucketPolicy(capacity=3, refill_per_second=0.5)
+
+    assert [asyncio.run(store.take("a", policy, 1)) for _ in range(3)] == [0, 0, 0]
+    assert asyncio.run(store.take("a", policy, 1)) == 2
+    assert asyncio.run(store.take("b", policy, 1)) == 0
+
+    clock.now += 1
+    assert asyncio.run(store.take("a", policy, 1)) == 1
+    clock.now += 1
+    assert asyncio.run(store.take("a", policy, 1)) == 0
+    # Never more than the capacity, however long the bucket was idle
+    clock.now += 3600
+    assert [asyncio.run(store.take("a", policy, 1)) for _ in range(4)][-1] == 2
+
+
+def test_routes_take_what_they_cost_from_their_bucket():
+    clock = Clock()
+    limiter = RateLimiter(LocalBucketStore(clock=clock))
+
+    assert limiter.route_limit("GET", "/api/v1/portfolios/summary") == RouteLimit(
+        "portfolios", 10
+    )
+    assert limiter.route_limit("GET", f"/api/v1/portfolios/{uuid.uuid4()}").cost == 5
+    assert limiter.route_limit("PATCH", f"/api/v1/portfolios/{uuid.uuid4()}").cost == 1
+    assert limiter.route_limit("GET", "/api/v1/transactions/").bucket == "api"
+
+    # 60 tokens, six summaries drain them, cheap routes have their own bucket
+    waits = [
+        asyncio.run(limiter.check("user:a", "GET", "/api/v1/portfolios/summary"))
+        for _ in "x" * 7
+    ]
+    assert waits[:6] == [0] * 6 and waits[6] == 5
+    assert asyncio.run(limiter.check("user:a", "GET", "/api/v1/transactions/")) == 0
+    assert (
+        asyncio.run(limiter.check("user:b", "GET", "/api/v1/portfolios/summary")) == 0
+    )
+
+
+def test_store_errors_let_requests_through():
+    assert asyncio.run(RateLimiter(DownStore()).check("user:a", "GET", "/")) == 0
+
+
+def test_shared_store_runs_the_take_script_asynchronously():
+    server = ScriptedRedis(lambda keys, args: b"2.5")
+    limiter = RateLimiter(RedisBucketStore(server))
+
+    assert asyncio.run(limiter.check("user:a", "GET", "/api/v1/auth/login")) == 2.5
+    assert server.calls == [(["ratelimit:auth:user:a"], [20, 0.2, 1])]
+
+
+def create_app(limiter):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+
+    @app.get("/api/v1/transactions/")
+    async def transactions():
+        return {"message": "ok"}
+
+    return app
+
+
+def test_clients_over_the_limit_get_429_with_retry_after():
+    limiter = RateLimiter(
+        LocalBucketStore(clock=Clock()),
+        buckets={"api": BucketPolicy(capacity=2, refill_per_second=0.25)},
+        routes=[],
+    )
+    client = TestClient(create_app(limiter))
+    token = create_access_token({"sub": uuid.uuid4()}, timedelta(days=1))
+
+    client.cookies.set("refresh_token", token)
+    signed_in = [client.get("/api/v1/transactions/") for _ in range(3)]
+    assert [response.status_code for response in signed_in] == [200, 200, 429]
+    assert signed_in[2].headers["retry-after"] == "4"
+
+    # Anonymous clients and invalid tokens are limited by address, apart
+    client.cookies.clear()
+    assert client.get("/api/v1/transactions/").status_code == 200
+    client.cookies.set("refresh_token", "invalid")
+    assert client.get("/api/v1/transactions/").status_code == 200
+    assert client.get("/api/v1/transactions/").status_code == 429
+
+
+def test_browsers_can_read_retry_after_cross_origin():
+    response = app_client.get(
+        "/api/v1/portfolios/", headers={"Origin": "http://localhost"}
+    )
+    assert response.headers["access-control-expose-headers"] == "Retry-After"
@@ -0,0 +1,119 @@
+import csv
+import io
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from tests.test_database import engine
+from app.controllers import report_controller
+from app.controllers.report_controller import ReportController
+from app.database.partitioning import create_partitions
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from tests.test_write_batcher import create_portfolio
+
+
+@pytest.fixture
+def db():
+    # Transactions dated years back get partitions of their own, and all of it
+    # is rolled back so that other tests find the table and its stats as is
+    with engine.connect() as connection, connection.begin() as transaction:
+        with Session(
+            bind=connection, join_transaction_mode="create_savepoint"
+        ) as session:
+            yield session
+        transaction.rollback()
+
+
+def add_transaction(db, user_id, portfolio_id, created_at, kind, amount, price, fee=0):
+    create_partitions(db.connection(), created_at.date(), created_at.date())
+    db.add(
+        TransactionModel(
+            ticker_symbol="BTC",
+            asset_name="bitcoin",
+            transaction_type=kind,
+            asset_type="crypto",
+            user_id=user_id,
+            amount=amount,
+            currency="usd",
+            unit_price=price,
+            transaction_fee=fee,
+            portfolio_id=portfolio_id,
+            note="",
+            created_at=created_at,
+        )
+    )
+    db.commit()
+
+
+def read_report(db, user_id, year):
+    report = "".join(ReportController.realized_gains_csv(db, user_id, year))
+    return list(csv.DictReader(io.StringIO(report)))
+
+
+def test_sales_are_matched_first_in_first_out_with_fees(db):
+    user_id, portfolio_id = create_portfolio()
+    for created_at, kind, amount, price, fee in (
+        (datetime(2020, 1, 10), TransactionType.BUY, 2, 100, 2),
+        (datetime(2020, 6, 1), TransactionType.SELL, 1, 150, 0),
+        (datetime(2021, 3, 1), TransactionType.BUY, 2, 200, 0),
+        (datetime(2021, 4, 1), TransactionType.SELL, 2, 300, 4),
+        (datetime(2021, 5, 1), TransactionType.TRANSFER_OUT, 1, 300, 0),
+        (datetime(2021, 6, 1), TransactionType.SELL, 1, 300, 0),
+        (datetime(2022, 1, 1), TransactionType.SELL, 1, 300, 0),
+    ):
+        add_transaction(db, user_id, portfolio_id, created_at, kind, amount, price, fee)
+
+    rows = read_report(db, user_id, 2021)
+
+    # The 2020 sale consumed half of the first lot before the year started,
+    # the transfer out consumed the rest of the second lot without realizing
+    assert [
+        (
+            row["acquired_at"][:10],
+            row["term"],
+            float(row["quantity"]),
+            float(row["gain"]),
+        )
+        for row in rows
+    ] == [
+        ("2020-01-10", "long", 1.0, 300 - 2 - 101),
+        ("2021-03-01", "short", 1.0, 300 - 2 - 200),
+        ("", "unmatched", 1.0, 300.0),
+    ]
+
+
+def test_report_is_streamed_in_chunks_through_a_server_side_cursor(db, monkeypatch):
+    monkeypatch.setattr(report_controller, "REPORT_CHUNK_ROWS", 2)
+    user_id, portfolio_id = create_portfolio()
+    cursors = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if "FROM transactions" in statement:
+            cursors.append(cursor.name)
+
+    add_transaction(
+        db, user_id, portfolio_id, datetime(2023, 1, 1), TransactionType.BUY, 5, 10
+    )
+    for day in range(1, 6):
+        add_transaction(
+            db,
+            user_id,
+            portfolio_id,
+            datetime(2023, 2, day),
+            TransactionType.SELL,
+            1,
+            20,
+        )
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        chunks = list(ReportController.realized_gains_csv(db, user_id, 2023))
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    assert len(chunks) == 3
+    assert len("".join(chunks).splitlines()) == 6
+    assert cursors and cursors[0] is not None
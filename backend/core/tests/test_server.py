@@ -0,0 +1,154 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from app.server import private_memory_bytes, request_budget
+
+CORE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def pid_app(scope, receive, send):
+    # Answers with the pid of the worker serving the request
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            await send({"type": f"{message['type']}.complete"})
+            if message["type"] == "lifespan.shutdown":
+                return
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(os.getpid()).encode()})
+
+
+async def flaky_app(scope, receive, send):
+    # Fails to start while the file named by FAIL_START_FILE exists
+    if scope["type"] == "lifespan" and os.path.exists(os.environ["FAIL_START_FILE"]):
+        await receive()
+        await send({"type": "lifespan.startup.failed", "message": "Failing"})
+        return
+    await pid_app(scope, receive, send)
+
+
+def spawn_master(port, app="pid_app", env=None, **options):
+    arguments = ", ".join(f"{name}={value!r}" for name, value in options.items())
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from app.server import PreforkServer; "
+            f"sys.exit(PreforkServer('tests.test_server:{app}', '127.0.0.1', "
+            f"{port}, after_fork=None, graceful_timeout=5, {arguments}).run())",
+        ],
+        cwd=CORE_DIRECTORY,
+        env={**os.environ, **(env or {})},
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(app="pid_app", env=None, **options):
+    port = free_port()
+    master = spawn_master(port, app, env, **options)
+    url = f"http://127.0.0.1:{port}/"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url)
+            return master, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    master.kill()
+    raise TimeoutError("The server did not start")
+
+
+def workers_of(master) -> set:
+    with open(f"/proc/{master.pid}/task/{master.pid}/children") as children:
+        return {int(pid) for pid in children.read().split()}
+
+
+def serving_pids(url, seconds) -> set:
+    # Every request must succeed meanwhile, on a connection of its own
+    pids = set()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        response = httpx.get(url)
+        assert response.status_code == 200
+        pids.add(int(response.text))
+    return pids
+
+
+def stop(master) -> int:
+    master.send_signal(signal.SIGTERM)
+    return master.wait(timeout=30)
+
+
+def test_rolling_restart_replaces_every_worker_without_dropping_requests():
+    master, url = start_server(workers=2, max_requests=0, max_memory_mb=0)
+    try:
+        first = workers_of(master)
+        assert len(first) == 2
+        assert serving_pids(url, 0.5) <= first
+
+        master.send_signal(signal.SIGHUP)
+        deadline = time.monotonic() + 20
+        while workers_of(master) & first and time.monotonic() < deadline:
+            serving_pids(url, 0.2)
+        second = workers_of(master)
+        assert len(second) == 2 and not second & first
+        assert serving_pids(url, 0.5) <= second
+    finally:
+        assert stop(master) == 0
+    assert not os.path.exists(f"/proc/{master.pid}")
+
+
+def test_workers_past_their_request_budget_are_replaced():
+    assert request_budget(0, 10) == 0
+    assert 100 <= request_budget(100, 10) <= 110
+    assert private_memory_bytes(os.getpid()) > 0
+
+    master, url = start_server(workers=1, max_requests=20, max_requests_jitter=0)
+    try:
+        first = workers_of(master)
+        # Checked by the worker every second
+        pids = serving_pids(url, 3)
+        assert len(pids) >= 2 and first < pids
+    finally:
+        assert stop(master) == 0
+
+
+def test_workers_failing_to_start_are_retried_while_the_others_serve(tmp_path):
+    fail_file = tmp_path / "fail"
+    env = {"FAIL_START_FILE": str(fail_file)}
+    master, url = start_server(
+        app="flaky_app", env=env, workers=2, max_requests=0, max_memory_mb=0
+    )
+    try:
+        first = workers_of(master)
+        fail_file.touch()
+        master.send_signal(signal.SIGHUP)
+        # Replacements fail to start, retried after 1 then 2 seconds
+        assert serving_pids(url, 2.5) <= first
+        assert master.poll() is None
+
+        fail_file.unlink()
+        deadline = time.monotonic() + 20
+        while workers_of(master) & first and time.monotonic() < deadline:
+            serving_pids(url, 0.2)
+        second = workers_of(master)
+        assert len(second) == 2 and not second & first
+    finally:
+        assert stop(master) == 0
+
+    # Failing from the start, the server gives up after the third failure
+    fail_file.touch()
+    master = spawn_master(free_port(), "flaky_app", env, max_boot_failures=3)
+    started = time.monotonic()
+    assert master.wait(timeout=30) == 1
+    # Retried after 1 and 2 seconds
+    assert time.monotonic() - started >= 3
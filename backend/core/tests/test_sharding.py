@@ -0,0 +1,225 @@
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from tests.test_database import engine, TestingSessionLocal
+from app.controllers.transaction_controller import TransactionController
+from app.database.partitioning import create_partitions
+from app.database.sharding import (
+    HashRing,
+    Shard,
+    ShardRouter,
+    open_shard,
+    rebalance,
+)
+from app.models.portfolio_model import Portfolio as PortfolioModel, AssetType
+from app.models.price_alert_model import AlertDirection, PriceAlert
+from app.models.transaction_model import Transaction as TransactionModel
+from app.models.transaction_model import TransactionType
+from app.models.user_model import User as UserModel, UserRole
+from app.schemas.transaction_schema import TransactionBatchSelection
+from app.utils.jwt import create_access_token
+
+SHARD_NAMES = [f"{os.getenv('POSTGRES_DB')}_test_shard_{i}" for i in range(3)]
+# Far enough ahead not to meet the rows of other tests
+START = datetime(2031, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def shards():
+    return [open_shard(name) for name in SHARD_NAMES]
+
+
+@pytest.fixture
+def router(shards):
+    return ShardRouter(shards, Shard("directory", engine, TestingSessionLocal))
+
+
+@pytest.fixture
+def sessions(shards):
+    # Everything written on the shards is rolled back afterwards
+    connections = [shard.engine.connect() for shard in shards]
+    transactions = [connection.begin() for connection in connections]
+    sessions = [
+        Session(bind=connection, join_transaction_mode="create_savepoint")
+        for connection in connections
+    ]
+    yield dict(zip((shard.name for shard in shards), sessions))
+    for session, transaction, connection in zip(sessions, transactions, connections):
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+def user_rows(user_id, created_ats):
+    portfolio_id = uuid.uuid4()
+    rows = [
+        UserModel(
+            id=user_id,
+            username=f"user-{user_id}",
+            email=f"{user_id}@example.com",
+            hashed_password="",
+            role=UserRole.USER,
+        ),
+        PortfolioModel(
+            id=portfolio_id,
+            name="Sharded",
+            description="",
+            user_id=user_id,
+            asset_type=AssetType.CRYPTO,
+        ),
+    ]
+    for created_at in created_ats:
+        rows.append(
+            TransactionModel(
+                ticker_symbol="BTC",
+                asset_name="bitcoin",
+                transaction_type=TransactionType.BUY,
+                asset_type=AssetType.CRYPTO,
+                user_id=user_id,
+                amount=1,
+                currency="usd",
+                unit_price=1,
+                transaction_fee=0,
+                portfolio_id=portfolio_id,
+                note="",
+                created_at=created_at,
+            )
+        )
+    return rows
+
+
+def add_user(db, user_id, created_ats):
+    create_partitions(db.connection(), START.date(), START.date())
+    for row in user_rows(user_id, created_ats):
+        db.add(row)
+        db.flush()
+    db.commit()
+
+
+def test_ring_spreads_users_and_moves_few_when_a_shard_is_added():
+    user_ids = [uuid.uuid4() for _ in range(20_000)]
+    ring = HashRing(["a", "b", "c", "d"])
+    counts = Counter(ring.shard_for(user_id) for user_id in user_ids)
+    assert max(counts.values()) / min(counts.values()) < 1.3
+
+    grown = HashRing(["a", "b", "c", "d", "e"])
+    moved = [
+        user_id
+        for user_id in user_ids
+        if ring.shard_for(user_id) != grown.shard_for(user_id)
+    ]
+    # Only the users taken over by the new shard move, about a fifth of them
+    assert {grown.shard_for(user_id) for user_id in moved} == {"e"}
+    assert 0.15 < len(moved) / len(user_ids) < 0.25
+
+
+def test_requests_are_routed_to_the_shard_of_their_user(router):
+    user_id = uuid.uuid4()
+    token = create_access_token({"sub": user_id}, timedelta(minutes=5))
+
+    with router.session_for_token(token) as db:
+        assert db.get_bind() is router.shard_for(user_id).engine
+    with router.session_for_token(None) as db:
+        assert db.get_bind() is engine
+    with router.session_for_token("not a token") as db:
+        assert db.get_bind() is engine
+
+
+def test_admin_listing_merges_the_shards_in_order(router, sessions):
+    created_at = iter(START + timedelta(minutes=i) for i in range(1000))
+    expected = []
+    for _ in range(30):
+        user_id = uuid.uuid4()
+        created_ats = [next(created_at) for _ in range(2)]
+        add_user(sessions[router.shard_for(user_id).name], user_id, created_ats)
+        expected += created_ats
+    expected.sort(reverse=True)
+    shard_sessions = list(sessions.values())
+    assert all(
+        db.scalar(select(func.count()).select_from(TransactionModel)) > 0
+        for db in shard_sessions
+    )
+
+    def page(skip, limit):
+        return TransactionController.get_all_transactions_from_shards(
+            shard_sessions, skip=skip, limit=limit, start_time=START
+        )
+
+    listed = []
+    for skip in range(0, len(expected), 5):
+        transactions, total = page(skip, 5)
+        assert total == len(expected)
+        listed += [transaction.created_at for transaction in transactions]
+    assert listed == expected
+
+    # Deleting by ids finds them on whichever shard holds them
+    transactions, _ = page(0, 10)
+    selection = TransactionBatchSelection(ids=[t.id for t in transactions])
+    assert (
+        TransactionController.delete_transactions_from_shards(shard_sessions, selection)
+        == 10
+    )
+    assert page(0, 100)[1] == len(expected) - 10
+
+
+def test_rebalancing_moves_the_users_of_a_new_shard(shards):
+    engines = {shard.name: shard.engine for shard in shards}
+    old_ring, new_ring = HashRing(SHARD_NAMES[:2]), HashRing(SHARD_NAMES)
+    user_ids = [uuid.uuid4() for _ in range(30)]
+    for user_id in user_ids:
+        with Session(engines[old_ring.shard_for(user_id)]) as db:
+            add_user(db, user_id, [START, START + timedelta(days=1)])
+            db.add(
+                PriceAlert(
+                    user_id=user_id,
+                    asset_name="bitcoin",
+                    currency="usd",
+                    direction=AlertDirection.ABOVE,
+                    threshold=100,
+                )
+            )
+            db.commit()
+
+    def rows_by_shard(model, user_id):
+        counts = {}
+        for name, shard_engine in engines.items():
+            with shard_engine.connect() as connection:
+                counts[name] = connection.scalar(
+                    select(func.count())
+                    .select_from(model)
+                    .where(model.user_id == user_id)
+                )
+        return counts
+
+    try:
+        moves = rebalance(old_ring, new_ring, engines)
+
+        moving = [
+            user_id
+            for user_id in user_ids
+            if old_ring.shard_for(user_id) != new_ring.shard_for(user_id)
+        ]
+        assert moving
+        assert sum(moves.values()) == len(moving)
+        assert {target for _, target in moves} == {SHARD_NAMES[2]}
+        for user_id in user_ids:
+            expected = dict.fromkeys(SHARD_NAMES, 0)
+            expected[new_ring.shard_for(user_id)] = 2
+            assert rows_by_shard(TransactionModel, user_id) == expected
+            # Not deleted with the user on its old shard
+            expected[new_ring.shard_for(user_id)] = 1
+            assert rows_by_shard(PriceAlert, user_id) == expected
+        # Moving again is a no-op
+        assert rebalance(old_ring, new_ring, engines) == {}
+    finally:
+        for shard_engine in engines.values():
+            with shard_engine.begin() as connection:
+                for model in (TransactionModel, PortfolioModel, UserModel):
+                    column = model.id if model is UserModel else model.user_id
+                    connection.execute(
+                        model.__table__.delete().where(column.in_(user_ids))
+                    )
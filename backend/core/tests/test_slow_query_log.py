@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from tests.test_database import engine
+from app.database.slow_query_log import SlowQueryLog, request_scope
+
+
+def run_with_log(slow_query_log, statement, parameters=None):
+    slow_query_log.install(engine)
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(statement), parameters or {})
+            # The transaction must still be usable after the EXPLAIN
+            connection.execute(text("SELECT 1"))
+    finally:
+        slow_query_log.uninstall(engine)
+
+
+def test_slow_statement_is_logged_with_route_shape_and_plan():
+    slow_query_log = SlowQueryLog(threshold_ms=20, explain_sample_rate=1)
+    token = request_scope.set(
+        {"method": "GET", "path": "/api/v1/portfolios/1", "route": None}
+    )
+    try:
+        run_with_log(slow_query_log, "SELECT pg_sleep(:seconds)", {"seconds": 0.05})
+    finally:
+        request_scope.reset(token)
+
+    [entry] = slow_query_log.recent()
+    assert entry.route == "GET /api/v1/portfolios/1"
+    assert entry.parameter_shape == "(seconds: float)"
+    assert entry.duration_ms >= 20
+    assert "actual time" in entry.plan
+
+
+def test_fast_statements_and_unsampled_plans_are_skipped():
+    slow_query_log = SlowQueryLog(threshold_ms=20, explain_sample_rate=0)
+    run_with_log(slow_query_log, "SELECT 1")
+    assert slow_query_log.recent() == []
+
+    run_with_log(slow_query_log, "SELECT pg_sleep(0.05)")
+    [entry] = slow_query_log.recent()
+    assert entry.route is None
+    assert entry.plan is None
+
+
+def test_failing_statements_leave_no_start_on_the_connection():
+    slow_query_log = SlowQueryLog(threshold_ms=20, explain_sample_rate=0)
+    slow_query_log.install(engine)
+    try:
+        with engine.connect() as connection:
+            with pytest.raises(DBAPIError):
+                connection.execute(text("SELECT 1 / 0"))
+            connection.rollback()
+            assert connection.info["slow_query_start"] == []
+
+            connection.execute(text("SELECT 1"))
+            assert connection.info["slow_query_start"] == []
+    finally:
+        slow_query_log.uninstall(engine)
+    assert slow_query_log.recent() == []
@@ -0,0 +1,103 @@
+import asyncio
+import uuid
+from datetime import timedelta
+import pytest
+from tests.test_database import TestingSessionLocal
+from app.dependencies import get_current_user
+from app.models.revoked_token_model import RevokedToken
+from app.utils.bloom_filter import BloomFilter
+from app.utils.custom_exceptions import CredentialsException
+from app.utils.jwt import create_access_token, decode_access_token
+from app.utils import token_revocation
+from app.utils.token_revocation import TokenRevocationList
+from tests.test_transaction_batch import count_statements
+from tests.test_write_batcher import create_portfolio
+
+
+@pytest.fixture(autouse=True)
+def clear_revoked_tokens():
+    yield
+    with TestingSessionLocal() as db:
+        db.query(RevokedToken).delete()
+        db.commit()
+
+
+def issue_token(user_id):
+    token = create_access_token({"sub": user_id}, expires_delta=timedelta(days=1))
+    return token, decode_access_token(token)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(10_000, 0.01)
+    added = [uuid.uuid4().hex for _ in range(10_000)]
+    for item in added:
+        bloom.add(item)
+
+    assert all(item in bloom for item in added)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10_000))
+    assert false_positives < 300
+    bloom.add(added[0])
+    assert len(bloom) <= 10_000
+
+
+def test_unrevoked_tokens_are_checked_without_the_database():
+    user_id, _ = create_portfolio()
+    revocations = TokenRevocationList(TestingSessionLocal)
+    with TestingSessionLocal() as db:
+        revocations.refresh(db)
+        statements, stop = count_statements()
+        for _ in range(100):
+            assert not revocations.is_revoked(db, issue_token(user_id)[1]["jti"])
+        stop()
+
+    assert statements == []
+
+
+def test_revocations_reach_the_other_workers_at_their_refresh():
+    user_id, _ = create_portfolio()
+    worker, other_worker = (TokenRevocationList(TestingSessionLocal) for _ in "ab")
+    token, payload = issue_token(user_id)
+    with TestingSessionLocal() as db:
+        worker.refresh(db)
+        other_worker.refresh(db)
+
+        assert worker.revoke(db, payload)
+        assert worker.is_revoked(db, payload["jti"])
+        assert not other_worker.is_revoked(db, payload["jti"])
+
+        other_worker.refresh(db)
+        assert other_worker.is_revoked(db, payload["jti"])
+        assert not worker.revoke(db, {"sub": str(user_id), "exp": payload["exp"]})
+
+
+def test_expired_revocations_are_dropped_at_the_rebuild():
+    user_id, _ = create_portfolio()
+    revocations = TokenRevocationList(TestingSessionLocal, rebuild_seconds=0)
+    expired = {**issue_token(user_id)[1], "jti": uuid.uuid4().hex, "exp": 1}
+    live = issue_token(user_id)[1]
+    with TestingSessionLocal() as db:
+        revocations.revoke(db, expired)
+        revocations.revoke(db, live)
+
+    revocations.refresh_from_database()
+
+    with TestingSessionLocal() as db:
+        assert db.get(RevokedToken, expired["jti"]) is None
+        assert revocations.is_revoked(db, live["jti"])
+    assert len(revocations._filter) == 1
+
+
+def test_revoked_refresh_tokens_are_rejected(monkeypatch):
+    user_id, _ = create_portfolio()
+    revocations = TokenRevocationList(TestingSessionLocal)
+    monkeypatch.setattr(token_revocation, "token_revocations", revocations)
+    monkeypatch.setattr("app.dependencies.token_revocations", revocations)
+    token, payload = issue_token(user_id)
+    with TestingSessionLocal() as db:
+        assert asyncio.run(get_current_user(token, db)).id == user_id
+
+        revocations.revoke(db, payload)
+        with pytest.raises(CredentialsException):
+            asyncio.run(get_current_user(token, db))
+        # Another token of the same user is still valid
+        assert asyncio.run(get_current_user(issue_token(user_id)[0], db)).id == user_id
@@ -0,0 +1,146 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+from tests.test_database import engine
+from app.controllers.portfolio_controller import _get_portfolio_holdings
+from app.controllers.report_controller import ReportController
+from app.controllers.transaction_controller import TransactionController
+from app.database.archival import (
+    archive_closed_batch,
+    archive_deleted_batch,
+    archive_transactions,
+    closed_positions,
+)
+from app.database.assets import intern_asset
+from app.jobs.handlers import JobContext, export_transactions, portfolio_history
+from app.models.job_model import Job as JobModel
+from app.models.archived_transaction_model import ArchivedTransaction
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import Transaction as TransactionModel
+from app.models.transaction_model import TransactionType
+from tests.test_realized_gains import add_transaction, db  # noqa: F401, fixture
+from tests.test_write_batcher import create_portfolio
+
+
+def listing(db, portfolio_id, include_deleted):
+    transactions, total = TransactionController.get_transactions_by_portfolio_id(
+        db, portfolio_id, include_deleted=include_deleted
+    )
+    assert len(transactions) == total
+    return sorted(transaction.amount for transaction in transactions)
+
+
+def run_handler(db, user_id, handler, **params):
+    job = JobModel(id=uuid.uuid4(), user_id=user_id, params=params)
+    return handler(JobContext(db, job)).content.decode()
+
+
+def exported_amounts(db, user_id):
+    lines = run_handler(db, user_id, export_transactions, include_deleted=True)
+    rows = lines.splitlines()
+    amount = rows[0].split(",").index("amount")
+    return sorted(float(row.split(",")[amount]) for row in rows[1:])
+
+
+def open_holdings(db, portfolio_id):
+    holdings = _get_portfolio_holdings(db, portfolio_id)
+    return [holding for holding in holdings if holding.quantity]
+
+
+TICKER_SYMBOLS = {"bitcoin": "BTC", "ethereum": "ETH"}
+
+
+def asset_id(asset_name):
+    return intern_asset(
+        engine, AssetType.CRYPTO, asset_name, TICKER_SYMBOLS[asset_name]
+    )
+
+
+def test_deleted_rows_are_archived_in_batches_past_the_retention(db):
+    user_id, portfolio_id = create_portfolio()
+    now = datetime.utcnow()
+    for amount in range(1, 9):
+        add_transaction(db, user_id, portfolio_id, now, TransactionType.BUY, amount, 1)
+    deleted_at = {1: now - timedelta(days=40), 2: now - timedelta(days=40)}
+    deleted_at.update({3: now - timedelta(days=35), 4: now - timedelta(days=31)})
+    deleted_at[5] = now - timedelta(days=1)
+    for amount, stamp in deleted_at.items():
+        db.query(TransactionModel).filter(
+            TransactionModel.portfolio_id == portfolio_id,
+            TransactionModel.amount == amount,
+        ).update({"deleted_at": stamp})
+    db.commit()
+
+    cutoff = now - timedelta(days=30)
+    batches = [archive_deleted_batch(db.connection(), cutoff, 3) for _ in range(3)]
+
+    assert batches == [3, 1, 0]
+    archived = db.query(ArchivedTransaction).filter(
+        ArchivedTransaction.portfolio_id == portfolio_id
+    )
+    assert sorted(row.amount for row in archived) == [1, 2, 3, 4]
+    assert {row.archive_reason for row in archived} == {"deleted"}
+    assert listing(db, portfolio_id, include_deleted=False) == [6, 7, 8]
+    # Deleted rows are listed the same, archived or not
+    assert listing(db, portfolio_id, include_deleted=True) == list(range(1, 9))
+    assert exported_amounts(db, user_id) == list(range(1, 9))
+
+
+def test_closed_positions_are_archived_and_still_reported(db):
+    # Registered first, partitions the fixture's transaction creates for the
+    # rows lock the assets table until the end of the test
+    asset_ids = {asset: asset_id(asset) for asset in TICKER_SYMBOLS}
+    user_id, portfolio_id = create_portfolio()
+    for created_at, asset, kind, amount, price in (
+        (datetime(2020, 1, 10), "bitcoin", TransactionType.BUY, 2, 100),
+        (datetime(2020, 3, 1), "bitcoin", TransactionType.SELL, 1, 150),
+        (datetime(2020, 6, 1), "bitcoin", TransactionType.TRANSFER_OUT, 1, 150),
+        (datetime(2020, 1, 11), "ethereum", TransactionType.BUY, 3, 10),
+        (datetime(2020, 3, 2), "ethereum", TransactionType.SELL, 1, 20),
+    ):
+        add_transaction(db, user_id, portfolio_id, created_at, kind, amount, price)
+        db.query(TransactionModel).filter(
+            TransactionModel.portfolio_id == portfolio_id,
+            TransactionModel.created_at == created_at,
+            TransactionModel.transaction_type == kind,
+        ).update({"asset_id": asset_ids[asset]})
+    db.commit()
+    gains_before = ReportController.realized_gains_csv(db, user_id, 2020)
+    gains_before = "".join(gains_before)
+    holdings_before = open_holdings(db, portfolio_id)
+    history_before = run_handler(
+        db, user_id, portfolio_history, portfolio_id=str(portfolio_id)
+    )
+
+    closed_before = datetime(2021, 1, 1)
+    positions = [
+        position
+        for position in closed_positions(db.connection(), closed_before)
+        if position.portfolio_id == portfolio_id
+    ]
+    assert [position.asset_id for position in positions] == [asset_ids["bitcoin"]]
+    assert archive_closed_batch(db.connection(), positions[0], closed_before, 10) == 3
+
+    assert listing(db, portfolio_id, include_deleted=False) == [1, 3]
+    assert listing(db, portfolio_id, include_deleted=True) == [1, 1, 1, 2, 3]
+    assert open_holdings(db, portfolio_id) == holdings_before
+    gains_after = "".join(ReportController.realized_gains_csv(db, user_id, 2020))
+    assert gains_after == gains_before
+    history_after = run_handler(
+        db, user_id, portfolio_history, portfolio_id=str(portfolio_id)
+    )
+    assert history_after == history_before
+    assert len(json.loads(history_after)["history"]) == 5
+    assert exported_amounts(db, user_id) == [1, 1, 1, 2, 3]
+
+
+def test_archival_reports_the_storage_before_and_after():
+    # Nothing is old enough to be moved, the run only measures
+    report = archive_transactions(
+        engine, retention_days=365 * 100, closed_before=datetime(1970, 1, 1)
+    )
+
+    assert (report.deleted_rows, report.closed_rows) == (0, 0)
+    assert report.before.rows == report.after.rows
+    assert report.after.table_bytes > 0 and report.after.index_bytes > 0
+    assert report.archive.index_bytes > 0
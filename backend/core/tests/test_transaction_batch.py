@@ -0,0 +1,194 @@
+import uuid
+import pytest
+from sqlalchemy import event
+from tests.test_database import engine, TestingSessionLocal
+from app.controllers.transaction_controller import TransactionController
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.schemas.transaction_schema import (
+    TransactionBatchFilter,
+    TransactionBatchSelection,
+    TransactionUpdate,
+)
+from app.utils.cache import cache, portfolio_scope
+from app.utils.custom_exceptions import (
+    BadRequestException,
+    ForbiddenException,
+    NotFoundException,
+)
+from tests.test_write_batcher import create_portfolio
+
+
+def add_transactions(db, user_id, portfolio_id, count):
+    transactions = [
+        TransactionModel(
+            ticker_symbol="BTC",
+            asset_name="bitcoin",
+            transaction_type=TransactionType.BUY,
+            asset_type="crypto",
+            user_id=user_id,
+            amount=1,
+            currency="usd",
+            unit_price=1,
+            transaction_fee=0,
+            portfolio_id=portfolio_id,
+            note="",
+        )
+        for _ in range(count)
+    ]
+    db.add_all(transactions)
+    db.commit()
+    return [transaction.id for transaction in transactions]
+
+
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement.split()[0])
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return statements, lambda: event.remove(
+        engine, "before_cursor_execute", before_cursor_execute
+    )
+
+
+def test_update_by_ids_runs_one_ownership_query_and_one_update():
+    user_id, portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        ids = add_transactions(db, user_id, portfolio_id, 3)
+        version = cache.version(portfolio_scope(portfolio_id))
+        statements, stop = count_statements()
+        try:
+            affected = TransactionController.update_transactions(
+                db,
+                TransactionBatchSelection(ids=ids),
+                TransactionUpdate(note="rebalanced"),
+                user_id=user_id,
+            )
+        finally:
+            stop()
+
+        assert affected == 3
+        assert statements.count("SELECT") == 1
+        assert statements.count("UPDATE") == 1
+        assert cache.version(portfolio_scope(portfolio_id)) == version + 1
+        notes = db.query(TransactionModel.note).filter(TransactionModel.id.in_(ids))
+        assert {note for note, in notes} == {"rebalanced"}
+
+
+def test_ids_of_other_users_are_rejected():
+    user_id, portfolio_id = create_portfolio()
+    other_user_id, other_portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        ids = add_transactions(db, user_id, portfolio_id, 1)
+        ids += add_transactions(db, other_user_id, other_portfolio_id, 1)
+
+        with pytest.raises(ForbiddenException):
+            TransactionController.soft_delete_transactions(
+                db, TransactionBatchSelection(ids=ids), user_id=user_id
+            )
+        with pytest.raises(NotFoundException):
+            TransactionController.soft_delete_transactions(
+                db,
+                TransactionBatchSelection(ids=ids[:1] + [portfolio_id]),
+                user_id=user_id,
+            )
+
+
+def test_filter_only_matches_live_transactions_of_the_user():
+    user_id, portfolio_id = create_portfolio()
+    other_user_id, other_portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        ids = add_transactions(db, user_id, portfolio_id, 3)
+        add_transactions(db, other_user_id, other_portfolio_id, 2)
+        TransactionController.soft_delete_transaction_by_id(db, ids[0])
+
+        # The portfolio filter is scoped to the user even for another portfolio
+        assert (
+            TransactionController.soft_delete_transactions(
+                db,
+                TransactionBatchSelection(
+                    filter=TransactionBatchFilter(portfolio_id=other_portfolio_id)
+                ),
+                user_id=user_id,
+            )
+            == 0
+        )
+        assert (
+            TransactionController.soft_delete_transactions(
+                db,
+                TransactionBatchSelection(
+                    filter=TransactionBatchFilter(portfolio_id=portfolio_id)
+                ),
+                user_id=user_id,
+            )
+            == 2
+        )
+        assert (
+            TransactionController.delete_transactions(
+                db,
+                TransactionBatchSelection(
+                    filter=TransactionBatchFilter(
+                        portfolio_id=portfolio_id, include_deleted=True
+                    )
+                ),
+            )
+            == 3
+        )
+
+
+def test_filter_without_conditions_is_rejected():
+    user_id, portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        ids = add_transactions(db, user_id, portfolio_id, 2)
+        for batch_filter in (
+            TransactionBatchFilter(),
+            TransactionBatchFilter(include_deleted=True),
+        ):
+            selection = TransactionBatchSelection(filter=batch_filter)
+            with pytest.raises(BadRequestException):
+                TransactionController.soft_delete_transactions(
+                    db, selection, user_id=user_id
+                )
+            with pytest.raises(BadRequestException):
+                TransactionController.delete_transactions(db, selection)
+        assert (
+            db.query(TransactionModel)
+            .filter(TransactionModel.id.in_(ids), TransactionModel.deleted_at.is_(None))
+            .count()
+            == 2
+        )
+
+
+def test_ticker_symbol_alone_is_rejected():
+    user_id, portfolio_id = create_portfolio()
+    asset_name = f"Coin-{uuid.uuid4().hex[:8]}"
+    with TestingSessionLocal() as db:
+        ids = add_transactions(db, user_id, portfolio_id, 2)
+        selection = TransactionBatchSelection(ids=ids)
+        with pytest.raises(BadRequestException):
+            TransactionController.update_transactions(
+                db, selection, TransactionUpdate(ticker_symbol="XBT"), user_id=user_id
+            )
+
+        assert (
+            TransactionController.update_transactions(
+                db,
+                selection,
+                TransactionUpdate(ticker_symbol="XBT", asset_name=asset_name),
+                user_id=user_id,
+            )
+            == 2
+        )
+        db.expire_all()
+        names = {
+            (transaction.asset_name, transaction.ticker_symbol)
+            for transaction in db.query(TransactionModel).filter(
+                TransactionModel.id.in_(ids)
+            )
+        }
+        # Registered with the ticker, under the provider id
+        assert names == {(asset_name.lower(), "XBT")}
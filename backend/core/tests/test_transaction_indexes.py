@@ -0,0 +1,83 @@
+import re
+from uuid import uuid4
+from sqlalchemy import event, text
+from app.controllers.transaction_controller import TransactionController
+from tests.test_database import engine, TestingSessionLocal
+
+
+def index_and_partitions(index_name):
+    """Names of an index and of the per-partition indexes attached to it."""
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(
+                "SELECT inhrelid::regclass::text FROM pg_inherits "
+                "WHERE inhparent = to_regclass(:index)"
+            ),
+            {"index": index_name},
+        )
+        return {index_name} | {row[0] for row in rows}
+
+
+def scanned_indexes(plan):
+    return set(re.findall(r"Scan (?:Backward )?using (\S+)", plan))
+
+
+def explain_listing_queries(run_listing):
+    """Run a listing call and return the EXPLAIN output of every SELECT it issued."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    db = TestingSessionLocal()
+    try:
+        # The test table is tiny, so force the planner away from sequential
+        # scans; a non-sargable predicate would still end up with one
+        db.execute(text("SET LOCAL enable_seqscan = off"))
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            run_listing(db)
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+
+        plans = []
+        for statement, parameters in statements:
+            rows = db.connection().exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            plans.append("\n".join(row[0] for row in rows))
+        return plans
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_user_listing_uses_live_partial_index():
+    plans = explain_listing_queries(
+        lambda db: TransactionController.get_transactions_by_user_id(db, uuid4())
+    )
+
+    # Pages also look up the asset of each row by its key
+    live_indexes = index_and_partitions("ix_transactions_live_user_id_created_at") | {
+        "assets_pkey"
+    }
+    assert len(plans) == 2  # COUNT and page
+    for plan in plans:
+        assert scanned_indexes(plan)
+        assert scanned_indexes(plan) <= live_indexes
+        assert "Seq Scan" not in plan
+
+
+def test_portfolio_listing_uses_live_partial_index():
+    plans = explain_listing_queries(
+        lambda db: TransactionController.get_transactions_by_portfolio_id(db, uuid4())
+    )
+
+    # Pages also look up the asset of each row by its key
+    live_indexes = index_and_partitions(
+        "ix_transactions_live_portfolio_id_created_at"
+    ) | {"assets_pkey"}
+    assert len(plans) == 2
+    for plan in plans:
+        assert scanned_indexes(plan)
+        assert scanned_indexes(plan) <= live_indexes
+        assert "Seq Scan" not in plan
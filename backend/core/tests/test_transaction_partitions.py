@@ -0,0 +1,128 @@
+import re
+import uuid
+from datetime import date, datetime
+from sqlalchemy import text
+from app.controllers.transaction_controller import TransactionController
+from app.database.assets import intern_asset
+from app.database.partitioning import (
+    DEFAULT_PARTITION,
+    create_partitions,
+    detach_partitions_before,
+    list_partitions,
+    month_start,
+    partition_name,
+)
+from app.models.portfolio_model import Portfolio as PortfolioModel, AssetType
+from app.models.transaction_model import (
+    Transaction as TransactionModel,
+    TransactionType,
+)
+from app.models.user_model import User as UserModel, UserRole
+from tests.test_database import engine
+from tests.test_transaction_indexes import explain_listing_queries
+
+
+def scanned_tables(plan):
+    # Bitmap index scans name the index after "on", not a table
+    return set(
+        re.findall(
+            r"(?<!Bitmap )(?:Seq|Bitmap Heap|Index|Index Only) Scan"
+            r"(?: Backward)?(?: using \S+)? on (transactions\w*)",
+            plan,
+        )
+    )
+
+
+def insert_transaction(connection, created_at):
+    user_id, portfolio_id, transaction_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    connection.execute(
+        UserModel.__table__.insert().values(
+            id=user_id,
+            username=f"user-{user_id}",
+            email=f"{user_id}@example.com",
+            hashed_password="",
+            role=UserRole.USER,
+        )
+    )
+    connection.execute(
+        PortfolioModel.__table__.insert().values(
+            id=portfolio_id,
+            name="Partitioned",
+            description="",
+            user_id=user_id,
+            asset_type=AssetType.CRYPTO,
+        )
+    )
+    connection.execute(
+        TransactionModel.__table__.insert().values(
+            id=transaction_id,
+            asset_id=intern_asset(connection, AssetType.CRYPTO, "bitcoin", "BTC"),
+            transaction_type=TransactionType.BUY,
+            asset_type=AssetType.CRYPTO,
+            user_id=user_id,
+            amount=1,
+            currency="usd",
+            unit_price=1,
+            transaction_fee=0,
+            portfolio_id=portfolio_id,
+            note="",
+            created_at=created_at,
+        )
+    )
+    return transaction_id
+
+
+def stored_in(connection, transaction_id):
+    return connection.execute(
+        text("SELECT tableoid::regclass::text FROM transactions WHERE id = :id"),
+        {"id": transaction_id},
+    ).scalar()
+
+
+def test_time_range_filter_prunes_other_partitions():
+    month = month_start(datetime.utcnow())
+    start_time = datetime(month.year, month.month, 2)
+    end_time = datetime(month.year, month.month, 20)
+
+    plans = explain_listing_queries(
+        lambda db: TransactionController.get_all_transactions(
+            db, start_time=start_time, end_time=end_time
+        )
+    )
+
+    assert len(plans) == 2
+    for plan in plans:
+        assert scanned_tables(plan) == {partition_name(month)}
+
+
+def test_new_partition_adopts_rows_from_default_partition():
+    with engine.connect() as connection, connection.begin() as transaction:
+        transaction_id = insert_transaction(connection, datetime(1999, 1, 15))
+        assert stored_in(connection, transaction_id) == DEFAULT_PARTITION
+
+        created = create_partitions(connection, date(1999, 1, 1), date(1999, 1, 1))
+
+        assert created == ["transactions_y1999m01"]
+        assert stored_in(connection, transaction_id) == "transactions_y1999m01"
+        assert DEFAULT_PARTITION in list_partitions(connection)
+        transaction.rollback()
+
+
+def test_detach_old_partitions_into_archive_schema():
+    with engine.connect() as connection, connection.begin() as transaction:
+        create_partitions(connection, date(1999, 1, 1), date(1999, 2, 1))
+        transaction_id = insert_transaction(connection, datetime(1999, 1, 15))
+
+        detached = detach_partitions_before(
+            connection, datetime(1999, 2, 10), archive_schema="transactions_archive"
+        )
+
+        assert detached == ["transactions_y1999m01"]
+        assert "transactions_y1999m01" not in list_partitions(connection)
+        assert "transactions_y1999m02" in list_partitions(connection)
+        assert stored_in(connection, transaction_id) is None
+        archived = connection.execute(
+            text("SELECT id FROM transactions_archive.transactions_y1999m01")
+        ).scalar()
+        assert archived == transaction_id
+        transaction.rollback()
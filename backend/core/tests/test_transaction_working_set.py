@@ -0,0 +1,139 @@
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from tests.test_database import TestingSessionLocal
+from tests.test_net_worth import add_transaction
+from tests.test_transaction_batch import count_statements
+from tests.test_write_batcher import create_portfolio
+from app.controllers.portfolio_controller import _get_portfolio_holdings
+from app.controllers.transaction_controller import TransactionController
+from app.models.portfolio_model import AssetType
+from app.models.transaction_model import TransactionType
+from app.schemas.transaction_schema import (
+    TransactionBatchSelection,
+    TransactionCreate,
+    TransactionUpdate,
+)
+from app.utils.transaction_working_set import (
+    TransactionWorkingSet,
+    UserTransactions,
+    transaction_working_set,
+)
+
+
+def working_set_holdings(db, user_id, portfolio_id):
+    holdings = transaction_working_set.get(db, user_id).holdings(portfolio_id)
+    return sorted(holdings)
+
+
+def sql_holdings(db, portfolio_id):
+    return sorted(
+        (h.asset_name, h.ticker_symbol, h.asset_type, h.currency, h.quantity)
+        for h in _get_portfolio_holdings(db, portfolio_id)
+    )
+
+
+def test_writes_by_id_are_followed_and_batches_reload():
+    user_id, portfolio_id = create_portfolio()
+    with TestingSessionLocal() as db:
+        for asset_name, kind, amount, currency in (
+            ("bitcoin", TransactionType.BUY, 3, "usd"),
+            ("bitcoin", TransactionType.SELL, 1, "usd"),
+            ("bitcoin", TransactionType.BUY, 2, "eur"),
+            ("ethereum", TransactionType.TRANSFER_IN, 5, "usd"),
+        ):
+            add_transaction(
+                db, user_id, portfolio_id, asset_name, kind, amount, currency
+            )
+        assert working_set_holdings(db, user_id, portfolio_id) == sql_holdings(
+            db, portfolio_id
+        )
+
+        created = TransactionController.create_transaction(
+            db,
+            TransactionCreate(
+                ticker_symbol="ETH",
+                asset_name="ethereum",
+                transaction_type=TransactionType.TRANSFER_OUT,
+                asset_type=AssetType.CRYPTO,
+                user_id=user_id,
+                portfolio_id=portfolio_id,
+                amount=2,
+                currency="usd",
+                unit_price=10,
+                transaction_fee=0,
+                note="",
+            ),
+        )
+        TransactionController.update_transaction_by_id(
+            db, created.id, TransactionUpdate(amount=4)
+        )
+        first = TransactionController.get_transactions_by_portfolio_id(
+            db, portfolio_id
+        )[0][-1]
+        TransactionController.soft_delete_transaction_by_id(db, first.id)
+
+        statements, stop = count_statements()
+        try:
+            holdings = working_set_holdings(db, user_id, portfolio_id)
+        finally:
+            stop()
+        assert statements == []
+        assert holdings == sql_holdings(db, portfolio_id)
+        assert ("ethereum", "ETH", AssetType.CRYPTO, "usd", 1.0) in holdings
+
+        TransactionController.soft_delete_transactions(
+            db, TransactionBatchSelection(ids=[created.id])
+        )
+        statements, stop = count_statements()
+        try:
+            holdings = working_set_holdings(db, user_id, portfolio_id)
+        finally:
+            stop()
+        assert statements == ["SELECT"]
+        assert holdings == sql_holdings(db, portfolio_id)
+
+
+def transactions(count, asset_name="bitcoin"):
+    return [
+        (
+            uuid.uuid4(),
+            "portfolio",
+            asset_name,
+            "BTC",
+            "usd",
+            AssetType.CRYPTO,
+            TransactionType.BUY,
+            1.0,
+            10.0,
+            0.0,
+            datetime(2024, 1, 1),
+        )
+        for _ in range(count)
+    ]
+
+
+class Shard:
+    # Answers the working set's query with the rows of each user
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, statement, parameters):
+        return SimpleNamespace(all=lambda: self.rows[parameters["user_id"]])
+
+
+def test_entries_are_bounded_in_bytes_least_recently_used_first():
+    db = Shard({user_id: transactions(100) for user_id in ("a", "b", "c")})
+    db.rows["d"] = transactions(1000)
+    size = UserTransactions.from_rows(db.rows["a"], 0).nbytes
+    working_set = TransactionWorkingSet(max_bytes=2 * size)
+
+    for user_id in ("a", "b", "a", "c"):
+        working_set.get(db, user_id)
+
+    assert list(working_set._entries) == ["a", "c"]
+    assert working_set.nbytes == 2 * size
+    assert (working_set.hits, working_set.misses) == (1, 3)
+    # A single user larger than the whole set is not kept
+    assert working_set.get(db, "d").size == 1000
+    assert list(working_set._entries) == ["a", "c"]
@@ -0,0 +1,130 @@
+import asyncio
+import uuid
+import pytest
+from sqlalchemy import event
+from tests.test_database import engine, TestingSessionLocal
+from app.models.portfolio_model import Portfolio as PortfolioModel, AssetType
+from app.models.transaction_model import TransactionType
+from app.models.user_model import User as UserModel, UserRole
+from app.schemas.transaction_schema import TransactionCreate
+from app.utils.custom_exceptions import BadRequestException
+from app.utils.write_batcher import TransactionWriteBatcher
+
+
+def create_portfolio():
+    user_id, portfolio_id = uuid.uuid4(), uuid.uuid4()
+    with engine.begin() as connection:
+        connection.execute(
+            UserModel.__table__.insert().values(
+                id=user_id,
+                username=f"user-{user_id}",
+                email=f"{user_id}@example.com",
+                hashed_password="",
+                role=UserRole.USER,
+            )
+        )
+        connection.execute(
+            PortfolioModel.__table__.insert().values(
+                id=portfolio_id,
+                name="Batched",
+                description="",
+                user_id=user_id,
+                asset_type=AssetType.CRYPTO,
+            )
+        )
+    return user_id, portfolio_id
+
+
+def transaction_create(user_id, portfolio_id, amount):
+    return TransactionCreate(
+        ticker_symbol="BTC",
+        asset_name="bitcoin",
+        transaction_type=TransactionType.BUY,
+        asset_type=AssetType.CRYPTO,
+        amount=amount,
+        currency="usd",
+        unit_price=1,
+        transaction_fee=0,
+        note="",
+        user_id=user_id,
+        portfolio_id=portfolio_id,
+    )
+
+
+def count_inserts():
+    inserts = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO transactions"):
+            inserts.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return inserts, lambda: event.remove(
+        engine, "before_cursor_execute", before_cursor_execute
+    )
+
+
+def test_concurrent_creates_share_one_insert():
+    user_id, portfolio_id = create_portfolio()
+    batcher = TransactionWriteBatcher(TestingSessionLocal, window_seconds=0.05)
+    inserts, stop = count_inserts()
+
+    async def scenario():
+        return await asyncio.gather(
+            *(
+                batcher.submit(transaction_create(user_id, portfolio_id, amount))
+                for amount in (1, 2, 3)
+            )
+        )
+
+    try:
+        created = asyncio.run(scenario())
+    finally:
+        stop()
+
+    assert [transaction.amount for transaction in created] == [1, 2, 3]
+    assert len({transaction.id for transaction in created}) == 3
+    assert len(inserts) == 1
+    assert batcher.batches_written == 1
+
+
+def test_batch_size_flushes_before_window():
+    user_id, portfolio_id = create_portfolio()
+    batcher = TransactionWriteBatcher(
+        TestingSessionLocal, window_seconds=60, max_batch_size=2
+    )
+
+    async def scenario():
+        return await asyncio.wait_for(
+            asyncio.gather(
+                batcher.submit(transaction_create(user_id, portfolio_id, 1)),
+                batcher.submit(transaction_create(user_id, portfolio_id, 2)),
+            ),
+            timeout=5,
+        )
+
+    assert len(asyncio.run(scenario())) == 2
+
+
+def test_failing_create_only_rejects_its_caller():
+    user_id, portfolio_id = create_portfolio()
+    batcher = TransactionWriteBatcher(TestingSessionLocal, window_seconds=0.05)
+
+    async def scenario():
+        # Queued together, written in the same batch
+        first, missing_portfolio, last = [
+            asyncio.ensure_future(batcher.submit(transaction))
+            for transaction in (
+                transaction_create(user_id, portfolio_id, 1),
+                transaction_create(user_id, uuid.uuid4(), 2),
+                transaction_create(user_id, portfolio_id, 3),
+            )
+        ]
+        with pytest.raises(BadRequestException) as error:
+            await missing_portfolio
+        return await first, await last, error.value
+
+    first, last, error = asyncio.run(scenario())
+
+    assert first.amount == 1 and last.amount == 3
+    assert error.detail == "Failed to create transaction"
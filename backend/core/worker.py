@@ -0,0 +1,7 @@
+from dotenv import load_dotenv
+from app.jobs.runner import main
+
+load_dotenv()
+
+if __name__ == "__main__":
+    main()